@@ -3,12 +3,14 @@ from __future__ import annotations
 import argparse
 import csv
 import hashlib
+import os
 import uuid
 import sys
 from pathlib import Path
 from datetime import datetime
 from typing import Any
 
+from mhy_ai_rag_data.make_inventory import hash_files, load_existing_rows, reusable_sha256
 from mhy_ai_rag_data.project_paths import find_project_root
 
 
@@ -87,6 +89,7 @@ FIELDS = [
     "size_bytes",
     "updated_at",
     "note",
+    "mtime_ns",
 ]
 
 
@@ -167,6 +170,17 @@ def load_existing_doc_ids(out_csv: Path) -> dict[str, str]:
 def main() -> None:
     ap = argparse.ArgumentParser(description="Scan data_raw/ and write inventory.csv")
     ap.add_argument("--root", default=None, help="Project root (default: auto-detect from CWD)")
+    ap.add_argument(
+        "--incremental",
+        default="true",
+        help="true/false: reuse content_sha256 from the previous inventory.csv when size_bytes and mtime_ns match",
+    )
+    ap.add_argument(
+        "--hash-workers",
+        type=int,
+        default=min(8, os.cpu_count() or 1),
+        help="Threads used to hash new/changed files (1 = serial)",
+    )
     args = ap.parse_args()
 
     project_root = find_project_root(args.root)
@@ -177,10 +191,14 @@ def main() -> None:
         print(f"[FAIL] missing directory: {raw_dir}", file=sys.stderr)
         raise SystemExit(2)
 
-    existing = load_existing_doc_ids(out_csv)
+    existing = load_existing_rows(out_csv)
+    # inventory.csv is written right after the scan: its mtime dates the previous run for the racy check.
+    prev_scan_ns = out_csv.stat().st_mtime_ns if existing else 0
+    incremental = str(args.incremental).strip().lower() in {"1", "true", "yes", "y", "on"}
     note_value = build_note(NOTE_CONFIG)
 
     rows: list[dict[str, str]] = []
+    to_hash: list[tuple[dict[str, str], Path]] = []
     for p in raw_dir.rglob("*"):
         if not p.is_file():
             continue
@@ -192,20 +210,29 @@ def main() -> None:
         filename = p.name
         source_type = EXT_MAP.get(p.suffix.lower(), "other")
 
-        doc_id = existing.get(source_uri) or str(uuid.uuid4())
-
-        rows.append(
-            {
-                "doc_id": doc_id,
-                "source_uri": source_uri,
-                "filename": filename,
-                "source_type": source_type,
-                "content_sha256": sha256_file(p),
-                "size_bytes": str(st.st_size),
-                "updated_at": iso_time_from_mtime(st.st_mtime),
-                "note": note_value,  # 从字典配置生成
-            }
-        )
+        prev = existing.get(source_uri)
+        doc_id = (prev or {}).get("doc_id") or str(uuid.uuid4())
+        size_bytes = str(st.st_size)
+        updated_at = iso_time_from_mtime(st.st_mtime)
+        mtime_ns = str(st.st_mtime_ns)
+
+        row = {
+            "doc_id": doc_id,
+            "source_uri": source_uri,
+            "filename": filename,
+            "source_type": source_type,
+            "content_sha256": reusable_sha256(prev, size_bytes, mtime_ns, prev_scan_ns) if incremental else "",
+            "size_bytes": size_bytes,
+            "updated_at": updated_at,
+            "note": note_value,  # 从字典配置生成
+            "mtime_ns": mtime_ns,
+        }
+        rows.append(row)
+        if not row["content_sha256"]:
+            to_hash.append((row, p))
+
+    for (row, _), sha in zip(to_hash, hash_files([p for _, p in to_hash], int(args.hash_workers))):
+        row["content_sha256"] = sha
 
     rows.sort(key=lambda r: r["source_uri"])
 
@@ -214,7 +241,7 @@ def main() -> None:
         w.writeheader()
         w.writerows(rows)
 
-    print(f"Wrote {len(rows)} rows to {out_csv}")
+    print(f"Wrote {len(rows)} rows to {out_csv} (hashed={len(to_hash)}, reused={len(rows) - len(to_hash)})")
 
 
 if __name__ == "__main__":
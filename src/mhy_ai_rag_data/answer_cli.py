@@ -6,27 +6,49 @@
     python answer_cli.py --q "如何自定义资产" --k 8
 
 默认行为：
-1）从 Chroma 中检索 top-k 证据块
+1）从 Chroma 中检索 top-k 证据块（默认 dense；--mode hybrid 使用持久化关键词索引做 dense + BM25 + RRF，与 run_eval_retrieval 同口径）
 2）打印每个证据块的概览
 3）构造 RAG prompt 调用 LLM
-4）打印最终回答
+4）打印最终回答（默认流式：token 到达即输出，结尾给出 TTFT / tokens/s；--no-stream 等整段返回）
+
+若常驻检索服务（rag_daemon.py）在线且服务同一索引，检索经 HTTP 完成（不加载模型、不打开 collection），
+否则在本进程内检索；--daemon off 强制进程内。
+
+--llm-cache read|write（默认 off）：同一请求（model/messages/temperature/max_tokens）的回答走 llm_cache 回放/录制，
+落盘于 rag_config.LLM_CACHE_PATH。
 """
 
 from __future__ import annotations
 
 import argparse
+import sys
 import textwrap
+from pathlib import Path
+from typing import Dict, List, Optional
 
-from mhy_ai_rag_data.rag_config import RAG_TOP_K
+from mhy_ai_rag_data.llm_cache import LLM_CACHE_MODES, LLMResponseCache, open_llm_cache
+from mhy_ai_rag_data.rag_config import LLM_CACHE_PATH, RAG_RETRIEVAL_MODE, RAG_TOP_K
+from mhy_ai_rag_data.rag_daemon import daemon_for, retrieve_remote, to_source_chunks
 from mhy_ai_rag_data.retriever_chroma import retrieve
 from mhy_ai_rag_data.prompt_rag import build_messages
-from mhy_ai_rag_data.llm_client_http import call_llm, LLMError
+from mhy_ai_rag_data.llm_client_http import call_llm, stream_llm, LLMError
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="RAG 闭环最小可用 CLI")
     parser.add_argument("--q", required=True, help="问题文本")
     parser.add_argument("--k", type=int, default=None, help="检索 top-k，默认使用 RAG_TOP_K")
+    parser.add_argument(
+        "--mode",
+        default=None,
+        choices=["hybrid", "dense"],
+        help="检索模式，默认使用 RAG_RETRIEVAL_MODE",
+    )
+    parser.add_argument(
+        "--daemon",
+        default="auto",
+        help="rag_daemon URL: auto（RAG_DAEMON_URL，在线则使用）| off（总是进程内检索）| <url>",
+    )
     parser.add_argument(
         "--only-sources",
         action="store_true",
@@ -38,15 +60,33 @@ def main() -> None:
         default=0.2,
         help="LLM temperature，默认 0.2",
     )
+    parser.add_argument(
+        "--stream",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="stream the answer as it is generated (SSE) and report TTFT / tokens/s; --no-stream waits for the full reply",
+    )
+    parser.add_argument(
+        "--llm-cache",
+        default="off",
+        choices=list(LLM_CACHE_MODES),
+        help="answer cache: off | read (replay identical requests, record misses) | write (always call, re-record)",
+    )
     args = parser.parse_args()
 
     k = args.k or RAG_TOP_K
     print(f"Q: {args.q}")
-    print(f"k={k}")
+    daemon_url = daemon_for(args.daemon)
+    print(
+        f"k={k} mode={args.mode or RAG_RETRIEVAL_MODE} retriever={'daemon ' + daemon_url if daemon_url else 'in-process'}"
+    )
     print()
 
-    # 1) 检索
-    sources = retrieve(args.q, k)
+    # 1) 检索（常驻服务在线时走 HTTP）
+    if daemon_url:
+        sources = to_source_chunks(retrieve_remote(daemon_url, args.q, k, mode=args.mode)["hits"])
+    else:
+        sources = retrieve(args.q, k, mode=args.mode)
     print(f"=== RETRIEVED SOURCES ({len(sources)}) ===")
     for s in sources:
         preview = (s.text or "").replace("\n", " ")
@@ -65,8 +105,40 @@ def main() -> None:
 
     # 3) 调用 LLM
     print("=== ANSWER ===")
+    cache = open_llm_cache(Path("."), args.llm_cache, LLM_CACHE_PATH)
+    try:
+        _answer(args, messages, cache)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def _answer(args: argparse.Namespace, messages: List[Dict[str, str]], cache: Optional[LLMResponseCache]) -> None:
+    if args.stream:
+
+        def _write(piece: str) -> None:
+            sys.stdout.write(piece)
+            sys.stdout.flush()
+
+        try:
+            res = stream_llm(messages, on_delta=_write, temperature=args.temperature, cache=cache)
+        except LLMError as exc:
+            print(f"\n[LLM ERROR] {exc}")
+            return
+        tps = res.tokens_per_s
+        print()
+        if res.cached:
+            print("\n[timing] llm-cache hit (no request sent)", file=sys.stderr)
+            return
+        print(
+            f"\n[timing] ttft_ms={res.ttft_ms} total_ms={res.total_ms} "
+            f"tokens={res.completion_tokens}({res.tokens_source}) tokens_per_s={tps if tps is not None else '-'}",
+            file=sys.stderr,
+        )
+        return
+
     try:
-        answer = call_llm(messages, temperature=args.temperature)
+        answer = call_llm(messages, temperature=args.temperature, cache=cache)
     except LLMError as exc:
         print(f"[LLM ERROR] {exc}")
         return
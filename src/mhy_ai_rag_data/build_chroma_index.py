@@ -32,6 +32,8 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+from mhy_ai_rag_data.units_reader import UnitsFile
+
 
 def _require_chromadb() -> Any:
     """Import chromadb only when needed.
@@ -185,7 +187,19 @@ def pack_paragraphs_to_chunks(paras: List[str], conf: ChunkConf) -> List[str]:
 # ---------------------------
 
 
-def iter_units(units_path: Path) -> Iterable[Dict[str, Any]]:
+def iter_units(units_path: Path, source_uris: Optional[Iterable[str]] = None) -> Iterable[Dict[str, Any]]:
+    """Units in file order; with source_uris, only those units (in the given order, unknown ones skipped).
+
+    The filtered form seeks to each unit via the sidecar offset index (mhy_ai_rag_data.units_reader)
+    instead of parsing every line.
+    """
+    if source_uris is not None:
+        with UnitsFile(units_path) as uf:
+            for uri in source_uris:
+                unit = uf.get(uri)
+                if unit is not None:
+                    yield unit
+        return
     with units_path.open("r", encoding="utf-8") as f:
         for line in f:
             line = line.strip()
@@ -271,15 +285,19 @@ def load_embedder(model_name_or_path: str, device: Optional[str]) -> Any:
     return SentenceTransformer(model_name_or_path)
 
 
-def embed_texts(model: Any, texts: List[str], batch_size: int) -> List[List[float]]:
+def embed_texts(model: Any, texts: List[str], batch_size: int, cache: Any = None) -> List[List[float]]:
     # normalize_embeddings=True is generally preferred for cosine similarity search.
-    emb = model.encode(
-        texts,
-        batch_size=batch_size,
-        show_progress_bar=False,
-        convert_to_numpy=True,
-        normalize_embeddings=True,
-    )
+    def _encode(batch: List[str]) -> Any:
+        return model.encode(
+            batch,
+            batch_size=batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+
+    # cache (EmbeddingCache) only sends misses to the model; vectors are stored already normalized.
+    emb = cache.encode_through(texts, _encode) if cache is not None else _encode(texts)
     return [e.astype("float32").tolist() for e in emb]
 
 
@@ -316,6 +334,23 @@ def cmd_build(args: argparse.Namespace) -> int:
         print(f"        Detail: {e}")
         return 2
 
+    from mhy_ai_rag_data.embedding_cache import open_embedding_cache
+
+    try:
+        emb_cache = open_embedding_cache(
+            root,
+            args.embed_cache,
+            embed_model=args.embed_model,
+            normalize=True,
+            backend="sentence-transformers",
+            dtype=args.embed_cache_dtype,
+            max_mb=args.embed_cache_max_mb,
+        )
+    except Exception as e:
+        # Optional cache (locked namespace, read-only/full disk, ...): build without it.
+        print(f"[WARN] embed cache disabled: {args.embed_cache} ({type(e).__name__}: {e})")
+        emb_cache = None
+
     ids: List[str] = []
     docs: List[str] = []
     metas: List[Dict[str, Any]] = []
@@ -326,44 +361,48 @@ def cmd_build(args: argparse.Namespace) -> int:
     total_chunks = 0
     type_breakdown: Dict[str, Dict[str, int]] = {}
 
-    for unit in iter_units(units_path):
-        total_units += 1
-        st = str(unit.get("source_type", "") or "").lower()
-        type_breakdown.setdefault(st, {"indexed": 0, "skipped": 0, "chunks": 0})
-
-        if not should_index_unit(unit, args.include_media_stub):
-            units_skipped += 1
-            type_breakdown[st]["skipped"] += 1
-            continue
+    try:
+        for unit in iter_units(units_path):
+            total_units += 1
+            st = str(unit.get("source_type", "") or "").lower()
+            type_breakdown.setdefault(st, {"indexed": 0, "skipped": 0, "chunks": 0})
+
+            if not should_index_unit(unit, args.include_media_stub):
+                units_skipped += 1
+                type_breakdown[st]["skipped"] += 1
+                continue
 
-        units_indexed += 1
-        type_breakdown[st]["indexed"] += 1
+            units_indexed += 1
+            type_breakdown[st]["indexed"] += 1
 
-        chunk_texts, base_md = build_chunks_from_unit(unit, conf)
-        if not chunk_texts:
-            continue
+            chunk_texts, base_md = build_chunks_from_unit(unit, conf)
+            if not chunk_texts:
+                continue
 
-        doc_id = str(base_md.get("doc_id"))
-        for idx, ct in enumerate(chunk_texts):
-            chunk_id = f"{doc_id}:{idx}"
-            ids.append(chunk_id)
-            docs.append(ct)
-            md = dict(base_md)
-            md["chunk_index"] = idx
-            md["chunk_chars"] = len(ct)
-            metas.append(md)
-
-        total_chunks += len(chunk_texts)
-        type_breakdown[st]["chunks"] += len(chunk_texts)
-
-        if len(ids) >= args.upsert_batch:
-            embs = embed_texts(embedder, docs, batch_size=args.embed_batch)
+            doc_id = str(base_md.get("doc_id"))
+            for idx, ct in enumerate(chunk_texts):
+                chunk_id = f"{doc_id}:{idx}"
+                ids.append(chunk_id)
+                docs.append(ct)
+                md = dict(base_md)
+                md["chunk_index"] = idx
+                md["chunk_chars"] = len(ct)
+                metas.append(md)
+
+            total_chunks += len(chunk_texts)
+            type_breakdown[st]["chunks"] += len(chunk_texts)
+
+            if len(ids) >= args.upsert_batch:
+                embs = embed_texts(embedder, docs, batch_size=args.embed_batch, cache=emb_cache)
+                collection.upsert(ids=ids, documents=docs, metadatas=metas, embeddings=embs)
+                ids, docs, metas = [], [], []
+
+        if ids:
+            embs = embed_texts(embedder, docs, batch_size=args.embed_batch, cache=emb_cache)
             collection.upsert(ids=ids, documents=docs, metadatas=metas, embeddings=embs)
-            ids, docs, metas = [], [], []
-
-    if ids:
-        embs = embed_texts(embedder, docs, batch_size=args.embed_batch)
-        collection.upsert(ids=ids, documents=docs, metadatas=metas, embeddings=embs)
+    finally:
+        if emb_cache is not None:
+            emb_cache.close()
 
     print("=== BUILD DONE ===")
     print(f"units_read={total_units}")
@@ -377,6 +416,9 @@ def cmd_build(args: argparse.Namespace) -> int:
     print(f"db_path={db_path}")
     print(f"collection={args.collection}")
     print(f"embed_model={args.embed_model} (cached after first download)")
+    if emb_cache is not None:
+        cs = emb_cache.stats()
+        print(f"embed_cache={cs['dir']} hits={cs['hits']} misses={cs['misses']} rows={cs['rows']}")
     # compact breakdown for debugging / postmortem
     top = sorted(((k, v.get("chunks", 0)) for k, v in type_breakdown.items()), key=lambda x: x[1], reverse=True)[:8]
     print(f"type_breakdown.top_chunks={top}")
@@ -466,6 +508,15 @@ def build_arg_parser() -> argparse.ArgumentParser:
     b.add_argument("--device", default=None, help='e.g. "cpu", "cuda", "cuda:0" (default: auto)')
     b.add_argument("--embed-batch", type=int, default=32, help="Embedding batch size")
     b.add_argument("--upsert-batch", type=int, default=256, help="Upsert batch size (chunks per write)")
+    b.add_argument(
+        "--embed-cache",
+        default="",
+        help="Embedding cache dir (relative to root), keyed by chunk text sha256; empty=off",
+    )
+    b.add_argument("--embed-cache-max-mb", type=int, default=4096, help="Embedding cache size cap in MB (0=unbounded)")
+    b.add_argument(
+        "--embed-cache-dtype", default="float16", choices=["float16", "float32"], help="Embedding cache storage dtype"
+    )
 
     b.add_argument("--chunk-chars", type=int, default=1200, help="Max characters per chunk")
     b.add_argument("--overlap-chars", type=int, default=120, help="Overlap characters between neighboring chunks")
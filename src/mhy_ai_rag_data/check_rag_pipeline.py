@@ -15,9 +15,10 @@
 from __future__ import annotations
 
 import argparse
+from typing import List
 
 from mhy_ai_rag_data.rag_config import RAG_TOP_K, RAG_MAX_CONTEXT_CHARS
-from mhy_ai_rag_data.retriever_chroma import retrieve
+from mhy_ai_rag_data.retriever_chroma import SourceChunk, retrieve
 from mhy_ai_rag_data.prompt_rag import build_context, build_messages
 
 
@@ -28,32 +29,35 @@ def main() -> None:
     args = parser.parse_args()
 
     k = args.k or RAG_TOP_K
-    print(f"Q={args.q!r}")
-    print(f"k={k}")
-    print()
 
     # 1) 检索
     sources = retrieve(args.q, k)
-    print(f"retrieved={len(sources)}")
+    print(format_pipeline_check(args.q, k, sources), end="")
+
+
+def format_pipeline_check(question: str, k: int, sources: List[SourceChunk]) -> str:
+    """检索之后的自检输出：上下文长度是否超限 + messages 结构（run_rag_eval_batch 进程内模式复用）。"""
+    lines = [f"Q={question!r}", f"k={k}", "", f"retrieved={len(sources)}"]
 
     # 2) 拼接上下文
     ctx = build_context(sources)
     ctx_len = len(ctx)
-    print(f"context_length={ctx_len} (limit={RAG_MAX_CONTEXT_CHARS})")
+    lines.append(f"context_length={ctx_len} (limit={RAG_MAX_CONTEXT_CHARS})")
     if ctx_len > RAG_MAX_CONTEXT_CHARS:
-        print("STATUS: WARN (context exceeds limit, consider reducing k or 调整切块策略)")
+        lines.append("STATUS: WARN (context exceeds limit, consider reducing k or 调整切块策略)")
     else:
-        print("STATUS: OK  (context within limit)")
+        lines.append("STATUS: OK  (context within limit)")
 
     # 3) 构造 messages（不调用 LLM）
-    messages = build_messages(args.q, sources)
-    print(f"messages_count={len(messages)}")
+    messages = build_messages(question, sources)
+    lines.append(f"messages_count={len(messages)}")
     for i, msg in enumerate(messages):
         role = msg.get("role")
         content = msg.get("content", "")
-        print(f"[message {i}] role={role}, content_length={len(content)}")
+        lines.append(f"[message {i}] role={role}, content_length={len(content)}")
 
-    print("\nRAG pipeline check finished.")
+    lines.append("\nRAG pipeline check finished.")
+    return "\n".join(lines) + "\n"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""mhy_ai_rag_data.embedding_cache
+
+内容寻址的 embedding 向量缓存（持久化，跨 collection / schema_hash 复用）。
+
+用途
+- schema_hash 变化（collection 改名、include_media_stub、A/B chunking 等）会触发全量重建，
+  但绝大多数 chunk 文本与上一轮逐字节相同；命中缓存即可跳过模型推理。
+
+键
+- 命名空间：(embed_model, normalize, backend, dtype) -> <cache_dir>/<ns_hash>/
+- 条目键：sha256(chunk_text) 的 32 字节 digest
+
+落盘布局（每个命名空间目录）
+- meta.json    ：命名空间与容量信息（dim/capacity，原子写）
+- vectors.bin  ：float16/float32 矩阵（np.memmap，shape=(capacity, dim)）
+- index.bin    ：与 vectors 行对齐的结构化数组（key[32] + tick；tick=0 表示空行）
+
+淘汰
+- max_bytes>0 时容量封顶；写满后按 tick（最近使用）批量淘汰最旧的 ~5% 行（LRU 近似）。
+
+一致性
+- 写入一行的顺序：先清 tick -> 写向量 -> 写 key/tick；进程中断最多丢失最后一行，不会出现 key 指向错误向量。
+- 每个命名空间目录同一时刻只允许一个 EmbeddingCache 打开：构造时对 <ns>/lock 加非阻塞的 OS 排他锁
+  （fcntl.flock / msvcrt.locking；进程退出即释放，不会残留）。锁被占用时抛 CacheLockedError，
+  调用方按“不使用缓存”继续（两个进程各自按内存快照分配空闲行会互相覆盖向量）。
+- 命中时再核对磁盘上该行的 key，不一致按 miss 处理，绝不返回别的文本的向量。
+- 本模块只依赖 numpy（核心依赖）；单线程使用（QueryEmbeddingCache 自带锁），调用方负责 close()。
+
+查询向量缓存（QueryEmbeddingCache）
+- 检索侧（embeddings_bge_m3 / run_eval_retrieval / run_eval_rag）的 query embedding：进程内 LRU（按文本），
+  可选再挂一个 float32 的 EmbeddingCache 作为持久化层（同一命名空间规则：模型/normalize/backend）。
+- 向量统一按 float32 取整后返回，命中与未命中得到的向量逐位一致（评估结果不因缓存状态而变）。
+- 加锁保护，可被多个检索线程共享；模型推理在锁外进行。
+"""
+
+from __future__ import annotations
+
+import errno
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+CACHE_VERSION = 1
+
+_INDEX_DTYPE = np.dtype([("key", np.uint8, (32,)), ("tick", "<i8")])
+_INITIAL_CAPACITY = 1024
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class CacheLockedError(RuntimeError):
+    """The namespace dir is already open in another EmbeddingCache (this or another process)."""
+
+
+def _lock_exclusive(path: Path) -> Any:
+    """Non-blocking exclusive OS lock on `path`; returns the open handle, or None if it is held elsewhere."""
+    fh = open(path, "a+b")
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fh.close()
+        return None
+    return fh
+
+
+def _unlock(fh: Any) -> None:
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+    except OSError:
+        pass
+    fh.close()
+
+
+def _extend_file(path: Path, size: int) -> None:
+    """Grow path to size with real blocks (not a sparse hole): a memmap store into a hole on a full disk is
+    SIGBUS, while running out of space here is an OSError the caller can handle. The file is left at its old
+    size on failure."""
+    with open(path, "ab") as f:
+        old = f.tell()
+        if old >= size:
+            return
+        try:
+            try:
+                os.posix_fallocate(f.fileno(), old, size - old)
+                return
+            except (AttributeError, OSError) as e:
+                if isinstance(e, OSError) and e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+            # No fallocate (Windows) or unsupported by the filesystem: write the zeros.
+            zeros = bytes(1 << 20)
+            left = size - old
+            while left > 0:
+                n = min(left, len(zeros))
+                f.write(zeros[:n])
+                left -= n
+            f.flush()
+        except BaseException:
+            f.truncate(old)
+            raise
+
+
+class EmbeddingCache:
+    """Content-addressed, memory-mapped embedding cache with LRU size cap.
+
+    Holds an exclusive lock on its namespace dir until close(); raises CacheLockedError if another
+    instance (in any process) has it open.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        *,
+        embed_model: str,
+        normalize: bool,
+        backend: str = "",
+        dtype: str = "float16",
+        max_bytes: int = 0,
+    ) -> None:
+        self.namespace: Dict[str, Any] = {
+            "version": CACHE_VERSION,
+            "embed_model": str(embed_model),
+            "normalize": bool(normalize),
+            "backend": str(backend),
+            "dtype": str(np.dtype(dtype).name),
+        }
+        ns_json = json.dumps(self.namespace, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        self.dir = Path(cache_dir) / hashlib.sha256(ns_json.encode("utf-8")).hexdigest()[:16]
+        self.dtype = np.dtype(dtype)
+        self.max_bytes = int(max(0, max_bytes))
+
+        self.dim: Optional[int] = None
+        self.capacity = 0
+        self._vecs: Any = None
+        self._index: Any = None
+        self._rows: Dict[bytes, int] = {}
+        self._free: List[int] = []
+        self._tick = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._lock_fh: Any = _lock_exclusive(self.dir / "lock")
+        if self._lock_fh is None:
+            raise CacheLockedError(f"embedding cache in use by another process: {self.dir.as_posix()}")
+
+        meta = self._read_meta()
+        if meta is not None:
+            try:
+                self.dim = int(meta["dim"])
+                self._map(int(meta["capacity"]))
+                self._load_index()
+            except BaseException:
+                _unlock(self._lock_fh)
+                self._lock_fh = None
+                raise
+
+    # ---- files ----
+    @property
+    def _meta_path(self) -> Path:
+        return self.dir / "meta.json"
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+        except Exception:
+            return None
+        if not isinstance(meta, dict) or int(meta.get("dim") or 0) <= 0 or int(meta.get("capacity") or 0) <= 0:
+            return None
+        if any(meta.get(k) != v for k, v in self.namespace.items()):
+            return None
+        return meta
+
+    def _write_meta(self) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        meta = dict(self.namespace)
+        meta.update({"dim": int(self.dim or 0), "capacity": int(self.capacity)})
+        tmp = self._meta_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(meta, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        os.replace(str(tmp), str(self._meta_path))
+
+    def _map(self, capacity: int) -> None:
+        assert self.dim is not None
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._flush()
+        self._vecs = None
+        self._index = None
+        vec_path = self.dir / "vectors.bin"
+        idx_path = self.dir / "index.bin"
+        _extend_file(vec_path, capacity * self.dim * self.dtype.itemsize)
+        _extend_file(idx_path, capacity * _INDEX_DTYPE.itemsize)
+        self._vecs = np.memmap(vec_path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+        self._index = np.memmap(idx_path, dtype=_INDEX_DTYPE, mode="r+", shape=(capacity,))
+        old = self.capacity
+        self.capacity = capacity
+        # New rows are free; pop() hands out the lowest row first.
+        self._free.extend(range(capacity - 1, old - 1, -1))
+
+    def _load_index(self) -> None:
+        ticks = np.asarray(self._index["tick"])
+        used = np.nonzero(ticks > 0)[0]
+        keys = np.asarray(self._index["key"])
+        self._rows = {keys[r].tobytes(): int(r) for r in used}
+        used_set = set(int(r) for r in used)
+        self._free = [r for r in range(self.capacity - 1, -1, -1) if r not in used_set]
+        self._tick = int(ticks.max()) if len(ticks) else 0
+
+    def _flush(self) -> None:
+        for mm in (self._vecs, self._index):
+            if mm is not None:
+                try:
+                    mm.flush()
+                except Exception:
+                    pass
+
+    # ---- capacity ----
+    def _max_rows(self) -> int:
+        if self.max_bytes <= 0 or not self.dim:
+            return 0
+        per_row = self.dim * self.dtype.itemsize + _INDEX_DTYPE.itemsize
+        return max(1, self.max_bytes // per_row)
+
+    def _alloc_row(self) -> int:
+        if not self._free:
+            limit = self._max_rows()
+            if limit == 0 or self.capacity < limit:
+                new_cap = max(_INITIAL_CAPACITY, self.capacity * 2)
+                self._map(min(new_cap, limit) if limit else new_cap)
+                self._write_meta()
+            else:
+                self._evict(max(1, self.capacity // 20))
+        return self._free.pop()
+
+    def _evict(self, n: int) -> None:
+        ticks = np.asarray(self._index["tick"])
+        n = min(int(n), len(ticks))
+        victims = np.argpartition(ticks, n - 1)[:n] if n < len(ticks) else np.arange(len(ticks))
+        for r in victims:
+            r = int(r)
+            if ticks[r] <= 0:
+                continue
+            self._rows.pop(np.asarray(self._index["key"][r]).tobytes(), None)
+            self._index["tick"][r] = 0
+            self._free.append(r)
+            self.evictions += 1
+
+    # ---- public API ----
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Return float32 vectors for cached texts (None for misses); hits refresh LRU ticks."""
+        out: List[Optional[np.ndarray]] = []
+        for t in texts:
+            key = text_key(t)
+            row = self._rows.get(key)
+            if row is not None and (self._index["tick"][row] <= 0 or self._index["key"][row].tobytes() != key):
+                # The row no longer holds this key on disk: never serve another text's vector.
+                self._rows.pop(key, None)
+                row = None
+            if row is None:
+                self.misses += 1
+                out.append(None)
+                continue
+            self.hits += 1
+            self._tick += 1
+            self._index["tick"][row] = self._tick
+            out.append(np.array(self._vecs[row], dtype=np.float32))
+        return out
+
+    def put_many(self, texts: Sequence[str], vectors: Any) -> None:
+        if len(texts) == 0:
+            return
+        mat = np.asarray(vectors)
+        if mat.ndim != 2 or mat.shape[0] != len(texts):
+            raise ValueError(f"expected ({len(texts)}, dim) vectors, got shape={mat.shape}")
+        if self.dim is None:
+            self.dim = int(mat.shape[1])
+        elif int(mat.shape[1]) != self.dim:
+            raise ValueError(f"embedding dim mismatch: cache={self.dim} got={mat.shape[1]} ({self.dir.as_posix()})")
+
+        for t, v in zip(texts, mat):
+            key = text_key(t)
+            row = self._rows.get(key)
+            if row is None:
+                row = self._alloc_row()
+            self._index["tick"][row] = 0
+            self._vecs[row] = v
+            self._tick += 1
+            self._index["key"][row] = np.frombuffer(key, dtype=np.uint8)
+            self._index["tick"][row] = self._tick
+            self._rows[key] = row
+
+    def encode_through(self, texts: Sequence[str], encode: Callable[[List[str]], Any]) -> np.ndarray:
+        """Return a (len(texts), dim) float32 matrix, calling encode() only for cache misses."""
+        cached = self.get_many(texts)
+        miss_idx = [i for i, v in enumerate(cached) if v is None]
+        if miss_idx:
+            fresh = np.asarray(encode([texts[i] for i in miss_idx]), dtype=np.float32)
+            self.put_many([texts[i] for i in miss_idx], fresh)
+            for k, i in enumerate(miss_idx):
+                cached[i] = fresh[k]
+        if not cached:
+            return np.zeros((0, int(self.dim or 0)), dtype=np.float32)
+        return np.stack([np.asarray(v, dtype=np.float32) for v in cached])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "dir": self.dir.as_posix(),
+            "dtype": self.dtype.name,
+            "dim": int(self.dim or 0),
+            "rows": len(self._rows),
+            "capacity": int(self.capacity),
+            "max_bytes": int(self.max_bytes),
+            "hits": int(self.hits),
+            "misses": int(self.misses),
+            "evictions": int(self.evictions),
+        }
+
+    def close(self) -> None:
+        if self._lock_fh is None:
+            return
+        self._flush()
+        if self.dim and self.capacity:
+            self._write_meta()
+        self._vecs = None
+        self._index = None
+        _unlock(self._lock_fh)
+        self._lock_fh = None
+
+
+def open_embedding_cache(
+    root: Path,
+    cache_arg: str,
+    *,
+    embed_model: str,
+    normalize: bool,
+    backend: str,
+    dtype: str = "float16",
+    max_mb: int = 0,
+) -> Optional[EmbeddingCache]:
+    """CLI helper: '' / 'off' disables the cache; relative paths are resolved from root.
+
+    Raises CacheLockedError when another process has the same namespace open (callers run uncached).
+    """
+    s = str(cache_arg or "").strip()
+    if not s or s.lower() == "off":
+        return None
+    p = Path(s)
+    cache_dir = p if p.is_absolute() else (root / p)
+    return EmbeddingCache(
+        cache_dir.resolve(),
+        embed_model=embed_model,
+        normalize=normalize,
+        backend=backend,
+        dtype=dtype,
+        max_bytes=int(max(0, max_mb)) * 1024 * 1024,
+    )
+
+
+class QueryEmbeddingCache:
+    """Thread-safe in-memory LRU of query vectors with an optional persistent EmbeddingCache behind it."""
+
+    def __init__(self, *, max_entries: int = 1024, store: Optional[EmbeddingCache] = None) -> None:
+        self.max_entries = int(max(0, max_entries))
+        self.store = store
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.encoded = 0
+
+    def _remember(self, text: str, vec: List[float]) -> None:
+        if self.max_entries <= 0:
+            return
+        self._lru[text] = vec
+        self._lru.move_to_end(text)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def encode_through(self, texts: Sequence[str], encode: Callable[[List[str]], Any]) -> List[List[float]]:
+        """Vectors for texts in input order; encode() is called once, only for texts missing from both layers."""
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            for i, t in enumerate(texts):
+                vec = self._lru.get(t)
+                if vec is not None:
+                    self._lru.move_to_end(t)
+                    self.memory_hits += 1
+                    out[i] = vec
+            pending = [i for i, v in enumerate(out) if v is None]
+            if pending and self.store is not None:
+                for i, got in zip(pending, self.store.get_many([texts[i] for i in pending])):
+                    if got is not None:
+                        self.store_hits += 1
+                        vec = got.tolist()
+                        out[i] = vec
+                        self._remember(texts[i], vec)
+            miss_idx = [i for i, v in enumerate(out) if v is None]
+            self.misses += len(miss_idx)
+
+        if miss_idx:
+            uniq = list(dict.fromkeys(texts[i] for i in miss_idx))
+            self.encoded += len(uniq)
+            mat = np.asarray(encode(uniq), dtype=np.float32)
+            if mat.ndim != 2 or mat.shape[0] != len(uniq):
+                raise ValueError(f"expected ({len(uniq)}, dim) vectors, got shape={mat.shape}")
+            fresh = {t: row.tolist() for t, row in zip(uniq, mat)}
+            with self._lock:
+                if self.store is not None:
+                    self.store.put_many(uniq, mat)
+                for t, vec in fresh.items():
+                    self._remember(t, vec)
+            for i in miss_idx:
+                out[i] = fresh[texts[i]]
+        return [v if v is not None else [] for v in out]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_entries": int(self.max_entries),
+                "entries": len(self._lru),
+                "hits": int(self.memory_hits + self.store_hits),
+                "memory_hits": int(self.memory_hits),
+                "store_hits": int(self.store_hits),
+                "misses": int(self.misses),
+                "encoded": int(self.encoded),
+                "store": self.store.dir.as_posix() if self.store is not None else None,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self.store is not None:
+                self.store.close()
+                self.store = None
+
+
+def open_query_embedding_cache(
+    root: Path,
+    cache_arg: str,
+    *,
+    embed_model: str,
+    normalize: bool,
+    backend: str,
+    max_entries: int = 1024,
+    max_mb: int = 256,
+) -> QueryEmbeddingCache:
+    """CLI helper: the in-memory LRU is always on (max_entries=0 disables it); cache_arg ''/'off' skips
+    the persistent layer. A store that cannot be opened degrades to memory-only (see stats()["store"])."""
+    store: Optional[EmbeddingCache] = None
+    try:
+        store = open_embedding_cache(
+            root,
+            cache_arg,
+            embed_model=embed_model,
+            normalize=normalize,
+            backend=backend,
+            dtype="float32",
+            max_mb=max_mb,
+        )
+    except Exception:
+        store = None
+    return QueryEmbeddingCache(max_entries=max_entries, store=store)
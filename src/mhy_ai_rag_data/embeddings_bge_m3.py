@@ -1,31 +1,82 @@
 """基于 BAAI/bge-m3 的查询向量计算封装。
 
 注意：本模块假定已经通过 FlagEmbedding 安装了 BGEM3FlagModel。
+
+查询向量经 embedding_cache.QueryEmbeddingCache 缓存（进程内 LRU + 可选持久化目录，见 rag_config.QUERY_EMBED_CACHE_*）；
+命中时不加载、不调用模型。
 """
 
+import atexit
+import threading
+from pathlib import Path
+from typing import Any
+
 from FlagEmbedding import BGEM3FlagModel
 
-from mhy_ai_rag_data.rag_config import EMBED_MODEL_NAME, EMBED_DEVICE, EMBED_BATCH
+from mhy_ai_rag_data.embedding_cache import QueryEmbeddingCache, open_query_embedding_cache
+from mhy_ai_rag_data.rag_config import (
+    EMBED_BATCH,
+    EMBED_DEVICE,
+    EMBED_MODEL_NAME,
+    QUERY_EMBED_CACHE_DIR,
+    QUERY_EMBED_CACHE_MAX_MB,
+    QUERY_EMBED_CACHE_SIZE,
+)
 
 _MODEL: BGEM3FlagModel | None = None
+_CACHE: QueryEmbeddingCache | None = None
+# Serializes model load/encode when several retrieval threads share the model (rag_daemon).
+_MODEL_LOCK = threading.Lock()
 
 
 def _get_model() -> BGEM3FlagModel:
     """懒加载并缓存 BGEM3FlagModel 实例。"""
     global _MODEL
-    if _MODEL is None:
-        _MODEL = BGEM3FlagModel(EMBED_MODEL_NAME, use_fp16=True, device=EMBED_DEVICE)
+    with _MODEL_LOCK:
+        if _MODEL is None:
+            _MODEL = BGEM3FlagModel(EMBED_MODEL_NAME, use_fp16=True, device=EMBED_DEVICE)
     return _MODEL
 
 
+def warmup() -> None:
+    """预先加载模型（常驻服务启动时调用，避免第一个请求承担加载时间）。"""
+    _get_model()
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    """懒创建进程内共享的查询向量缓存（进程退出时落盘）。"""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = open_query_embedding_cache(
+            Path("."),
+            QUERY_EMBED_CACHE_DIR,
+            embed_model=EMBED_MODEL_NAME,
+            normalize=True,  # BGEM3FlagModel dense_vecs are L2-normalized
+            backend="bge_m3",
+            max_entries=QUERY_EMBED_CACHE_SIZE,
+            max_mb=QUERY_EMBED_CACHE_MAX_MB,
+        )
+        atexit.register(_CACHE.close)
+    return _CACHE
+
+
+def _encode(texts: list[str]) -> Any:
+    model = _get_model()
+    with _MODEL_LOCK:
+        outputs = model.encode(list(texts), batch_size=EMBED_BATCH)
+    return outputs["dense_vecs"]
+
+
 def embed_query(text: str) -> list[float]:
     """将单条查询文本编码为 dense 向量。
 
     返回值为 list[float]，可直接用于 chroma.query 的 query_embeddings。
     """
-    model = _get_model()
-    outputs = model.encode([text], batch_size=EMBED_BATCH)
-    dense_vecs = outputs["dense_vecs"]
-    vec = dense_vecs[0]
-    # 兼容 numpy 数组 / list 等
-    return vec.tolist() if hasattr(vec, "tolist") else list(vec)
+    return get_query_cache().encode_through([text], _encode)[0]
+
+
+def embed_queries(texts: list[str]) -> list[list[float]]:
+    """将多条查询文本在一次 model.encode 中批量编码（按输入顺序返回；缓存命中的不再编码）。"""
+    if not texts:
+        return []
+    return get_query_cache().encode_through(texts, _encode)
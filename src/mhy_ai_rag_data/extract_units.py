@@ -1,6 +1,7 @@
 # extract_units.py
 # Purpose:
-#   Read inventory.csv and produce data_processed/text_units.jsonl.
+#   Read inventory.csv and produce data_processed/text_units.jsonl
+#   (+ sidecar offset index text_units.jsonl.idx, see mhy_ai_rag_data.units_reader).
 #   Contract:
 #   - Output JSONL must contain keys required by validate_rag_units.py:
 #       doc_id, source_uri, source_type, locator, text, content_sha256, updated_at, note
@@ -16,12 +17,16 @@ from __future__ import annotations
 import argparse
 import csv
 import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Any, Dict, Generator, List, Optional, Tuple
 
 from mhy_ai_rag_data.md_refs import extract_refs_from_md
 from mhy_ai_rag_data.project_paths import find_project_root
+from mhy_ai_rag_data.units_reader import UnitRef, scan_fields, write_units_index
 
 
 # We treat 'md' specially (needs refs extraction), so don't include it here.
@@ -29,6 +34,21 @@ TEXT_TYPES = {"txt", "code", "other", "html"}
 IMAGE_TYPES = {"image"}
 VIDEO_TYPES = {"video"}
 
+# Unit key order per kind (json.dumps keeps insertion order; incremental reuse relies on it).
+UNIT_KEYS = ("doc_id", "source_uri", "source_type", "locator", "text", "content_sha256", "updated_at", "note")
+MD_UNIT_KEYS = (
+    "doc_id",
+    "source_uri",
+    "source_type",
+    "locator",
+    "text",
+    "asset_refs",
+    "doc_refs",
+    "content_sha256",
+    "updated_at",
+    "note",
+)
+
 
 def _read_text(path: Path) -> str:
     return path.read_text(encoding="utf-8", errors="ignore")
@@ -74,11 +94,223 @@ def _normalize_source_type(row_source_type: str, source_uri: str) -> str:
     return st or "other"
 
 
+def build_unit(row: Dict[str, str], project_root: Path) -> Optional[Dict[str, Any]]:
+    """Build the text unit for one inventory row (None when the row lacks doc_id/source_uri)."""
+    doc_id = (row.get("doc_id") or "").strip()
+    source_uri = (row.get("source_uri") or "").strip()
+    if not doc_id or not source_uri:
+        return None
+
+    source_type = _normalize_source_type(row.get("source_type", ""), source_uri)
+    note = row.get("note", "")
+    content_sha256 = row.get("content_sha256", "")
+    updated_at = row.get("updated_at", "")
+
+    path = (project_root / source_uri).resolve()
+
+    # 0) Markdown (special): extract refs via markdown-it-py
+    if source_type == "md":
+        text = _read_text(path)
+        asset_refs, doc_refs = extract_refs_from_md(
+            md_path=path,
+            md_text=text,
+            project_root=project_root,
+            preset="commonmark",
+        )
+        return {
+            "doc_id": doc_id,
+            "source_uri": source_uri,
+            "source_type": "md",
+            "locator": f"file:{source_uri}",
+            "text": text,
+            "asset_refs": asset_refs,
+            "doc_refs": doc_refs,
+            "content_sha256": content_sha256,
+            "updated_at": updated_at,
+            "note": note,
+        }
+
+    # 1) Other text types (txt/code/html/other)
+    if source_type in TEXT_TYPES:
+        text = _read_text(path)
+        return {
+            "doc_id": doc_id,
+            "source_uri": source_uri,
+            "source_type": source_type,
+            "locator": f"file:{source_uri}",
+            "text": text,
+            "content_sha256": content_sha256,
+            "updated_at": updated_at,
+            "note": note,
+        }
+
+    # 2) Images
+    if source_type in IMAGE_TYPES:
+        sidecar = _find_sidecar_text(path)
+        if sidecar:
+            loc_suffix, extra_text = sidecar
+            text = f"[IMAGE]\nfilename={path.name}\npath={source_uri}\n{extra_text}"
+            locator = f"file:{source_uri};{loc_suffix}"
+        else:
+            text = f"[IMAGE]\nfilename={path.name}\npath={source_uri}\ncaption=TODO"
+            locator = f"file:{source_uri}"
+
+        return {
+            "doc_id": doc_id,
+            "source_uri": source_uri,
+            "source_type": "image",
+            "locator": locator,
+            "text": text,
+            "content_sha256": content_sha256,
+            "updated_at": updated_at,
+            "note": note,
+        }
+
+    # 3) Videos
+    if source_type in VIDEO_TYPES:
+        sidecar = _find_sidecar_text(path)
+        if sidecar:
+            loc_suffix, extra_text = sidecar
+            text = f"[VIDEO]\nfilename={path.name}\npath={source_uri}\n{extra_text}"
+            locator = f"file:{source_uri};{loc_suffix}"
+        else:
+            text = f"[VIDEO]\nfilename={path.name}\npath={source_uri}\ntranscript=TODO"
+            locator = f"file:{source_uri}"
+
+        return {
+            "doc_id": doc_id,
+            "source_uri": source_uri,
+            "source_type": "video",
+            "locator": locator,
+            "text": text,
+            "content_sha256": content_sha256,
+            "updated_at": updated_at,
+            "note": note,
+        }
+
+    # 4) Fallback for unknown binary types
+    text = f"[BINARY]\nfilename={path.name}\npath={source_uri}\nkind={source_type}"
+    return {
+        "doc_id": doc_id,
+        "source_uri": source_uri,
+        "source_type": source_type,
+        "locator": f"file:{source_uri}",
+        "text": text,
+        "content_sha256": content_sha256,
+        "updated_at": updated_at,
+        "note": note,
+    }
+
+
+def _unit_line(unit: Dict[str, Any]) -> str:
+    return json.dumps(unit, ensure_ascii=False) + "\n"
+
+
+def build_unit_line(row: Dict[str, str], project_root: Path) -> Optional[str]:
+    """build_unit() + JSONL serialization (top-level so it can run in a worker process)."""
+    unit = build_unit(row, project_root)
+    return _unit_line(unit) if unit is not None else None
+
+
+def iter_unit_lines(rows: List[Dict[str, str]], project_root: Path, jobs: int) -> Generator[Optional[str], None, None]:
+    """Yield build_unit_line() for each row, in input order.
+
+    jobs<=1 runs serially; otherwise a process pool parses files in parallel (markdown parsing and
+    ref resolution are CPU-bound) while Executor.map keeps results in submission order.
+    """
+    if jobs <= 1 or len(rows) <= 1:
+        for row in rows:
+            yield build_unit_line(row, project_root)
+        return
+    chunksize = max(1, len(rows) // (jobs * 8))
+    with ProcessPoolExecutor(max_workers=jobs) as ex:
+        yield from ex.map(build_unit_line, rows, repeat(project_root), chunksize=chunksize)
+
+
+# ---- incremental mode ----
+# A previous unit line is copied verbatim when everything it was built from is unchanged:
+# the inventory row fields plus the file content (content_sha256). Image/video units also
+# embed sidecar caption/transcript files that are not covered by their own sha, so they are
+# always rebuilt (cheap: no markdown parsing).
+_PrevKey = Tuple[str, ...]
+
+
+def _reuse_key(unit: Dict[str, Any]) -> _PrevKey:
+    return (
+        str(unit.get("doc_id", "")),
+        str(unit.get("source_uri", "")),
+        str(unit.get("source_type", "")),
+        str(unit.get("locator", "")),
+        str(unit.get("content_sha256", "")),
+        str(unit.get("updated_at", "")),
+        str(unit.get("note", "")),
+        ",".join(unit.keys()),
+    )
+
+
+def expected_reuse_key(row: Dict[str, str]) -> Optional[_PrevKey]:
+    """Reuse key a full run would produce for `row` (None: row skipped or unit not reusable)."""
+    doc_id = (row.get("doc_id") or "").strip()
+    source_uri = (row.get("source_uri") or "").strip()
+    if not doc_id or not source_uri:
+        return None
+    source_type = _normalize_source_type(row.get("source_type", ""), source_uri)
+    if source_type in IMAGE_TYPES or source_type in VIDEO_TYPES:
+        return None
+    keys = MD_UNIT_KEYS if source_type == "md" else UNIT_KEYS
+    return (
+        doc_id,
+        source_uri,
+        source_type,
+        f"file:{source_uri}",
+        row.get("content_sha256", ""),
+        row.get("updated_at", ""),
+        row.get("note", ""),
+        ",".join(keys),
+    )
+
+
+def index_previous_units(path: Path) -> Dict[str, Tuple[int, int, _PrevKey]]:
+    """source_uri -> (byte offset, byte length, reuse key) for each complete line of a previous units file."""
+    out: Dict[str, Tuple[int, int, _PrevKey]] = {}
+    if not path.exists():
+        return out
+    with path.open("rb") as f:
+        offset = 0
+        for raw in f:
+            n = len(raw)
+            try:
+                if raw.endswith(b"\n"):
+                    unit = json.loads(raw)
+                    if isinstance(unit, dict):
+                        out.setdefault(str(unit.get("source_uri", "")), (offset, n, _reuse_key(unit)))
+            except (ValueError, UnicodeDecodeError):
+                pass
+            offset += n
+    return out
+
+
+def _truthy(s: str) -> bool:
+    return str(s).strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
 def main() -> None:
     ap = argparse.ArgumentParser(description="Read inventory.csv and produce data_processed/text_units.jsonl")
     ap.add_argument("--root", default=None, help="Project root. Default: auto-detect from cwd")
     ap.add_argument("--inventory", default="inventory.csv", help="Inventory CSV path relative to root")
     ap.add_argument("--out", default="data_processed/text_units.jsonl", help="Output JSONL path relative to root")
+    ap.add_argument(
+        "--incremental",
+        default="true",
+        help="true/false: copy unit lines of unchanged inventory rows (same content_sha256/updated_at/note) "
+        "from the previous output instead of re-reading and re-parsing them",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes for reading/parsing new or changed files (1 = serial); output order is unchanged",
+    )
     args = ap.parse_args()
 
     project_root = find_project_root(args.root)
@@ -90,130 +322,56 @@ def main() -> None:
         print(f"[FAIL] missing inventory: {inv}", file=sys.stderr)
         raise SystemExit(2)
 
-    n = 0
-    with inv.open("r", encoding="utf-8", newline="") as f_in, out.open("w", encoding="utf-8") as f_out:
-        reader = csv.DictReader(f_in)
-        for row in reader:
-            doc_id = (row.get("doc_id") or "").strip()
-            source_uri = (row.get("source_uri") or "").strip()
-            if not doc_id or not source_uri:
-                continue
-
-            source_type = _normalize_source_type(row.get("source_type", ""), source_uri)
-            note = row.get("note", "")
-            content_sha256 = row.get("content_sha256", "")
-            updated_at = row.get("updated_at", "")
-
-            path = (project_root / source_uri).resolve()
-
-            # 0) Markdown (special): extract refs via markdown-it-py
-            if source_type == "md":
-                text = _read_text(path)
-                asset_refs, doc_refs = extract_refs_from_md(
-                    md_path=path,
-                    md_text=text,
-                    project_root=project_root,
-                    preset="commonmark",
-                )
-                unit = {
-                    "doc_id": doc_id,
-                    "source_uri": source_uri,
-                    "source_type": "md",
-                    "locator": f"file:{source_uri}",
-                    "text": text,
-                    "asset_refs": asset_refs,
-                    "doc_refs": doc_refs,
-                    "content_sha256": content_sha256,
-                    "updated_at": updated_at,
-                    "note": note,
-                }
-                f_out.write(json.dumps(unit, ensure_ascii=False) + "\n")
-                n += 1
-                continue
+    prev_index = index_previous_units(out) if _truthy(args.incremental) else {}
 
-            # 1) Other text types (txt/code/html/other)
-            if source_type in TEXT_TYPES:
-                text = _read_text(path)
-                unit = {
-                    "doc_id": doc_id,
-                    "source_uri": source_uri,
-                    "source_type": source_type,
-                    "locator": f"file:{source_uri}",
-                    "text": text,
-                    "content_sha256": content_sha256,
-                    "updated_at": updated_at,
-                    "note": note,
-                }
-                f_out.write(json.dumps(unit, ensure_ascii=False) + "\n")
-                n += 1
-                continue
-
-            # 2) Images
-            if source_type in IMAGE_TYPES:
-                sidecar = _find_sidecar_text(path)
-                if sidecar:
-                    loc_suffix, extra_text = sidecar
-                    text = f"[IMAGE]\nfilename={path.name}\npath={source_uri}\n{extra_text}"
-                    locator = f"file:{source_uri};{loc_suffix}"
-                else:
-                    text = f"[IMAGE]\nfilename={path.name}\npath={source_uri}\ncaption=TODO"
-                    locator = f"file:{source_uri}"
-
-                unit = {
-                    "doc_id": doc_id,
-                    "source_uri": source_uri,
-                    "source_type": "image",
-                    "locator": locator,
-                    "text": text,
-                    "content_sha256": content_sha256,
-                    "updated_at": updated_at,
-                    "note": note,
-                }
-                f_out.write(json.dumps(unit, ensure_ascii=False) + "\n")
-                n += 1
-                continue
+    # Plan in inventory order: each row is either a reused previous line or a row to (re)build.
+    plan: List[Tuple[Optional[Tuple[int, int, _PrevKey]], Dict[str, str]]] = []
+    with inv.open("r", encoding="utf-8", newline="") as f_in:
+        for row in csv.DictReader(f_in):
+            key = expected_reuse_key(row) if prev_index else None
+            prev = prev_index.get(key[1]) if key is not None else None
+            plan.append((prev if prev is not None and prev[2] == key else None, row))
+    to_build = [row for prev, row in plan if prev is None]
 
-            # 3) Videos
-            if source_type in VIDEO_TYPES:
-                sidecar = _find_sidecar_text(path)
-                if sidecar:
-                    loc_suffix, extra_text = sidecar
-                    text = f"[VIDEO]\nfilename={path.name}\npath={source_uri}\n{extra_text}"
-                    locator = f"file:{source_uri};{loc_suffix}"
-                else:
-                    text = f"[VIDEO]\nfilename={path.name}\npath={source_uri}\ntranscript=TODO"
-                    locator = f"file:{source_uri}"
-
-                unit = {
-                    "doc_id": doc_id,
-                    "source_uri": source_uri,
-                    "source_type": "video",
-                    "locator": locator,
-                    "text": text,
-                    "content_sha256": content_sha256,
-                    "updated_at": updated_at,
-                    "note": note,
-                }
-                f_out.write(json.dumps(unit, ensure_ascii=False) + "\n")
-                n += 1
-                continue
-
-            # 4) Fallback for unknown binary types
-            text = f"[BINARY]\nfilename={path.name}\npath={source_uri}\nkind={source_type}"
-            unit = {
-                "doc_id": doc_id,
-                "source_uri": source_uri,
-                "source_type": source_type,
-                "locator": f"file:{source_uri}",
-                "text": text,
-                "content_sha256": content_sha256,
-                "updated_at": updated_at,
-                "note": note,
-            }
-            f_out.write(json.dumps(unit, ensure_ascii=False) + "\n")
+    # Write next to the old file and swap at the end: reused lines are read from the old file.
+    # Bytes are written as-is so each line's (offset, length) lands in the sidecar index.
+    tmp = out.with_name(out.name + ".tmp")
+    n = 0
+    n_reused = 0
+    offset = 0
+    refs: List[UnitRef] = []
+    built = iter_unit_lines(to_build, project_root, int(args.jobs))
+    with (
+        tmp.open("wb") as f_out,
+        out.open("rb") if prev_index else open(os.devnull, "rb") as f_prev,
+    ):
+        for prev, row in plan:
+            if prev is not None:
+                f_prev.seek(prev[0])
+                raw = f_prev.read(prev[1]).rstrip(b"\r\n") + b"\n"
+                key = prev[2]
+                head = {"doc_id": key[0], "source_uri": key[1], "source_type": key[2]}
+                head.update(content_sha256=key[4], updated_at=key[5])
+                n_reused += 1
+            else:
+                line = next(built)
+                if line is None:
+                    continue
+                raw = line.encode("utf-8")
+                head = scan_fields(raw)
+            f_out.write(raw)
+            refs.append(UnitRef(offset, len(raw), head))
+            offset += len(raw)
             n += 1
-
-    print(f"Wrote {n} units to {out}")
+    built.close()  # shuts the worker pool down
+
+    os.replace(tmp, out)
+    try:
+        write_units_index(out, refs)
+    except OSError as e:
+        # Readers detect a stale/missing index by size+mtime and fall back to scanning the JSONL.
+        print(f"[WARN] units index not written: {e}", file=sys.stderr)
+    print(f"Wrote {n} units to {out} (reused={n_reused}, extracted={n - n_reused})")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""mhy_ai_rag_data.hybrid_retriever
+
+Hybrid 检索（dense + BM25 + RRF）的库级 API：retriever_chroma / answer_cli / run_eval_rag 共用，
+保证“评估的口径 == 线上服务的口径”（融合逻辑与 run_eval_retrieval 相同）。
+
+设计
+- HybridRetriever 持有已打开的 Chroma collection 与 KeywordIndex（keyword_index.sqlite），进程内复用，
+  不再每次调用重建关键词索引。
+- 一次 retrieve：keyword 腿在后台线程查询 SQLite，dense 腿（query embedding + collection.query）在调用线程执行，
+  两腿并发；随后 RRF 融合，仅对“只被 keyword 腿召回”的 id 追加一次 collection.get 取回文本与 metadata。
+- retrieve_many：N 个 query 一次 embed（embed_many）、一次 collection.query（query_embeddings 为 N 行矩阵）、
+  至多一次 collection.get；retrieve 即单元素的 retrieve_many。
+- 池大小：dense_pool_k / keyword_pool_k（0 表示等于 k），rrf_k 为 RRF 常数。
+- where（metadata 过滤）只作用于 dense 腿；传入 where 时本次调用退化为 dense-only（关键词索引不存 metadata）。
+- 默认 dense 的检索器可带 keyword_index_loader：持久化关键词索引推迟到第一次 mode="hybrid" 调用才打开，
+  纯 dense 的进程不付 collection.count() 与 terms 表加载的代价。
+
+线程安全
+- retrieve() 可被多个线程并发调用（KeywordIndex 内部加锁；embed 回调需自行保证可重入）。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from mhy_ai_rag_data.keyword_index import (
+    DEFAULT_META_FIELD,
+    KeywordIndex,
+    extract_source,
+    open_keyword_index_for_collection,
+)
+
+RETRIEVAL_MODES = ("hybrid", "dense")
+
+KeywordIndexLoader = Callable[[], Tuple[Optional[KeywordIndex], Dict[str, Any]]]
+
+
+@dataclass
+class RetrievedChunk:
+    id: str
+    rank: int
+    text: str
+    metadata: Dict[str, Any]
+    source: str
+    distance: Optional[float] = None
+    keyword_score: Optional[float] = None
+    fusion_score: Optional[float] = None
+    dense_rank: Optional[int] = None
+    keyword_rank: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Report-friendly view (no text/metadata)."""
+        out: Dict[str, Any] = {"rank": self.rank, "id": self.id, "source": self.source, "distance": self.distance}
+        if self.fusion_score is not None:
+            out.update(
+                {
+                    "fusion_score": self.fusion_score,
+                    "keyword_score": self.keyword_score,
+                    "dense_rank": self.dense_rank,
+                    "keyword_rank": self.keyword_rank,
+                }
+            )
+        return out
+
+
+@dataclass
+class RetrievalResult:
+    hits: List[RetrievedChunk]
+    mode: str
+    dense: List[Dict[str, Any]] = field(default_factory=list)
+    keyword: List[Dict[str, Any]] = field(default_factory=list)
+    # Ranked dicts as produced by rrf_fuse (hybrid) or the dense list truncated to k (dense).
+    fused: List[Dict[str, Any]] = field(default_factory=list)
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+
+def rrf_fuse(
+    *,
+    dense: List[Dict[str, Any]],
+    keyword: List[Dict[str, Any]],
+    topk: int,
+    rrf_k: int = 60,
+) -> List[Dict[str, Any]]:
+    """Reciprocal Rank Fusion of dense and keyword candidate lists (ranked dicts with "id")."""
+    scores: Dict[str, float] = {}
+    dense_rank: Dict[str, int] = {}
+    keyword_rank: Dict[str, int] = {}
+
+    for it in dense:
+        cid = str(it.get("id") or "")
+        if not cid:
+            continue
+        r = int(it.get("rank") or 0) or (len(dense_rank) + 1)
+        dense_rank[cid] = r
+        scores[cid] = scores.get(cid, 0.0) + (1.0 / float(rrf_k + r))
+
+    for it in keyword:
+        cid = str(it.get("id") or "")
+        if not cid:
+            continue
+        r = int(it.get("rank") or 0) or (len(keyword_rank) + 1)
+        keyword_rank[cid] = r
+        scores[cid] = scores.get(cid, 0.0) + (1.0 / float(rrf_k + r))
+
+    # Materialize candidates.
+    dense_by_id = {str(it.get("id")): it for it in dense if it.get("id")}
+    keyword_by_id = {str(it.get("id")): it for it in keyword if it.get("id")}
+
+    fused: List[Dict[str, Any]] = []
+    for cid, sc in scores.items():
+        base: Dict[str, Any] = {"id": cid, "fusion_score": float(sc)}
+        if cid in dense_by_id:
+            base["distance"] = dense_by_id[cid].get("distance")
+            base["source"] = dense_by_id[cid].get("source")
+        if cid in keyword_by_id:
+            base["keyword_score"] = keyword_by_id[cid].get("keyword_score")
+            if not base.get("source"):
+                base["source"] = keyword_by_id[cid].get("source")
+        base["dense_rank"] = dense_rank.get(cid)
+        base["keyword_rank"] = keyword_rank.get(cid)
+        fused.append(base)
+
+    # Stable: fusion_score desc, then best rank asc, then id.
+    def _best_rank(x: Dict[str, Any]) -> int:
+        dr = x.get("dense_rank")
+        kr = x.get("keyword_rank")
+        ranks = [r for r in [dr, kr] if isinstance(r, int) and r > 0]
+        return min(ranks) if ranks else 10**9
+
+    fused.sort(key=lambda x: (-float(x.get("fusion_score") or 0.0), _best_rank(x), str(x.get("id") or "")))
+    out: List[Dict[str, Any]] = []
+    for r, it in enumerate(fused[: max(0, int(topk))], start=1):
+        it2 = dict(it)
+        it2["rank"] = r
+        out.append(it2)
+    return out
+
+
+class HybridRetriever:
+    """Warm dense + keyword retriever over one Chroma collection."""
+
+    def __init__(
+        self,
+        *,
+        collection: Any,
+        embed: Callable[[str], Sequence[float]],
+        embed_many: Optional[Callable[[List[str]], Sequence[Sequence[float]]]] = None,
+        keyword_index: Optional[KeywordIndex] = None,
+        mode: str = "hybrid",
+        dense_pool_k: int = 0,
+        keyword_pool_k: int = 0,
+        rrf_k: int = 60,
+        meta_field: str = DEFAULT_META_FIELD,
+        keyword_index_loader: Optional[KeywordIndexLoader] = None,
+    ) -> None:
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"unknown retrieval mode: {mode!r} (expected one of {RETRIEVAL_MODES})")
+        if mode == "hybrid" and keyword_index is None:
+            raise ValueError("hybrid retrieval requires a keyword index")
+        self.collection = collection
+        self.embed = embed
+        self.embed_many = embed_many
+        self.keyword_index = keyword_index
+        self.mode = mode
+        self.dense_pool_k = int(dense_pool_k)
+        self.keyword_pool_k = int(keyword_pool_k)
+        self.rrf_k = int(rrf_k)
+        self.meta_field = str(meta_field)
+        self.keyword_index_info: Dict[str, Any] = {}
+        self._kw_pool: Optional[ThreadPoolExecutor] = None
+        self._kw_loader = keyword_index_loader if keyword_index is None else None
+        self._kw_lock = threading.Lock()
+        if keyword_index is not None:
+            self._kw_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="keyword-leg")
+
+    def _load_keyword_index(self) -> None:
+        """Run the deferred keyword_index_loader once; if it finds no index the retriever stays dense-only."""
+        with self._kw_lock:
+            loader, self._kw_loader = self._kw_loader, None
+            if loader is None:
+                return
+            kw, info = loader()
+            self.keyword_index_info = info
+            if kw is not None:
+                self.keyword_index = kw
+                self._kw_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="keyword-leg")
+
+    def _keyword_leg(self, queries: List[str], topk: int) -> tuple[List[List[Dict[str, Any]]], float]:
+        t0 = time.perf_counter()
+        kw = self.keyword_index
+        hits = [kw.search(q, topk) if kw is not None else [] for q in queries]
+        return hits, (time.perf_counter() - t0) * 1000.0
+
+    def _embed_many(self, queries: List[str]) -> List[Sequence[float]]:
+        if self.embed_many is not None:
+            return list(self.embed_many(queries))
+        return [self.embed(q) for q in queries]
+
+    def retrieve(
+        self,
+        query: str,
+        k: int,
+        *,
+        where: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+        with_text: bool = True,
+    ) -> RetrievalResult:
+        """Top-k chunks for query; mode overrides the retriever default for this call ("dense" forces dense-only)."""
+        return self.retrieve_many([query], k, where=where, mode=mode, with_text=with_text)[0]
+
+    def retrieve_many(
+        self,
+        queries: Sequence[str],
+        k: int,
+        *,
+        where: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+        with_text: bool = True,
+    ) -> List[RetrievalResult]:
+        """Batched retrieve: one embed call and one collection.query for all queries (results in input order).
+
+        with_text=False skips documents (dense include and the keyword-only collection.get); hits then carry
+        metadata/source but empty text. timings_ms are per batch (batch_size records how many queries shared them).
+        """
+        k = int(k)
+        qs = [str(q) for q in queries]
+        if not qs:
+            return []
+        use_mode = str(mode or self.mode)
+        if use_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"unknown retrieval mode: {use_mode!r}")
+        if use_mode == "hybrid" and not where and self._kw_loader is not None:
+            self._load_keyword_index()
+        if use_mode == "hybrid" and (where or self._kw_pool is None):
+            use_mode = "dense"
+        dense_k = self.dense_pool_k if self.dense_pool_k > 0 else k
+        keyword_k = self.keyword_pool_k if self.keyword_pool_k > 0 else k
+
+        t0 = time.perf_counter()
+        kw_future = (
+            self._kw_pool.submit(self._keyword_leg, qs, keyword_k)
+            if use_mode == "hybrid" and self._kw_pool is not None
+            else None
+        )
+
+        qvecs = self._embed_many(qs)
+        t_embed = time.perf_counter()
+        include = ["documents", "metadatas", "distances"] if with_text else ["metadatas", "distances"]
+        query_kwargs: Dict[str, Any] = {"query_embeddings": qvecs, "n_results": dense_k, "include": include}
+        if where:
+            query_kwargs["where"] = where
+        res = self.collection.query(**query_kwargs)
+        t_dense = time.perf_counter()
+
+        all_ids = res.get("ids") or []
+        all_docs = res.get("documents") or []
+        all_metas = res.get("metadatas") or []
+        all_dists = res.get("distances") or []
+        payload: Dict[str, tuple[str, Dict[str, Any]]] = {}
+        dense_lists: List[List[Dict[str, Any]]] = []
+        for qi in range(len(qs)):
+            ids = [str(x) for x in (all_ids[qi] if qi < len(all_ids) else [])]
+            docs = list(all_docs[qi] or []) if qi < len(all_docs) else []
+            metas = list(all_metas[qi] or []) if qi < len(all_metas) else []
+            dists = list(all_dists[qi] or []) if qi < len(all_dists) else []
+            dense: List[Dict[str, Any]] = []
+            for i, cid in enumerate(ids):
+                meta = dict(metas[i] or {}) if i < len(metas) else {}
+                payload[cid] = (str(docs[i] or "") if i < len(docs) else "", meta)
+                dense.append(
+                    {
+                        "rank": i + 1,
+                        "id": cid,
+                        "source": extract_source(meta, self.meta_field),
+                        "distance": dists[i] if i < len(dists) else None,
+                    }
+                )
+            dense_lists.append(dense)
+
+        timings: Dict[str, float] = {
+            "batch_size": len(qs),
+            "embed_ms": round((t_embed - t0) * 1000.0, 3),
+            "dense_ms": round((t_dense - t0) * 1000.0, 3),
+        }
+        keyword_lists: List[List[Dict[str, Any]]] = [[] for _ in qs]
+        fused_lists: List[List[Dict[str, Any]]]
+        if kw_future is not None:
+            keyword_lists, kw_ms = kw_future.result()
+            timings["keyword_ms"] = round(kw_ms, 3)
+            fused_lists = [
+                rrf_fuse(dense=d, keyword=kwl, topk=k, rrf_k=self.rrf_k) for d, kwl in zip(dense_lists, keyword_lists)
+            ]
+            missing = sorted({str(it["id"]) for fl in fused_lists for it in fl if str(it["id"]) not in payload})
+            if missing:
+                got = self.collection.get(
+                    ids=missing, include=["documents", "metadatas"] if with_text else ["metadatas"]
+                )
+                g_ids = [str(x) for x in (got.get("ids") or [])]
+                g_docs = list(got.get("documents") or [])
+                g_metas = list(got.get("metadatas") or [])
+                for i, cid in enumerate(g_ids):
+                    meta = dict(g_metas[i] or {}) if i < len(g_metas) else {}
+                    payload[cid] = (str(g_docs[i] or "") if i < len(g_docs) else "", meta)
+        else:
+            fused_lists = [d[:k] for d in dense_lists]
+        timings["total_ms"] = round((time.perf_counter() - t0) * 1000.0, 3)
+
+        out: List[RetrievalResult] = []
+        for dense, keyword, fused in zip(dense_lists, keyword_lists, fused_lists):
+            hits: List[RetrievedChunk] = []
+            for it in fused:
+                cid = str(it["id"])
+                text, meta = payload.get(cid, ("", {}))
+                hits.append(
+                    RetrievedChunk(
+                        id=cid,
+                        rank=int(it["rank"]),
+                        text=text,
+                        metadata=meta,
+                        source=str(it.get("source") or extract_source(meta, self.meta_field)),
+                        distance=it.get("distance"),
+                        keyword_score=it.get("keyword_score"),
+                        fusion_score=it.get("fusion_score"),
+                        dense_rank=it.get("dense_rank"),
+                        keyword_rank=it.get("keyword_rank"),
+                    )
+                )
+            out.append(
+                RetrievalResult(
+                    hits=hits, mode=use_mode, dense=dense, keyword=keyword, fused=fused, timings_ms=dict(timings)
+                )
+            )
+        return out
+
+    def close(self) -> None:
+        self._kw_loader = None
+        if self._kw_pool is not None:
+            self._kw_pool.shutdown(wait=True)
+            self._kw_pool = None
+        if self.keyword_index is not None:
+            self.keyword_index.close()
+            self.keyword_index = None
+
+
+def open_hybrid_retriever(
+    *,
+    collection: Any,
+    collection_name: str,
+    embed: Callable[[str], Sequence[float]],
+    state_root: Path,
+    embed_many: Optional[Callable[[List[str]], Sequence[Sequence[float]]]] = None,
+    mode: str = "hybrid",
+    keyword_index: str = "auto",
+    dense_pool_k: int = 0,
+    keyword_pool_k: int = 0,
+    rrf_k: int = 60,
+    meta_field: str = DEFAULT_META_FIELD,
+) -> HybridRetriever:
+    """Build a retriever over an opened collection; in hybrid mode the persisted keyword index is opened
+    (or, unless keyword_index="persisted", rebuilt from the collection; see open_keyword_index_for_collection)
+    once, here. keyword_index="persisted" never builds, so a dense-default retriever gets it as a deferred
+    loader instead: the index is opened on the first call that asks for mode="hybrid".
+
+    Raises ValueError when hybrid is requested but no keyword index is available: the collection stores no
+    documents, or keyword_index="persisted" and the persisted index is missing, dirty or stale.
+    """
+
+    def open_keyword_index() -> Tuple[Optional[KeywordIndex], Dict[str, Any]]:
+        kw, info = open_keyword_index_for_collection(
+            mode=keyword_index,
+            col=collection,
+            state_root=state_root,
+            collection=collection_name,
+            meta_field=meta_field,
+        )
+        if kw is not None:
+            info.update({"n_docs": kw.n_chunks, "avgdl": kw.avgdl})
+        return kw, info
+
+    kw: Optional[KeywordIndex] = None
+    info: Dict[str, Any] = {}
+    if mode == "hybrid":
+        kw, info = open_keyword_index()
+        if kw is None and keyword_index == "persisted":
+            raise ValueError(
+                f"hybrid retrieval requires an up-to-date persisted keyword index (path={info.get('path') or '-'} "
+                f"stale={info.get('stale')}); build the collection with --keyword-index true"
+            )
+        if kw is None:
+            raise ValueError("hybrid retrieval requires Chroma documents (collection has no documents)")
+    retriever = HybridRetriever(
+        collection=collection,
+        embed=embed,
+        embed_many=embed_many,
+        keyword_index=kw,
+        mode=mode,
+        dense_pool_k=dense_pool_k,
+        keyword_pool_k=keyword_pool_k,
+        rrf_k=rrf_k,
+        meta_field=meta_field,
+        keyword_index_loader=open_keyword_index if mode != "hybrid" and keyword_index == "persisted" else None,
+    )
+    retriever.keyword_index_info = info
+    return retriever
@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""mhy_ai_rag_data.keyword_index
+
+持久化 BM25 倒排索引（SQLite，标准库实现），供 hybrid 检索的 keyword 腿使用。
+
+用途
+- 取代 run_eval_retrieval 每次运行都从 Chroma 全量 dump 重建、并对每个 query 线性扫描全部文档的做法。
+- 查询时只遍历 query 词项的 postings（在 SQLite 内聚合打分），复杂度与命中 postings 数相关，而不是 N_docs × N_queries。
+
+落盘位置
+- data_processed/index_state/<collection>/<schema_hash>/keyword_index.sqlite（与 index_state.json 同目录）
+
+表结构
+- chunks(ord, chunk_id, source, dl)      ：每个 Chroma chunk 一行；ord 为插入序（打分并列时的稳定次序）
+- terms(tid, term, df)                   ：词表与文档频率
+- postings(tid, ord, tf)                 ：倒排表（主键 (tid, ord)，另有 ord 索引用于删除）
+- meta(key, value)                       ：version / tokenizer / meta_field / dirty
+- 文件库使用 journal_mode=WAL + synchronous=NORMAL：逐文档 commit 不触发 fsync，读者（检索服务）不阻塞构建写入
+
+同步语义
+- build_chroma_index_flagembedding 在每次 upsert / delete 后镜像写入本索引，并在文档提交（DOC_COMMITTED）时 commit；
+  add() 对已存在的 chunk_id 先删后加（幂等），因此 resume 重放不会重复计数。
+- 构建期间 meta.dirty=1，构建成功且 n_chunks == collection.count() 后才置回 0；
+  中断（abort/崩溃）后未 commit 的写入随 SQLite 事务回滚，已 commit 的部分与 WAL 的 DOC_COMMITTED 对齐：
+  WAL resume 时沿用该 dirty 索引继续镜像；非 resume 的构建会删除它，run_eval_retrieval 则改用内存索引。
+- 打开时若 n_chunks 与 collection.count() 不一致，调用方应视为失效并重建（run_eval_retrieval 会从 Chroma dump 重建）。
+
+打分
+- BM25（k1=1.5, b=0.75, idf=log((N-df+0.5)/(df+0.5)+1)），与旧的 run_eval_retrieval._bm25_score 口径一致；
+  同分按 ord 升序。
+"""
+
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from mhy_ai_rag_data.tools.index_state import read_latest_pointer, state_dir_for
+
+KEYWORD_INDEX_VERSION = 1
+KEYWORD_INDEX_FILENAME = "keyword_index.sqlite"
+TOKENIZER_ID = "alnum+cjk-char/v1"
+DEFAULT_META_FIELD = "source_uri|source|path|file"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+|[\u4e00-\u9fff]", re.UNICODE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chunks (
+    ord INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    dl INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (tid INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE, df INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS postings (
+    tid INTEGER NOT NULL,
+    ord INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (tid, ord)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_by_ord ON postings(ord);
+"""
+
+_SEARCH_SQL = """
+WITH q(tid, idf) AS (SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?))
+SELECT p.ord, SUM(q.idf * (p.tf * (? + 1.0)) / (p.tf + ? * (1.0 - ? + ? * c.dl / ?))) AS score
+FROM q
+JOIN postings AS p ON p.tid = q.tid
+JOIN chunks AS c ON c.ord = p.ord
+GROUP BY p.ord
+ORDER BY score DESC, p.ord ASC
+LIMIT ?
+"""
+
+
+def tokenize(s: str) -> List[str]:
+    """Lowercased ASCII words/digits + single CJK characters (the BM25 vocabulary)."""
+    return _TOKEN_RE.findall((s or "").lower())
+
+
+def extract_source(meta: Mapping[str, Any], meta_field: str) -> str:
+    """First non-empty metadata field among "a|b|c" candidates."""
+    for key in [k.strip() for k in (meta_field or "").split("|") if k.strip()]:
+        if key in meta and meta[key]:
+            return str(meta[key])
+    return ""
+
+
+def keyword_index_path(state_dir: Path) -> Path:
+    return state_dir / KEYWORD_INDEX_FILENAME
+
+
+def drop_keyword_index(path: Path) -> None:
+    """Remove an index file (and SQLite side files); missing files are ignored."""
+    for p in (path, *(path.with_name(path.name + s) for s in ("-journal", "-wal", "-shm"))):
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _chunks(seq: Sequence[Any], n: int) -> Iterable[Sequence[Any]]:
+    for i in range(0, len(seq), n):
+        yield seq[i : i + n]
+
+
+class KeywordIndex:
+    """SQLite-backed BM25 inverted index over chunk texts.
+
+    path=":memory:" gives a throwaway in-process index with the same API.
+    Writes are buffered in a transaction until commit(); search() commits pending writes first.
+    """
+
+    def __init__(self, path: Path | str, *, meta_field: str = DEFAULT_META_FIELD) -> None:
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+        if self.path != ":memory:":
+            # The builder commits once per document: in WAL mode a commit under synchronous=NORMAL is an append
+            # without fsync (only checkpoints sync), instead of a journal create/fsync/delete per commit.
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        if not meta:
+            meta = {"version": str(KEYWORD_INDEX_VERSION), "tokenizer": TOKENIZER_ID, "meta_field": str(meta_field)}
+            self._db.executemany("INSERT INTO meta(key, value) VALUES (?, ?)", sorted(meta.items()))
+            self._db.commit()
+        self.meta: Dict[str, str] = meta
+        self._tids: Dict[str, int] = dict(self._db.execute("SELECT term, tid FROM terms").fetchall())
+        self._df_delta: Counter[int] = Counter()
+        self._totals: Optional[Tuple[int, int]] = None
+
+    # ---- properties ----
+    @property
+    def meta_field(self) -> str:
+        return self.meta.get("meta_field", DEFAULT_META_FIELD)
+
+    def is_compatible(self, *, meta_field: str) -> bool:
+        return (
+            self.meta.get("version") == str(KEYWORD_INDEX_VERSION)
+            and self.meta.get("tokenizer") == TOKENIZER_ID
+            and self.meta_field == str(meta_field)
+        )
+
+    @property
+    def dirty(self) -> bool:
+        """True while a builder run is mirroring writes (or was interrupted before finishing)."""
+        return self.meta.get("dirty", "0") == "1"
+
+    def set_dirty(self, dirty: bool) -> None:
+        with self._lock:
+            self.meta["dirty"] = "1" if dirty else "0"
+            self._db.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('dirty', ?)", (self.meta["dirty"],))
+            self.commit()
+
+    def _totals_now(self) -> Tuple[int, int]:
+        if self._totals is None:
+            n, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(dl), 0) FROM chunks").fetchone()
+            self._totals = (int(n), int(total))
+        return self._totals
+
+    @property
+    def n_chunks(self) -> int:
+        with self._lock:
+            return self._totals_now()[0]
+
+    @property
+    def avgdl(self) -> float:
+        with self._lock:
+            n, total = self._totals_now()
+            return float(total) / float(n) if n else 0.0
+
+    # ---- writes ----
+    def _tid(self, term: str) -> int:
+        tid = self._tids.get(term)
+        if tid is None:
+            cur = self._db.execute("INSERT INTO terms(term, df) VALUES (?, 0)", (term,))
+            tid = int(cur.lastrowid or 0)
+            self._tids[term] = tid
+        return tid
+
+    def add(self, ids: Sequence[str], texts: Sequence[str], sources: Sequence[str]) -> None:
+        """Index chunks (upsert semantics: an existing chunk_id is replaced)."""
+        with self._lock:
+            self.remove(ids)
+            for cid, text, src in zip(ids, texts, sources):
+                tf = Counter(tokenize(text))
+                dl = sum(tf.values())
+                cur = self._db.execute(
+                    "INSERT INTO chunks(chunk_id, source, dl) VALUES (?, ?, ?)", (str(cid), str(src or ""), dl)
+                )
+                ord_ = int(cur.lastrowid or 0)
+                rows = [(self._tid(t), ord_, n) for t, n in tf.items()]
+                self._db.executemany("INSERT INTO postings(tid, ord, tf) VALUES (?, ?, ?)", rows)
+                for tid, _, _ in rows:
+                    self._df_delta[tid] += 1
+            self._totals = None
+
+    def remove(self, ids: Sequence[str]) -> int:
+        """Drop chunks by id; unknown ids are ignored. Returns the number of chunks removed."""
+        with self._lock:
+            if not ids:
+                return 0
+            removed = 0
+            for part in _chunks(list(ids), 500):
+                marks = ",".join("?" * len(part))
+                ords = [
+                    int(r[0])
+                    for r in self._db.execute(
+                        f"SELECT ord FROM chunks WHERE chunk_id IN ({marks})", [str(x) for x in part]
+                    )
+                ]
+                for ord_ in ords:
+                    for (tid,) in self._db.execute("SELECT tid FROM postings WHERE ord = ?", (ord_,)):
+                        self._df_delta[int(tid)] -= 1
+                    self._db.execute("DELETE FROM postings WHERE ord = ?", (ord_,))
+                    self._db.execute("DELETE FROM chunks WHERE ord = ?", (ord_,))
+                removed += len(ords)
+            if removed:
+                self._totals = None
+            return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM chunks")
+            self._db.execute("DELETE FROM terms")
+            self._db.commit()
+            self._tids.clear()
+            self._df_delta.clear()
+            self._totals = None
+
+    def commit(self) -> None:
+        with self._lock:
+            if self._df_delta:
+                self._db.executemany(
+                    "UPDATE terms SET df = df + ? WHERE tid = ?", [(d, t) for t, d in self._df_delta.items() if d]
+                )
+                self._df_delta.clear()
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self.commit()
+            finally:
+                self._db.close()
+
+    # ---- reads ----
+    def search(self, query: str, topk: int) -> List[Dict[str, Any]]:
+        """BM25 top-k over the postings of the query terms: [{rank, id, source, keyword_score}]."""
+        import json
+        import math
+
+        with self._lock:
+            if self._df_delta:
+                self.commit()
+            n, total = self._totals_now()
+            terms = sorted(set(tokenize(query)))
+            if not terms or not n or total <= 0 or int(topk) <= 0:
+                return []
+            avgdl = float(total) / float(n)
+            q: List[Tuple[int, float]] = []
+            for part in _chunks(terms, 500):
+                marks = ",".join("?" * len(part))
+                for tid, df in self._db.execute(f"SELECT tid, df FROM terms WHERE term IN ({marks})", list(part)):
+                    idf = math.log(((n - int(df) + 0.5) / (int(df) + 0.5)) + 1.0)
+                    q.append((int(tid), idf))
+            if not q:
+                return []
+            scored = self._db.execute(
+                _SEARCH_SQL, (json.dumps(q), BM25_K1, BM25_K1, BM25_B, BM25_B, avgdl, int(topk))
+            ).fetchall()
+            if not scored:
+                return []
+            marks = ",".join("?" * len(scored))
+            meta = {
+                int(o): (str(cid), str(src))
+                for o, cid, src in self._db.execute(
+                    f"SELECT ord, chunk_id, source FROM chunks WHERE ord IN ({marks})", [int(o) for o, _ in scored]
+                )
+            }
+        out: List[Dict[str, Any]] = []
+        for rank, (o, s) in enumerate(scored, start=1):
+            cid, src = meta.get(int(o), ("", ""))
+            out.append({"rank": rank, "id": cid, "source": src, "keyword_score": float(s)})
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n, total = self._totals_now()
+            return {
+                "path": self.path.replace("\\", "/"),
+                "n_docs": int(n),
+                "avgdl": (float(total) / float(n)) if n else 0.0,
+                "n_terms": len(self._tids),
+                "meta_field": self.meta_field,
+                "tokenizer": self.meta.get("tokenizer", ""),
+            }
+
+
+def build_keyword_index(
+    path: Path | str,
+    *,
+    ids: Sequence[str],
+    texts: Sequence[str],
+    metas: Sequence[Mapping[str, Any]],
+    meta_field: str = DEFAULT_META_FIELD,
+    batch_size: int = 2000,
+) -> KeywordIndex:
+    """(Re)build an index from a full collection dump (replaces any existing file at path)."""
+    if str(path) != ":memory:":
+        drop_keyword_index(Path(path))
+    idx = KeywordIndex(path, meta_field=meta_field)
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        idx.add(
+            ids[start:end],
+            texts[start:end],
+            [extract_source(m or {}, meta_field) for m in metas[start:end]],
+        )
+    idx.commit()
+    return idx
+
+
+def open_keyword_index_for_sync(
+    path: Path,
+    *,
+    collection_count: int,
+    meta_field: str = DEFAULT_META_FIELD,
+    resume: bool = False,
+) -> Tuple[Optional[KeywordIndex], str]:
+    """Open the index a builder run will mirror its writes into.
+
+    Returns (index, status); status is one of:
+    - opened: clean index matching the collection
+    - resumed: dirty index left by the interrupted run that this run resumes from the WAL
+      (committed up to its last DOC_COMMITTED; the resumed run re-mirrors everything after it)
+    - created: no usable index and the collection is empty -> start a fresh one
+    - dropped: stale/dirty index removed, collection non-empty -> no mirroring this run
+      (run_eval_retrieval rebuilds it from the Chroma dump on demand)
+    - missing: no index and collection non-empty (same as dropped, nothing removed)
+    The returned index is marked dirty until the caller calls set_dirty(False).
+    """
+    status = "missing"
+    if path.exists():
+        idx = KeywordIndex(path, meta_field=meta_field)
+        if not idx.dirty and idx.is_compatible(meta_field=meta_field) and idx.n_chunks == int(collection_count):
+            idx.set_dirty(True)
+            return idx, "opened"
+        if resume and idx.dirty and idx.is_compatible(meta_field=meta_field):
+            return idx, "resumed"
+        idx.close()
+        drop_keyword_index(path)
+        status = "dropped"
+    if int(collection_count) != 0:
+        return None, status
+    idx = KeywordIndex(path, meta_field=meta_field)
+    idx.set_dirty(True)
+    return idx, "created"
+
+
+def load_collection_docs(
+    col: Any,
+    *,
+    include_documents: bool,
+    batch_size: int = 512,
+) -> Tuple[List[str], List[str], List[Mapping[str, Any]]]:
+    """Load all docs from a Chroma collection.
+
+    Why: keyword retrieval needs documents; Chroma `get()` is usually paginated.
+
+    Returns: (ids, documents, metadatas)
+    - If documents are not stored in the collection, documents may be an empty list.
+    """
+
+    include: List[str] = ["metadatas"]
+    if include_documents:
+        include.append("documents")
+
+    # Best effort paging (API differs across chromadb versions).
+    try:
+        n = int(col.count())
+    except Exception:
+        n = -1
+
+    ids: List[str] = []
+    docs: List[str] = []
+    metas: List[Mapping[str, Any]] = []
+
+    def _extend(res: Mapping[str, Any]) -> None:
+        _ids = res.get("ids") or []
+        _docs = res.get("documents") or []
+        _metas = res.get("metadatas") or []
+
+        # Some versions may return nested lists.
+        if _ids and isinstance(_ids, list) and _ids and isinstance(_ids[0], list):
+            _ids = _ids[0]
+        if _docs and isinstance(_docs, list) and _docs and isinstance(_docs[0], list):
+            _docs = _docs[0]
+        if _metas and isinstance(_metas, list) and _metas and isinstance(_metas[0], list):
+            _metas = _metas[0]
+
+        ids.extend([str(x) for x in (_ids or [])])
+        docs.extend([str(x or "") for x in (_docs or [])])
+        metas.extend([x if isinstance(x, dict) else {} for x in (_metas or [])])
+
+    # Fast path: try single get() call.
+    try:
+        res0 = col.get(include=include)
+        if isinstance(res0, dict) and res0.get("ids"):
+            _extend(res0)
+            # If it looks like a full dump, accept.
+            if n <= 0 or len(ids) >= n or (n > 0 and len(ids) == n):
+                return ids, docs, metas
+    except Exception:
+        pass
+
+    if n <= 0:
+        return ids, docs, metas
+
+    # Paged path.
+    ids.clear()
+    docs.clear()
+    metas.clear()
+    offset = 0
+    while offset < n:
+        lim = min(int(batch_size), n - offset)
+        try:
+            res = col.get(include=include, limit=lim, offset=offset)
+        except TypeError:
+            # Older API might not support offset/limit.
+            res = col.get(include=include)
+        if not isinstance(res, dict) or not res.get("ids"):
+            break
+        _extend(res)
+        offset += lim
+
+    return ids, docs, metas
+
+
+def open_keyword_index_for_collection(
+    *,
+    mode: str,
+    col: Any,
+    state_root: Path,
+    collection: str,
+    meta_field: str,
+) -> Tuple[Optional[KeywordIndex], Dict[str, Any]]:
+    """Open the persisted BM25 index for the collection, or (re)build it from a Chroma dump.
+
+    mode:
+    - auto: reuse data_processed/index_state/<collection>/<schema_hash>/keyword_index.sqlite when it
+      matches the collection (same chunk count, tokenizer, meta_field); otherwise rebuild and persist it.
+      A dirty index (build in progress / interrupted) is never touched: fall back to an in-memory build.
+    - rebuild: always rebuild from Chroma and persist.
+    - memory: build a throwaway in-memory index (never touches index_state).
+    - persisted: reuse the persisted index like auto, but never build one (serving path: the builder owns it).
+
+    Returns (None, info) when the collection stores no documents, or in persisted mode when there is no
+    clean index matching the collection (info["stale"] says why, if a file exists).
+    """
+
+    info: Dict[str, Any] = {"mode": mode, "source": "", "path": ""}
+    try:
+        n_col = int(col.count())
+    except Exception:
+        n_col = -1
+
+    path: Optional[Path] = None
+    if mode != "memory":
+        schema_hash = read_latest_pointer(state_root, collection)
+        if schema_hash:
+            path = keyword_index_path(state_dir_for(state_root, collection, schema_hash))
+            info["path"] = path.as_posix()
+
+    if path is not None and path.exists():
+        idx = KeywordIndex(path, meta_field=meta_field)
+        if idx.dirty:
+            # A build is mirroring into it right now (or was interrupted): leave the file to the builder.
+            info["stale"] = {"dirty": True}
+            path = None
+        elif (
+            mode in ("auto", "persisted")
+            and idx.is_compatible(meta_field=meta_field)
+            and n_col > 0
+            and idx.n_chunks == n_col
+        ):
+            info.update({"source": "persisted", "build_seconds": 0.0})
+            return idx, info
+        elif mode in ("auto", "persisted"):
+            info["stale"] = {"n_chunks": idx.n_chunks, "collection_count": n_col, "meta_field": idx.meta_field}
+        idx.close()
+    if mode == "persisted":
+        return None, info
+
+    t0 = time.time()
+    doc_ids, doc_texts, doc_metas = load_collection_docs(col, include_documents=True)
+    if not doc_texts:
+        return None, info
+    idx = build_keyword_index(
+        path if path is not None else ":memory:",
+        ids=doc_ids,
+        texts=doc_texts,
+        metas=doc_metas,
+        meta_field=meta_field,
+    )
+    info.update({"source": "rebuilt" if path is not None else "memory", "build_seconds": round(time.time() - t0, 3)})
+    return idx, info
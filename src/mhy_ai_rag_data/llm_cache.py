@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""mhy_ai_rag_data.llm_cache
+
+LLM 回答缓存（按内容寻址，SQLite，标准库实现），用于评测回放。
+
+用途
+- run_eval_rag / answer_cli（run_rag_eval_batch --answer 经由它）在检索上下文未变时，对同一请求不再重复调用 LLM；
+  只改了打分/报告逻辑的回归重跑从“小时级本地推理”降到秒级。
+
+键
+- sha256(规范化 JSON(payload))：payload 为实际发送的请求体（model / messages / temperature / max_tokens ...），
+  sort_keys + 紧凑分隔符 + ensure_ascii=False；stream / stream_options 只影响传输方式，不入键。
+- base_url 不入键：同一 model id 换端口/换机器仍命中；换模型请换 model id（或用 write 模式重录）。
+
+模式（--llm-cache）
+- off  ：不读不写（默认；评测测的是在线模型本身）
+- read ：命中则直接返回缓存回答、不发请求；未命中照常调用并写入，下次回放即命中
+- write：总是调用 LLM 并覆盖写入（刷新录制）
+
+只缓存成功的回答（错误不入库）。temperature>0 的请求同样缓存（键含 temperature），回放得到的是录制时那一次采样。
+
+落盘位置
+- data_processed/llm_cache/llm_cache.sqlite（rag_config.LLM_CACHE_PATH）
+
+表结构
+- responses(key, model, payload, content, meta, created_at)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional
+
+LLM_CACHE_MODES = ("off", "read", "write")
+
+# Transport-only request fields: the same answer whether it arrives as SSE chunks or one JSON body.
+_TRANSPORT_KEYS = frozenset({"stream", "stream_options"})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    content TEXT NOT NULL,
+    meta TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def payload_key(payload: Mapping[str, Any]) -> str:
+    """Content address of a chat request: sha256 of its canonical JSON minus transport-only fields."""
+    canon = json.dumps(
+        {k: v for k, v in payload.items() if k not in _TRANSPORT_KEYS},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite store of chat answers keyed by payload_key(); safe to share across threads.
+
+    mode="read" serves hits and records misses; mode="write" never serves, always records.
+    """
+
+    def __init__(self, path: Path | str, *, mode: str = "read") -> None:
+        if mode not in ("read", "write"):
+            raise ValueError(f"invalid llm cache mode={mode!r} (expected read/write)")
+        self.path = str(path)
+        self.mode = mode
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+
+    def get(self, payload: Mapping[str, Any]) -> Optional[str]:
+        """Cached answer for payload (read mode only); None on miss or in write mode."""
+        if self.mode != "read":
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT content FROM responses WHERE key = ?", (payload_key(payload),)).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return str(row[0])
+
+    def put(self, payload: Mapping[str, Any], content: str, meta: Optional[Mapping[str, Any]] = None) -> None:
+        """Record a successful answer (overwrites an existing entry for the same payload)."""
+        rec = {k: v for k, v in payload.items() if k not in _TRANSPORT_KEYS}
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses(key, model, payload, content, meta, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    payload_key(payload),
+                    str(rec.get("model") or ""),
+                    json.dumps(rec, ensure_ascii=False, sort_keys=True),
+                    str(content),
+                    json.dumps(dict(meta or {}), ensure_ascii=False, sort_keys=True),
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+            self._writes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            return {
+                "path": self.path.replace("\\", "/"),
+                "mode": self.mode,
+                "entries": int(entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "writes": self._writes,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def open_llm_cache(root: Path, mode: str, path_arg: str) -> Optional[LLMResponseCache]:
+    """CLI helper: None for mode "off", else a cache at root/path_arg (absolute path_arg is used as-is)."""
+    mode = (mode or "off").strip().lower()
+    if mode not in LLM_CACHE_MODES:
+        raise ValueError(f"invalid llm cache mode={mode!r} (expected {'/'.join(LLM_CACHE_MODES)})")
+    if mode == "off":
+        return None
+    return LLMResponseCache((root / path_arg).resolve(), mode=mode)
@@ -9,22 +9,37 @@
 关键改动（替代方案 B）：
 - 统一走 tools/llm_http_client.py，默认对回环地址禁用环境代理（trust_env=False），避免 127.0.0.1:7890 代理劫持。
 - timeout 拆分 connect/read：requests 支持 timeout=(connect, read)。
+- stream_llm：SSE 流式版本，边生成边回调（answer_cli 逐字输出），并返回 TTFT / tokens/s。
+- cache（llm_cache.LLMResponseCache，可选）：read 模式命中时不发请求；成功的回答写回缓存。
 
 """
 
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
+from mhy_ai_rag_data.llm_cache import LLMResponseCache
 from mhy_ai_rag_data.rag_config import LLM_BASE_URL, LLM_API_KEY, LLM_MODEL, LLM_MAX_TOKENS
 
 try:
     # answer_cli 在项目根目录运行时可用
-    from mhy_ai_rag_data.tools.llm_http_client import chat_completions, extract_chat_content, LLMHTTPError
+    from mhy_ai_rag_data.tools.llm_http_client import (
+        ChatStreamResult,
+        LLMHTTPError,
+        chat_completions,
+        extract_chat_content,
+        stream_chat_completions,
+    )
 except Exception:  # noqa: BLE001
     # 极端情况下（例如被复制到 tools 目录单独运行）兜底
-    from llm_http_client import chat_completions, extract_chat_content, LLMHTTPError  # type: ignore
+    from llm_http_client import (  # type: ignore
+        ChatStreamResult,
+        LLMHTTPError,
+        chat_completions,
+        extract_chat_content,
+        stream_chat_completions,
+    )
 
 
 @dataclass
@@ -35,6 +50,22 @@ class LLMError(Exception):
         return self.message
 
 
+def _request(
+    messages: List[Dict[str, str]], temperature: float, api_key: str, model: str, max_tokens: int
+) -> tuple[Dict[str, Any], Optional[Dict[str, str]]]:
+    headers: Optional[Dict[str, str]] = None
+    if api_key and api_key.upper() != "EMPTY":
+        headers = {"Authorization": f"Bearer {api_key}"}
+
+    payload: Dict[str, Any] = {
+        "model": model,
+        "messages": messages,
+        "temperature": float(temperature),
+        "max_tokens": int(max_tokens),
+    }
+    return payload, headers
+
+
 def call_llm(
     messages: List[Dict[str, str]],
     *,
@@ -46,30 +77,74 @@ def call_llm(
     connect_timeout: float = 10.0,
     read_timeout: float = 300.0,
     trust_env: str = "auto",
+    cache: Optional[LLMResponseCache] = None,
 ) -> str:
     """调用 OpenAI-compatible 的 /chat/completions 并返回文本内容。"""
-    headers: Optional[Dict[str, str]] = None
-    if api_key and api_key.upper() != "EMPTY":
-        headers = {"Authorization": f"Bearer {api_key}"}
+    payload, headers = _request(messages, temperature, api_key, model, max_tokens)
+    if cache is not None:
+        hit = cache.get(payload)
+        if hit is not None:
+            return hit
+    try:
+        resp = chat_completions(
+            base_url,
+            payload,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            trust_env_mode=trust_env,
+            headers=headers,
+        )
+        content = extract_chat_content(resp)
+    except LLMHTTPError as exc:
+        raise LLMError(str(exc)) from exc
+    except Exception as exc:  # noqa: BLE001
+        raise LLMError(f"{type(exc).__name__}: {exc}") from exc
+    if cache is not None:
+        cache.put(payload, content)
+    return content
 
-    payload = {
-        "model": model,
-        "messages": messages,
-        "temperature": float(temperature),
-        "max_tokens": int(max_tokens),
-    }
 
+def stream_llm(
+    messages: List[Dict[str, str]],
+    *,
+    on_delta: Optional[Callable[[str], None]] = None,
+    temperature: float = 0.2,
+    base_url: str = LLM_BASE_URL,
+    api_key: str = LLM_API_KEY,
+    model: str = LLM_MODEL,
+    max_tokens: int = LLM_MAX_TOKENS,
+    connect_timeout: float = 10.0,
+    read_timeout: float = 300.0,
+    trust_env: str = "auto",
+    cache: Optional[LLMResponseCache] = None,
+) -> ChatStreamResult:
+    """流式调用 /chat/completions（stream=true）；每个内容增量到达即回调 on_delta。
+
+    缓存命中时整段回答一次性回调，返回 cached=True（无 TTFT / tokens/s）。
+    """
+    payload, headers = _request(messages, temperature, api_key, model, max_tokens)
+    if cache is not None:
+        hit = cache.get(payload)
+        if hit is not None:
+            if on_delta is not None:
+                on_delta(hit)
+            return ChatStreamResult(
+                content=hit, ttft_ms=None, total_ms=0, completion_tokens=0, tokens_source="cache", cached=True
+            )
     try:
-        resp = chat_completions(
+        res = stream_chat_completions(
             base_url,
             payload,
+            on_delta=on_delta,
             connect_timeout=connect_timeout,
             read_timeout=read_timeout,
             trust_env_mode=trust_env,
             headers=headers,
         )
-        return extract_chat_content(resp)
     except LLMHTTPError as exc:
         raise LLMError(str(exc)) from exc
     except Exception as exc:  # noqa: BLE001
         raise LLMError(f"{type(exc).__name__}: {exc}") from exc
+    if cache is not None:
+        cache.put(payload, res.content, {"finish_reason": res.finish_reason})
+    return res
@@ -3,8 +3,10 @@ from __future__ import annotations
 import argparse
 import csv
 import hashlib
+import os
 import uuid
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from typing import Any
@@ -61,6 +63,7 @@ FIELDS = [
     "size_bytes",
     "updated_at",
     "note",
+    "mtime_ns",
 ]
 
 
@@ -89,26 +92,67 @@ def build_note(conf: dict[str, Any]) -> str:
     return ";".join(parts)
 
 
-def load_existing_doc_ids(out_csv: Path) -> dict[str, str]:
-    """增量复用：source_uri -> doc_id。
-
-    语义：保持 doc_id 对稳定文件的稳定性，以减少下游“删除/新增”波动。
-    """
+def load_existing_rows(out_csv: Path) -> dict[str, dict[str, str]]:
+    """增量复用：source_uri -> 上一轮 inventory 行（doc_id / content_sha256 / size_bytes / updated_at ...）。"""
     if not out_csv.exists():
         return {}
-    mapping: dict[str, str] = {}
+    rows: dict[str, dict[str, str]] = {}
     with out_csv.open("r", encoding="utf-8", newline="") as f:
         for row in csv.DictReader(f):
             su = (row.get("source_uri") or "").strip()
-            di = (row.get("doc_id") or "").strip()
-            if su and di:
-                mapping[su] = di
-    return mapping
+            if su:
+                rows[su] = {k: (v or "").strip() for k, v in row.items() if k}
+    return rows
+
+
+def load_existing_doc_ids(out_csv: Path) -> dict[str, str]:
+    """增量复用：source_uri -> doc_id。
+
+    语义：保持 doc_id 对稳定文件的稳定性，以减少下游“删除/新增”波动。
+    """
+    return {su: row["doc_id"] for su, row in load_existing_rows(out_csv).items() if row.get("doc_id")}
+
+
+# mtime 落在上一轮扫描前这段时间内的文件视为 racily clean（同 git）：
+# 文件系统时间戳有粒度，扫描之后同一时间片内的再次写入可能不改变 mtime_ns。
+RACY_WINDOW_NS = 2 * 10**9
+
+
+def reusable_sha256(prev: dict[str, str] | None, size_bytes: str, mtime_ns: str, prev_scan_ns: int = 0) -> str:
+    """stat 快路径：(size_bytes, mtime_ns) 与上一轮一致、且 mtime 早于上一轮扫描 RACY_WINDOW_NS 以上时复用
+    content_sha256，否则返回空串（需要重新哈希）。旧版 inventory 没有 mtime_ns 列，一律重新哈希。"""
+    if not prev:
+        return ""
+    sha = prev.get("content_sha256") or ""
+    if len(sha) != 64 or not mtime_ns or prev.get("size_bytes") != size_bytes or prev.get("mtime_ns") != mtime_ns:
+        return ""
+    if int(mtime_ns) >= int(prev_scan_ns) - RACY_WINDOW_NS:
+        return ""
+    return sha
+
+
+def hash_files(paths: list[Path], workers: int) -> list[str]:
+    """sha256 of each path (same order); hashlib releases the GIL on large reads, so threads scale with IO/CPU."""
+    if workers <= 1 or len(paths) <= 1:
+        return [sha256_file(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inventory-hash") as ex:
+        return list(ex.map(sha256_file, paths))
 
 
 def main() -> None:
     ap = argparse.ArgumentParser(description="Scan data_raw/ and write inventory.csv")
     ap.add_argument("--root", default=None, help="Project root (default: auto-detect from CWD)")
+    ap.add_argument(
+        "--incremental",
+        default="true",
+        help="true/false: reuse content_sha256 from the previous inventory.csv when size_bytes and mtime_ns match",
+    )
+    ap.add_argument(
+        "--hash-workers",
+        type=int,
+        default=min(8, os.cpu_count() or 1),
+        help="Threads used to hash new/changed files (1 = serial)",
+    )
     args = ap.parse_args()
 
     project_root = find_project_root(args.root)
@@ -119,10 +163,14 @@ def main() -> None:
         print(f"[FAIL] missing directory: {raw_dir}", file=sys.stderr)
         raise SystemExit(2)
 
-    existing = load_existing_doc_ids(out_csv)
+    existing = load_existing_rows(out_csv)
+    # inventory.csv is written right after the scan: its mtime dates the previous run for the racy check.
+    prev_scan_ns = out_csv.stat().st_mtime_ns if existing else 0
+    incremental = str(args.incremental).strip().lower() in {"1", "true", "yes", "y", "on"}
     note_value = build_note(NOTE_CONFIG)
 
     rows: list[dict[str, str]] = []
+    to_hash: list[tuple[dict[str, str], Path]] = []
     for p in raw_dir.rglob("*"):
         if not p.is_file():
             continue
@@ -132,20 +180,29 @@ def main() -> None:
         filename = p.name
         source_type = EXT_MAP.get(p.suffix.lower(), "other")
 
-        doc_id = existing.get(source_uri) or str(uuid.uuid4())
-
-        rows.append(
-            {
-                "doc_id": doc_id,
-                "source_uri": source_uri,
-                "filename": filename,
-                "source_type": source_type,
-                "content_sha256": sha256_file(p),
-                "size_bytes": str(st.st_size),
-                "updated_at": iso_time_from_mtime(st.st_mtime),
-                "note": note_value,  # 从字典配置生成
-            }
-        )
+        prev = existing.get(source_uri)
+        doc_id = (prev or {}).get("doc_id") or str(uuid.uuid4())
+        size_bytes = str(st.st_size)
+        updated_at = iso_time_from_mtime(st.st_mtime)
+        mtime_ns = str(st.st_mtime_ns)
+
+        row = {
+            "doc_id": doc_id,
+            "source_uri": source_uri,
+            "filename": filename,
+            "source_type": source_type,
+            "content_sha256": reusable_sha256(prev, size_bytes, mtime_ns, prev_scan_ns) if incremental else "",
+            "size_bytes": size_bytes,
+            "updated_at": updated_at,
+            "note": note_value,  # 从字典配置生成
+            "mtime_ns": mtime_ns,
+        }
+        rows.append(row)
+        if not row["content_sha256"]:
+            to_hash.append((row, p))
+
+    for (row, _), sha in zip(to_hash, hash_files([p for _, p in to_hash], int(args.hash_workers))):
+        row["content_sha256"] = sha
 
     rows.sort(key=lambda r: r["source_uri"])
 
@@ -154,7 +211,7 @@ def main() -> None:
         w.writeheader()
         w.writerows(rows)
 
-    print(f"Wrote {len(rows)} rows to {out_csv}")
+    print(f"Wrote {len(rows)} rows to {out_csv} (hashed={len(to_hash)}, reused={len(rows) - len(to_hash)})")
 
 
 if __name__ == "__main__":
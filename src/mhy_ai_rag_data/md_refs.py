@@ -14,6 +14,26 @@ ROOT_PREFIXES = ("教程/", "综合指南/")  # 按需扩展
 ASSET_EXT = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".mp4", ".mkv", ".mov"}
 DOC_EXT = {".md", ".markdown"}
 
+# MarkdownIt() compiles its rule chains on construction; one parser per preset is reused for all files.
+_PARSERS: dict[str, MarkdownIt] = {}
+
+
+def get_md_parser(preset: str = "commonmark") -> MarkdownIt:
+    """Return the shared MarkdownIt instance for `preset` (created on first use)."""
+    md = _PARSERS.get(preset)
+    if md is None:
+        md = _PARSERS[preset] = MarkdownIt(preset)
+    return md
+
+
+def may_contain_refs(md_text: str) -> bool:
+    """Cheap pre-check: can md_text produce an image/link token at all?
+
+    Inline links/images need "](" and reference-style ones need a "[label]: dest" definition ("]:").
+    Text with neither cannot yield refs, so tokenization can be skipped.
+    """
+    return "](" in md_text or "]:" in md_text
+
 
 def _split_query_anchor(raw: str) -> tuple[str, str]:
     """return (clean_path, hint) where hint keeps original #/? part if any."""
@@ -74,8 +94,9 @@ def extract_refs_from_md(
       - raw: raw src/href (decoded)
       - hint: query/anchor part (optional)
     """
-    md = MarkdownIt(preset)
-    tokens = md.parse(md_text)
+    if not may_contain_refs(md_text):
+        return [], []
+    tokens = get_md_parser(preset).parse(md_text)
 
     asset_refs: list[dict[str, Any]] = []
     doc_refs: list[dict[str, Any]] = []
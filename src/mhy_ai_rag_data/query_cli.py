@@ -1,8 +1,18 @@
+"""Minimal Chroma query CLI (dense-only) for manual inspection.
+
+Uses a running rag_daemon (same db/collection/embed model) when available; otherwise loads the model and
+opens the collection in-process. chromadb / FlagEmbedding are imported lazily for that reason.
+"""
+
+from __future__ import annotations
+
 import argparse
-from typing import Any, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
-from chromadb import PersistentClient
-from FlagEmbedding import BGEM3FlagModel
+from mhy_ai_rag_data.rag_daemon import daemon_for, retrieve_remote
+
+if TYPE_CHECKING:
+    from FlagEmbedding import BGEM3FlagModel
 
 
 def build_embedder(
@@ -11,6 +21,8 @@ def build_embedder(
     """
     Create a BGEM3FlagModel embedder consistent with the index build step.
     """
+    from FlagEmbedding import BGEM3FlagModel
+
     model = BGEM3FlagModel(model_name, use_fp16=True, device=device)
     return model, batch_size
 
@@ -24,6 +36,27 @@ def embed_queries(model: BGEM3FlagModel, queries: List[str], batch_size: int = 3
     return dense_vecs
 
 
+def _print_results(ids: List[str], docs: List[str], metas: List[Dict[str, Any]], dists: List[Any]) -> None:
+    print(f"retrieved={len(ids)}")
+    if not ids:
+        print("STATUS: INFO (no results)")
+        return
+
+    print("\nTop results:")
+    for i in range(len(ids)):
+        meta = metas[i] or {}
+        text = docs[i] or ""
+        text_preview = text.replace("\n", " ")
+        if len(text_preview) > 200:
+            text_preview = text_preview[:200] + "..."
+        print(f"[{i + 1}] id={ids[i]}")
+        print(f"    distance={dists[i]}")
+        print(f"    doc_id={meta.get('doc_id')}")
+        print(f"    source_uri={meta.get('source_uri')}")
+        print(f"    locator={meta.get('locator')}")
+        print(f"    text_preview={text_preview}")
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Minimal Chroma RAG query CLI for manual inspection.")
     parser.add_argument("--db", default="chroma_db", help="Path to Chroma persistent directory")
@@ -37,6 +70,11 @@ def main() -> None:
         help="Embedding model name; should match the one used in build step",
     )
     parser.add_argument("--embed-batch", type=int, default=32, help="Batch size for embedding")
+    parser.add_argument(
+        "--daemon",
+        default="auto",
+        help="rag_daemon URL: auto (RAG_DAEMON_URL, use it when running) | off (always in-process) | <url>",
+    )
     parser.add_argument(
         "--where",
         default=None,
@@ -51,6 +89,34 @@ def main() -> None:
     print(f"embed_model={args.embed_model}")
     print(f"device={args.device}")
 
+    where_filter: Optional[dict[str, Any]] = None
+    if args.where:
+        where_filter = {}
+        for kv in str(args.where).split(","):
+            kv = kv.strip()
+            if not kv or "=" not in kv:
+                continue
+            k, v = kv.split("=", 1)
+            where_filter[k.strip()] = v.strip()
+
+    daemon_url = daemon_for(args.daemon, db=args.db, collection=args.collection, embed_model=args.embed_model)
+    if daemon_url:
+        print(f"retriever=daemon {daemon_url}")
+        try:
+            hits = retrieve_remote(daemon_url, args.q, args.k, where=where_filter, mode="dense")["hits"]
+        except Exception as e:
+            print(f"STATUS: FAIL (daemon query failed) - {e}")
+            return
+        _print_results(
+            [str(h.get("id")) for h in hits],
+            [str(h.get("text") or "") for h in hits],
+            [{"doc_id": h.get("doc_id"), "source_uri": h.get("source_uri"), "locator": h.get("locator")} for h in hits],
+            [h.get("distance") for h in hits],
+        )
+        return
+
+    from chromadb import PersistentClient
+
     # 1) Connect to Chroma
     client = PersistentClient(path=args.db)
     try:
@@ -73,16 +139,6 @@ def main() -> None:
         return
 
     # 3) Query Chroma
-    where_filter: Optional[dict[str, Any]] = None
-    if args.where:
-        where_filter = {}
-        for kv in str(args.where).split(","):
-            kv = kv.strip()
-            if not kv or "=" not in kv:
-                continue
-            k, v = kv.split("=", 1)
-            where_filter[k.strip()] = v.strip()
-
     try:
         results = coll.query(
             query_embeddings=[q_vec],
@@ -108,24 +164,7 @@ def main() -> None:
     metas = metas_list[0]
     dists = dists_list[0]
 
-    print(f"retrieved={len(ids)}")
-    if not ids:
-        print("STATUS: INFO (no results)")
-        return
-
-    print("\nTop results:")
-    for i in range(len(ids)):
-        meta = metas[i] or {}
-        text = docs[i] or ""
-        text_preview = text.replace("\n", " ")
-        if len(text_preview) > 200:
-            text_preview = text_preview[:200] + "..."
-        print(f"[{i + 1}] id={ids[i]}")
-        print(f"    distance={dists[i]}")
-        print(f"    doc_id={meta.get('doc_id')}")
-        print(f"    source_uri={meta.get('source_uri')}")
-        print(f"    locator={meta.get('locator')}")
-        print(f"    text_preview={text_preview}")
+    _print_results(ids, docs, metas, dists)
 
 
 if __name__ == "__main__":
@@ -14,6 +14,11 @@ EMBED_MODEL_NAME = "BAAI/bge-m3"
 # EMBED_DEVICE = "cpu"  # 或者 "cuda:0"
 EMBED_DEVICE = "cuda:0"
 EMBED_BATCH = 32
+# 查询向量缓存：进程内 LRU 条数（0 关闭）；持久化目录（相对当前工作目录，"" / "off" 仅用内存，默认）。
+# 持久化层为可选项，例如 "data_processed/query_embed_cache"：同一目录同一时刻只允许一个进程持有，其余进程退化为仅内存。
+QUERY_EMBED_CACHE_SIZE = 1024
+QUERY_EMBED_CACHE_DIR = ""
+QUERY_EMBED_CACHE_MAX_MB = 256
 
 # LLM 调用配置（假定为 OpenAI 兼容接口；本地 Qwen/LM Studio/Ollama 均可按此适配）
 LLM_BASE_URL = "http://localhost:8000/v1"  # 示例：本地服务地址
@@ -22,7 +27,23 @@ _env_openai_api_key = os.environ.get("OPENAI_API_KEY", "").strip()
 LLM_API_KEY = _env_llm_api_key or _env_openai_api_key or "EMPTY"  # 优先环境变量，未配置则回退
 LLM_MODEL = "qwen2.5-7b-instruct-q4_k_m.gguf"  # 按实际本地模型名称调整
 LLM_MAX_TOKENS = 1024
+# LLM 回答缓存（llm_cache.py，--llm-cache read|write 时使用；相对当前工作目录）
+LLM_CACHE_PATH = "data_processed/llm_cache/llm_cache.sqlite"
 
 # RAG 检索与上下文拼接配置
 RAG_TOP_K = 5
+# 检索模式：dense（默认）或 hybrid（dense + BM25 关键词腿，RRF 融合，与 run_eval_retrieval 的 hybrid 口径一致）。
+# hybrid 只使用建库时持久化的关键词索引（--keyword-index true）；索引缺失/过期时回退 dense 并告警，查询路径不会重建索引。
+RAG_RETRIEVAL_MODE = "dense"
+RAG_DENSE_POOL_K = 0  # dense 候选池大小，0 表示等于 top-k
+RAG_KEYWORD_POOL_K = 0  # 关键词候选池大小，0 表示等于 top-k
+RAG_RRF_K = 60
+# 建库 state 根目录（持久化关键词索引 keyword_index.sqlite 位于 <root>/<collection>/<schema_hash>/ 下）
+INDEX_STATE_ROOT = "data_processed/index_state"
+
+# 常驻检索服务（rag_daemon.py）：answer_cli / query_cli / retriever_chroma 探测到服务在线且索引一致时走 HTTP，
+# 否则进程内检索。环境变量 RAG_DAEMON_URL 可覆盖（设为 "off" 关闭探测）。
+RAG_DAEMON_URL = os.environ.get("RAG_DAEMON_URL", "").strip() or "http://127.0.0.1:8765"
+RAG_DAEMON_PROBE_TIMEOUT = 0.3  # /health 探测超时（秒），服务未启动时 CLI 只多付出这一点
+RAG_DAEMON_TIMEOUT = 330.0  # /retrieve、/answer 读超时（秒），需覆盖 LLM 生成时间
 RAG_MAX_CONTEXT_CHARS = 12000  # 控制拼接到 prompt 中的总字符数
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""mhy_ai_rag_data.rag_daemon
+
+常驻检索服务：进程内常驻 embedding 模型、Chroma collection 与关键词索引，通过本地 HTTP 提供检索/问答。
+
+动机
+- answer_cli / query_cli / retriever_chroma 每次启动都要付出 import + BGEM3FlagModel 加载 + PersistentClient 打开的
+  冷启动成本（CPU 上数十秒）；常驻服务把它摊到一次，单次提问只剩检索与 HTTP 往返。
+
+用法（项目根目录，与 CLI 使用同一份 rag_config）：
+  python rag_daemon.py                    # 监听 RAG_DAEMON_URL（默认 http://127.0.0.1:8765）
+  python rag_daemon.py --port 9000
+  python rag_daemon.py --status           # 探测服务是否在线（在线 rc=0，否则 rc=2）
+
+接口（JSON）
+- GET  /health   -> {ok, pid, db, collection, embed_model, index, mode, uptime_s, requests, query_embed_cache}
+  index = {schema_hash, state_mtime_ns}：服务启动时所打开索引的身份（LATEST 指针 + index_state 文件 mtime）
+- POST /retrieve {question, k?, where?, mode?} -> {hits: [{sid, id, rank, source, distance, ..., doc_id, source_uri, locator, text}],
+                                                   mode, timings_ms}
+- POST /answer   {question, k?, mode?, temperature?} -> /retrieve 的字段 + {answer, error}
+
+客户端（thin client）
+- daemon_for()：按 RAG_DAEMON_URL（环境变量同名可覆盖，"off" 关闭）探测 /health，且服务的 db/collection/embed_model
+  与 index 身份都与调用方当前看到的一致时才返回 URL；否则返回 ""，调用方回退进程内检索。
+  重建/增量构建后 index 身份改变，旧服务不再被使用（告警提示重启），避免继续返回旧索引的结果。
+  探测超时很短（RAG_DAEMON_PROBE_TIMEOUT）。
+- retrieve_remote()/answer_remote()：服务已确认在线后发起请求；服务端错误抛 DaemonError（不静默回退，避免掩盖问题）。
+- 客户端只依赖标准库，且对本地地址不走环境代理。
+
+边界
+- 只监听本机地址（默认 127.0.0.1），无鉴权；不要绑定到对外网卡。
+- where 过滤与 mode=dense 的语义与 retriever_chroma.retrieve 相同（where 使本次检索退化为 dense-only）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from mhy_ai_rag_data.hybrid_retriever import HybridRetriever, RetrievedChunk
+from mhy_ai_rag_data.rag_config import (
+    CHROMA_COLLECTION,
+    CHROMA_DB_PATH,
+    EMBED_MODEL_NAME,
+    INDEX_STATE_ROOT,
+    RAG_DAEMON_PROBE_TIMEOUT,
+    RAG_DAEMON_TIMEOUT,
+    RAG_DAEMON_URL,
+    RAG_TOP_K,
+)
+from mhy_ai_rag_data.retriever_chroma import SourceChunk
+from mhy_ai_rag_data.tools.index_state import read_latest_pointer, state_db_for, state_file_for
+
+AnswerFn = Callable[[str, List[SourceChunk], float], Dict[str, Any]]
+
+
+class DaemonError(RuntimeError):
+    """The daemon answered, but with an error (bad request, retrieval failure, malformed reply)."""
+
+
+def _hit_payload(idx: int, hit: RetrievedChunk) -> Dict[str, Any]:
+    out = hit.to_dict()
+    meta = hit.metadata
+    out.update(
+        {
+            "sid": f"S{idx + 1}",
+            "doc_id": meta.get("doc_id"),
+            "source_uri": meta.get("source_uri"),
+            "locator": meta.get("locator"),
+            "text": hit.text,
+        }
+    )
+    return out
+
+
+def to_source_chunks(hits: List[Dict[str, Any]]) -> List[SourceChunk]:
+    """Rebuild retriever_chroma.SourceChunk objects from /retrieve hits."""
+    return [
+        SourceChunk(
+            sid=str(h.get("sid") or f"S{i + 1}"),
+            doc_id=h.get("doc_id"),
+            source_uri=h.get("source_uri"),
+            locator=h.get("locator"),
+            text=str(h.get("text") or ""),
+        )
+        for i, h in enumerate(hits)
+    ]
+
+
+def _default_answer(question: str, sources: List[SourceChunk], temperature: float) -> Dict[str, Any]:
+    from mhy_ai_rag_data.llm_client_http import LLMError, call_llm
+    from mhy_ai_rag_data.prompt_rag import build_messages
+
+    try:
+        return {"answer": call_llm(build_messages(question, sources), temperature=temperature), "error": None}
+    except LLMError as exc:
+        return {"answer": None, "error": str(exc)}
+
+
+# ---- server ----
+class RagDaemonServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        *,
+        retriever: HybridRetriever,
+        info: Dict[str, Any],
+        answer: Optional[AnswerFn] = None,
+        cache_stats: Optional[Callable[[], Dict[str, Any]]] = None,
+    ) -> None:
+        super().__init__(address, _Handler)
+        self.retriever = retriever
+        self.info = dict(info)
+        self.answer = answer or _default_answer
+        self.cache_stats = cache_stats
+        self.started = time.time()
+        self.requests = 0
+        self._count_lock = threading.Lock()
+
+    def count(self) -> None:
+        with self._count_lock:
+            self.requests += 1
+
+    def health(self) -> Dict[str, Any]:
+        out = dict(self.info)
+        out.update(
+            {
+                "ok": True,
+                "pid": os.getpid(),
+                "uptime_s": round(time.time() - self.started, 3),
+                "requests": self.requests,
+                "query_embed_cache": self.cache_stats() if self.cache_stats is not None else {},
+            }
+        )
+        return out
+
+    def retrieve(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        question = str(req.get("question") or "")
+        if not question.strip():
+            raise ValueError("missing question")
+        k = int(req.get("k") or RAG_TOP_K)
+        where = req.get("where") or None
+        if where is not None and not isinstance(where, dict):
+            raise ValueError("where must be an object")
+        res = self.retriever.retrieve(question, k, where=where, mode=req.get("mode") or None)
+        return {
+            "hits": [_hit_payload(i, h) for i, h in enumerate(res.hits)],
+            "mode": res.mode,
+            "timings_ms": res.timings_ms,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: RagDaemonServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        sys.stderr.write(f"[rag_daemon] {self.address_string()} {format % args}\n")
+
+    def _send(self, status: int, obj: Dict[str, Any]) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path.rstrip("/") == "/health":
+            self._send(200, self.server.health())
+        else:
+            self._send(404, {"error": f"unknown path: {self.path}"})
+
+    def do_POST(self) -> None:  # noqa: N802
+        path = self.path.rstrip("/")
+        if path not in ("/retrieve", "/answer"):
+            self._send(404, {"error": f"unknown path: {self.path}"})
+            return
+        try:
+            n = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(n).decode("utf-8") or "{}")
+            if not isinstance(req, dict):
+                raise ValueError("request body must be a JSON object")
+        except Exception as e:
+            self._send(400, {"error": f"bad request: {type(e).__name__}: {e}"})
+            return
+
+        self.server.count()
+        try:
+            out = self.server.retrieve(req)
+            if path == "/answer":
+                sources = to_source_chunks(out["hits"])
+                out.update(self.server.answer(str(req["question"]), sources, float(req.get("temperature", 0.2))))
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send(200, out)
+
+
+def index_identity(state_root: Path, collection: str) -> Dict[str, Any]:
+    """Which build of the collection is on disk: LATEST schema_hash + mtime of its index_state (json or sqlite).
+
+    Every successful build rewrites index_state, so the pair changes whenever the served content may have.
+    """
+    schema_hash = read_latest_pointer(state_root, collection)
+    mtime_ns = 0
+    if schema_hash:
+        for p in (
+            state_file_for(state_root, collection, schema_hash),
+            state_db_for(state_root, collection, schema_hash),
+        ):
+            try:
+                mtime_ns = max(mtime_ns, p.stat().st_mtime_ns)
+            except OSError:
+                pass
+    return {"schema_hash": schema_hash or "", "state_mtime_ns": mtime_ns}
+
+
+def daemon_info() -> Dict[str, Any]:
+    """Identity of the index this process serves (compared by daemon_for on the client side)."""
+    return {
+        "db": Path(CHROMA_DB_PATH).resolve().as_posix(),
+        "collection": CHROMA_COLLECTION,
+        "embed_model": EMBED_MODEL_NAME,
+        "index": index_identity(Path(INDEX_STATE_ROOT), CHROMA_COLLECTION),
+    }
+
+
+def serve(host: str, port: int) -> int:
+    from mhy_ai_rag_data.embeddings_bge_m3 import get_query_cache, warmup
+    from mhy_ai_rag_data.retriever_chroma import get_retriever
+
+    t0 = time.time()
+    # Taken before opening: a build finishing meanwhile makes the identity look stale, never fresh.
+    info = daemon_info()
+    retriever = get_retriever()
+    warmup()
+    info["mode"] = retriever.mode
+    server = RagDaemonServer((host, port), retriever=retriever, info=info, cache_stats=get_query_cache().stats)
+    print(
+        f"[rag_daemon] ready in {time.time() - t0:.1f}s: http://{host}:{server.server_port} "
+        f"db={info['db']} collection={info['collection']} mode={info['mode']}",
+        flush=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        retriever.close()
+    return 0
+
+
+# ---- client ----
+_OPENER = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+
+def _request(url: str, path: str, payload: Optional[Dict[str, Any]], timeout: float) -> Dict[str, Any]:
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url.rstrip("/") + path, data=data, method="POST" if data is not None else "GET")
+    if data is not None:
+        req.add_header("Content-Type", "application/json; charset=utf-8")
+    try:
+        with _OPENER.open(req, timeout=timeout) as resp:
+            body = resp.read()
+    except urllib.error.HTTPError as e:
+        try:
+            detail = json.loads(e.read().decode("utf-8")).get("error")
+        except Exception:
+            detail = e.reason
+        raise DaemonError(f"{path} -> HTTP {e.code}: {detail}") from None
+    try:
+        out = json.loads(body.decode("utf-8"))
+    except Exception as e:
+        raise DaemonError(f"{path} -> malformed reply: {type(e).__name__}: {e}") from None
+    if not isinstance(out, dict):
+        raise DaemonError(f"{path} -> malformed reply: expected a JSON object")
+    return out
+
+
+def resolve_daemon_url(arg: str = "auto") -> str:
+    """'auto' -> RAG_DAEMON_URL (config / env); 'off' or '' -> disabled (''); anything else is used as the URL."""
+    s = str(arg or "").strip()
+    if s.lower() == "auto":
+        s = RAG_DAEMON_URL
+    return "" if s.lower() in ("", "off") else s
+
+
+def daemon_health(url: str, timeout: float = RAG_DAEMON_PROBE_TIMEOUT) -> Optional[Dict[str, Any]]:
+    """GET /health; None when nothing usable is listening at url."""
+    if not url:
+        return None
+    try:
+        out = _request(url, "/health", None, timeout)
+    except (OSError, DaemonError):
+        return None
+    return out if out.get("ok") else None
+
+
+def daemon_for(
+    arg: str = "auto",
+    *,
+    db: str = CHROMA_DB_PATH,
+    collection: str = CHROMA_COLLECTION,
+    embed_model: str = EMBED_MODEL_NAME,
+    state_root: str = INDEX_STATE_ROOT,
+) -> str:
+    """URL of a running daemon serving the same db/collection/embed_model and the same build of the index
+    (index_identity under state_root), or '' (caller runs in-process)."""
+    url = resolve_daemon_url(arg)
+    health = daemon_health(url)
+    if health is None:
+        return ""
+    want = {"db": Path(db).resolve().as_posix(), "collection": collection, "embed_model": embed_model}
+    mismatch = {k: health.get(k) for k, v in want.items() if health.get(k) != v}
+    if mismatch:
+        print(f"[WARN] rag_daemon at {url} serves a different index {mismatch}; retrieving in-process", file=sys.stderr)
+        return ""
+    current = index_identity(Path(state_root), collection)
+    if health.get("index") != current:
+        print(
+            f"[WARN] rag_daemon at {url} serves an older build (daemon={health.get('index')} on_disk={current}); "
+            "restart it to pick up the rebuilt index; retrieving in-process",
+            file=sys.stderr,
+        )
+        return ""
+    return url
+
+
+def retrieve_remote(
+    url: str,
+    question: str,
+    k: Optional[int] = None,
+    *,
+    where: Optional[Dict[str, str]] = None,
+    mode: Optional[str] = None,
+    timeout: float = RAG_DAEMON_TIMEOUT,
+) -> Dict[str, Any]:
+    return _request(url, "/retrieve", {"question": question, "k": k, "where": where, "mode": mode}, timeout)
+
+
+def answer_remote(
+    url: str,
+    question: str,
+    k: Optional[int] = None,
+    *,
+    mode: Optional[str] = None,
+    temperature: float = 0.2,
+    timeout: float = RAG_DAEMON_TIMEOUT,
+) -> Dict[str, Any]:
+    payload = {"question": question, "k": k, "mode": mode, "temperature": temperature}
+    return _request(url, "/answer", payload, timeout)
+
+
+def main() -> int:
+    default = urlparse(resolve_daemon_url("auto") or "http://127.0.0.1:8765")
+    ap = argparse.ArgumentParser(description="常驻检索服务（warm embedder + collection），供 answer_cli 等 CLI 复用")
+    ap.add_argument("--host", default=default.hostname or "127.0.0.1", help="listen address (keep it loopback)")
+    ap.add_argument("--port", type=int, default=default.port or 8765, help="listen port")
+    ap.add_argument("--status", action="store_true", help="probe a running daemon at --host/--port and exit")
+    args = ap.parse_args()
+
+    if args.status:
+        health = daemon_health(f"http://{args.host}:{args.port}", timeout=2.0)
+        if health is None:
+            print(f"rag_daemon: not running at http://{args.host}:{args.port}")
+            return 2
+        print(json.dumps(health, ensure_ascii=False, indent=2))
+        return 0
+    return serve(str(args.host), int(args.port))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
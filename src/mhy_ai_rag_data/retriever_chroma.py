@@ -1,19 +1,36 @@
 """Chroma 检索封装。
 
-提供 retrieve(question, k) -> SourceChunk 列表，
+提供 retrieve(question, k) -> SourceChunk 列表（以及批量版 retrieve_many），
 供 RAG 上层直接调用。
+
+检索走 hybrid_retriever.HybridRetriever（默认 dense；hybrid 为 dense + BM25 + RRF，见 rag_config.RAG_RETRIEVAL_MODE），
+与 run_eval_retrieval / run_eval_rag 同一实现；collection 与关键词索引在进程内只打开一次。
+hybrid 只读取建库时持久化的关键词索引，查询路径从不构建索引。
 """
 
 from __future__ import annotations
 
+import sys
+import textwrap
 from dataclasses import dataclass
+from pathlib import Path
 from typing import List, Dict, Optional, Any
 
-from mhy_ai_rag_data.rag_config import CHROMA_DB_PATH, CHROMA_COLLECTION, RAG_TOP_K
-from mhy_ai_rag_data.embeddings_bge_m3 import embed_query
+from mhy_ai_rag_data.rag_config import (
+    CHROMA_DB_PATH,
+    CHROMA_COLLECTION,
+    INDEX_STATE_ROOT,
+    RAG_DENSE_POOL_K,
+    RAG_KEYWORD_POOL_K,
+    RAG_RETRIEVAL_MODE,
+    RAG_RRF_K,
+    RAG_TOP_K,
+)
+from mhy_ai_rag_data.hybrid_retriever import HybridRetriever, RetrievedChunk, open_hybrid_retriever
 
 _CLIENT: Any = None
 _COLLECTION = None
+_RETRIEVER: HybridRetriever | None = None
 
 
 @dataclass
@@ -35,44 +52,115 @@ def _get_collection() -> Any:
     return _COLLECTION
 
 
-def retrieve(question: str, k: int | None = None, where: Optional[Dict[str, str]] = None) -> List[SourceChunk]:
+def get_retriever() -> HybridRetriever:
+    """进程内共享的检索器（懒加载；hybrid 所需的持久化关键词索引缺失/过期时回退 dense 并告警）。"""
+    global _RETRIEVER
+    if _RETRIEVER is None:
+        # Imported here so that thin clients (rag_daemon users) never pay for FlagEmbedding/torch.
+        from mhy_ai_rag_data.embeddings_bge_m3 import embed_queries, embed_query
+
+        coll = _get_collection()
+        kwargs: Dict[str, Any] = {
+            "collection": coll,
+            "collection_name": CHROMA_COLLECTION,
+            "embed": embed_query,
+            "embed_many": embed_queries,
+            "state_root": Path(INDEX_STATE_ROOT),
+            "keyword_index": "persisted",
+            "dense_pool_k": RAG_DENSE_POOL_K,
+            "keyword_pool_k": RAG_KEYWORD_POOL_K,
+            "rrf_k": RAG_RRF_K,
+        }
+        try:
+            _RETRIEVER = open_hybrid_retriever(mode=RAG_RETRIEVAL_MODE, **kwargs)
+        except ValueError as e:
+            print(f"[WARN] {e}; falling back to dense retrieval", file=sys.stderr)
+            _RETRIEVER = open_hybrid_retriever(mode="dense", **kwargs)
+    return _RETRIEVER
+
+
+def retrieve(
+    question: str,
+    k: int | None = None,
+    where: Optional[Dict[str, str]] = None,
+    mode: Optional[str] = None,
+) -> List[SourceChunk]:
     """对自然语言 question 进行检索，返回 SourceChunk 列表。
 
     参数：
       - k: 返回 top-k 条数（None 则取配置 RAG_TOP_K）
-      - where: 可选 Chroma metadata 过滤（where dict），例如 {"source_type":"md"}
+      - where: 可选 Chroma metadata 过滤（where dict），例如 {"source_type":"md"}；传入时本次检索为 dense-only
+      - mode: hybrid|dense（None 则取配置 RAG_RETRIEVAL_MODE）
 
     说明：where 仅用于隔离变量做回归/诊断；若你在上层做更复杂的过滤/重排，建议在 RAG 层实现策略。
     """
     if k is None:
         k = RAG_TOP_K
 
-    coll = _get_collection()
-    q_vec = embed_query(question)
-    results = coll.query(query_embeddings=[q_vec], n_results=k, where=where)
+    result = get_retriever().retrieve(question, k, where=where, mode=mode)
+    return _to_source_chunks(result.hits)
+
+
+def retrieve_many(
+    questions: List[str],
+    k: int | None = None,
+    where: Optional[Dict[str, str]] = None,
+    mode: Optional[str] = None,
+) -> List[List[SourceChunk]]:
+    """批量检索：所有 question 一次 embed、一次 collection.query；返回与 questions 等长、按输入顺序的列表。"""
+    if k is None:
+        k = RAG_TOP_K
+
+    results = get_retriever().retrieve_many(questions, k, where=where, mode=mode)
+    return [_to_source_chunks(r.hits) for r in results]
 
-    ids = results.get("ids", [[]])[0]
-    docs = results.get("documents", [[]])[0]
-    metas = results.get("metadatas", [[]])[0]
+
+def _to_source_chunks(hits: List[RetrievedChunk]) -> List[SourceChunk]:
     chunks: List[SourceChunk] = []
-    for idx, cid in enumerate(ids):
-        meta = metas[idx] or {}
-        text = docs[idx] or ""
+    for idx, hit in enumerate(hits):
+        meta = hit.metadata
         chunks.append(
             SourceChunk(
                 sid=f"S{idx + 1}",
                 doc_id=meta.get("doc_id"),
                 source_uri=meta.get("source_uri"),
                 locator=meta.get("locator"),
-                text=text,
+                text=hit.text,
             )
         )
     return chunks
 
 
+def format_results(
+    question: str,
+    k: int | None,
+    where: Optional[Dict[str, str]],
+    mode: Optional[str],
+    retriever_label: str,
+    chunks: List[SourceChunk],
+) -> str:
+    """CLI 输出文本（run_rag_eval_batch 的关键词启发式与 parse_retriever_output 以此为准）。"""
+    lines = [
+        f"query={question!r}",
+        f"k={k or RAG_TOP_K}",
+        f"where={where!r}",
+        f"mode={mode or RAG_RETRIEVAL_MODE}",
+        f"retriever={retriever_label}",
+        f"retrieved={len(chunks)}",
+        "",
+    ]
+    for ch in chunks:
+        preview = ch.text.replace("\n", " ")
+        if len(preview) > 200:
+            preview = preview[:200] + "..."
+        lines.append(f"{ch.sid}: doc_id={ch.doc_id} source_uri={ch.source_uri} locator={ch.locator}")
+        lines.append(textwrap.indent(preview, prefix="    "))
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
 if __name__ == "__main__":
     import argparse
-    import textwrap as _tw
 
     parser = argparse.ArgumentParser(description="简单 CLI：检索并打印前 k 条结果。")
     parser.add_argument("--q", required=True, help="查询问题文本")
@@ -80,6 +168,14 @@ if __name__ == "__main__":
     parser.add_argument(
         "--where", default=None, help='Metadata filter, e.g. "source_type=md" or "access=public,pii=no"'
     )
+    parser.add_argument(
+        "--mode", default=None, choices=["hybrid", "dense"], help="检索模式，默认取配置中的 RAG_RETRIEVAL_MODE"
+    )
+    parser.add_argument(
+        "--daemon",
+        default="auto",
+        help="rag_daemon URL: auto (RAG_DAEMON_URL, use it when running) | off (always in-process) | <url>",
+    )
     args = parser.parse_args()
 
     where = None
@@ -107,17 +203,12 @@ if __name__ == "__main__":
                 d[k.strip()] = v.strip()
             where = d or None
 
-    print(f"query={args.q!r}")
-    print(f"k={args.k or RAG_TOP_K}")
-    print(f"where={where!r}")
+    from mhy_ai_rag_data.rag_daemon import daemon_for, retrieve_remote, to_source_chunks
 
-    chunks = retrieve(args.q, args.k, where=where)
-    print(f"retrieved={len(chunks)}\n")
-
-    for ch in chunks:
-        preview = ch.text.replace("\n", " ")
-        if len(preview) > 200:
-            preview = preview[:200] + "..."
-        print(f"{ch.sid}: doc_id={ch.doc_id} source_uri={ch.source_uri} locator={ch.locator}")
-        print(_tw.indent(preview, prefix="    "))
-        print()
+    daemon_url = daemon_for(args.daemon)
+    if daemon_url:
+        chunks = to_source_chunks(retrieve_remote(daemon_url, args.q, args.k, where=where, mode=args.mode)["hits"])
+    else:
+        chunks = retrieve(args.q, args.k, where=where, mode=args.mode)
+    label = "daemon " + daemon_url if daemon_url else "in-process"
+    print(format_results(args.q, args.k, where, args.mode, label, chunks), end="")
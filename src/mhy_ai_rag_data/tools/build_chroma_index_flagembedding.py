@@ -31,9 +31,23 @@ tools/build_chroma_index_flagembedding.py
 
 from __future__ import annotations
 
+from mhy_ai_rag_data.embedding_cache import open_embedding_cache
+from mhy_ai_rag_data.keyword_index import (
+    DEFAULT_META_FIELD,
+    KeywordIndex,
+    drop_keyword_index,
+    extract_source,
+    keyword_index_path,
+    open_keyword_index_for_sync,
+)
+from mhy_ai_rag_data.tools.embed_pipeline import JOB_RESUME_SKIP, StageError, build_doc_pipeline, summarize_embed_stats
+from mhy_ai_rag_data.tools.embed_workers import EmbedWorkerPool, encode_dense_vecs
 from mhy_ai_rag_data.tools.selftest_utils import add_selftest_args, maybe_run_selftest_from_args
+from mhy_ai_rag_data.units_reader import UnitsFile, iter_unit_refs
 
 import argparse
+import atexit
+import threading
 import time
 import json
 import os
@@ -46,6 +60,8 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Mapping, cast
 
+import numpy as np
+
 try:
     from tqdm import tqdm
 except Exception:  # tqdm not installed
@@ -83,6 +99,28 @@ def _chunk_id(doc_id: str, idx: int) -> str:
     return f"{doc_id}:{idx}"
 
 
+def _l2_normalize_rows(rows: Any) -> np.ndarray:
+    """Stack vectors into one C-contiguous float32 (n, dim) matrix and L2-normalize rows in place."""
+    mat = np.array(rows, dtype=np.float32, order="C")
+    if mat.ndim != 2:
+        raise ValueError(f"expected a (n, dim) batch of vectors, got shape={mat.shape}")
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    mat /= norms
+    return mat
+
+
+# Older chromadb releases validate embeddings as python lists only and reject an ndarray before any write,
+# either with an explicit "to be a list" message or by tripping over ndarray truthiness.
+_NDARRAY_REJECTED = ("to be a list", "truth value of an array")
+
+
+def _is_ndarray_rejection(e: BaseException) -> bool:
+    """True only for chromadb's list-type validation errors (not dim/metadata contract errors)."""
+    msg = str(e)
+    return isinstance(e, (TypeError, ValueError)) and any(s in msg for s in _NDARRAY_REJECTED)
+
+
 def _safe_bool(s: str) -> bool:
     return str(s).strip().lower() in {"1", "true", "yes", "y", "on"}
 
@@ -162,6 +200,11 @@ def _setup_logging(*, log_path: Path, level: str) -> logging.Logger:
 # -------- WAL / resume helpers --------
 WAL_VERSION = 1
 WAL_FILENAME = "index_state.stage.jsonl"
+# Sidecar next to the WAL: {"offset","length","run_id","seq"} of the latest CHECKPOINT line.
+WAL_CHECKPOINT_SUFFIX = ".ckpt"
+WAL_CHECKPOINT_EVENTS = 1000
+WAL_KEEP_ROTATED = 3
+WAL_FLUSH_MS = 50.0
 
 
 def _iso_now() -> str:
@@ -197,6 +240,9 @@ class WalSnapshot:
     finished_ok: bool
     truncated_tail_ignored: bool
     last_event: str
+    # Byte offset of the CHECKPOINT the replay started from (-1: full scan) and bytes replayed after it.
+    checkpoint_offset: int = -1
+    bytes_replayed: int = 0
 
 
 def _safe_json_loads(line: str) -> Dict[str, Any] | None:
@@ -207,72 +253,74 @@ def _safe_json_loads(line: str) -> Dict[str, Any] | None:
         return None
 
 
-def read_wal(
-    wal_path: Path,
-    *,
-    collection: str,
-    schema_hash: str,
-    db_path_posix: str,
-) -> WalSnapshot | None:
-    """Read WAL and return snapshot for the latest matching run.
+def wal_checkpoint_path(wal_path: Path) -> Path:
+    return wal_path.with_name(wal_path.name + WAL_CHECKPOINT_SUFFIX)
 
-    The WAL may contain multiple runs (append-only). We treat the latest RUN_START/RUN_RESUME
-    as the active run. If the active run has RUN_FINISH(ok=true), it is considered finished.
 
-    Tail truncation tolerance: if the last line is partially written, stop reading and mark
-    truncated_tail_ignored.
-    """
-    if not wal_path.exists():
-        return None
+class _WalReplay:
+    """Fold WAL events into the latest matching run's state (shared by full scan and tail replay)."""
 
-    active_run_id = ""
-    done_docs: Dict[str, WalDoc] = {}
-    committed_batches = 0
-    upsert_rows_committed_total = 0
-    finished_ok = False
-    truncated_tail_ignored = False
-    last_event = ""
-
-    for raw in wal_path.read_text(encoding="utf-8", errors="replace").splitlines():
-        line = raw.strip()
-        if not line:
-            continue
-        obj = _safe_json_loads(line)
-        if obj is None:
-            truncated_tail_ignored = True
-            break
-
-        if str(obj.get("collection") or "") != str(collection):
-            continue
-        if str(obj.get("schema_hash") or "") != str(schema_hash):
-            continue
-        if str(obj.get("db_path") or "") not in {"", str(db_path_posix)}:
-            # Allow empty db_path for backward/partial events.
-            continue
+    def __init__(self, *, collection: str, schema_hash: str, db_path_posix: str) -> None:
+        self.collection = str(collection)
+        self.schema_hash = str(schema_hash)
+        self.db_path_posix = str(db_path_posix)
+        self.active_run_id = ""
+        self.done_docs: Dict[str, WalDoc] = {}
+        self.committed_batches = 0
+        self.upsert_rows_committed_total = 0
+        self.finished_ok = False
+        self.truncated_tail_ignored = False
+        self.last_event = ""
+
+    def matches(self, obj: Mapping[str, Any]) -> bool:
+        if str(obj.get("collection") or "") != self.collection:
+            return False
+        if str(obj.get("schema_hash") or "") != self.schema_hash:
+            return False
+        # Allow empty db_path for backward/partial events.
+        return str(obj.get("db_path") or "") in {"", self.db_path_posix}
+
+    def apply(self, obj: Mapping[str, Any]) -> None:
+        if not self.matches(obj):
+            return
 
         ev = str(obj.get("event") or "")
         rid = str(obj.get("run_id") or "")
 
-        if ev in {"RUN_START", "RUN_RESUME"}:
-            active_run_id = rid
-            done_docs = {}
-            committed_batches = 0
-            upsert_rows_committed_total = 0
-            finished_ok = False
-            truncated_tail_ignored = False
-            last_event = ev
-            continue
+        if ev in {"RUN_START", "RUN_RESUME", "CHECKPOINT"}:
+            # A CHECKPOINT is a compacted RUN_* + every event of that run up to it.
+            self.active_run_id = rid
+            self.done_docs = {}
+            self.committed_batches = 0
+            self.upsert_rows_committed_total = 0
+            self.finished_ok = False
+            self.truncated_tail_ignored = False
+            self.last_event = ev
+            if ev == "CHECKPOINT":
+                for rec in obj.get("done_docs") or []:
+                    uri, doc_id, sha, n_chunks, updated_at = rec
+                    self.done_docs[str(uri)] = WalDoc(
+                        source_uri=str(uri),
+                        doc_id=str(doc_id),
+                        content_sha256=str(sha),
+                        n_chunks=int(n_chunks),
+                        updated_at=str(updated_at),
+                    )
+                self.committed_batches = int(obj.get("committed_batches") or 0)
+                self.upsert_rows_committed_total = int(obj.get("upsert_rows_committed_total") or 0)
+                self.last_event = str(obj.get("last_event") or "")
+            return
 
-        if not active_run_id or rid != active_run_id:
-            continue
+        if not self.active_run_id or rid != self.active_run_id:
+            return
 
-        last_event = ev
+        self.last_event = ev
 
         if ev in {"DOC_COMMITTED", "DOC_DONE"}:
             uri = str(obj.get("source_uri") or "")
             if not uri:
-                continue
-            done_docs[uri] = WalDoc(
+                return
+            self.done_docs[uri] = WalDoc(
                 source_uri=uri,
                 doc_id=str(obj.get("doc_id") or ""),
                 content_sha256=str(obj.get("content_sha256") or ""),
@@ -280,26 +328,174 @@ def read_wal(
                 updated_at=str(obj.get("updated_at") or ""),
             )
         elif ev == "UPSERT_BATCH_COMMITTED":
-            committed_batches += 1
-            upsert_rows_committed_total = int(obj.get("upsert_rows_committed_total") or upsert_rows_committed_total)
+            self.committed_batches += 1
+            self.upsert_rows_committed_total = int(
+                obj.get("upsert_rows_committed_total") or self.upsert_rows_committed_total
+            )
         elif ev == "RUN_FINISH":
-            finished_ok = bool(obj.get("ok"))
+            self.finished_ok = bool(obj.get("ok"))
 
-    if not active_run_id:
+
+def _load_checkpoint(wal_path: Path) -> tuple[Dict[str, Any], int, int] | None:
+    """Return (CHECKPOINT event, its offset, its length) if the sidecar points at a valid one."""
+    side = _safe_json_loads(wal_checkpoint_path(wal_path).read_text(encoding="utf-8", errors="replace"))
+    if side is None:
+        return None
+    offset = int(side.get("offset") or 0)
+    length = int(side.get("length") or 0)
+    if offset < 0 or length <= 0 or offset + length > wal_path.stat().st_size:
+        return None
+    with wal_path.open("rb") as f:
+        f.seek(offset)
+        raw = f.read(length)
+    if not raw.endswith(b"\n"):
+        return None
+    obj = _safe_json_loads(raw.decode("utf-8", errors="replace"))
+    if obj is None or str(obj.get("event") or "") != "CHECKPOINT":
+        return None
+    # Guards against a sidecar left over from a rotated/rewritten WAL.
+    if str(obj.get("run_id") or "") != str(side.get("run_id") or "") or obj.get("seq") != side.get("seq"):
+        return None
+    return obj, offset, length
+
+
+def read_wal(
+    wal_path: Path,
+    *,
+    collection: str,
+    schema_hash: str,
+    db_path_posix: str,
+    use_checkpoint: bool = True,
+) -> WalSnapshot | None:
+    """Read WAL and return snapshot for the latest matching run.
+
+    The WAL may contain multiple runs (append-only). We treat the latest RUN_START/RUN_RESUME
+    as the active run. If the active run has RUN_FINISH(ok=true), it is considered finished.
+
+    Fast path: if the checkpoint sidecar points at a valid CHECKPOINT for this
+    collection/schema_hash/db_path, seek there and replay only the tail written after it
+    (O(live docs + tail) instead of O(history)). Otherwise fall back to a full scan; both
+    paths fold events identically, so the snapshot is the same.
+
+    Tail truncation tolerance: if the last line is partially written, stop reading and mark
+    truncated_tail_ignored.
+    """
+    if not wal_path.exists():
+        return None
+
+    st = _WalReplay(collection=collection, schema_hash=schema_hash, db_path_posix=db_path_posix)
+    start = 0
+    checkpoint_offset = -1
+    if use_checkpoint:
+        try:
+            ckpt = _load_checkpoint(wal_path)
+        except (OSError, ValueError, TypeError):
+            ckpt = None
+        if ckpt is not None and st.matches(ckpt[0]):
+            st.apply(ckpt[0])
+            checkpoint_offset = ckpt[1]
+            start = ckpt[1] + ckpt[2]
+
+    bytes_replayed = 0
+    with wal_path.open("rb") as f:
+        f.seek(start)
+        for raw in f:
+            bytes_replayed += len(raw)
+            line = raw.decode("utf-8", errors="replace").strip()
+            if not line:
+                continue
+            obj = _safe_json_loads(line)
+            if obj is None:
+                st.truncated_tail_ignored = True
+                break
+            st.apply(obj)
+
+    if not st.active_run_id:
         return None
 
     return WalSnapshot(
-        run_id=active_run_id,
-        done_docs=done_docs,
-        committed_batches=committed_batches,
-        upsert_rows_committed_total=upsert_rows_committed_total,
-        finished_ok=finished_ok,
-        truncated_tail_ignored=truncated_tail_ignored,
-        last_event=last_event,
+        run_id=st.active_run_id,
+        done_docs=st.done_docs,
+        committed_batches=st.committed_batches,
+        upsert_rows_committed_total=st.upsert_rows_committed_total,
+        finished_ok=st.finished_ok,
+        truncated_tail_ignored=st.truncated_tail_ignored,
+        last_event=st.last_event,
+        checkpoint_offset=checkpoint_offset,
+        bytes_replayed=bytes_replayed,
     )
 
 
+def rotate_wal(wal_path: Path, *, keep: int = WAL_KEEP_ROTATED) -> Path:
+    """Move the WAL aside to <wal>.prev-<ts>, drop its checkpoint sidecar, keep only the newest `keep` rotations."""
+    rotated = wal_path.with_name(wal_path.name + f".prev-{int(time.time())}")
+    os.replace(str(wal_path), str(rotated))
+    try:
+        wal_checkpoint_path(wal_path).unlink()
+    except FileNotFoundError:
+        pass
+
+    def _ts(p: Path) -> int:
+        try:
+            return int(p.name.rsplit(".prev-", 1)[1])
+        except ValueError:
+            return int(p.stat().st_mtime)
+
+    prev = sorted(wal_path.parent.glob(wal_path.name + ".prev-*"), key=_ts, reverse=True)
+    for old in prev[max(0, int(keep)) :]:
+        if old == rotated:
+            continue
+        try:
+            old.unlink()
+        except OSError:
+            pass
+    return rotated
+
+
+def _truncate_torn_tail(path: Path) -> int:
+    """Cut a partially written last line (crash mid-write) so appended events start on a fresh line."""
+    if not path.exists():
+        return 0
+    with path.open("r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return 0
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return 0
+        pos = size
+        block = 64 * 1024
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            nl = f.read(step).rfind(b"\n")
+            if nl >= 0:
+                keep = pos + nl + 1
+                break
+        else:
+            keep = 0
+        f.truncate(keep)
+        return size - keep
+
+
 class WalWriter:
+    """Append-only WAL writer for one run.
+
+    Mirrors the state read_wal() would fold for this run and, every `checkpoint_every`
+    events, appends a CHECKPOINT (compacted done_docs + counters) and points the sidecar at
+    it. A checkpoint is also deferred until at least its own size has been appended since the
+    previous one, so checkpoints stay a bounded fraction of the file.
+
+    group_commit=True: write_event() only serializes and enqueues. A background flusher
+    coalesces queued lines into one write() per group (waiting up to flush_ms for more), fsyncs
+    per group (fsync_mode="doc") or once fsync_interval events have accumulated ("interval"),
+    and moves the checkpoint sidecar only after its CHECKPOINT line is on disk. barrier()
+    blocks until every event enqueued so far is durable. Lines are always written whole and
+    in order, so read_wal() sees the same prefix semantics as with per-event writes.
+    group_commit=False keeps the synchronous write+flush per event.
+    """
+
     def __init__(
         self,
         *,
@@ -310,6 +506,10 @@ class WalWriter:
         run_id: str,
         fsync_mode: str,
         fsync_interval: int,
+        checkpoint_every: int = WAL_CHECKPOINT_EVENTS,
+        group_commit: bool = False,
+        flush_ms: float = WAL_FLUSH_MS,
+        group_max_events: int = 1024,
     ) -> None:
         self.wal_path = wal_path
         self.collection = str(collection)
@@ -318,13 +518,59 @@ class WalWriter:
         self.run_id = str(run_id)
         self.fsync_mode = str(fsync_mode)
         self.fsync_interval = int(max(1, fsync_interval))
+        self.checkpoint_every = int(max(0, checkpoint_every))
+        self.group_commit = bool(group_commit)
+        self.flush_s = max(0.0, float(flush_ms)) / 1000.0
+        self.group_max_events = int(max(1, group_max_events))
+        self.checkpoints_written = 0
+        self.groups_written = 0
+        self.fsyncs = 0
+        self.write_errors = 0
         self._seq = 0
         self._since_fsync = 0
 
+        # Mirror of this run's replayed state (what read_wal would return).
+        self._done: Dict[str, List[Any]] = {}
+        self._committed_batches = 0
+        self._upsert_rows_committed_total = 0
+        self._last_event = ""
+        self._events_since_ckpt = 0
+        self._bytes_since_ckpt = 0
+        self._last_ckpt_bytes = 0
+
         self.wal_path.parent.mkdir(parents=True, exist_ok=True)
-        self._fp = self.wal_path.open("a", encoding="utf-8")
+        self.torn_tail_bytes = _truncate_torn_tail(self.wal_path)
+        self._fp = self.wal_path.open("ab")
+        self._offset = self._fp.seek(0, os.SEEK_END)
+        self._closed = False
+
+        # Group commit: (line, sidecar-or-None) queue and event counters, all guarded by _cv.
+        self._cv = threading.Condition()
+        self._queue: List[tuple[bytes, Dict[str, Any] | None]] = []
+        self._enqueued = 0
+        self._written = 0
+        self._durable = 0
+        self._barrier_target = 0
+        self._closing = False
+        self._failed = False
+        self._thread: threading.Thread | None = None
+        if self.group_commit:
+            self._thread = threading.Thread(target=self._flusher, name="wal-flusher", daemon=True)
+            self._thread.start()
+            # Backstop for early-return paths that never reach close(): do not lose queued events.
+            atexit.register(self.close)
 
     def close(self) -> None:
+        if self._closed:
+            return
+        if self._thread is not None:
+            with self._cv:
+                self._closing = True
+                self._barrier_target = max(self._barrier_target, self._enqueued)
+                self._cv.notify_all()
+            self._thread.join()
+            atexit.unregister(self.close)
+        self._closed = True
         try:
             self._fp.close()
         except Exception:
@@ -341,19 +587,62 @@ class WalWriter:
             try:
                 self._fp.flush()
                 os.fsync(self._fp.fileno())
+                self.fsyncs += 1
             except Exception:
                 pass
             self._since_fsync = 0
 
     def fsync_now(self) -> None:
+        if self.group_commit:
+            self.barrier()
+            return
         try:
             self._fp.flush()
             os.fsync(self._fp.fileno())
+            self.fsyncs += 1
         except Exception:
             pass
         self._since_fsync = 0
 
-    def write_event(self, event: str, payload: Dict[str, Any] | None = None) -> None:
+    def doc_boundary(self) -> None:
+        """Called after each document's events; fsync_mode="doc" syncs here unless group commit batches it."""
+        if self.fsync_mode == "doc" and not self.group_commit:
+            self.fsync_now()
+
+    def barrier(self, timeout: float | None = None) -> bool:
+        """Block until every event written so far is handed to the OS (and fsynced unless fsync_mode=off).
+
+        Use before destructive Chroma operations that rely on the preceding WAL events.
+        Returns False if the flusher hit a write error or the timeout expired.
+        """
+        if not self.group_commit:
+            try:
+                self._fp.flush()
+            except Exception:
+                return False
+            if self.fsync_mode != "off":
+                self.fsync_now()
+            return True
+        with self._cv:
+            target = self._enqueued
+            if self._durable < target and not self._failed:
+                self._barrier_target = max(self._barrier_target, target)
+                self._cv.notify_all()
+                self._cv.wait_for(lambda: self._durable >= target or self._failed, timeout)
+            return self._durable >= target and not self._failed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "group_commit": self.group_commit,
+            "fsync_mode": self.fsync_mode,
+            "events": self._seq,
+            "groups_written": self.groups_written,
+            "fsyncs": self.fsyncs,
+            "checkpoints_written": self.checkpoints_written,
+            "write_errors": self.write_errors,
+        }
+
+    def _encode(self, event: str, payload: Dict[str, Any] | None) -> bytes:
         self._seq += 1
         obj: Dict[str, Any] = {
             "wal_version": WAL_VERSION,
@@ -367,14 +656,164 @@ class WalWriter:
         }
         if payload:
             obj.update(payload)
-        line = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+        return (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def _submit(self, data: bytes, side: Dict[str, Any] | None = None) -> bool:
+        """Append one line (inline, or via the flusher queue). False if an inline write failed."""
+        if self.group_commit:
+            with self._cv:
+                self._queue.append((data, side))
+                self._enqueued += 1
+                # Wake the flusher when it idles on an empty queue or when a full group is ready;
+                # otherwise let it keep gathering for flush_ms.
+                if len(self._queue) == 1 or len(self._queue) >= self.group_max_events:
+                    self._cv.notify_all()
+            self._offset += len(data)
+            return True
         try:
-            self._fp.write(line + "\n")
+            self._fp.write(data)
             self._fp.flush()
+        except Exception:
+            return False
+        self._offset += len(data)
+        if side is not None:
+            if self.fsync_mode != "off":
+                self.fsync_now()
+            self._write_sidecar(side)
+        return True
+
+    def _write_sidecar(self, side: Dict[str, Any]) -> None:
+        side_path = wal_checkpoint_path(self.wal_path)
+        tmp = side_path.with_name(side_path.name + ".tmp")
+        try:
+            tmp.write_text(json.dumps(side, ensure_ascii=False), encoding="utf-8")
+            os.replace(str(tmp), str(side_path))
         except Exception:
             return
+        self.checkpoints_written += 1
+
+    def _flusher(self) -> None:
+        while True:
+            with self._cv:
+                while not self._queue and not self._closing and self._barrier_target <= self._durable:
+                    self._cv.wait()
+                if (
+                    self._queue
+                    and not self._closing
+                    and self._barrier_target <= self._durable
+                    and len(self._queue) < self.group_max_events
+                    and self.flush_s > 0
+                ):
+                    # Group window: more events (or a barrier/close) may arrive meanwhile.
+                    self._cv.wait(timeout=self.flush_s)
+                batch, self._queue = self._queue, []
+                force = self._barrier_target > self._durable
+                closing = self._closing
+                failed = self._failed
+
+            synced = False
+            if batch and not failed:
+                try:
+                    self._fp.write(b"".join(d for d, _ in batch))
+                    self._fp.flush()
+                    self.groups_written += 1
+                    self._since_fsync += len(batch)
+                    sides = [s for _, s in batch if s is not None]
+                    if self.fsync_mode != "off" and (
+                        force
+                        or sides
+                        or self.fsync_mode == "doc"
+                        or (self.fsync_mode == "interval" and self._since_fsync >= self.fsync_interval)
+                    ):
+                        os.fsync(self._fp.fileno())
+                        self.fsyncs += 1
+                        self._since_fsync = 0
+                        synced = True
+                    for s in sides:
+                        self._write_sidecar(s)
+                except Exception:
+                    # Stop at the first failure: a WAL that ends early only costs redone docs on resume,
+                    # a gap in the middle would not be detected by read_wal.
+                    failed = True
+                    self.write_errors += 1
+            elif force and not failed and self.fsync_mode != "off":
+                try:
+                    os.fsync(self._fp.fileno())
+                    self.fsyncs += 1
+                    self._since_fsync = 0
+                    synced = True
+                except Exception:
+                    failed = True
+                    self.write_errors += 1
+
+            with self._cv:
+                self._written += len(batch)
+                self._failed = failed
+                if synced or self.fsync_mode == "off":
+                    self._durable = self._written
+                self._cv.notify_all()
+                if closing and not self._queue:
+                    return
 
-        self._maybe_fsync()
+    def write_event(self, event: str, payload: Dict[str, Any] | None = None) -> None:
+        data = self._encode(event, payload)
+        if not self._submit(data):
+            return
+
+        ev = str(event)
+        p = payload or {}
+        self._last_event = ev
+        if ev in {"DOC_COMMITTED", "DOC_DONE"} and p.get("source_uri"):
+            self._done[str(p["source_uri"])] = [
+                str(p["source_uri"]),
+                str(p.get("doc_id") or ""),
+                str(p.get("content_sha256") or ""),
+                int(p.get("n_chunks") or 0),
+                str(p.get("updated_at") or ""),
+            ]
+        elif ev == "UPSERT_BATCH_COMMITTED":
+            self._committed_batches += 1
+            self._upsert_rows_committed_total = int(
+                p.get("upsert_rows_committed_total") or self._upsert_rows_committed_total
+            )
+
+        if not self.group_commit:
+            self._maybe_fsync()
+
+        self._events_since_ckpt += 1
+        self._bytes_since_ckpt += len(data)
+        if (
+            self.checkpoint_every
+            and ev != "RUN_FINISH"
+            and self._events_since_ckpt >= self.checkpoint_every
+            and self._bytes_since_ckpt >= self._last_ckpt_bytes
+        ):
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """Append a CHECKPOINT of the current run state and point the sidecar at it (once it is on disk)."""
+        offset = self._offset
+        data = self._encode(
+            "CHECKPOINT",
+            {
+                "done_docs": list(self._done.values()),
+                "committed_batches": self._committed_batches,
+                "upsert_rows_committed_total": self._upsert_rows_committed_total,
+                "last_event": self._last_event,
+            },
+        )
+        side = {
+            "wal_version": WAL_VERSION,
+            "offset": offset,
+            "length": len(data),
+            "run_id": self.run_id,
+            "seq": self._seq,
+        }
+        if not self._submit(data, side):
+            return
+        self._events_since_ckpt = 0
+        self._bytes_since_ckpt = 0
+        self._last_ckpt_bytes = len(data)
 
 
 class WriterLock:
@@ -450,8 +889,60 @@ def main() -> int:
 
     b.add_argument("--embed-model", default="BAAI/bge-m3")
     b.add_argument("--device", default="cpu")
-    b.add_argument("--embed-batch", type=int, default=32)
+    b.add_argument(
+        "--embed-batch", type=int, default=32, help="Chunks per model.encode call (filled across documents)."
+    )
     b.add_argument("--upsert-batch", type=int, default=256)
+    b.add_argument(
+        "--embed-cache",
+        default="",
+        help="Embedding cache dir keyed by (embed_model, sha256(chunk_text)); reused across collections/schema_hash. Empty/off = disabled.",
+    )
+    b.add_argument(
+        "--embed-cache-max-mb", type=int, default=4096, help="Embedding cache size cap (LRU eviction); 0 = unbounded."
+    )
+    b.add_argument(
+        "--embed-cache-dtype", default="float16", choices=["float16", "float32"], help="Embedding cache storage dtype."
+    )
+    b.add_argument(
+        "--keyword-index",
+        default="true",
+        help="true/false: mirror upserts/deletes into the persisted BM25 index (<state_dir>/keyword_index.sqlite) used by hybrid retrieval.",
+    )
+    b.add_argument(
+        "--length-bucketing",
+        action="store_true",
+        help="Sort pending chunks by approximate token length before batching (less padding; order restored).",
+    )
+    b.add_argument(
+        "--bucket-window",
+        type=int,
+        default=8,
+        help="With --length-bucketing: number of embed batches collected and sorted together.",
+    )
+    b.add_argument(
+        "--pipeline",
+        default="true",
+        help="true/false: overlap chunking, embedding and upsert via bounded stage queues (false = sequential per doc).",
+    )
+    b.add_argument(
+        "--pipeline-depth",
+        type=int,
+        default=4,
+        help="Max documents buffered between pipeline stages (backpressure bound).",
+    )
+    b.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Embedding worker processes (CPU only; each loads the model once). 1 = encode in-process.",
+    )
+    b.add_argument(
+        "--worker-threads",
+        type=int,
+        default=0,
+        help="Torch/BLAS threads per embedding worker (0 = available CPUs / workers).",
+    )
 
     b.add_argument("--chunk-chars", type=int, default=1200)
     b.add_argument("--overlap-chars", type=int, default=120)
@@ -510,6 +1001,18 @@ def main() -> int:
         "--strict-sync", default="true", help="true/false: fail if collection.count != expected_chunks after build."
     )
     b.add_argument("--write-state", default="true", help="true/false: write index_state.json after successful build.")
+    b.add_argument(
+        "--state-backend",
+        default="json",
+        choices=["json", "sqlite"],
+        help="Doc manifest storage: json (whole index_state.json per build) / sqlite (index_state.sqlite: keyed lookups, only changed docs written).",
+    )
+    b.add_argument(
+        "--state-json-export",
+        default="false",
+        help="true/false: with --state-backend sqlite, also export the full index_state.json after a successful build "
+        "(O(N) rewrite per build; off by default).",
+    )
 
     # resume / WAL (progress)
     b.add_argument(
@@ -528,6 +1031,30 @@ def main() -> int:
     b.add_argument(
         "--wal-fsync-interval", type=int, default=200, help="When wal-fsync=interval, fsync every N WAL events."
     )
+    b.add_argument(
+        "--wal-checkpoint-every",
+        type=int,
+        default=WAL_CHECKPOINT_EVENTS,
+        help="Append a compacted CHECKPOINT (done docs + counters) every N WAL events so resume replays only the tail; 0=off.",
+    )
+    b.add_argument(
+        "--wal-keep-rotated",
+        type=int,
+        default=WAL_KEEP_ROTATED,
+        help="Keep only the newest N rotated WALs (index_state.stage.jsonl.prev-<ts>) when a fresh run rotates the WAL.",
+    )
+    b.add_argument(
+        "--wal-group-commit",
+        default="on",
+        choices=["on", "off"],
+        help="on: a background flusher batches WAL events into one write (and at most one fsync) per group; off: write+flush every event inline.",
+    )
+    b.add_argument(
+        "--wal-flush-ms",
+        type=float,
+        default=WAL_FLUSH_MS,
+        help="Group-commit window: how long the flusher waits for more events before writing a group.",
+    )
     b.add_argument("--keep-wal", action="store_true", help="Do not delete WAL on success.")
     b.add_argument(
         "--writer-lock", default="true", help="true/false: create an exclusive writer lock in the state dir."
@@ -545,7 +1072,6 @@ def main() -> int:
     try:
         mod = _load_build_logic()
         ChunkConf = mod.ChunkConf
-        iter_units = mod.iter_units
         should_index_unit = mod.should_index_unit
         build_chunks_from_unit = mod.build_chunks_from_unit
         normalize_dense = getattr(mod, "normalize_dense", None)
@@ -659,8 +1185,15 @@ def main() -> int:
             collection = client.get_or_create_collection(name=args.collection)
         latest = None  # treat as fresh
 
+    state_backend = str(args.state_backend)
     state_file = ist.state_file_for(state_root, args.collection, schema_hash)
-    prev_state = ist.load_index_state(state_file, root=root)
+    if state_backend == "sqlite":
+        state_file = ist.state_db_for(state_root, args.collection, schema_hash)
+        prev_state = ist.load_index_state_sqlite(
+            state_file, root=root, json_fallback=ist.state_file_for(state_root, args.collection, schema_hash)
+        )
+    else:
+        prev_state = ist.load_index_state(state_file, root=root)
     existing_count = 0
     try:
         existing_count = int(collection.count())
@@ -737,7 +1270,7 @@ def main() -> int:
         print(f"collection={args.collection}")
         print(f"schema_hash={schema_hash}")
         print(f"collection_count={existing_count}")
-        print(f"state_file={state_file} state_present={state_file.exists()}")
+        print(f"state_backend={state_backend} state_file={state_file} state_present={prev_state is not None}")
         print(f"wal_path={wal_path} wal_present={wal_path.exists()} wal_on={wal_on}")
         if wal_snapshot:
             print(
@@ -746,6 +1279,9 @@ def main() -> int:
             print(
                 f"wal_docs_committed={len(wal_snapshot.done_docs)} wal_committed_batches={wal_snapshot.committed_batches} wal_upsert_rows_committed_total={wal_snapshot.upsert_rows_committed_total}"
             )
+            print(
+                f"wal_size_bytes={wal_path.stat().st_size} wal_checkpoint_offset={wal_snapshot.checkpoint_offset} wal_bytes_replayed={wal_snapshot.bytes_replayed}"
+            )
         else:
             print("wal_snapshot=None")
         print(f"resume_mode={resume_mode} resume_active={resume_active}")
@@ -767,8 +1303,7 @@ def main() -> int:
         # If not resuming, rotate existing WAL to avoid mixing multiple runs.
         if wal_path.exists() and not resume_active:
             try:
-                rotated = wal_path.with_suffix(wal_path.suffix + f".prev-{int(time.time())}")
-                os.replace(str(wal_path), str(rotated))
+                rotated = rotate_wal(wal_path, keep=int(args.wal_keep_rotated))
                 logger.warning("existing WAL rotated: %s", rotated.as_posix())
             except Exception:
                 pass
@@ -781,7 +1316,12 @@ def main() -> int:
             run_id=run_id,
             fsync_mode=str(args.wal_fsync),
             fsync_interval=int(args.wal_fsync_interval),
+            checkpoint_every=int(args.wal_checkpoint_every),
+            group_commit=str(args.wal_group_commit) == "on",
+            flush_ms=float(args.wal_flush_ms),
         )
+        if wal_writer.torn_tail_bytes:
+            logger.warning("WAL torn tail truncated before resume: %d bytes", wal_writer.torn_tail_bytes)
         wal_writer.write_event(
             "RUN_RESUME" if resume_active else "RUN_START",
             {
@@ -790,8 +1330,7 @@ def main() -> int:
                 "write_state": bool(_safe_bool(args.write_state)),
             },
         )
-        if str(args.wal_fsync) == "doc":
-            wal_writer.fsync_now()
+        wal_writer.doc_boundary()
 
     if prev_state is None and existing_count > 0:
         # 状态缺失但库非空：无法可靠定位“多余 ids”。
@@ -807,6 +1346,7 @@ def main() -> int:
                 print("[FATAL] missing index_state + non-empty collection; refuse to proceed")
                 if wal_writer:
                     wal_writer.write_event("RUN_FINISH", {"ok": False, "reason": "missing_state"})
+                    wal_writer.close()
                 if writer_lock:
                     writer_lock.release()
                 return 2
@@ -822,6 +1362,7 @@ def main() -> int:
                     print(f"[FATAL] failed to delete_collection(name={args.collection}) on missing-state reset: {e}")
                     if wal_writer:
                         wal_writer.write_event("RUN_FINISH", {"ok": False, "reason": "missing_state_reset_failed"})
+                        wal_writer.close()
                     if writer_lock:
                         writer_lock.release()
                     return 2
@@ -832,37 +1373,70 @@ def main() -> int:
                 existing_count = 0
             # full-upsert: proceed without reset (may keep stale)
 
+    # Persisted BM25 index: mirrors every Chroma upsert/delete of this run (dirty until the run succeeds).
+    kw_path = keyword_index_path(state_dir)
+    kw_index: KeywordIndex | None = None
+    if _safe_bool(str(args.keyword_index)):
+        try:
+            kw_index, kw_status = open_keyword_index_for_sync(
+                kw_path, collection_count=existing_count, resume=resume_active
+            )
+            logger.info("keyword index: %s (%s)", kw_status, kw_path.as_posix())
+        except Exception as e:
+            logger.warning("keyword index disabled: %s: %s", type(e).__name__, str(e))
+            drop_keyword_index(kw_path)
+            kw_index = None
+    else:
+        drop_keyword_index(kw_path)
+
+    def close_keyword_index(*, clean: bool) -> None:
+        if kw_index is None:
+            return
+        try:
+            if clean:
+                kw_index.set_dirty(False)
+            kw_index.close()
+        except Exception as e:
+            logger.warning("keyword index close failed: %s: %s", type(e).__name__, str(e))
+
     # 5) read current units (doc-level)
+    # Two-pass: only head fields + (offset, length) are kept here; the full unit (with text) is re-read
+    # from units_path by the chunk stage for the documents that actually need (re)building.
+    # A fresh sidecar index (written by extract_units) supplies the heads without reading units_path at all.
     cur_docs: Dict[str, Dict[str, Any]] = {}
     total_units = 0
     indexed_units = 0
     skipped_units = 0
 
-    for unit in iter_units(units_path):
+    for ref in iter_unit_refs(units_path):
+        head = ref.head
         total_units += 1
-        if not should_index_unit(unit, include_media_stub=include_media_stub):
+        if not should_index_unit(head, include_media_stub=include_media_stub):
             skipped_units += 1
             continue
 
         indexed_units += 1
-        source_uri = str(unit.get("source_uri") or "")
+        source_uri = str(head.get("source_uri") or "")
         if not source_uri:
             continue
         cur_docs[source_uri] = {
-            "doc_id": str(unit.get("doc_id") or ""),
+            "doc_id": str(head.get("doc_id") or ""),
             "source_uri": source_uri,
-            "source_type": str(unit.get("source_type") or ""),
-            "content_sha256": str(unit.get("content_sha256") or ""),
-            "updated_at": str(unit.get("updated_at") or ""),
-            "unit": unit,  # keep reference for building
+            "source_type": str(head.get("source_type") or ""),
+            "content_sha256": str(head.get("content_sha256") or ""),
+            "updated_at": str(head.get("updated_at") or ""),
+            "offset": ref.offset,
+            "length": ref.length,
         }
 
     # 6) decide delta (based on prev_state manifest)
-    prev_docs: Dict[str, Any] = {}
+    # sqlite backend: prev_docs is a lazy SqliteDocStore; only (sha, n_chunks) digests are loaded for the delta.
+    prev_docs: Mapping[str, Any] = {}
     if isinstance(prev_state, dict):
-        prev_docs = dict(prev_state.get("docs", {}) or {})
+        prev_docs = prev_state.get("docs", {}) or {}
+    prev_digests = ist.doc_digests(prev_docs)
 
-    prev_uris = set(prev_docs.keys())
+    prev_uris = set(prev_digests.keys())
     cur_uris = set(cur_docs.keys())
 
     deleted_uris = sorted(prev_uris - cur_uris)
@@ -871,8 +1445,7 @@ def main() -> int:
     changed_uris: List[str] = []
     unchanged_uris: List[str] = []
     for uri in sorted(prev_uris & cur_uris):
-        prev = prev_docs.get(uri) or {}
-        if str(prev.get("content_sha256", "")) != str(cur_docs[uri].get("content_sha256", "")):
+        if prev_digests[uri][0] != str(cur_docs[uri].get("content_sha256", "")):
             changed_uris.append(uri)
         else:
             unchanged_uris.append(uri)
@@ -892,7 +1465,7 @@ def main() -> int:
     expected_chunks = 0
     if sync_mode == "incremental" and prev_state is not None:
         for uri in unchanged_uris:
-            expected_chunks += int((prev_docs.get(uri) or {}).get("n_chunks", 0))
+            expected_chunks += prev_digests[uri][1]
 
     logger.info(
         "delta: docs_current=%s added=%s changed=%s deleted=%s unchanged=%s to_process=%s do_delete=%s",
@@ -946,6 +1519,8 @@ def main() -> int:
                         pbar.close()
                     print(f"[FATAL] collection.delete failed (doc_id={doc_id}, batch={len(batch)}): {e}")
                     raise
+                if kw_index is not None:
+                    kw_index.remove(batch)
                 deleted += len(batch)
                 batch = []
 
@@ -957,6 +1532,8 @@ def main() -> int:
                     pbar.close()
                 print(f"[FATAL] collection.delete failed (doc_id={doc_id}, batch={len(batch)}): {e}")
                 raise
+            if kw_index is not None:
+                kw_index.remove(batch)
             deleted += len(batch)
 
         return deleted
@@ -980,6 +1557,8 @@ def main() -> int:
                     wal_writer.write_event(
                         "RUN_FINISH", {"ok": False, "reason": "delete_removed_failed", "source_uri": uri}
                     )
+                    wal_writer.close()
+                close_keyword_index(clean=False)
                 if writer_lock:
                     writer_lock.release()
                 if pbar is not None:
@@ -991,36 +1570,49 @@ def main() -> int:
             changed_prev[uri] = {"doc_id": str(prev.get("doc_id") or ""), "n_chunks": int(prev.get("n_chunks") or 0)}
 
     # 8) embed + upsert (for selected docs)
+    # chunk -> embed -> upsert run as a bounded pipeline (see embed_pipeline); all Chroma writes,
+    # deletes and WAL events stay on this thread, so per-doc commit ordering is unchanged.
     ids_buf: List[str] = []
     docs_buf: List[str] = []
     metas_buf: List[Dict[str, MetaValue]] = []
-    embeds_buf: List[List[float]] = []
-
-    def l2_normalize(embs: Any) -> Any:
-        import math
-
-        out = []
-        for v in embs:
-            n = math.sqrt(sum((x * x for x in v))) or 1.0
-            out.append([float(x) / n for x in v])
-        return out
+    # Rows stay NumPy vectors (views into the encode output or cache hits) until flush() stacks them.
+    embeds_buf: List[Any] = []
+    stage_seconds: Dict[str, float] = {"chunk": 0.0, "embed": 0.0, "upsert": 0.0}
+    embed_stats: Dict[str, float] = {}
+    # Flipped once if this chromadb rejects ndarray embeddings; later batches go straight to lists.
+    upsert_lists = False
 
     def flush() -> None:
+        nonlocal upsert_lists
         if not ids_buf:
             return
 
-        vecs = embeds_buf
+        t_upsert = time.perf_counter()
+        vecs: Any
         if normalize_dense:
-            vecs = normalize_dense(vecs)
+            vecs = normalize_dense(embeds_buf)
         else:
-            vecs = l2_normalize(vecs)
+            vecs = _l2_normalize_rows(embeds_buf)
 
         metas_for_upsert = cast(List[Mapping[str, MetaValue]], metas_buf)
+        if upsert_lists and isinstance(vecs, np.ndarray):
+            vecs = vecs.tolist()
         try:
-            collection.upsert(ids=ids_buf, documents=docs_buf, metadatas=metas_for_upsert, embeddings=vecs)
+            try:
+                collection.upsert(ids=ids_buf, documents=docs_buf, metadatas=metas_for_upsert, embeddings=vecs)
+            except (TypeError, ValueError) as e:
+                if not isinstance(vecs, np.ndarray) or not _is_ndarray_rejection(e):
+                    raise
+                logger.info("chromadb rejected ndarray embeddings (%s); upserting python lists", str(e)[:120])
+                upsert_lists = True
+                vecs = vecs.tolist()
+                collection.upsert(ids=ids_buf, documents=docs_buf, metadatas=metas_for_upsert, embeddings=vecs)
         except Exception as e:
             logger.error("collection.upsert failed (batch=%s): %s", len(ids_buf), str(e))
             raise
+        if kw_index is not None:
+            kw_index.add(ids_buf, docs_buf, [extract_source(m, DEFAULT_META_FIELD) for m in metas_buf])
+        stage_seconds["upsert"] += time.perf_counter() - t_upsert
 
         batch_size = int(len(ids_buf))
         wal_stats["upsert_rows_committed_total"] += batch_size
@@ -1041,11 +1633,24 @@ def main() -> int:
         metas_buf.clear()
         embeds_buf.clear()
 
+    suppress_embed_progress = _safe_bool(str(getattr(args, "suppress_embed_progress", "true")))
+
+    def encode_dense(texts: List[str]) -> Any:
+        # Load model only when we are about to embed (runs on the embed stage thread when pipelined).
+        try:
+            m = _load_flagembedding_model()
+        except Exception as e:
+            raise StageError("embed_model_load_failed", detail=str(e)) from e
+
+        with _suppress_stderr(suppress_embed_progress):
+            return encode_dense_vecs(m, texts, max_length=8192)
+
     t0 = time.perf_counter()
 
     new_docs_state: Dict[str, Dict[str, Any]] = {}
 
-    if sync_mode == "incremental" and prev_state is not None:
+    # The sqlite backend keeps unchanged docs in place and only writes this build's delta.
+    if sync_mode == "incremental" and prev_state is not None and state_backend == "json":
         for uri in unchanged_uris:
             prev = prev_docs.get(uri) or {}
             if prev:
@@ -1055,32 +1660,196 @@ def main() -> int:
     docs_processed = 0
     docs_skipped_resume = 0
 
-    suppress_embed_progress = _safe_bool(str(getattr(args, "suppress_embed_progress", "true")))
+    pipeline_on = _safe_bool(str(getattr(args, "pipeline", "true")))
+    pipeline_depth = max(1, int(getattr(args, "pipeline_depth", 4) or 1))
+    logger.info(
+        "pipeline=%s pipeline_depth=%s length_bucketing=%s bucket_window=%s",
+        pipeline_on,
+        pipeline_depth,
+        bool(args.length_bucketing),
+        int(args.bucket_window),
+    )
 
-    for uri in to_process_uris:
-        info = cur_docs.get(uri)
-        if not info:
-            if pbar is not None:
-                pbar.update(1)
-                pbar.set_postfix(_pbar_postfix())
-            continue
+    # FlagEmbedding dense output is cached raw (normalize=False); normalization happens in flush().
+    try:
+        emb_cache = open_embedding_cache(
+            root,
+            str(args.embed_cache),
+            embed_model=str(args.embed_model),
+            normalize=False,
+            backend="flagembedding",
+            dtype=str(args.embed_cache_dtype),
+            max_mb=int(args.embed_cache_max_mb),
+        )
+    except Exception as e:
+        logger.warning("embed cache disabled: %s (%s: %s)", str(args.embed_cache), type(e).__name__, str(e))
+        emb_cache = None
+    if emb_cache is not None:
+        logger.info("embed cache: dir=%s rows=%s", emb_cache.dir.as_posix(), len(emb_cache))
 
-        if ids_buf:
+    def close_embed_cache() -> None:
+        if emb_cache is not None:
             try:
-                flush()
-            except Exception:
-                if wal_writer:
-                    wal_writer.write_event("RUN_FINISH", {"ok": False, "reason": "upsert_failed"})
-                if writer_lock:
-                    writer_lock.release()
-                if pbar is not None:
-                    pbar.close()
-                return 2
+                emb_cache.close()
+            except Exception as e:
+                logger.warning("embed cache close failed: %s: %s", type(e).__name__, str(e))
+
+    # Multi-process embedding: workers only run model.encode; this process stays the sole Chroma/WAL writer.
+    n_workers = max(1, int(getattr(args, "workers", 1) or 1))
+    if n_workers > 1 and not str(args.device).lower().startswith("cpu"):
+        logger.warning("--workers=%s is for CPU builds; device=%s -> encoding in-process", n_workers, args.device)
+        n_workers = 1
+    worker_pool: EmbedWorkerPool | None = None
+    if n_workers > 1:
+        worker_pool = EmbedWorkerPool(
+            workers=n_workers,
+            embed_model=str(args.embed_model),
+            device=str(args.device),
+            threads_per_worker=int(getattr(args, "worker_threads", 0) or 0),
+        )
+        logger.info("embed workers=%s threads_per_worker=%s", n_workers, worker_pool.threads_per_worker)
+
+    def close_worker_pool(cancel: bool = False) -> None:
+        if worker_pool is not None:
+            try:
+                worker_pool.close(cancel=cancel)
+            except Exception as e:
+                logger.warning("embed worker pool shutdown failed: %s: %s", type(e).__name__, str(e))
+
+    units_file = UnitsFile(units_path)
+
+    def load_unit(info: Dict[str, Any]) -> Dict[str, Any]:
+        unit = units_file.read(int(info["offset"]), int(info["length"]))
+        if str(unit.get("source_uri") or "") != info["source_uri"]:
+            raise StageError(
+                "units_changed_during_build",
+                source_uri=str(info["source_uri"]),
+                detail=f"{units_path.as_posix()} changed since delta detection (offset {info['offset']})",
+            )
+        return unit
+
+    def close_units_file() -> None:
+        try:
+            units_file.close()
+        except Exception as e:
+            logger.warning("units file close failed: %s: %s", type(e).__name__, str(e))
+
+    jobs = build_doc_pipeline(
+        to_process_uris,
+        cur_docs=cur_docs,
+        resume_done=dict(wal_done_docs),
+        build_chunks=build_chunks_from_unit,
+        conf=conf,
+        encode=encode_dense,
+        embed_batch=int(args.embed_batch),
+        depth=pipeline_depth if pipeline_on else None,
+        stats=embed_stats,
+        length_bucketing=bool(args.length_bucketing),
+        bucket_window=int(args.bucket_window),
+        cache=emb_cache,
+        on_cache_error=lambda e: logger.warning(
+            "embed cache disabled for the rest of this run: %s: %s", type(e).__name__, str(e)
+        ),
+        submit=worker_pool.submit if worker_pool is not None else None,
+        max_inflight=worker_pool.max_inflight if worker_pool is not None else 1,
+        load_unit=load_unit,
+    )
+
+    def abort_run(reason: str, payload: Dict[str, Any] | None = None) -> int:
+        close_jobs = getattr(jobs, "close", None)
+        if callable(close_jobs):
+            close_jobs()
+        close_worker_pool(cancel=True)
+        close_embed_cache()
+        close_units_file()
+        close_keyword_index(clean=False)
+        if wal_writer:
+            wal_writer.write_event("RUN_FINISH", {"ok": False, "reason": reason, **(payload or {})})
+            wal_writer.close()
+        if writer_lock:
+            writer_lock.release()
+        if pbar is not None:
+            pbar.close()
+        return 2
+
+    def advance_progress() -> None:
+        if pbar is not None:
+            pbar.update(1)
+            pbar.set_postfix(_pbar_postfix())
+
+    def delete_changed_tail(uri: str, new_doc_id: str, new_n: int) -> bool:
+        """After a changed doc is committed, drop chunk ids that the new version no longer owns.
+
+        Returns False (nothing deleted) when the WAL could not be made durable first; the caller aborts.
+        """
+        nonlocal chunks_deleted_changed_tail, docs_changed_tail_deleted
+        if uri not in changed_prev:
+            return True
+        prev_doc_id = str((changed_prev.get(uri) or {}).get("doc_id") or "")
+        prev_n = int((changed_prev.get(uri) or {}).get("n_chunks") or 0)
+        if not prev_doc_id or prev_n <= 0:
+            return True
+        if wal_writer and (prev_doc_id != new_doc_id or prev_n > int(new_n)):
+            # Keep the WAL ahead of destructive Chroma ops: this doc's DOC_COMMITTED/DOC_SKIPPED must be
+            # on disk before its old chunks go away (the ordering per-event writes used to give for free).
+            if not wal_writer.barrier():
+                return False
+        if prev_doc_id != new_doc_id:
+            deleted_tail = delete_doc_chunks(prev_doc_id, prev_n)
+        elif prev_n > int(new_n):
+            deleted_tail = delete_doc_chunks_range(prev_doc_id, int(new_n), prev_n)
+        else:
+            deleted_tail = 0
+        if deleted_tail:
+            chunks_deleted_changed_tail += int(deleted_tail)
+            docs_changed_tail_deleted += 1
+        return True
+
+    def commit_doc(uri: str, info: Dict[str, Any], doc_id: str, n_chunks: int) -> None:
+        wal_done_docs[uri] = WalDoc(
+            source_uri=uri,
+            doc_id=doc_id,
+            content_sha256=str(info.get("content_sha256") or ""),
+            n_chunks=int(n_chunks),
+            updated_at=str(info.get("updated_at") or ""),
+        )
+        if wal_writer:
+            wal_writer.write_event(
+                "DOC_COMMITTED",
+                {
+                    "source_uri": uri,
+                    "doc_id": doc_id,
+                    "content_sha256": str(info.get("content_sha256") or ""),
+                    "n_chunks": int(n_chunks),
+                    "updated_at": str(info.get("updated_at") or ""),
+                },
+            )
+            wal_writer.doc_boundary()
+        if kw_index is not None:
+            # Same boundary as the WAL: a resumed run keeps everything up to the last DOC_COMMITTED.
+            kw_index.commit()
 
+    job_iter = iter(jobs)
+    while True:
+        try:
+            job = next(job_iter)
+        except StopIteration:
+            break
+        except StageError as e:
+            if e.reason == "embed_failed":
+                logger.error("embedding failed for doc=%s: %s", e.source_uri, str(e))
+            else:
+                logger.error("%s: %s", e.reason, str(e))
+            return abort_run(e.reason, {"source_uri": e.source_uri} if e.source_uri else None)
+
+        uri = job.uri
+        info = job.info
         cur_sha = str(info.get("content_sha256") or "")
+        stage_seconds["chunk"] += job.chunk_seconds
+        stage_seconds["embed"] += job.embed_seconds
 
-        wal_doc = wal_done_docs.get(uri) if resume_active else None
-        if wal_doc and str(wal_doc.content_sha256) == cur_sha:
+        if job.kind == JOB_RESUME_SKIP:
+            wal_doc = wal_done_docs[uri]
             n_chunks = int(wal_doc.n_chunks)
             expected_chunks += n_chunks
             new_docs_state[uri] = {
@@ -1104,52 +1873,31 @@ def main() -> int:
                         "reason": "resume_done",
                     },
                 )
-                if str(args.wal_fsync) == "doc":
-                    wal_writer.fsync_now()
-
-            if uri in changed_prev:
-                prev_doc_id = str((changed_prev.get(uri) or {}).get("doc_id") or "")
-                prev_n = int((changed_prev.get(uri) or {}).get("n_chunks") or 0)
-                new_doc_id = str(wal_doc.doc_id or prev_doc_id)
-                new_n = n_chunks
-                try:
-                    if prev_doc_id and prev_n > 0:
-                        if prev_doc_id != new_doc_id:
-                            deleted_tail = delete_doc_chunks(prev_doc_id, prev_n)
-                        elif prev_n > new_n:
-                            deleted_tail = delete_doc_chunks_range(prev_doc_id, new_n, prev_n)
-                        else:
-                            deleted_tail = 0
-                        if deleted_tail:
-                            chunks_deleted_changed_tail += int(deleted_tail)
-                            docs_changed_tail_deleted += 1
-                except Exception as e:
-                    logger.error("delete changed-tail failed (source_uri=%s): %s", uri, str(e))
-                    if wal_writer:
-                        wal_writer.write_event(
-                            "RUN_FINISH", {"ok": False, "reason": "delete_changed_tail_failed", "source_uri": uri}
-                        )
-                    if writer_lock:
-                        writer_lock.release()
-                    if pbar is not None:
-                        pbar.close()
-                    return 2
+                wal_writer.doc_boundary()
 
-            if pbar is not None:
-                pbar.update(1)
-                pbar.set_postfix(_pbar_postfix())
-            continue
+            prev_doc_id = str((changed_prev.get(uri) or {}).get("doc_id") or "")
+            try:
+                wal_durable = delete_changed_tail(uri, str(wal_doc.doc_id or prev_doc_id), n_chunks)
+            except Exception as e:
+                logger.error("delete changed-tail failed (source_uri=%s): %s", uri, str(e))
+                return abort_run("delete_changed_tail_failed", {"source_uri": uri})
+            if not wal_durable:
+                logger.error("WAL barrier failed before changed-tail delete (source_uri=%s); aborting", uri)
+                return abort_run("wal_write_failed", {"source_uri": uri})
 
-        unit = info["unit"]
+            advance_progress()
+            continue
 
+        # DOC_BEGIN is written when the doc reaches the writer stage (chunk/embed may already be done).
         if wal_writer:
             wal_writer.write_event(
                 "DOC_BEGIN", {"source_uri": uri, "doc_id": str(info.get("doc_id") or ""), "content_sha256": cur_sha}
             )
 
-        chunk_texts, base_md = build_chunks_from_unit(unit, conf)
-        doc_id = str(base_md.get("doc_id") or info.get("doc_id") or "")
-        n_chunks = len(chunk_texts or [])
+        doc_id = job.doc_id
+        chunk_texts = job.chunk_texts
+        base_md = job.base_md
+        n_chunks = len(chunk_texts)
         expected_chunks += n_chunks
 
         new_docs_state[uri] = {
@@ -1161,209 +1909,46 @@ def main() -> int:
             "updated_at": str(info.get("updated_at") or ""),
         }
 
-        if not chunk_texts:
-            wal_done_docs[uri] = WalDoc(
-                source_uri=uri,
-                doc_id=doc_id,
-                content_sha256=cur_sha,
-                n_chunks=0,
-                updated_at=str(info.get("updated_at") or ""),
-            )
-            if wal_writer:
-                wal_writer.write_event(
-                    "DOC_COMMITTED",
-                    {
-                        "source_uri": uri,
-                        "doc_id": doc_id,
-                        "content_sha256": cur_sha,
-                        "n_chunks": 0,
-                        "updated_at": str(info.get("updated_at") or ""),
-                    },
-                )
-                if str(args.wal_fsync) == "doc":
-                    wal_writer.fsync_now()
-
-            if uri in changed_prev:
-                prev_doc_id = str((changed_prev.get(uri) or {}).get("doc_id") or "")
-                prev_n = int((changed_prev.get(uri) or {}).get("n_chunks") or 0)
-                try:
-                    if prev_doc_id and prev_n > 0:
-                        if prev_doc_id != doc_id:
-                            deleted_tail = delete_doc_chunks(prev_doc_id, prev_n)
-                        else:
-                            deleted_tail = delete_doc_chunks_range(prev_doc_id, 0, prev_n)
-                        if deleted_tail:
-                            chunks_deleted_changed_tail += int(deleted_tail)
-                            docs_changed_tail_deleted += 1
-                except Exception as e:
-                    logger.error("delete changed-tail failed (source_uri=%s): %s", uri, str(e))
-                    if wal_writer:
-                        wal_writer.write_event(
-                            "RUN_FINISH", {"ok": False, "reason": "delete_changed_tail_failed", "source_uri": uri}
-                        )
-                    if writer_lock:
-                        writer_lock.release()
-                    if pbar is not None:
-                        pbar.close()
-                    return 2
-
-            docs_processed += 1
-            if pbar is not None:
-                pbar.update(1)
-                pbar.set_postfix(_pbar_postfix())
-            continue
-
-        # Load model only when we are about to embed.
-        try:
-            model = _load_flagembedding_model()
-        except Exception:
-            if wal_writer:
-                wal_writer.write_event("RUN_FINISH", {"ok": False, "reason": "embed_model_load_failed"})
-            if writer_lock:
-                writer_lock.release()
-            if pbar is not None:
-                pbar.close()
-            return 2
-
-        # Embed chunk_texts in batches
-        for i in range(0, len(chunk_texts), int(args.embed_batch)):
-            batch_texts = chunk_texts[i : i + int(args.embed_batch)]
+        for idx, ct in enumerate(chunk_texts):
+            md = dict(base_md)
+            md["chunk_index"] = idx
+            md["chunk_chars"] = len(ct)
+            md["source_uri"] = uri
 
-            try:
-                with _suppress_stderr(suppress_embed_progress):
-                    # Prefer an explicit "no progress bar" kw; fall back if current FlagEmbedding version rejects it.
-                    try:
-                        out = model.encode(
-                            batch_texts,
-                            batch_size=len(batch_texts),
-                            max_length=8192,
-                            return_dense=True,
-                            return_sparse=False,
-                            return_colbert_vecs=False,
-                            show_progress_bar=False,
-                        )
-                    except TypeError:
-                        out = model.encode(
-                            batch_texts,
-                            batch_size=len(batch_texts),
-                            max_length=8192,
-                            return_dense=True,
-                            return_sparse=False,
-                            return_colbert_vecs=False,
-                        )
-                dense = out["dense_vecs"]
-            except Exception as e:
-                logger.error("embedding failed for doc=%s: %s", uri, str(e))
-                if wal_writer:
-                    wal_writer.write_event("RUN_FINISH", {"ok": False, "reason": "embed_failed", "source_uri": uri})
-                if writer_lock:
-                    writer_lock.release()
-                if pbar is not None:
-                    pbar.close()
-                return 2
+            ids_buf.append(_chunk_id(doc_id, idx))
+            docs_buf.append(ct)
+            metas_buf.append(md)
+            embeds_buf.append(job.dense[idx])
 
-            for j, ct in enumerate(batch_texts):
-                idx = i + j
-                cid = _chunk_id(doc_id, idx)
-                md = dict(base_md)
-                md["chunk_index"] = idx
-                md["chunk_chars"] = len(ct)
-                md["source_uri"] = uri
-
-                ids_buf.append(cid)
-                docs_buf.append(ct)
-                metas_buf.append(md)
-                embeds_buf.append([float(x) for x in dense[j]])
-
-                chunks_upserted += 1
-                if len(ids_buf) >= int(args.upsert_batch):
-                    try:
-                        flush()
-                    except Exception:
-                        if wal_writer:
-                            wal_writer.write_event("RUN_FINISH", {"ok": False, "reason": "upsert_failed"})
-                        if writer_lock:
-                            writer_lock.release()
-                        if pbar is not None:
-                            pbar.close()
-                        return 2
+            chunks_upserted += 1
+            if len(ids_buf) >= int(args.upsert_batch):
+                try:
+                    flush()
+                except Exception:
+                    return abort_run("upsert_failed")
 
         try:
             flush()
         except Exception:
-            if wal_writer:
-                wal_writer.write_event("RUN_FINISH", {"ok": False, "reason": "upsert_failed"})
-            if writer_lock:
-                writer_lock.release()
-            if pbar is not None:
-                pbar.close()
-            return 2
-
-        wal_done_docs[uri] = WalDoc(
-            source_uri=uri,
-            doc_id=doc_id,
-            content_sha256=cur_sha,
-            n_chunks=int(n_chunks),
-            updated_at=str(info.get("updated_at") or ""),
-        )
+            return abort_run("upsert_failed")
 
-        if wal_writer:
-            wal_writer.write_event(
-                "DOC_COMMITTED",
-                {
-                    "source_uri": uri,
-                    "doc_id": doc_id,
-                    "content_sha256": cur_sha,
-                    "n_chunks": int(n_chunks),
-                    "updated_at": str(info.get("updated_at") or ""),
-                },
-            )
-            if str(args.wal_fsync) == "doc":
-                wal_writer.fsync_now()
+        commit_doc(uri, info, doc_id, n_chunks)
 
-        if uri in changed_prev:
-            prev_doc_id = str((changed_prev.get(uri) or {}).get("doc_id") or "")
-            prev_n = int((changed_prev.get(uri) or {}).get("n_chunks") or 0)
-            try:
-                if prev_doc_id and prev_n > 0:
-                    if prev_doc_id != doc_id:
-                        deleted_tail = delete_doc_chunks(prev_doc_id, prev_n)
-                    elif prev_n > int(n_chunks):
-                        deleted_tail = delete_doc_chunks_range(prev_doc_id, int(n_chunks), prev_n)
-                    else:
-                        deleted_tail = 0
-                    if deleted_tail:
-                        chunks_deleted_changed_tail += int(deleted_tail)
-                        docs_changed_tail_deleted += 1
-            except Exception as e:
-                logger.error("delete changed-tail failed (source_uri=%s): %s", uri, str(e))
-                if wal_writer:
-                    wal_writer.write_event(
-                        "RUN_FINISH", {"ok": False, "reason": "delete_changed_tail_failed", "source_uri": uri}
-                    )
-                if writer_lock:
-                    writer_lock.release()
-                if pbar is not None:
-                    pbar.close()
-                return 2
+        try:
+            wal_durable = delete_changed_tail(uri, doc_id, n_chunks)
+        except Exception as e:
+            logger.error("delete changed-tail failed (source_uri=%s): %s", uri, str(e))
+            return abort_run("delete_changed_tail_failed", {"source_uri": uri})
+        if not wal_durable:
+            logger.error("WAL barrier failed before changed-tail delete (source_uri=%s); aborting", uri)
+            return abort_run("wal_write_failed", {"source_uri": uri})
 
         docs_processed += 1
-        if pbar is not None:
-            pbar.update(1)
-            pbar.set_postfix(_pbar_postfix())
-
-    if ids_buf:
-        try:
-            flush()
-        except Exception:
-            if wal_writer:
-                wal_writer.write_event("RUN_FINISH", {"ok": False, "reason": "upsert_failed"})
-            if writer_lock:
-                writer_lock.release()
-            if pbar is not None:
-                pbar.close()
-            return 2
+        advance_progress()
 
+    close_worker_pool()
+    close_embed_cache()
+    close_units_file()
     dt = time.perf_counter() - t0
 
     if pbar is not None:
@@ -1377,6 +1962,18 @@ def main() -> int:
     except Exception:
         final_count = None
 
+    kw_info: Dict[str, Any] | None = None
+    if kw_index is not None:
+        kw_info = kw_index.stats()
+        kw_in_sync = final_count is not None and kw_index.n_chunks == final_count
+        close_keyword_index(clean=kw_in_sync)
+        if not kw_in_sync:
+            logger.warning(
+                "keyword index out of sync (n_chunks=%s collection_count=%s); dropped", kw_info["n_docs"], final_count
+            )
+            drop_keyword_index(kw_path)
+            kw_info = None
+
     ok = True
     if strict_sync and final_count is not None:
         if final_count != expected_chunks:
@@ -1445,22 +2042,59 @@ def main() -> int:
             "wal_path": wal_path.as_posix(),
             "wal_committed_batches": int(wal_committed_batches),
             "wal_upsert_rows_committed_total": int(upsert_rows_committed_total),
+            "wal_writer": wal_writer.stats() if wal_writer else None,
             "log_file": log_path.as_posix(),
+            "pipeline": {
+                "enabled": bool(pipeline_on),
+                "depth": int(pipeline_depth),
+                "chunk_seconds": round(float(stage_seconds["chunk"]), 3),
+                "embed_seconds": round(float(stage_seconds["embed"]), 3),
+                "upsert_seconds": round(float(stage_seconds["upsert"]), 3),
+                "embed_batch": int(args.embed_batch),
+                "length_bucketing": bool(args.length_bucketing),
+                "bucket_window": int(args.bucket_window),
+                "workers": int(n_workers),
+                "worker_threads": int(worker_pool.threads_per_worker) if worker_pool is not None else 0,
+                **summarize_embed_stats(embed_stats),
+            },
+            "embed_cache": emb_cache.stats() if emb_cache is not None else None,
+            "keyword_index": kw_info,
         }
 
-        ist.write_index_state_report(
-            root=root,
-            state_root=state_root,
-            collection=str(args.collection),
-            schema_hash=schema_hash,
-            db=db_path,
-            embed_model=str(args.embed_model),
-            chunk_conf=chunk_conf_dict,
-            include_media_stub=include_media_stub,
-            docs=new_docs_state,
-            last_build=last_build,
-            items=raw_items,
-        )
+        if state_backend == "sqlite":
+            if isinstance(prev_docs, ist.SqliteDocStore):
+                prev_docs.close()
+            ist.write_index_state_sqlite(
+                root=root,
+                state_root=state_root,
+                collection=str(args.collection),
+                schema_hash=schema_hash,
+                db=db_path,
+                embed_model=str(args.embed_model),
+                chunk_conf=chunk_conf_dict,
+                include_media_stub=include_media_stub,
+                upserts=new_docs_state,
+                # Final state = current docs: unchanged rows stay, processed rows are upserted.
+                deletes=sorted(prev_uris - cur_uris),
+                replace=prev_state is None,
+                last_build=last_build,
+                items=raw_items,
+                export_json=_safe_bool(str(args.state_json_export)),
+            )
+        else:
+            ist.write_index_state_report(
+                root=root,
+                state_root=state_root,
+                collection=str(args.collection),
+                schema_hash=schema_hash,
+                db=db_path,
+                embed_model=str(args.embed_model),
+                chunk_conf=chunk_conf_dict,
+                include_media_stub=include_media_stub,
+                docs=new_docs_state,
+                last_build=last_build,
+                items=raw_items,
+            )
 
     # 11) summary (kept on console as key info)
     print("=== BUILD SUMMARY (FlagEmbedding) ===")
@@ -1487,6 +2121,25 @@ def main() -> int:
     print(f"include_media_stub={include_media_stub}")
     print(f"chunk_conf={chunk_conf_dict}")
     print(f"elapsed_sec={round(float(dt), 3)}")
+    print(
+        f"pipeline={pipeline_on} depth={pipeline_depth} workers={n_workers} stage_seconds="
+        + ",".join(f"{k}:{round(float(v), 3)}" for k, v in stage_seconds.items())
+    )
+    embed_summary = summarize_embed_stats(embed_stats)
+    print(
+        f"encode_calls={embed_summary['encode_calls']} encode_texts={embed_summary['encode_texts']}"
+        f" embed_batch={int(args.embed_batch)} length_bucketing={bool(args.length_bucketing)}"
+        f" padding_ratio={embed_summary['padding_ratio']} padding_ratio_doc_order={embed_summary['padding_ratio_doc_order']}"
+        f" tokens_per_sec={embed_summary['tokens_per_sec']}"
+    )
+    if emb_cache is not None:
+        cs = emb_cache.stats()
+        print(
+            f"embed_cache={cs['dir']} hits={cs['hits']} misses={cs['misses']} rows={cs['rows']} evictions={cs['evictions']}"
+        )
+
+    if kw_info is not None:
+        print(f"keyword_index={kw_info['path']} chunks={kw_info['n_docs']} terms={kw_info['n_terms']}")
 
     if strict_sync and final_count is not None and final_count != expected_chunks:
         print(f"STATUS: FAIL (sync mismatch; expected_chunks={expected_chunks} got={final_count})")
@@ -1567,6 +2220,9 @@ def main() -> int:
             try:
                 if wal_path.exists():
                     os.remove(wal_path)
+                ckpt_path = wal_checkpoint_path(wal_path)
+                if ckpt_path.exists():
+                    os.remove(ckpt_path)
             except Exception:
                 pass
 
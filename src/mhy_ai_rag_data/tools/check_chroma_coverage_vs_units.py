@@ -28,6 +28,9 @@ python tools/check_chroma_coverage_vs_units.py \
   --chunk-chars 1200 --overlap-chars 120 --min-chunk-chars 200 \
   --batch 200
 
+抽查：--source-uri（可重复）只检查指定文档；经 units 的 sidecar 偏移索引直接定位，不解析整个 units 文件。
+未被 should_index 选中的 unit 只看头部字段，不解析全文。
+
 退出码
 ------
 0：成功输出覆盖率
@@ -39,6 +42,8 @@ from __future__ import annotations
 import argparse
 from pathlib import Path
 
+from mhy_ai_rag_data.units_reader import UnitsFile, iter_unit_refs
+
 
 def _bool(s: str) -> bool:
     return str(s).strip().lower() in {"1", "true", "yes", "y", "on"}
@@ -55,6 +60,12 @@ def main() -> int:
     ap.add_argument("--overlap-chars", type=int, default=120)
     ap.add_argument("--min-chunk-chars", type=int, default=200)
     ap.add_argument("--batch", type=int, default=200)
+    ap.add_argument(
+        "--source-uri",
+        action="append",
+        default=None,
+        help="Only check this unit's chunks (repeatable); spot-check without parsing the whole units file",
+    )
     args = ap.parse_args()
 
     root = Path(args.root).resolve()
@@ -67,7 +78,6 @@ def main() -> int:
         from mhy_ai_rag_data import build_chroma_index as mod
 
         ChunkConf = mod.ChunkConf
-        iter_units = mod.iter_units
         should_index_unit = mod.should_index_unit
         build_chunks_from_unit = mod.build_chunks_from_unit
     except Exception as e:
@@ -79,19 +89,28 @@ def main() -> int:
 
     # 1) compute expected ids
     expected_ids: list[str] = []
-    for unit in iter_units(units_path):
-        if not should_index_unit(unit, include_media_stub):
-            continue
-        chunks, base_md = build_chunks_from_unit(unit, conf)
-        if not chunks:
-            continue
-        doc_id = str(base_md.get("doc_id"))
-        for i in range(len(chunks)):
-            expected_ids.append(f"{doc_id}:{i}")
+    wanted = set(args.source_uri or [])
+    found: set[str] = set()
+    with UnitsFile(units_path) as uf:
+        for ref in iter_unit_refs(units_path):
+            uri = str(ref.head.get("source_uri") or "")
+            if wanted and uri not in wanted:
+                continue
+            found.add(uri)
+            if not should_index_unit(ref.head, include_media_stub):
+                continue
+            chunks, base_md = build_chunks_from_unit(uf.read(ref.offset, ref.length), conf)
+            if not chunks:
+                continue
+            doc_id = str(base_md.get("doc_id"))
+            for i in range(len(chunks)):
+                expected_ids.append(f"{doc_id}:{i}")
 
     expected = len(expected_ids)
     print(f"expected_chunks={expected}")
     print(f"include_media_stub={include_media_stub}")
+    if wanted:
+        print(f"source_uris={len(wanted)} missing_in_units={len(wanted - found)}")
     print(
         f"chunk_conf=chunk_chars:{args.chunk_chars} overlap_chars:{args.overlap_chars} min_chunk_chars:{args.min_chunk_chars}"
     )
@@ -35,6 +35,8 @@ from pathlib import Path
 
 from chromadb import PersistentClient
 
+from mhy_ai_rag_data.units_reader import load_units_index
+
 
 def _ext(p: str) -> str:
     try:
@@ -44,6 +46,10 @@ def _ext(p: str) -> str:
 
 
 def load_units_sources(units_path: Path) -> set[str]:
+    # A fresh sidecar offset index already lists every source_uri: no need to parse the units text.
+    refs = load_units_index(units_path)
+    if refs is not None:
+        return {u for u in (str(r.head.get("source_uri") or "").strip() for r in refs) if u}
     s: set[str] = set()
     with units_path.open("r", encoding="utf-8") as f:
         for line in f:
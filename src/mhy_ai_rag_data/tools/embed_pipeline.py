@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""mhy_ai_rag_data.tools.embed_pipeline
+
+build_chroma_index_flagembedding 的分段流水线（chunk -> embed -> upsert）。
+
+设计
+- 每个阶段是一个普通的迭代器变换（DocJob 进、DocJob 出），顺序执行时与旧的逐文档循环等价。
+- embed 阶段跨文档攒批（micro-batch）：来自多个文档的 chunk 共同填满 embed_batch，向量再按 (doc, chunk_index) 回填。
+- 可选长度分桶（length bucketing）：在若干批的窗口内按近似 token 长度排序后再切批，减少 padding；回填时恢复原顺序。
+- 可选向量缓存（mhy_ai_rag_data.embedding_cache）：命中的 chunk 不进入批次，只有 miss 才调用模型。
+- 可选进程池（embed_workers.EmbedWorkerPool，--workers N）：批次以 Future 形式并发推理，按提交顺序回收。
+- iter_background() 把某个阶段放进后台线程，阶段之间以有界队列衔接（队列满即阻塞上游 = 背压）。
+- 单线程 FIFO 保证 DocJob 的输出顺序与输入顺序一致；Chroma 写入 / WAL / 删除只发生在消费端（主线程），
+  因此 DOC_COMMITTED 仍然严格在该文档所有行 upsert 之后写出。
+
+失败语义
+- 阶段内部失败统一包装为 StageError(reason, source_uri)，由消费端映射到 RUN_FINISH(ok=false, reason=...)。
+
+本模块不依赖第三方库（模型/Chroma 由调用方以回调形式注入）。
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+JOB_RESUME_SKIP = "resume_skip"
+JOB_EMPTY = "empty"
+JOB_EMBED = "embed"
+
+
+class StageError(RuntimeError):
+    """Failure inside a pipeline stage, tagged with the WAL RUN_FINISH reason."""
+
+    def __init__(self, reason: str, *, source_uri: str = "", detail: str = "") -> None:
+        super().__init__(detail or reason)
+        self.reason = str(reason)
+        self.source_uri = str(source_uri)
+
+
+@dataclass
+class DocJob:
+    uri: str
+    info: Dict[str, Any]
+    kind: str
+    doc_id: str = ""
+    chunk_texts: List[str] = field(default_factory=list)
+    base_md: Dict[str, Any] = field(default_factory=dict)
+    dense: List[Any] = field(default_factory=list)
+    n_pending: int = 0
+    chunk_seconds: float = 0.0
+    embed_seconds: float = 0.0
+
+
+_END = object()
+
+
+def iter_background(source: Iterable[T], *, maxsize: int, name: str) -> Iterator[T]:
+    """Run `source` in a daemon thread and yield its items through a bounded queue.
+
+    - maxsize bounds the number of in-flight items (backpressure on the producer).
+    - Exceptions raised by the producer are re-raised in the consumer, after all items
+      produced before the failure have been yielded.
+    - Closing the returned generator (break/return/exception in the consumer) stops the
+      producer at its next item, closes `source` if it is a generator, and waits for the thread
+      to exit, so resources the producer uses (embed cache memmaps, units mmap) can be closed next.
+    """
+
+    q: "queue.Queue[Tuple[Any, Any]]" = queue.Queue(maxsize=max(1, int(maxsize)))
+    stop = threading.Event()
+
+    def _put(item: Tuple[Any, Any]) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run() -> None:
+        it = iter(source)
+        try:
+            for item in it:
+                if not _put((item, None)):
+                    break
+            else:
+                _put((_END, None))
+        except BaseException as e:  # noqa: BLE001 - forwarded to consumer
+            _put((_END, e))
+        finally:
+            close = getattr(it, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+
+    th = threading.Thread(target=_run, name=f"embed-pipeline-{name}", daemon=True)
+    th.start()
+    try:
+        while True:
+            item, err = q.get()
+            if item is _END:
+                if err is not None:
+                    raise err
+                return
+            yield item
+    finally:
+        stop.set()
+        if th is not threading.current_thread():
+            th.join()
+
+
+def iter_chunk_jobs(
+    uris: Iterable[str],
+    *,
+    cur_docs: Mapping[str, Dict[str, Any]],
+    resume_done: Mapping[str, Any],
+    build_chunks: Callable[[Dict[str, Any], Any], Tuple[List[str], Dict[str, Any]]],
+    conf: Any,
+    load_unit: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+) -> Iterator[DocJob]:
+    """Stage 1: decide resume-skip and split each document into chunk texts.
+
+    resume_done is a read-only snapshot (source_uri -> WalDoc-like object with content_sha256).
+    Documents missing from cur_docs are silently dropped (same as the legacy loop).
+    load_unit (optional) fetches the full unit for a cur_docs entry; default is info["unit"].
+    The unit is only referenced while its chunks are built, so skipped documents are never read.
+    """
+
+    for uri in uris:
+        info = cur_docs.get(uri)
+        if not info:
+            continue
+        cur_sha = str(info.get("content_sha256") or "")
+        wal_doc = resume_done.get(uri)
+        if wal_doc is not None and str(getattr(wal_doc, "content_sha256", "")) == cur_sha:
+            yield DocJob(uri=uri, info=info, kind=JOB_RESUME_SKIP, doc_id=str(getattr(wal_doc, "doc_id", "") or ""))
+            continue
+
+        t0 = time.perf_counter()
+        unit = load_unit(info) if load_unit is not None else info["unit"]
+        chunk_texts, base_md = build_chunks(unit, conf)
+        del unit
+        doc_id = str(base_md.get("doc_id") or info.get("doc_id") or "")
+        yield DocJob(
+            uri=uri,
+            info=info,
+            kind=JOB_EMBED if chunk_texts else JOB_EMPTY,
+            doc_id=doc_id,
+            chunk_texts=list(chunk_texts or []),
+            base_md=base_md,
+            chunk_seconds=time.perf_counter() - t0,
+        )
+
+
+def approx_tokens(text: str, *, max_length: int = 8192) -> int:
+    """Cheap token-count estimate used for length bucketing / padding stats.
+
+    CJK characters count ~1 token each, other non-space characters ~4 per token, plus BOS/EOS.
+    Capped at max_length (the encoder truncates there anyway).
+    """
+
+    cjk = 0
+    other = 0
+    for ch in text:
+        if "\u3000" <= ch <= "\u9fff" or "\uac00" <= ch <= "\ud7af" or "\uf900" <= ch <= "\ufaff":
+            cjk += 1
+        elif not ch.isspace():
+            other += 1
+    return min(int(max_length), cjk + (other + 3) // 4 + 2)
+
+
+def _padded_tokens(lens: List[int], batches: List[List[int]]) -> int:
+    return sum(max(lens[k] for k in b) * len(b) for b in batches if b)
+
+
+def iter_embedded_jobs(
+    jobs: Iterable[DocJob],
+    *,
+    encode: Callable[[List[str]], Any],
+    batch_size: int,
+    stats: Optional[Dict[str, float]] = None,
+    length_bucketing: bool = False,
+    bucket_window: int = 8,
+    cache: Optional[Any] = None,
+    on_cache_error: Optional[Callable[[Exception], None]] = None,
+    submit: Optional[Callable[[List[str]], "Future[Any]"]] = None,
+    max_inflight: int = 1,
+) -> Iterator[DocJob]:
+    """Stage 2: attach dense vectors (aligned with chunk_texts) to every JOB_EMBED job.
+
+    Cross-document micro-batching: chunks from consecutive documents fill the same `batch_size`
+    slots, so a corpus of many short files still produces full encode batches. Each vector is
+    mapped back to its (doc, chunk_index); documents are released in input order once all of
+    their chunks have vectors (non-embed jobs wait behind earlier incomplete documents).
+
+    length_bucketing: collect `bucket_window` batches worth of chunks, sort them by approx_tokens()
+    and cut the sorted window into batches, so each batch holds similar lengths (less padding).
+    Vectors are scattered back by (doc, chunk_index), i.e. the original order is restored.
+
+    cache (optional, EmbeddingCache-like get_many/put_many): chunks with a cached vector skip the
+    model entirely; only misses enter the batches, and fresh vectors are written back. The cache is
+    optional, so its failures never fail the build: the first get_many/put_many error is passed to
+    on_cache_error, the cache is dropped for the rest of the run (stats cache_errors=1) and the
+    computed vectors are used as usual.
+
+    encode(texts) returns a sequence of vectors; it may raise StageError (e.g. model load failure),
+    any other exception is reported as reason=embed_failed for the earliest document of the batch.
+
+    submit (optional, e.g. EmbedWorkerPool.submit) replaces the in-thread encode() call: batches are
+    handed to a pool and up to `max_inflight` of them run concurrently; results are collected in
+    submission order, so vector alignment, document order and failure attribution are unchanged.
+    In this mode encode_seconds is the wall time during which at least one batch was in flight.
+
+    stats keys: encode_calls/encode_texts/encode_seconds, cache_hits, tokens_real, tokens_padded and
+    tokens_padded_doc_order (padding the same chunks would cost in plain document order).
+    """
+
+    bs = max(1, int(batch_size))
+    window_size = bs * max(1, int(bucket_window)) if length_bucketing else bs
+    pending: Deque[DocJob] = deque()
+    slots: List[Tuple[DocJob, int]] = []
+
+    def _bump(key: str, value: float) -> None:
+        if stats is not None:
+            stats[key] = stats.get(key, 0) + value
+
+    def _drop_cache(e: Exception) -> None:
+        nonlocal cache
+        cache = None
+        _bump("cache_errors", 1)
+        if on_cache_error is not None:
+            on_cache_error(e)
+
+    inflight: Deque[Tuple[List[Tuple[DocJob, int]], str, "Future[Any]", float]] = deque()
+    busy_since = [0.0]
+
+    def _run_batch(batch: List[Tuple[DocJob, int]], first_uri: str) -> None:
+        texts = [job.chunk_texts[i] for job, i in batch]
+        t0 = time.perf_counter()
+        if submit is not None:
+            if not inflight:
+                busy_since[0] = t0
+            inflight.append((batch, first_uri, submit(texts), t0))
+            while len(inflight) > max(1, int(max_inflight)):
+                _collect_one()
+            _collect_done()
+            return
+        try:
+            out = encode(texts)
+        except StageError:
+            raise
+        except Exception as e:
+            raise StageError("embed_failed", source_uri=first_uri, detail=str(e)) from e
+        dt = time.perf_counter() - t0
+        _bump("encode_seconds", dt)
+        _store(batch, first_uri, texts, out, dt)
+
+    def _collect_one() -> None:
+        batch, first_uri, fut, t0 = inflight.popleft()
+        try:
+            out = fut.result()
+        except StageError:
+            raise
+        except Exception as e:
+            raise StageError("embed_failed", source_uri=first_uri, detail=f"{type(e).__name__}: {e}") from e
+        now = time.perf_counter()
+        _bump("encode_seconds", now - busy_since[0])
+        busy_since[0] = now
+        _store(batch, first_uri, [job.chunk_texts[i] for job, i in batch], out, now - t0)
+
+    def _collect_done() -> None:
+        while inflight and inflight[0][2].done():
+            _collect_one()
+
+    def _store(batch: List[Tuple[DocJob, int]], first_uri: str, texts: List[str], out: Any, dt: float) -> None:
+        if cache is not None:
+            try:
+                cache.put_many(texts, out)
+            except Exception as e:
+                _drop_cache(e)
+        share = dt / len(batch)
+        for k, (job, i) in enumerate(batch):
+            job.dense[i] = out[k]
+            job.n_pending -= 1
+            job.embed_seconds += share
+        _bump("encode_calls", 1)
+        _bump("encode_texts", len(batch))
+
+    def _run_window(window: List[Tuple[DocJob, int]]) -> None:
+        lens = [approx_tokens(job.chunk_texts[i]) for job, i in window]
+        positions = list(range(len(window)))
+        doc_order = [positions[k : k + bs] for k in range(0, len(positions), bs)]
+        if length_bucketing:
+            positions.sort(key=lambda k: lens[k])
+        batches = [positions[k : k + bs] for k in range(0, len(positions), bs)]
+        _bump("tokens_real", sum(lens))
+        _bump("tokens_padded", _padded_tokens(lens, batches))
+        _bump("tokens_padded_doc_order", _padded_tokens(lens, doc_order))
+        for b in batches:
+            _run_batch([window[k] for k in b], window[min(b)][0].uri)
+
+    def _ready() -> Iterator[DocJob]:
+        while pending and pending[0].n_pending <= 0:
+            yield pending.popleft()
+
+    for job in jobs:
+        pending.append(job)
+        if job.kind == JOB_EMBED:
+            job.dense = [None] * len(job.chunk_texts)
+            missing = list(range(len(job.chunk_texts)))
+            if cache is not None:
+                try:
+                    cached = cache.get_many(job.chunk_texts)
+                except Exception as e:
+                    _drop_cache(e)
+                    cached = []
+                for i, vec in enumerate(cached):
+                    if vec is not None:
+                        job.dense[i] = vec
+                missing = [i for i in missing if job.dense[i] is None]
+                _bump("cache_hits", len(job.chunk_texts) - len(missing))
+            job.n_pending = len(missing)
+            slots.extend((job, i) for i in missing)
+            while len(slots) >= window_size:
+                window, slots = slots[:window_size], slots[window_size:]
+                _run_window(window)
+        _collect_done()
+        yield from _ready()
+
+    if slots:
+        _run_window(slots)
+        slots = []
+    while inflight:
+        _collect_one()
+        yield from _ready()
+    yield from _ready()
+
+
+def summarize_embed_stats(stats: Mapping[str, float]) -> Dict[str, Any]:
+    """Derive report fields (padding ratios, tokens/sec) from iter_embedded_jobs stats."""
+
+    real = float(stats.get("tokens_real", 0))
+    padded = float(stats.get("tokens_padded", 0))
+    padded_doc = float(stats.get("tokens_padded_doc_order", 0))
+    secs = float(stats.get("encode_seconds", 0.0))
+    return {
+        "encode_calls": int(stats.get("encode_calls", 0)),
+        "encode_texts": int(stats.get("encode_texts", 0)),
+        "cache_hits": int(stats.get("cache_hits", 0)),
+        "cache_errors": int(stats.get("cache_errors", 0)),
+        "encode_seconds": round(secs, 3),
+        "approx_tokens": int(real),
+        "padding_ratio": round(1.0 - real / padded, 4) if padded else 0.0,
+        "padding_ratio_doc_order": round(1.0 - real / padded_doc, 4) if padded_doc else 0.0,
+        "tokens_per_sec": round(real / secs, 1) if secs > 0 else 0.0,
+        "padded_tokens_per_sec": round(padded / secs, 1) if secs > 0 else 0.0,
+    }
+
+
+def build_doc_pipeline(
+    uris: Iterable[str],
+    *,
+    cur_docs: Mapping[str, Dict[str, Any]],
+    resume_done: Mapping[str, Any],
+    build_chunks: Callable[[Dict[str, Any], Any], Tuple[List[str], Dict[str, Any]]],
+    conf: Any,
+    encode: Callable[[List[str]], Any],
+    embed_batch: int,
+    depth: Optional[int],
+    stats: Optional[Dict[str, float]] = None,
+    length_bucketing: bool = False,
+    bucket_window: int = 8,
+    cache: Optional[Any] = None,
+    on_cache_error: Optional[Callable[[Exception], None]] = None,
+    submit: Optional[Callable[[List[str]], "Future[Any]"]] = None,
+    max_inflight: int = 1,
+    load_unit: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+) -> Iterator[DocJob]:
+    """Compose chunk -> embed stages.
+
+    depth=None (or <=0) keeps everything on the caller thread (legacy sequential behavior);
+    otherwise each stage runs in its own thread with a queue of `depth` documents.
+    stats (optional) collects encode/padding counters from the embed stage (see summarize_embed_stats).
+    """
+
+    threaded = depth is not None and int(depth) > 0
+    chunked: Iterable[DocJob] = iter_chunk_jobs(
+        uris,
+        cur_docs=cur_docs,
+        resume_done=resume_done,
+        build_chunks=build_chunks,
+        conf=conf,
+        load_unit=load_unit,
+    )
+    if threaded:
+        chunked = iter_background(chunked, maxsize=int(depth or 1), name="chunk")
+    embedded: Iterator[DocJob] = iter_embedded_jobs(
+        chunked,
+        encode=encode,
+        batch_size=embed_batch,
+        stats=stats,
+        length_bucketing=length_bucketing,
+        bucket_window=bucket_window,
+        cache=cache,
+        on_cache_error=on_cache_error,
+        submit=submit,
+        max_inflight=max_inflight,
+    )
+    if threaded:
+        embedded = iter_background(embedded, maxsize=int(depth or 1), name="embed")
+    return embedded
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""mhy_ai_rag_data.tools.embed_workers
+
+build_chroma_index_flagembedding 的多进程 embedding worker（--workers N，面向纯 CPU 构建）。
+
+设计
+- N 个 spawn 子进程，各自只加载一次 BGEM3FlagModel；每个 worker 限定 torch/BLAS 线程数，
+  Linux 上另按 worker 序号绑定到互不重叠的 CPU 子集（sched_setaffinity）。
+- 批次经 ProcessPoolExecutor 的共享任务队列分发，哪个 worker 空闲就由哪个取走；
+  返回 Future，由 embed_pipeline 按提交顺序收集并回填向量。
+- 子进程只做推理，不接触 Chroma / WAL / state：父进程仍是唯一写入者（WriterLock 单写入者契约不变）。
+- 进程池懒启动：--resume-status、全部命中 embed cache 的一轮都不会拉起子进程。
+
+失败语义
+- 子进程加载模型失败 -> StageError("embed_model_load_failed")；encode 失败或子进程崩溃 -> embed_failed（由 embed_pipeline 包装）。
+"""
+
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from mhy_ai_rag_data.tools.embed_pipeline import StageError
+
+_THREAD_ENV_KEYS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+# Per-process state inside a worker (set by _init_worker, model loaded on the first batch).
+_WORKER_CONF: Dict[str, Any] = {}
+_WORKER_MODEL: Any = None
+
+
+def encode_dense_vecs(model: Any, texts: List[str], *, max_length: int = 8192) -> Any:
+    """Dense-only BGEM3FlagModel.encode for one batch; returns out["dense_vecs"]."""
+    # Prefer an explicit "no progress bar" kw; fall back if current FlagEmbedding version rejects it.
+    try:
+        out = model.encode(
+            texts,
+            batch_size=len(texts),
+            max_length=max_length,
+            return_dense=True,
+            return_sparse=False,
+            return_colbert_vecs=False,
+            show_progress_bar=False,
+        )
+    except TypeError:
+        out = model.encode(
+            texts,
+            batch_size=len(texts),
+            max_length=max_length,
+            return_dense=True,
+            return_sparse=False,
+            return_colbert_vecs=False,
+        )
+    return out["dense_vecs"]
+
+
+def _cpu_slice(index: int, threads: int) -> List[int]:
+    if not hasattr(os, "sched_getaffinity"):
+        return []
+    cpus = sorted(os.sched_getaffinity(0))
+    lo = (index * threads) % max(1, len(cpus))
+    return cpus[lo : lo + threads]
+
+
+def _init_worker(conf: Dict[str, Any], counter: Any) -> None:
+    with counter.get_lock():
+        index = int(counter.value)
+        counter.value += 1
+    threads = max(1, int(conf.get("threads") or 1))
+    for k in _THREAD_ENV_KEYS:
+        os.environ[k] = str(threads)
+    if conf.get("pin") and hasattr(os, "sched_setaffinity"):
+        cpus = _cpu_slice(index, threads)
+        if cpus:
+            try:
+                os.sched_setaffinity(0, cpus)
+            except OSError:
+                pass
+    _WORKER_CONF.clear()
+    _WORKER_CONF.update(conf)
+    _WORKER_CONF["index"] = index
+
+
+def _worker_model() -> Any:
+    global _WORKER_MODEL
+    if _WORKER_MODEL is not None:
+        return _WORKER_MODEL
+    threads = max(1, int(_WORKER_CONF.get("threads") or 1))
+    try:
+        try:
+            import torch
+
+            torch.set_num_threads(threads)
+        except Exception:
+            pass
+        from FlagEmbedding import BGEM3FlagModel
+
+        try:
+            _WORKER_MODEL = BGEM3FlagModel(
+                str(_WORKER_CONF["embed_model"]), use_fp16=True, device=str(_WORKER_CONF.get("device") or "cpu")
+            )
+        except TypeError:
+            _WORKER_MODEL = BGEM3FlagModel(str(_WORKER_CONF["embed_model"]), use_fp16=True)
+    except Exception as e:
+        raise StageError(
+            "embed_model_load_failed", detail=f"worker={_WORKER_CONF.get('index')}: {type(e).__name__}: {e}"
+        ) from None
+    return _WORKER_MODEL
+
+
+def _encode_in_worker(texts: List[str]) -> Any:
+    model = _worker_model()
+    return encode_dense_vecs(model, texts, max_length=int(_WORKER_CONF.get("max_length") or 8192))
+
+
+def default_worker_threads(workers: int) -> int:
+    """Split the CPUs available to this process evenly across workers (at least 1 thread each)."""
+    if hasattr(os, "sched_getaffinity"):
+        n_cpu = len(os.sched_getaffinity(0))
+    else:
+        n_cpu = os.cpu_count() or 1
+    return max(1, n_cpu // max(1, int(workers)))
+
+
+class EmbedWorkerPool:
+    """Lazily started pool of embedding processes; submit() returns a Future of dense vectors."""
+
+    def __init__(
+        self,
+        *,
+        workers: int,
+        embed_model: str,
+        device: str = "cpu",
+        threads_per_worker: int = 0,
+        pin_cpus: bool = True,
+        max_length: int = 8192,
+    ) -> None:
+        self.workers = max(1, int(workers))
+        self.threads_per_worker = int(threads_per_worker) or default_worker_threads(self.workers)
+        self._conf: Dict[str, Any] = {
+            "embed_model": str(embed_model),
+            "device": str(device),
+            "threads": self.threads_per_worker,
+            "pin": bool(pin_cpus),
+            "max_length": int(max_length),
+        }
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def max_inflight(self) -> int:
+        # One batch running plus one queued per worker keeps every process busy between batches.
+        return 2 * self.workers
+
+    def submit(self, texts: List[str]) -> "Future[Any]":
+        if self._executor is None:
+            ctx = mp.get_context("spawn")
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(dict(self._conf), ctx.Value("i", 0)),
+            )
+        return self._executor.submit(_encode_in_worker, list(texts))
+
+    def close(self, *, cancel: bool = False) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=cancel)
+            self._executor = None
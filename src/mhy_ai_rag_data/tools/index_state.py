@@ -8,8 +8,16 @@
 
 文件布局（建议）
 - data_processed/index_state/<collection>/<schema_hash>/index_state.json
+- data_processed/index_state/<collection>/<schema_hash>/index_state.sqlite  （--state-backend sqlite）
 - data_processed/index_state/<collection>/LATEST  （指向当前 schema_hash）
 
+存储后端
+- json（默认）：docs 全量写在 index_state.json 里；每次构建整体加载、整体原子重写。
+- sqlite：docs 存在 index_state.sqlite 的 docs 表（source_uri 主键），report 其余字段存在 meta 表。
+  读取侧 docs 是惰性的 Mapping（SqliteDocStore：按键查询、按需遍历），写入侧只在一个事务里 upsert/删除本次变化的 doc；
+  index_state.json 退化为可选导出（--state-json-export）。首次切到 sqlite 时若只有 index_state.json，会一次性导入。
+  两个后端互相切换时，成功写入的一方会删除另一方的旧文件，避免读到过期 manifest。
+
 输出契约（v2）
 - index_state.json 作为“状态元数据”，也纳入统一输出层：schema_version=2 envelope。
   顶层必须包含：schema_version/generated_at/tool/root/summary/items。
@@ -29,9 +37,10 @@ from __future__ import annotations
 import hashlib
 import json
 import os
+import sqlite3
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
 
 from mhy_ai_rag_data.tools.report_contract import compute_summary, ensure_item_fields, ensure_report_v2, iso_now
 from mhy_ai_rag_data.tools.report_order import prepare_report_for_file_output
@@ -83,6 +92,13 @@ def state_file_for(state_root: Path, collection: str, schema_hash: str) -> Path:
     return state_dir_for(state_root, collection, schema_hash) / "index_state.json"
 
 
+STATE_BACKENDS = ("json", "sqlite")
+
+
+def state_db_for(state_root: Path, collection: str, schema_hash: str) -> Path:
+    return state_dir_for(state_root, collection, schema_hash) / "index_state.sqlite"
+
+
 def atomic_write_text(path: Path, text: str, encoding: str = "utf-8") -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     tmp = path.with_suffix(path.suffix + ".tmp")
@@ -149,6 +165,124 @@ class DocState:
         )
 
 
+_DOCS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS docs (
+    source_uri TEXT PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    source_type TEXT NOT NULL,
+    content_sha256 TEXT NOT NULL,
+    n_chunks INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+_DOC_COLS = "doc_id, source_uri, source_type, content_sha256, n_chunks, updated_at"
+
+
+def _drop_sqlite(path: Path) -> None:
+    for p in (path, path.with_name(path.name + "-journal"), path.with_name(path.name + "-wal")):
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SqliteDocStore(Mapping[str, Dict[str, Any]]):
+    """index_state docs in SQLite, read as Mapping[source_uri -> doc dict] (same shape as index_state.json "docs").
+
+    Lookups are keyed queries and iteration streams source_uri; nothing is loaded up front.
+    apply() writes a delta (upserts + deletes + report meta) in one transaction.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path))
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_DOCS_SCHEMA)
+
+    def __getitem__(self, uri: str) -> Dict[str, Any]:
+        st = self.get_state(uri)
+        if st is None:
+            raise KeyError(uri)
+        return st.to_dict()
+
+    def __iter__(self) -> Iterator[str]:
+        for (uri,) in self._db.execute("SELECT source_uri FROM docs ORDER BY source_uri"):
+            yield str(uri)
+
+    def __len__(self) -> int:
+        (n,) = self._db.execute("SELECT COUNT(*) FROM docs").fetchone()
+        return int(n)
+
+    def __contains__(self, uri: object) -> bool:
+        return self._db.execute("SELECT 1 FROM docs WHERE source_uri = ?", (str(uri),)).fetchone() is not None
+
+    def get_state(self, uri: str) -> Optional[DocState]:
+        row = self._db.execute(f"SELECT {_DOC_COLS} FROM docs WHERE source_uri = ?", (str(uri),)).fetchone()
+        if row is None:
+            return None
+        return DocState(str(row[0]), str(row[1]), str(row[2]), str(row[3]), int(row[4]), str(row[5]))
+
+    def iter_states(self) -> Iterator[DocState]:
+        for row in self._db.execute(f"SELECT {_DOC_COLS} FROM docs ORDER BY source_uri"):
+            yield DocState(str(row[0]), str(row[1]), str(row[2]), str(row[3]), int(row[4]), str(row[5]))
+
+    def digests(self) -> Dict[str, Tuple[str, int]]:
+        """source_uri -> (content_sha256, n_chunks): everything delta detection needs, in one query."""
+        return {
+            str(uri): (str(sha), int(n))
+            for uri, sha, n in self._db.execute("SELECT source_uri, content_sha256, n_chunks FROM docs")
+        }
+
+    def read_meta(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        obj = json.loads(row[0])
+        return obj if isinstance(obj, dict) else None
+
+    def apply(
+        self,
+        *,
+        upserts: Iterable[DocState],
+        deletes: Iterable[str] = (),
+        meta: Optional[Mapping[str, Dict[str, Any]]] = None,
+        replace: bool = False,
+    ) -> None:
+        """Write a delta atomically; replace=True drops every existing doc first."""
+        with self._db:
+            if replace:
+                self._db.execute("DELETE FROM docs")
+            self._db.executemany("DELETE FROM docs WHERE source_uri = ?", ((str(u),) for u in deletes))
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO docs({_DOC_COLS}) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (d.doc_id, d.source_uri, d.source_type, d.content_sha256, int(d.n_chunks), d.updated_at)
+                    for d in upserts
+                ),
+            )
+            for key, value in (meta or {}).items():
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False)),
+                )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def doc_digests(docs: Mapping[str, Any]) -> Dict[str, Tuple[str, int]]:
+    """source_uri -> (content_sha256, n_chunks) for either backend's docs mapping."""
+    if isinstance(docs, SqliteDocStore):
+        return docs.digests()
+    return {
+        str(uri): (str((d or {}).get("content_sha256", "")), int((d or {}).get("n_chunks", 0) or 0))
+        for uri, d in docs.items()
+    }
+
+
 def ensure_index_state_report_v2(
     raw: Dict[str, Any],
     *,
@@ -241,6 +375,36 @@ def load_index_state(path: Path, *, root: Optional[Path] = None) -> Optional[Dic
     return ensure_index_state_report_v2(raw, root=root, state_file=path)
 
 
+def load_index_state_sqlite(
+    path: Path, *, root: Path, json_fallback: Optional[Path] = None
+) -> Optional[Dict[str, Any]]:
+    """Load the sqlite-backed index_state: the report from meta with "docs" as a lazy SqliteDocStore.
+
+    If the database has no report yet but json_fallback (index_state.json) exists, its docs and report are
+    imported once. Returns None when neither exists. The caller owns (and should close) result["docs"].
+    """
+
+    if not path.exists() and not (json_fallback is not None and json_fallback.exists()):
+        return None
+    store = SqliteDocStore(path)
+    report = store.read_meta("report")
+    if report is None and json_fallback is not None and json_fallback.exists():
+        raw = ensure_index_state_report_v2(load_json(json_fallback), root=root, state_file=json_fallback)
+        docs = raw.pop("docs", None) or {}
+        store.apply(
+            upserts=(DocState.from_dict({**(d or {}), "source_uri": uri}) for uri, d in docs.items()),
+            meta={"report": raw},
+            replace=True,
+        )
+        report = raw
+    if report is None:
+        store.close()
+        return None
+    out = ensure_index_state_report_v2(report, root=root, state_file=path)
+    out["docs"] = store
+    return out
+
+
 def write_latest_pointer(state_root: Path, collection: str, schema_hash: str) -> None:
     atomic_write_text(latest_schema_file(state_root, collection), schema_hash.strip() + "\n")
 
@@ -253,34 +417,20 @@ def read_latest_pointer(state_root: Path, collection: str) -> Optional[str]:
     return s or None
 
 
-def write_index_state_report(
+def _index_state_report(
     *,
     root: Path,
-    state_root: Path,
+    out_path: Path,
     collection: str,
     schema_hash: str,
     db: Path,
     embed_model: str,
     chunk_conf: Dict[str, Any],
     include_media_stub: bool,
-    docs: Dict[str, Any],
+    docs: Mapping[str, Any],
     last_build: Dict[str, Any],
-    items: Optional[List[Dict[str, Any]]] = None,
-) -> Path:
-    """Write index_state.json as a schema_version=2 report.
-
-    该函数是“写入侧 SSOT”：尽量让 build/upsert/sync 只关注业务字段，输出契约由这里统一保证。
-
-    - items：允许调用方补充更细粒度的构建信息（例如 collection.count 不可用等）。
-      若未提供，将生成最小 PASS item。
-    """
-
-    root = root.resolve()
-    state_root = state_root.resolve()
-    db = db.resolve()
-
-    out_path = state_file_for(state_root, str(collection), str(schema_hash)).resolve()
-
+    items: Optional[List[Dict[str, Any]]],
+) -> Dict[str, Any]:
     tool_name = "index_state"
 
     raw_items: List[Dict[str, Any]] = []
@@ -335,8 +485,120 @@ def write_index_state_report(
     final_obj = prepare_report_for_file_output(report)
     if not isinstance(final_obj, dict):
         raise RuntimeError("prepare_report_for_file_output did not return dict")
+    return final_obj
+
+
+def write_index_state_report(
+    *,
+    root: Path,
+    state_root: Path,
+    collection: str,
+    schema_hash: str,
+    db: Path,
+    embed_model: str,
+    chunk_conf: Dict[str, Any],
+    include_media_stub: bool,
+    docs: Dict[str, Any],
+    last_build: Dict[str, Any],
+    items: Optional[List[Dict[str, Any]]] = None,
+) -> Path:
+    """Write index_state.json as a schema_version=2 report.
+
+    该函数是“写入侧 SSOT”：尽量让 build/upsert/sync 只关注业务字段，输出契约由这里统一保证。
+
+    - items：允许调用方补充更细粒度的构建信息（例如 collection.count 不可用等）。
+      若未提供，将生成最小 PASS item。
+    - json 后端成为事实来源：同目录旧的 index_state.sqlite 已过期，会被删除。
+    """
+
+    root = root.resolve()
+    state_root = state_root.resolve()
+    db = db.resolve()
+
+    out_path = state_file_for(state_root, str(collection), str(schema_hash)).resolve()
+
+    final_obj = _index_state_report(
+        root=root,
+        out_path=out_path,
+        collection=collection,
+        schema_hash=schema_hash,
+        db=db,
+        embed_model=embed_model,
+        chunk_conf=chunk_conf,
+        include_media_stub=include_media_stub,
+        docs=docs,
+        last_build=last_build,
+        items=items,
+    )
 
     save_json_atomic(out_path, final_obj)
+    _drop_sqlite(state_db_for(state_root, str(collection), str(schema_hash)))
     write_latest_pointer(state_root, str(collection), str(schema_hash))
 
     return out_path
+
+
+def write_index_state_sqlite(
+    *,
+    root: Path,
+    state_root: Path,
+    collection: str,
+    schema_hash: str,
+    db: Path,
+    embed_model: str,
+    chunk_conf: Dict[str, Any],
+    include_media_stub: bool,
+    upserts: Mapping[str, Dict[str, Any]],
+    deletes: Iterable[str],
+    replace: bool,
+    last_build: Dict[str, Any],
+    items: Optional[List[Dict[str, Any]]] = None,
+    export_json: bool = True,
+) -> Path:
+    """Apply this build's doc delta to index_state.sqlite (one transaction) and store the report in meta.
+
+    - upserts/deletes：只写变化的 doc；replace=True 表示上一轮 state 不可用，先清空再写入。
+    - export_json：同时导出完整 index_state.json（O(N)，给人看/给旧工具用）；关闭时删除旧的 index_state.json，
+      避免 json 后端读到过期 manifest。
+    """
+
+    root = root.resolve()
+    state_root = state_root.resolve()
+    db = db.resolve()
+
+    db_path = state_db_for(state_root, str(collection), str(schema_hash)).resolve()
+    json_path = state_file_for(state_root, str(collection), str(schema_hash)).resolve()
+
+    final_obj = _index_state_report(
+        root=root,
+        out_path=db_path,
+        collection=collection,
+        schema_hash=schema_hash,
+        db=db,
+        embed_model=embed_model,
+        chunk_conf=chunk_conf,
+        include_media_stub=include_media_stub,
+        docs={},
+        last_build=last_build,
+        items=items,
+    )
+    meta = {k: v for k, v in final_obj.items() if k != "docs"}
+
+    store = SqliteDocStore(db_path)
+    try:
+        store.apply(
+            upserts=(DocState.from_dict({**d, "source_uri": uri}) for uri, d in upserts.items()),
+            deletes=deletes,
+            meta={"report": meta},
+            replace=replace,
+        )
+        if export_json:
+            final_obj["docs"] = {st.source_uri: st.to_dict() for st in store.iter_states()}
+            save_json_atomic(json_path, final_obj)
+        elif json_path.exists():
+            json_path.unlink()
+    finally:
+        store.close()
+    write_latest_pointer(state_root, str(collection), str(schema_hash))
+
+    return db_path
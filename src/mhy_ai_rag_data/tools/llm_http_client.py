@@ -8,6 +8,9 @@
 - 统一代理策略：默认对回环地址（localhost/127.0.0.1/::1）不信任环境代理（trust_env=False），避免被 127.0.0.1:7890 等劫持。
 - 统一超时语义：拆分 connect_timeout / read_timeout（requests 的 timeout=(connect, read)）。
 - 统一错误可观测性：异常信息包含 url/base_url/trust_env/timeout，便于落盘报告与排查。
+- 流式输出：stream_chat_completions 解析 SSE（stream=true）增量，边到边回调，并给出 TTFT / tokens/s。
+- 连接复用：每个 trust_env 一个进程级 Session（线程间共享 keep-alive 连接池，池大小可配）；
+  429/503 有界重试（指数退避 + full jitter，优先 Retry-After）；每次请求记录建连/等待/读取耗时（http_stats）。
 
 依据（Primary）：
 - LM Studio OpenAI compatibility 端点：/v1/models, /v1/chat/completions 等。参见 LM Studio 文档。\n
@@ -15,12 +18,19 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from urllib.parse import urlparse
 import ipaddress
+import json
+import random
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 
 @dataclass
@@ -64,9 +74,6 @@ class LLMHTTPError(Exception):
         }
 
 
-_SESSIONS: Dict[bool, requests.Session] = {}
-
-
 def _safe_truncate_text(text: Optional[str], limit: int = 2000) -> Optional[str]:
     if text is None:
         return None
@@ -105,15 +112,277 @@ def resolve_trust_env(base_url: str, trust_env_mode: str) -> bool:
     return not _is_loopback_base_url(base_url)
 
 
+# -----------------------------
+# pooled session / retry / per-request timing
+# -----------------------------
+
+
+@dataclass
+class HTTPConfig:
+    """进程级 HTTP 连接与重试策略（configure_http 修改）。
+
+    pool_maxsize 应不小于并发请求数：超出部分的连接用完即丢（urllib3 "pool is full"），
+    每次都要重新建连，这正是并发评测打 llama.cpp 类服务时的连接抖动来源。
+    """
+
+    pool_connections: int = 4
+    pool_maxsize: int = 16
+    max_retries: int = 2
+    backoff_base_s: float = 0.5
+    backoff_max_s: float = 8.0
+    retry_statuses: Tuple[int, ...] = (429, 503)
+
+
+@dataclass
+class RequestTiming:
+    """一次逻辑请求（含重试）的耗时拆分，单位 ms。
+
+    - connect_ms：本次新建 TCP(/TLS) 连接的耗时；复用 keep-alive 连接时为 0（new_connections=0）。
+    - wait_ms：请求发出到响应头到达（不含建连），即服务端排队 + 预填充时间。
+    - read_ms：读取响应体；stream=True 时由调用方在读完后补记（finish_read）。
+    - backoff_ms：重试前的退避等待总和。
+    """
+
+    method: str = ""
+    url: str = ""
+    status_code: Optional[int] = None
+    attempts: int = 0
+    new_connections: int = 0
+    connect_ms: float = 0.0
+    wait_ms: float = 0.0
+    read_ms: float = 0.0
+    backoff_ms: float = 0.0
+    total_ms: float = 0.0
+    _t0: float = field(default=0.0, repr=False)
+
+    def as_dict(self) -> Dict[str, Any]:
+        d = asdict(self)
+        d.pop("_t0", None)
+        for k in ("connect_ms", "wait_ms", "read_ms", "backoff_ms", "total_ms"):
+            d[k] = round(float(d[k]), 3)
+        return d
+
+
+_CONFIG = HTTPConfig()
+_SESSIONS: Dict[bool, requests.Session] = {}
+_SESSIONS_LOCK = threading.Lock()
+_STATS_LOCK = threading.Lock()
+_STATS: Dict[str, float] = {}
+_TL = threading.local()
+
+
+def _reset_stats() -> None:
+    _STATS.clear()
+    _STATS.update(
+        requests=0,
+        attempts=0,
+        retries=0,
+        errors=0,
+        new_connections=0,
+        reused_connections=0,
+        connect_ms=0.0,
+        wait_ms=0.0,
+        read_ms=0.0,
+        backoff_ms=0.0,
+    )
+
+
+_reset_stats()
+
+
+def _note_connect(seconds: float) -> None:
+    # Connections are opened on the thread that sends the request, so a thread-local tally is exact.
+    _TL.connect_s = getattr(_TL, "connect_s", 0.0) + seconds
+    _TL.connects = getattr(_TL, "connects", 0) + 1
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self) -> None:
+        t0 = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _note_connect(time.perf_counter() - t0)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self) -> None:
+        t0 = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _note_connect(time.perf_counter() - t0)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+_TIMED_POOL_CLASSES = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+
+class _TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools time every new connection (keep-alive reuse shows up as zero connects)."""
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _TIMED_POOL_CLASSES
+
+    def proxy_manager_for(self, proxy: str, **proxy_kwargs: Any) -> Any:
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        manager.pool_classes_by_scheme = _TIMED_POOL_CLASSES
+        return manager
+
+
+def configure_http(
+    *,
+    pool_connections: Optional[int] = None,
+    pool_maxsize: Optional[int] = None,
+    max_retries: Optional[int] = None,
+    backoff_base_s: Optional[float] = None,
+    backoff_max_s: Optional[float] = None,
+) -> HTTPConfig:
+    """Update the process-wide pool/retry policy; cached sessions are closed and rebuilt on next use."""
+    with _SESSIONS_LOCK:
+        if pool_connections is not None:
+            _CONFIG.pool_connections = max(1, int(pool_connections))
+        if pool_maxsize is not None:
+            _CONFIG.pool_maxsize = max(1, int(pool_maxsize))
+        if max_retries is not None:
+            _CONFIG.max_retries = max(0, int(max_retries))
+        if backoff_base_s is not None:
+            _CONFIG.backoff_base_s = max(0.0, float(backoff_base_s))
+        if backoff_max_s is not None:
+            _CONFIG.backoff_max_s = max(0.0, float(backoff_max_s))
+        for sess in _SESSIONS.values():
+            sess.close()
+        _SESSIONS.clear()
+        return HTTPConfig(**asdict(_CONFIG))
+
+
 def get_session(trust_env: bool) -> requests.Session:
-    s = _SESSIONS.get(bool(trust_env))
+    """进程级共享 Session：连接池线程安全，多线程并发请求复用同一组 keep-alive 连接。"""
+    key = bool(trust_env)
+    s = _SESSIONS.get(key)
     if s is not None:
         return s
-    s = requests.Session()
-    # requests Session 默认会信任环境变量代理；这里显式控制
-    s.trust_env = bool(trust_env)
-    _SESSIONS[bool(trust_env)] = s
-    return s
+    with _SESSIONS_LOCK:
+        s = _SESSIONS.get(key)
+        if s is not None:
+            return s
+        s = requests.Session()
+        # requests Session 默认会信任环境变量代理；这里显式控制
+        s.trust_env = key
+        adapter = _TimedAdapter(pool_connections=_CONFIG.pool_connections, pool_maxsize=_CONFIG.pool_maxsize)
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
+        _SESSIONS[key] = s
+        return s
+
+
+def _retry_delay(attempt: int, retry_after: Optional[str]) -> float:
+    """Seconds to wait before retry #attempt (1-based): Retry-After if given, else full-jitter exponential backoff."""
+    cap = _CONFIG.backoff_max_s
+    if retry_after:
+        try:
+            return min(cap, max(0.0, float(retry_after)))
+        except ValueError:
+            pass  # HTTP-date form: fall through to computed backoff
+    return random.uniform(0.0, min(cap, _CONFIG.backoff_base_s * (2 ** (attempt - 1))))
+
+
+def send_request(
+    method: str,
+    url: str,
+    *,
+    trust_env: bool,
+    timeout: Tuple[float, float],
+    stream: bool = False,
+    **kwargs: Any,
+) -> requests.Response:
+    """Send through the shared session, retrying 429/503 up to max_retries times.
+
+    Returns the final response (any status; callers decide whether to raise_for_status).
+    Timing of this request is available afterwards via last_request_timing() on the same thread.
+    """
+    sess = get_session(trust_env=trust_env)
+    timing = RequestTiming(method=method.upper(), url=url, _t0=time.perf_counter())
+    _TL.timing = timing
+    attempt = 0
+    try:
+        while True:
+            attempt += 1
+            _TL.connect_s, _TL.connects = 0.0, 0
+            t_send = time.perf_counter()
+            r = sess.request(method, url, timeout=timeout, stream=stream, **kwargs)
+            t_done = time.perf_counter()
+            connect_s = float(getattr(_TL, "connect_s", 0.0))
+            # r.elapsed stops when headers are parsed; requests reads a non-streamed body after that.
+            headers_s = min(r.elapsed.total_seconds(), t_done - t_send)
+            timing.new_connections += int(getattr(_TL, "connects", 0))
+            timing.connect_ms += connect_s * 1000
+            timing.wait_ms += max(0.0, headers_s - connect_s) * 1000
+            timing.read_ms += max(0.0, t_done - t_send - headers_s) * 1000
+            timing.attempts = attempt
+            timing.status_code = r.status_code
+            if r.status_code not in _CONFIG.retry_statuses or attempt > _CONFIG.max_retries:
+                return r
+            delay = _retry_delay(attempt, r.headers.get("Retry-After"))
+            r.close()
+            timing.backoff_ms += delay * 1000
+            time.sleep(delay)
+    except requests.RequestException:
+        with _STATS_LOCK:
+            _STATS["errors"] += 1
+        raise
+    finally:
+        timing.attempts = attempt
+        _record(timing)
+
+
+def finish_read(read_s: float) -> None:
+    """For stream=True requests: add the body read time once the caller has consumed the stream."""
+    timing: Optional[RequestTiming] = getattr(_TL, "timing", None)
+    if timing is None:
+        return
+    timing.read_ms += read_s * 1000
+    timing.total_ms += read_s * 1000
+    with _STATS_LOCK:
+        _STATS["read_ms"] += read_s * 1000
+
+
+def _record(timing: RequestTiming) -> None:
+    timing.total_ms = (time.perf_counter() - timing._t0) * 1000
+    with _STATS_LOCK:
+        _STATS["requests"] += 1
+        _STATS["attempts"] += timing.attempts
+        _STATS["retries"] += max(0, timing.attempts - 1)
+        _STATS["new_connections"] += timing.new_connections
+        _STATS["reused_connections"] += max(0, timing.attempts - timing.new_connections)
+        _STATS["connect_ms"] += timing.connect_ms
+        _STATS["wait_ms"] += timing.wait_ms
+        _STATS["read_ms"] += timing.read_ms
+        _STATS["backoff_ms"] += timing.backoff_ms
+
+
+def last_request_timing() -> Optional[Dict[str, Any]]:
+    """Timing of the most recent request sent from the calling thread (None if none yet)."""
+    timing: Optional[RequestTiming] = getattr(_TL, "timing", None)
+    return timing.as_dict() if timing is not None else None
+
+
+def http_stats(reset: bool = False) -> Dict[str, Any]:
+    """Process-wide counters since start (or last reset) plus the active pool/retry config."""
+    with _STATS_LOCK:
+        out: Dict[str, Any] = {k: (round(v, 3) if isinstance(v, float) else int(v)) for k, v in _STATS.items()}
+        if reset:
+            _reset_stats()
+    out["config"] = {k: (list(v) if isinstance(v, tuple) else v) for k, v in asdict(_CONFIG).items()}
+    return out
 
 
 def _join(base_url: str, path: str) -> str:
@@ -174,9 +443,8 @@ def get_json(
     trust_env = resolve_trust_env(base_url, trust_env_mode)
     url = _join(base_url, path)
     timeout = (float(connect_timeout), float(read_timeout))
-    sess = get_session(trust_env=trust_env)
     try:
-        r = sess.get(url, headers=headers, timeout=timeout)
+        r = send_request("GET", url, trust_env=trust_env, timeout=timeout, headers=headers)
         r.raise_for_status()
         result = r.json()
         if not isinstance(result, dict):
@@ -219,9 +487,8 @@ def post_json(
     trust_env = resolve_trust_env(base_url, trust_env_mode)
     url = _join(base_url, path)
     timeout = (float(connect_timeout), float(read_timeout))
-    sess = get_session(trust_env=trust_env)
     try:
-        r = sess.post(url, json=payload, headers=headers, timeout=timeout)
+        r = send_request("POST", url, trust_env=trust_env, timeout=timeout, json=payload, headers=headers)
         r.raise_for_status()
         result = r.json()
         if not isinstance(result, dict):
@@ -279,6 +546,196 @@ def extract_chat_content(resp_json: Dict[str, Any]) -> str:
         raise ValueError(f"unexpected chat completion response format: keys={list(resp_json.keys())}") from exc
 
 
+# -----------------------------
+# streaming (SSE) chat completions
+# -----------------------------
+
+
+@dataclass
+class ChatStreamResult:
+    """一次流式调用的结果与时延。
+
+    - ttft_ms：请求发出到首个非空内容增量（time to first token）；无内容时为 None。
+    - completion_tokens：服务端 usage 优先（tokens_source="usage"），否则按内容增量块计数（"chunks"，
+      主流 OpenAI-compatible 服务每块约 1 token）。
+    - streamed=False 表示服务端忽略 stream 直接回了整段 JSON（此时 ttft_ms == total_ms）。
+    - cached=True 表示回答来自调用方的回答缓存（未发请求，无时延数据）。
+    """
+
+    content: str
+    ttft_ms: Optional[int]
+    total_ms: int
+    completion_tokens: int
+    tokens_source: str
+    finish_reason: Optional[str] = None
+    streamed: bool = True
+    decode_ms: Optional[float] = None
+    cached: bool = False
+
+    @property
+    def tokens_per_s(self) -> Optional[float]:
+        """Decode throughput: tokens after the first one over the time between first and last delta."""
+        if self.decode_ms is None or self.decode_ms <= 0 or self.completion_tokens < 2:
+            return None
+        return round((self.completion_tokens - 1) * 1000.0 / self.decode_ms, 2)
+
+    def timings(self) -> Dict[str, Any]:
+        return {
+            "ttft_ms": self.ttft_ms,
+            "total_ms": self.total_ms,
+            "completion_tokens": self.completion_tokens,
+            "tokens_source": self.tokens_source,
+            "tokens_per_s": self.tokens_per_s,
+            "streamed": self.streamed,
+            "cached": self.cached,
+        }
+
+
+def iter_sse_data(lines: Iterable[bytes]) -> Iterator[str]:
+    """Yield the payload of each SSE event (multi-line ``data:`` fields joined by newlines).
+
+    Comments (``:`` keep-alives) and non-data fields (event/id/retry) are skipped.
+    """
+    buf: List[str] = []
+    for raw in lines:
+        line = raw.decode("utf-8", errors="replace").rstrip("\r")
+        if not line:
+            if buf:
+                yield "\n".join(buf)
+                buf = []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if field == "data":
+            buf.append(value[1:] if value.startswith(" ") else value)
+    if buf:
+        yield "\n".join(buf)
+
+
+def stream_chat_completions(
+    base_url: str,
+    payload: Dict[str, Any],
+    *,
+    on_delta: Optional[Callable[[str], None]] = None,
+    connect_timeout: float = 10.0,
+    read_timeout: float = 120.0,
+    trust_env_mode: str = "auto",
+    headers: Optional[Dict[str, str]] = None,
+) -> ChatStreamResult:
+    """POST /chat/completions with ``stream: true``; ``on_delta`` is called with each content piece as it arrives.
+
+    read_timeout 在流式下是“两次收包之间”的上限，而非整次生成的总时长。
+    """
+    trust_env = resolve_trust_env(base_url, trust_env_mode)
+    url = _join(base_url, "/chat/completions")
+    timeout = (float(connect_timeout), float(read_timeout))
+    body = dict(payload)
+    body["stream"] = True
+
+    def _err(message: str, *, cause: Optional[str] = None, snippet: Optional[str] = None) -> LLMHTTPError:
+        return LLMHTTPError(
+            message=message,
+            base_url=base_url,
+            url=url,
+            trust_env=trust_env,
+            timeout=timeout,
+            response_snippet=snippet,
+            cause=cause,
+        )
+
+    t0 = time.perf_counter()
+    parts: List[str] = []
+    first_at: Optional[float] = None
+    last_at: Optional[float] = None
+    chunks = 0
+    usage_tokens: Optional[int] = None
+    finish_reason: Optional[str] = None
+    try:
+        r = send_request("POST", url, trust_env=trust_env, timeout=timeout, json=body, headers=headers, stream=True)
+        t_headers = time.perf_counter()
+        with r:
+            try:
+                r.raise_for_status()
+                ctype = (r.headers.get("content-type") or "").lower()
+                if "text/event-stream" not in ctype:
+                    # Server ignored stream=true: treat the whole JSON body as a single delta.
+                    resp_json = r.json()
+                    if not isinstance(resp_json, dict):
+                        raise ValueError("Expected dict response")
+                    content = extract_chat_content(resp_json)
+                    total_ms = int((time.perf_counter() - t0) * 1000)
+                    if content and on_delta is not None:
+                        on_delta(content)
+                    usage = resp_json.get("usage") or {}
+                    n = usage.get("completion_tokens") if isinstance(usage, dict) else None
+                    return ChatStreamResult(
+                        content=content,
+                        ttft_ms=total_ms if content else None,
+                        total_ms=total_ms,
+                        completion_tokens=int(n) if isinstance(n, int) else (1 if content else 0),
+                        tokens_source="usage" if isinstance(n, int) else "chunks",
+                        finish_reason=((resp_json.get("choices") or [{}])[0] or {}).get("finish_reason"),
+                        streamed=False,
+                    )
+                # chunk_size=None: hand over each transfer chunk as soon as it arrives (no 512-byte buffering).
+                # The iterator is consumed to its end (past [DONE]) so the keep-alive connection goes back to the
+                # pool; breaking out early would make requests close the socket.
+                done = False
+                for data in iter_sse_data(r.iter_lines(chunk_size=None)):
+                    if done or data.strip() == "[DONE]":
+                        done = True
+                        continue
+                    try:
+                        event = json.loads(data)
+                    except ValueError as exc:
+                        raise _err(
+                            "LLM SSE chunk JSON decode failed", cause=str(exc), snippet=_truncate_text(data)
+                        ) from exc
+                    if not isinstance(event, dict):
+                        continue
+                    if event.get("error"):
+                        raise _err("LLM SSE stream returned error", snippet=_truncate_text(json.dumps(event)))
+                    usage = event.get("usage")
+                    if isinstance(usage, dict) and isinstance(usage.get("completion_tokens"), int):
+                        usage_tokens = int(usage["completion_tokens"])
+                    for choice in event.get("choices") or []:
+                        if not isinstance(choice, dict):
+                            continue
+                        finish_reason = choice.get("finish_reason") or finish_reason
+                        piece = (choice.get("delta") or {}).get("content")
+                        if not piece:
+                            continue
+                        now = time.perf_counter()
+                        if first_at is None:
+                            first_at = now
+                        last_at = now
+                        chunks += 1
+                        parts.append(str(piece))
+                        if on_delta is not None:
+                            on_delta(str(piece))
+            finally:
+                finish_read(time.perf_counter() - t_headers)
+    except requests.RequestException as exc:
+        status, resp_ctype, snippet = _extract_response_info(exc)
+        e = _err("LLM HTTP stream failed", cause=f"{type(exc).__name__}: {exc}", snippet=snippet)
+        e.status_code = status
+        e.response_content_type = resp_ctype
+        raise e from exc
+    except ValueError as exc:
+        raise _err("LLM HTTP stream JSON decode failed", cause=f"{type(exc).__name__}: {exc}") from exc
+
+    return ChatStreamResult(
+        content="".join(parts),
+        ttft_ms=int((first_at - t0) * 1000) if first_at is not None else None,
+        total_ms=int((time.perf_counter() - t0) * 1000),
+        completion_tokens=usage_tokens if usage_tokens is not None else chunks,
+        tokens_source="usage" if usage_tokens is not None else "chunks",
+        finish_reason=finish_reason,
+        decode_ms=round((last_at - first_at) * 1000, 3) if first_at is not None and last_at is not None else None,
+    )
+
+
 # -----------------------------
 # /models helpers
 # -----------------------------
@@ -15,6 +15,12 @@
   在 exec_module() 之前执行：sys.modules[spec.name] = mod
 
 其余逻辑不变（仍然保证 plan 与 build 使用同一套 chunking/should_index 逻辑）。
+
+读取方式
+--------
+按 units_reader.iter_unit_refs 先取头部字段（有新鲜的 sidecar 偏移索引时不读 units 文件），
+被 should_index 过滤掉的 unit 不再解析全文；只有要切块的 unit 才按偏移回读。
+--source-uri（可重复）只规划指定文档，用于抽查。
 """
 
 from __future__ import annotations
@@ -26,6 +32,7 @@ from typing import Any, Dict
 
 from mhy_ai_rag_data.tools.report_bundle import write_report_bundle
 from mhy_ai_rag_data.tools.selftest_utils import add_selftest_args, maybe_run_selftest_from_args
+from mhy_ai_rag_data.units_reader import UnitsFile, iter_unit_refs
 
 
 # Tool self-description for report-output-v2 gates (static-AST friendly)
@@ -59,6 +66,12 @@ def main() -> int:
         default="false",
         help="Whether to index media stubs (true/false). Must match build step.",
     )
+    ap.add_argument(
+        "--source-uri",
+        action="append",
+        default=None,
+        help="Only plan this unit (repeatable); located via the units offset index instead of a full parse",
+    )
     ap.add_argument("--out", default="data_processed/chunk_plan.json", help="Output json path (relative to root)")
     args = ap.parse_args()
 
@@ -88,7 +101,6 @@ def main() -> int:
         from mhy_ai_rag_data import build_chroma_index as mod
 
         ChunkConf = mod.ChunkConf
-        iter_units = mod.iter_units
         should_index_unit = mod.should_index_unit
         build_chunks_from_unit = mod.build_chunks_from_unit
     except Exception as e:
@@ -106,22 +118,27 @@ def main() -> int:
     # type_breakdown[source_type] = {"indexed": x, "skipped": y, "chunks": z}
     type_breakdown: Dict[str, Dict[str, int]] = {}
 
-    for unit in iter_units(units_path):
-        units_read += 1
-        st = str(unit.get("source_type", "") or "").lower()
-        type_breakdown.setdefault(st, {"indexed": 0, "skipped": 0, "chunks": 0})
+    wanted = set(args.source_uri or [])
+    with UnitsFile(units_path) as uf:
+        for ref in iter_unit_refs(units_path):
+            head = ref.head
+            if wanted and str(head.get("source_uri") or "") not in wanted:
+                continue
+            units_read += 1
+            st = str(head.get("source_type", "") or "").lower()
+            type_breakdown.setdefault(st, {"indexed": 0, "skipped": 0, "chunks": 0})
 
-        if not should_index_unit(unit, include_media_stub):
-            units_skipped += 1
-            type_breakdown[st]["skipped"] += 1
-            continue
+            if not should_index_unit(head, include_media_stub):
+                units_skipped += 1
+                type_breakdown[st]["skipped"] += 1
+                continue
 
-        units_indexed += 1
-        type_breakdown[st]["indexed"] += 1
+            units_indexed += 1
+            type_breakdown[st]["indexed"] += 1
 
-        chunks, _ = build_chunks_from_unit(unit, conf)
-        planned_chunks += len(chunks)
-        type_breakdown[st]["chunks"] += len(chunks)
+            chunks, _ = build_chunks_from_unit(uf.read(ref.offset, ref.length), conf)
+            planned_chunks += len(chunks)
+            type_breakdown[st]["chunks"] += len(chunks)
 
     report: Dict[str, Any] = {
         "root": str(root),
@@ -136,6 +153,7 @@ def main() -> int:
             "min_chunk_chars": args.min_chunk_chars,
         },
         "include_media_stub": include_media_stub,
+        "source_uris": sorted(wanted),
         "type_breakdown": type_breakdown,
     }
 
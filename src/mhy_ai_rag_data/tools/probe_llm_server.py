@@ -25,9 +25,14 @@ from urllib.parse import urljoin
 
 try:
     # 兼容两种运行方式：python -m tools.probe_llm_server 以及 python tools/probe_llm_server.py
-    from mhy_ai_rag_data.tools.llm_http_client import resolve_trust_env, get_session, resolve_model_id
+    from mhy_ai_rag_data.tools.llm_http_client import (
+        last_request_timing,
+        resolve_model_id,
+        resolve_trust_env,
+        send_request,
+    )
 except Exception:  # noqa: BLE001
-    from llm_http_client import resolve_trust_env, get_session, resolve_model_id  # type: ignore
+    from llm_http_client import last_request_timing, resolve_model_id, resolve_trust_env, send_request  # type: ignore
 
 from mhy_ai_rag_data.tools.report_bundle import write_report_bundle
 from mhy_ai_rag_data.tools.selftest_utils import add_selftest_args, maybe_run_selftest_from_args
@@ -66,13 +71,18 @@ POST_CANDIDATES = [
 def _get(url: str, connect_timeout: float, read_timeout: float, trust_env: bool) -> dict[str, Any]:
     t0 = time.time()
     try:
-        sess = get_session(trust_env=trust_env)
-        r = sess.get(url, timeout=(connect_timeout, read_timeout))
+        r = send_request("GET", url, trust_env=trust_env, timeout=(connect_timeout, read_timeout))
         dt = time.time() - t0
-        return {"ok": True, "status": r.status_code, "seconds": round(dt, 4), "text_head": r.text[:600]}
+        return {
+            "ok": True,
+            "status": r.status_code,
+            "seconds": round(dt, 4),
+            "http": last_request_timing(),
+            "text_head": r.text[:600],
+        }
     except Exception as e:
         dt = time.time() - t0
-        return {"ok": False, "error": repr(e), "seconds": round(dt, 4)}
+        return {"ok": False, "error": repr(e), "seconds": round(dt, 4), "http": last_request_timing()}
 
 
 def _post(
@@ -80,13 +90,28 @@ def _post(
 ) -> dict[str, Any]:
     t0 = time.time()
     try:
-        sess = get_session(trust_env=trust_env)
-        r = sess.post(url, json=payload, timeout=(connect_timeout, read_timeout))
+        r = send_request("POST", url, trust_env=trust_env, timeout=(connect_timeout, read_timeout), json=payload)
         dt = time.time() - t0
-        return {"ok": True, "status": r.status_code, "seconds": round(dt, 4), "text_head": r.text[:800]}
+        return {
+            "ok": True,
+            "status": r.status_code,
+            "seconds": round(dt, 4),
+            "http": last_request_timing(),
+            "text_head": r.text[:800],
+        }
     except Exception as e:
         dt = time.time() - t0
-        return {"ok": False, "error": repr(e), "seconds": round(dt, 4)}
+        return {"ok": False, "error": repr(e), "seconds": round(dt, 4), "http": last_request_timing()}
+
+
+def _fmt_http(res: dict[str, Any]) -> str:
+    h = res.get("http") or {}
+    if not h:
+        return ""
+    return (
+        f"  connect={h.get('connect_ms', 0):.1f}ms wait={h.get('wait_ms', 0):.1f}ms"
+        f" read={h.get('read_ms', 0):.1f}ms new_conn={h.get('new_connections', 0)} attempts={h.get('attempts', 0)}"
+    )
 
 
 def main() -> int:
@@ -170,7 +195,7 @@ def main() -> int:
         report["get"].append({"path": path, "url": url, **res})
         ok = "OK" if res.get("ok") and res.get("status") == 200 else "FAIL"
         code = res.get("status", "")
-        print(f"{ok:<4} {str(code):<4} {path:<16} {res.get('seconds', 0):>6.2f}s")
+        print(f"{ok:<4} {str(code):<4} {path:<16} {res.get('seconds', 0):>6.2f}s{_fmt_http(res)}")
 
     print("\n== POST probes ==")
     report["post"] = []
@@ -181,7 +206,7 @@ def main() -> int:
         report["post"].append({"path": path, "url": url, "payload": payload, **res})
         ok = "OK" if res.get("ok") and res.get("status") == 200 else "FAIL"
         code = res.get("status", "")
-        print(f"{ok:<4} {str(code):<4} {path:<22} {res.get('seconds', 0):>6.2f}s")
+        print(f"{ok:<4} {str(code):<4} {path:<22} {res.get('seconds', 0):>6.2f}s{_fmt_http(res)}")
 
     # No longer compute final status here; will use summary.overall_rc later
 
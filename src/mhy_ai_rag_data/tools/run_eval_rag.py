@@ -22,20 +22,29 @@ run_eval_rag.py
 说明：
 - 控制台输出（stdout）为最终报告（detail 从轻到重，summary 在末尾，整体以 \n\n 结束）。
 - 运行时进度（stderr）不写入 items/events。
+- --llm-cache read 回放同一请求（model/messages/temperature/max_tokens 不变）的已录制回答，只改打分/报告逻辑的
+  重跑不再调用 LLM；write 强制重录。命中的 case 不计入 ttft_ms / tokens_per_s 统计。
 """
 
 from __future__ import annotations
 
 
 import argparse
+import bisect
 import importlib
 import json
+import math
 import sys
 import time
 import traceback
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+from typing import Any, Deque, Dict, List, Mapping, Optional, Sequence, Tuple
 
+from mhy_ai_rag_data.embedding_cache import QueryEmbeddingCache, open_query_embedding_cache
+from mhy_ai_rag_data.hybrid_retriever import HybridRetriever, RetrievedChunk, open_hybrid_retriever
+from mhy_ai_rag_data.llm_cache import LLM_CACHE_MODES, LLMResponseCache, open_llm_cache
 from mhy_ai_rag_data.tools.report_bundle import default_md_path_for_json, write_report_bundle
 from mhy_ai_rag_data.tools.selftest_utils import add_selftest_args, maybe_run_selftest_from_args
 from mhy_ai_rag_data.tools.report_contract import compute_summary, iso_now
@@ -72,6 +81,10 @@ try:
 except Exception:  # noqa: BLE001
     _llm_http_client = importlib.import_module("llm_http_client")
 chat_completions = _llm_http_client.chat_completions
+stream_chat_completions = _llm_http_client.stream_chat_completions
+configure_http = _llm_http_client.configure_http
+http_stats = _llm_http_client.http_stats
+last_request_timing = _llm_http_client.last_request_timing
 resolve_model_id = _llm_http_client.resolve_model_id
 LLMHTTPError = _llm_http_client.LLMHTTPError
 
@@ -132,6 +145,17 @@ def embed_query(embedder: Any, backend: str, text: str) -> List[float]:
     raise RuntimeError(f"Unknown backend: {backend}")
 
 
+def embed_queries(embedder: Any, backend: str, texts: List[str]) -> List[List[float]]:
+    """Encode a batch of queries in one model call (same vectors as embed_query, row by row)."""
+    if backend == "flagembedding":
+        mat = embedder.encode(list(texts))
+    elif backend == "sentence-transformers":
+        mat = embedder.encode(list(texts), normalize_embeddings=False)
+    else:
+        raise RuntimeError(f"Unknown backend: {backend}")
+    return [v.tolist() if hasattr(v, "tolist") else list(v) for v in mat]
+
+
 def extract_source(meta: Mapping[str, Any], meta_field: str) -> str:
     for key in [k.strip() for k in meta_field.split("|") if k.strip()]:
         if key in meta and meta[key]:
@@ -169,6 +193,54 @@ def must_include_ok(answer: str, must_include: List[str]) -> Tuple[bool, List[st
     return (len(missing) == 0), missing
 
 
+# Upper bucket edges (ms) for the per-case latency histogram; the last bucket is open-ended.
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 5000, 10000, 30000, 60000, 120000, 300000)
+
+
+def latency_summary(values_ms: Sequence[int]) -> Dict[str, Any]:
+    """count/mean/nearest-rank percentiles plus a per-bucket histogram {"<=250": n, ..., ">300000": n}."""
+    vals = sorted(int(v) for v in values_ms)
+    if not vals:
+        return {"count": 0}
+
+    def _pct(p: int) -> int:
+        return vals[max(0, math.ceil(p / 100.0 * len(vals)) - 1)]
+
+    labels = [f"<={edge}" for edge in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+    counts = [0] * len(labels)
+    for v in vals:
+        counts[bisect.bisect_left(LATENCY_BUCKETS_MS, v)] += 1
+    return {
+        "count": len(vals),
+        "mean": round(sum(vals) / len(vals), 1),
+        "p50": _pct(50),
+        "p90": _pct(90),
+        "p95": _pct(95),
+        "p99": _pct(99),
+        "max": vals[-1],
+        "histogram_ms": dict(zip(labels, counts)),
+    }
+
+
+def rate_summary(values: Sequence[float]) -> Dict[str, Any]:
+    """count/mean/min/p50 for throughput-style numbers (higher is better, so the low tail is what matters)."""
+    vals = sorted(float(v) for v in values)
+    if not vals:
+        return {"count": 0}
+    return {
+        "count": len(vals),
+        "mean": round(sum(vals) / len(vals), 2),
+        "min": vals[0],
+        "p10": vals[max(0, math.ceil(0.10 * len(vals)) - 1)],
+        "p50": vals[max(0, math.ceil(0.50 * len(vals)) - 1)],
+    }
+
+
+def chat_payload(model: str, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> Dict[str, Any]:
+    """Request body shared by the blocking and streaming paths (and the llm_cache key)."""
+    return {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+
+
 def call_chat(
     base_url: str,
     connect_timeout: float,
@@ -179,7 +251,7 @@ def call_chat(
     max_tokens: int,
     temperature: float,
 ) -> Dict[str, Any]:
-    payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+    payload = chat_payload(model, messages, max_tokens, temperature)
     result = chat_completions(
         base_url,
         payload,
@@ -203,11 +275,64 @@ def main() -> int:
         "--cases", default="data_processed/eval/eval_cases.jsonl", help="eval cases jsonl (relative to root)"
     )
     ap.add_argument("--k", type=int, default=5, help="topK for retrieval")
+    ap.add_argument(
+        "--retrieval-mode",
+        default="dense",
+        choices=["dense", "hybrid"],
+        help="retrieval strategy: dense|hybrid (dense + keyword via RRF; same retriever as answer_cli)",
+    )
+    ap.add_argument("--dense-topk", type=int, default=0, help="dense candidate pool for fusion; 0 means use --k")
+    ap.add_argument("--keyword-topk", type=int, default=0, help="keyword candidate pool for fusion; 0 means use --k")
+    ap.add_argument("--rrf-k", type=int, default=60, help="RRF k parameter (rank bias)")
+    ap.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="chat completions in flight at once (thread pool); results are still written in case order",
+    )
+    ap.add_argument(
+        "--http-pool-size",
+        type=int,
+        default=0,
+        help="keep-alive connections kept per LLM host; 0 = auto (max(16, --concurrency))",
+    )
+    ap.add_argument(
+        "--http-retries",
+        type=int,
+        default=2,
+        help="retries on HTTP 429/503 with jittered exponential backoff (Retry-After honoured); 0 = no retry",
+    )
+    ap.add_argument(
+        "--query-batch",
+        type=int,
+        default=32,
+        help="cases per batched retrieval call (one embed + one collection.query); 1 = one query at a time",
+    )
+    ap.add_argument(
+        "--keyword-index",
+        default="auto",
+        choices=["auto", "rebuild", "memory"],
+        help="BM25 index for hybrid: auto (reuse persisted index, rebuild if stale)|rebuild|memory (no persistence)",
+    )
+    ap.add_argument(
+        "--state-root",
+        default="data_processed/index_state",
+        help="index_state root (relative to root); the persisted keyword index lives next to index_state.json",
+    )
     ap.add_argument(
         "--meta-field",
         default="source_uri|source|path|file",
         help="metadata field(s) for source path (use | to separate)",
     )
+    ap.add_argument(
+        "--query-embed-cache",
+        default="off",
+        help="persistent query-vector cache dir (relative to root, e.g. data_processed/query_embed_cache); "
+        "off = in-memory LRU only",
+    )
+    ap.add_argument(
+        "--query-embed-cache-size", type=int, default=1024, help="in-memory query-vector LRU entries (0 = disabled)"
+    )
     ap.add_argument("--embed-backend", default="auto", help="auto|flagembedding|sentence-transformers")
     ap.add_argument("--embed-model", default="BAAI/bge-m3", help="embed model name")
     ap.add_argument("--device", default="cpu", help="cpu|cuda")
@@ -226,6 +351,23 @@ def main() -> int:
     ap.add_argument("--context-max-chars", type=int, default=12000, help="max context chars to send to LLM")
     ap.add_argument("--max-tokens", type=int, default=256, help="max_tokens for answer")
     ap.add_argument("--temperature", type=float, default=0.0, help="temperature for answer")
+    ap.add_argument(
+        "--llm-cache",
+        default="off",
+        choices=list(LLM_CACHE_MODES),
+        help="answer cache: off | read (replay identical requests, record misses) | write (always call, re-record)",
+    )
+    ap.add_argument(
+        "--llm-cache-path",
+        default="data_processed/llm_cache/llm_cache.sqlite",
+        help="answer cache sqlite (relative to root)",
+    )
+    ap.add_argument(
+        "--stream",
+        default="on",
+        choices=["on", "off"],
+        help="stream chat completions (SSE) and record per-case TTFT / tokens/s; off = one blocking JSON reply",
+    )
     ap.add_argument(
         "--out", default="data_processed/build_reports/eval_rag_report.json", help="output json (relative to root)"
     )
@@ -279,6 +421,10 @@ def main() -> int:
     # runtime feedback (stderr only)
     progress = Progress(total=None, mode=args.progress, min_interval_ms=int(args.progress_min_interval_ms)).start()
     progress.update(stage="init")
+    configure_http(
+        pool_maxsize=int(args.http_pool_size) if int(args.http_pool_size) > 0 else max(16, int(args.concurrency)),
+        max_retries=int(args.http_retries),
+    )
 
     # events stream (items only; for recovery)
     events_writer: Optional[ItemEventsWriter] = None
@@ -299,6 +445,9 @@ def main() -> int:
     per_case: List[Dict[str, Any]] = []
     pass_count = 0
     t0 = time.time()
+    retriever: Optional[HybridRetriever] = None
+    query_cache: Optional[QueryEmbeddingCache] = None
+    llm_cache: Optional[LLMResponseCache] = None
 
     def _emit_item(it: Dict[str, Any]) -> None:
         # Ensure required fields exist (explicit severity_level; no string ordering).
@@ -342,11 +491,30 @@ def main() -> int:
                 "collection": str(args.collection),
                 "k": int(args.k),
                 "cases_path": str(cases_path.resolve().as_posix()),
+                "retrieval": {
+                    "mode": str(args.retrieval_mode),
+                    "dense_pool_k": int(args.dense_topk) if int(args.dense_topk) > 0 else int(args.k),
+                    "keyword_pool_k": int(args.keyword_topk) if int(args.keyword_topk) > 0 else int(args.k),
+                    "rrf_k": int(args.rrf_k),
+                    "query_batch": int(args.query_batch),
+                    "keyword_index": retriever.keyword_index_info if retriever is not None else {},
+                    "query_embed_cache": query_cache.stats() if query_cache is not None else {},
+                },
                 "metrics": {
                     "cases": len(per_case),
                     "passed_cases": int(pass_count),
                     "pass_rate": (float(pass_count) / float(len(per_case))) if per_case else 0.0,
                     "elapsed_ms": int((time.time() - t0) * 1000),
+                    "concurrency": int(args.concurrency),
+                    "latency_ms": latency_summary([int(x.get("elapsed_ms") or 0) for x in per_case]),
+                    "llm_latency_ms": latency_summary([int(x.get("llm_ms") or 0) for x in per_case]),
+                    "stream": str(args.stream),
+                    "ttft_ms": latency_summary([int(x["ttft_ms"]) for x in per_case if x.get("ttft_ms") is not None]),
+                    "tokens_per_s": rate_summary(
+                        [float(x["tokens_per_s"]) for x in per_case if x.get("tokens_per_s") is not None]
+                    ),
+                    "http": http_stats(),
+                    "llm_cache": llm_cache.stats() if llm_cache is not None else {"mode": "off"},
                 },
                 "cases": per_case,
             },
@@ -426,61 +594,109 @@ def main() -> int:
         client = chromadb.PersistentClient(path=str(db_path))
         col = client.get_collection(args.collection)
 
-        progress.update(current=0, stage="run")
-
-        for i, (line_no, c) in enumerate(cases, start=1):
-            cid = c.get("id", "")
-            q = c.get("query", "")
-            must_inc = c.get("must_include", []) or []
-            must_inc = [str(x) for x in must_inc]
+        # Query vectors go through an in-memory LRU + persistent store; hits skip the model.
+        qc = open_query_embedding_cache(
+            root,
+            str(args.query_embed_cache),
+            embed_model=str(args.embed_model),
+            normalize=backend == "flagembedding",
+            backend=backend,
+            max_entries=int(args.query_embed_cache_size),
+        )
+        query_cache = qc
+        llm_cache = open_llm_cache(root, args.llm_cache, args.llm_cache_path)
 
-            case_t0 = time.time()
+        def _embed_many(texts: List[str]) -> List[List[float]]:
+            return qc.encode_through(texts, lambda miss: embed_queries(embedder, backend, miss))
 
-            qvec = embed_query(embedder, backend, q)
-            query_embeddings: List[Sequence[float]] = [qvec]
-            res = col.query(
-                query_embeddings=query_embeddings, n_results=args.k, include=["documents", "metadatas", "distances"]
+        try:
+            progress.update(current=0, stage="open_retriever")
+            retriever = open_hybrid_retriever(
+                collection=col,
+                collection_name=str(args.collection),
+                embed=lambda text: _embed_many([text])[0],
+                embed_many=_embed_many,
+                state_root=root / str(args.state_root),
+                mode=str(args.retrieval_mode),
+                keyword_index=str(args.keyword_index),
+                dense_pool_k=int(args.dense_topk),
+                keyword_pool_k=int(args.keyword_topk),
+                rrf_k=int(args.rrf_k),
+                meta_field=str(args.meta_field),
             )
-            docs = (res.get("documents") or [[]])[0]
-            metas = (res.get("metadatas") or [[]])[0]
-            dists = (res.get("distances") or [[]])[0]
-
-            sources = [extract_source(m or {}, args.meta_field) for m in metas]
-            ctx = build_context([str(d or "") for d in docs], sources, args.context_max_chars)
+        except Exception as e:
+            it = _termination_item(message=f"retriever init failed: {type(e).__name__}: {e}", exc=e)
+            items.append(it)
+            _emit_item(it)
+            return _finalize_and_write()
 
-            messages = [
-                {
-                    "role": "system",
-                    "content": "你是一个严格基于提供上下文回答问题的助手；若上下文不足以回答，请明确说明缺失信息。",
-                },
-                {"role": "user", "content": f"问题：{q}\n\n上下文：\n{ctx}\n\n请给出回答："},
-            ]
+        progress.update(current=0, stage="run")
 
-            ok_call = True
-            answer = ""
-            err = None
-            err_detail: Optional[Dict[str, Any]] = None
+        def _run_llm(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+            """One chat completion (runs on a worker thread when --concurrency > 1); errors are returned, not raised."""
+            call_t0 = time.time()
+            out: Dict[str, Any] = {
+                "ok_call": True,
+                "answer": "",
+                "err": None,
+                "err_detail": None,
+                "timing": None,
+                "http": None,
+                "cache": None,
+            }
+            payload = chat_payload(resolved_model, messages, args.max_tokens, args.temperature)
+            if llm_cache is not None:
+                hit = llm_cache.get(payload)
+                if hit is not None:
+                    out.update(answer=hit, cache="hit", llm_ms=int((time.time() - call_t0) * 1000))
+                    return out
             try:
-                j = call_chat(
-                    args.base_url,
-                    args.connect_timeout,
-                    args.timeout,
-                    args.trust_env,
-                    resolved_model,
-                    messages,
-                    args.max_tokens,
-                    args.temperature,
-                )
-                # OpenAI-style: choices[0].message.content
-                answer = (((j.get("choices") or [{}])[0].get("message") or {}).get("content")) or ""
+                if args.stream == "on":
+                    # TTFT is what a user waits for before text appears; total latency stays in llm_ms.
+                    sr = stream_chat_completions(
+                        args.base_url,
+                        payload,
+                        connect_timeout=args.connect_timeout,
+                        read_timeout=args.timeout,
+                        trust_env_mode=args.trust_env,
+                    )
+                    out["answer"] = sr.content
+                    out["timing"] = sr.timings()
+                else:
+                    j = call_chat(
+                        args.base_url,
+                        args.connect_timeout,
+                        args.timeout,
+                        args.trust_env,
+                        resolved_model,
+                        messages,
+                        args.max_tokens,
+                        args.temperature,
+                    )
+                    # OpenAI-style: choices[0].message.content
+                    out["answer"] = (((j.get("choices") or [{}])[0].get("message") or {}).get("content")) or ""
+                if llm_cache is not None:
+                    llm_cache.put(payload, out["answer"])
+                    out["cache"] = "miss" if llm_cache.mode == "read" else "write"
             except LLMHTTPError as e:
-                ok_call = False
-                err = f"{type(e).__name__}: {e.message}"
+                out["ok_call"] = False
+                out["err"] = f"{type(e).__name__}: {e.message}"
                 # 关键：把服务端返回的 error body（截断）落盘，避免只看到 '400 Bad Request'
-                err_detail = e.as_dict()
+                out["err_detail"] = e.as_dict()
             except Exception as e:
-                ok_call = False
-                err = f"{type(e).__name__}: {e}"
+                out["ok_call"] = False
+                out["err"] = f"{type(e).__name__}: {e}"
+            # Connect / wait / read split of this case's request (thread-local, so exact under --concurrency).
+            out["http"] = last_request_timing()
+            out["llm_ms"] = int((time.time() - call_t0) * 1000)
+            return out
+
+        def _finish(prep: Dict[str, Any], res: Dict[str, Any]) -> None:
+            """Score one case and emit its item; called strictly in case order."""
+            nonlocal pass_count
+            i, line_no, c = prep["i"], prep["line_no"], prep["case"]
+            cid, q, must_inc, ctx = prep["cid"], prep["q"], prep["must_inc"], prep["ctx"]
+            ok_call, answer, err, err_detail = res["ok_call"], res["answer"], res["err"], res["err_detail"]
 
             ok_must, missing = (False, must_inc)
             if ok_call:
@@ -498,6 +714,8 @@ def main() -> int:
             if passed:
                 pass_count += 1
 
+            # Case latency = retrieval share + prompt build + LLM call (time spent queued behind other cases excluded).
+            elapsed_ms = int(prep["prep_ms"]) + int(res["llm_ms"])
             per_case.append(
                 {
                     "line_no": line_no,
@@ -516,18 +734,17 @@ def main() -> int:
                         "max_tokens": args.max_tokens,
                         "temperature": args.temperature,
                     },
-                    "topk": [
-                        {
-                            "rank": i + 1,
-                            "source": sources[i] if i < len(sources) else "",
-                            "distance": dists[i] if i < len(dists) else None,
-                        }
-                        for i in range(min(args.k, len(sources)))
-                    ],
+                    "topk": prep["topk"],
                     "answer": answer,
                     "error": err,
                     "error_detail": err_detail,
-                    "elapsed_ms": int((time.time() - case_t0) * 1000),
+                    "llm_ms": int(res["llm_ms"]),
+                    "elapsed_ms": elapsed_ms,
+                    "ttft_ms": (res["timing"] or {}).get("ttft_ms"),
+                    "tokens_per_s": (res["timing"] or {}).get("tokens_per_s"),
+                    "llm_timing": res["timing"],
+                    "http": res["http"],
+                    "llm_cache": res["cache"],
                 }
             )
             # Build one report item and emit to events immediately.
@@ -555,7 +772,7 @@ def main() -> int:
                 "severity_level": int(severity_level),
                 "message": f"passed={passed_item} llm_call_ok={ok_call} missing={len(missing)} bucket={c.get('bucket', '')}",
                 "loc": f"{cases_rel}:{line_no}:1",
-                "duration_ms": int((time.time() - case_t0) * 1000),
+                "duration_ms": elapsed_ms,
                 "detail": dict(per_case[-1]),
             }
             items.append(item)
@@ -563,6 +780,70 @@ def main() -> int:
 
             progress.update(current=i, stage="run")
 
+        concurrency = max(1, int(args.concurrency))
+        pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="eval-llm") if concurrency > 1 else None
+        # In-flight cases in case order; the head is finished (and emitted) before anything behind it.
+        pending: Deque[Tuple[Dict[str, Any], "Future[Dict[str, Any]]"]] = deque()
+
+        def _drain(limit: int) -> None:
+            while pending and (len(pending) > limit or pending[0][1].done()):
+                head, fut = pending.popleft()
+                _finish(head, fut.result())
+
+        query_batch = max(1, int(args.query_batch))
+        batch_hits: List[List[RetrievedChunk]] = []
+        batch_share_s = 0.0
+        try:
+            for i, (line_no, c) in enumerate(cases, start=1):
+                cid = c.get("id", "")
+                q = c.get("query", "")
+                must_inc = c.get("must_include", []) or []
+                must_inc = [str(x) for x in must_inc]
+
+                if (i - 1) % query_batch == 0:
+                    # Retrieve the next chunk of cases with one batched embed + collection.query call.
+                    chunk = cases[i - 1 : i - 1 + query_batch]
+                    batch_t0 = time.time()
+                    results = retriever.retrieve_many([str(cc.get("query", "")) for _ln, cc in chunk], int(args.k))
+                    batch_hits = [r.hits for r in results]
+                    batch_share_s = (time.time() - batch_t0) / len(chunk)
+
+                case_t0 = time.time() - batch_share_s
+
+                hits = batch_hits[(i - 1) % query_batch]
+                sources = [h.source for h in hits]
+                ctx = build_context([h.text for h in hits], sources, args.context_max_chars)
+
+                messages = [
+                    {
+                        "role": "system",
+                        "content": "你是一个严格基于提供上下文回答问题的助手；若上下文不足以回答，请明确说明缺失信息。",
+                    },
+                    {"role": "user", "content": f"问题：{q}\n\n上下文：\n{ctx}\n\n请给出回答："},
+                ]
+                prep = {
+                    "i": i,
+                    "line_no": line_no,
+                    "case": c,
+                    "cid": cid,
+                    "q": q,
+                    "must_inc": must_inc,
+                    "ctx": ctx,
+                    "topk": [h.to_dict() for h in hits],
+                    "prep_ms": int((time.time() - case_t0) * 1000),
+                }
+
+                if pool is None:
+                    _finish(prep, _run_llm(messages))
+                    continue
+                pending.append((prep, pool.submit(_run_llm, messages)))
+                # Keep at most 2x concurrency cases in flight so the workers never starve between completions.
+                _drain(2 * concurrency - 1)
+            _drain(0)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
         return _finalize_and_write()
 
     except KeyboardInterrupt as e:
@@ -581,6 +862,12 @@ def main() -> int:
             progress.close()
         except Exception:
             pass
+        if retriever is not None:
+            retriever.close()
+        if query_cache is not None:
+            query_cache.close()
+        if llm_cache is not None:
+            llm_cache.close()
         try:
             if events_writer is not None:
                 events_writer.close()
@@ -23,16 +23,21 @@ from __future__ import annotations
 
 import argparse
 import json
-import math
-import re
 from collections import Counter
 import platform
 import sys
 import time
 import traceback
 from pathlib import Path
-from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
-
+from typing import Any, Dict, List, Optional, Tuple
+
+from mhy_ai_rag_data.embedding_cache import QueryEmbeddingCache, open_query_embedding_cache
+from mhy_ai_rag_data.hybrid_retriever import HybridRetriever, RetrievalResult
+from mhy_ai_rag_data.keyword_index import (
+    KeywordIndex,
+    open_keyword_index_for_collection,
+    tokenize,
+)
 from mhy_ai_rag_data.tools.report_bundle import default_md_path_for_json, write_report_bundle
 from mhy_ai_rag_data.tools.selftest_utils import add_selftest_args, maybe_run_selftest_from_args
 from mhy_ai_rag_data.tools.report_contract import compute_summary, ensure_item_fields, iso_now
@@ -148,299 +153,15 @@ def embed_query(embedder: Any, backend: str, text: str) -> List[float]:
     raise RuntimeError(f"Unknown backend: {backend}")
 
 
-def extract_source(meta: Mapping[str, Any], meta_field: str) -> str:
-    """从 metadata 提取来源字段。
-
-    meta_field 支持 "source|path|file" 的优先级表达：用 '|' 分隔多个候选字段。
-    """
-
-    for key in [k.strip() for k in (meta_field or "").split("|") if k.strip()]:
-        if key in meta and meta[key]:
-            return str(meta[key])
-    return ""
-
-
-_TOKEN_RE = re.compile(r"[A-Za-z0-9]+|[\u4e00-\u9fff]", re.UNICODE)
-
-
-def _tokenize(s: str) -> List[str]:
-    s = (s or "").lower()
-    return _TOKEN_RE.findall(s)
-
-
-class _KeywordIndex:
-    # Minimal BM25-style index over Chroma documents, restricted to the query vocabulary.
-
-    def __init__(
-        self,
-        *,
-        doc_ids: List[str],
-        doc_sources: List[str],
-        doc_tfs: List[Dict[str, int]],
-        doc_lens: List[int],
-        avgdl: float,
-        df: Dict[str, int],
-        n_docs: int,
-    ) -> None:
-        self.doc_ids = doc_ids
-        self.doc_sources = doc_sources
-        self.doc_tfs = doc_tfs
-        self.doc_lens = doc_lens
-        self.avgdl = float(avgdl)
-        self.df = df
-        self.n_docs = int(n_docs)
-
-
-def _build_keyword_index(
-    *,
-    doc_ids: List[str],
-    doc_texts: List[str],
-    doc_metas: List[Mapping[str, Any]],
-    query_vocab: set[str],
-    meta_field: str,
-) -> _KeywordIndex:
-    # Restrict tf/df to tokens that appear in any query, to reduce memory.
-    df: Dict[str, int] = {t: 0 for t in query_vocab}
-    doc_tfs: List[Dict[str, int]] = []
-    doc_lens: List[int] = []
-    doc_sources: List[str] = []
-
-    total_len = 0
-    n_docs = len(doc_texts)
-
-    for i in range(n_docs):
-        txt = doc_texts[i] or ""
-        toks = _tokenize(txt)
-        dl = len(toks)
-        total_len += dl
-        doc_lens.append(dl)
-
-        tf: Dict[str, int] = {}
-        for t in toks:
-            if t in query_vocab:
-                tf[t] = tf.get(t, 0) + 1
-        doc_tfs.append(tf)
-
-        for t in tf.keys():
-            df[t] = df.get(t, 0) + 1
-
-        meta = doc_metas[i] if i < len(doc_metas) else {}
-        doc_sources.append(extract_source(meta or {}, meta_field))
-
-    avgdl = (float(total_len) / float(n_docs)) if n_docs else 0.0
-    return _KeywordIndex(
-        doc_ids=doc_ids,
-        doc_sources=doc_sources,
-        doc_tfs=doc_tfs,
-        doc_lens=doc_lens,
-        avgdl=avgdl,
-        df=df,
-        n_docs=n_docs,
-    )
-
-
-def _load_chroma_docs(
-    col: Any,
-    *,
-    include_documents: bool,
-    batch_size: int = 512,
-) -> Tuple[List[str], List[str], List[Mapping[str, Any]]]:
-    """Load all docs from a Chroma collection.
-
-    Why: keyword retrieval needs documents; Chroma `get()` is usually paginated.
-
-    Returns: (ids, documents, metadatas)
-    - If documents are not stored in the collection, documents may be an empty list.
-    """
-
-    include: List[str] = ["metadatas"]
-    if include_documents:
-        include.append("documents")
-
-    # Best effort paging (API differs across chromadb versions).
-    try:
-        n = int(col.count())
-    except Exception:
-        n = -1
-
-    ids: List[str] = []
-    docs: List[str] = []
-    metas: List[Mapping[str, Any]] = []
-
-    def _extend(res: Mapping[str, Any]) -> None:
-        _ids = res.get("ids") or []
-        _docs = res.get("documents") or []
-        _metas = res.get("metadatas") or []
-
-        # Some versions may return nested lists.
-        if _ids and isinstance(_ids, list) and _ids and isinstance(_ids[0], list):
-            _ids = _ids[0]
-        if _docs and isinstance(_docs, list) and _docs and isinstance(_docs[0], list):
-            _docs = _docs[0]
-        if _metas and isinstance(_metas, list) and _metas and isinstance(_metas[0], list):
-            _metas = _metas[0]
-
-        ids.extend([str(x) for x in (_ids or [])])
-        docs.extend([str(x or "") for x in (_docs or [])])
-        metas.extend([x if isinstance(x, dict) else {} for x in (_metas or [])])
-
-    # Fast path: try single get() call.
-    try:
-        res0 = col.get(include=include)
-        if isinstance(res0, dict) and res0.get("ids"):
-            _extend(res0)
-            # If it looks like a full dump, accept.
-            if n <= 0 or len(ids) >= n or (n > 0 and len(ids) == n):
-                return ids, docs, metas
-    except Exception:
-        pass
-
-    if n <= 0:
-        return ids, docs, metas
-
-    # Paged path.
-    ids.clear()
-    docs.clear()
-    metas.clear()
-    offset = 0
-    while offset < n:
-        lim = min(int(batch_size), n - offset)
-        try:
-            res = col.get(include=include, limit=lim, offset=offset)
-        except TypeError:
-            # Older API might not support offset/limit.
-            res = col.get(include=include)
-        if not isinstance(res, dict) or not res.get("ids"):
-            break
-        _extend(res)
-        offset += lim
-
-    return ids, docs, metas
-
-
-def _bm25_score(
-    *,
-    q_tokens: List[str],
-    tf: Mapping[str, int],
-    dl: int,
-    avgdl: float,
-    df: Mapping[str, int],
-    n_docs: int,
-    k1: float = 1.5,
-    b: float = 0.75,
-) -> float:
-    if not q_tokens or not n_docs or avgdl <= 0:
-        return 0.0
-
-    score = 0.0
-    # Use unique tokens only for scoring.
-    for t in set(q_tokens):
-        f = int(tf.get(t, 0))
-        if f <= 0:
-            continue
-        dfi = int(df.get(t, 0))
-        # BM25 idf (with +1 to keep non-negative)
-        idf = math.log(((n_docs - dfi + 0.5) / (dfi + 0.5)) + 1.0)
-        denom = f + k1 * (1.0 - b + b * (float(dl) / float(avgdl)))
-        score += idf * ((f * (k1 + 1.0)) / (denom if denom else 1.0))
-    return float(score)
-
-
-def _keyword_search(
-    *,
-    idx: _KeywordIndex,
-    query: str,
-    topk: int,
-) -> List[Dict[str, Any]]:
-    toks = _tokenize(query)
-    scored: List[Tuple[float, int]] = []
-    for i in range(idx.n_docs):
-        s = _bm25_score(
-            q_tokens=toks,
-            tf=idx.doc_tfs[i],
-            dl=idx.doc_lens[i],
-            avgdl=idx.avgdl,
-            df=idx.df,
-            n_docs=idx.n_docs,
-        )
-        if s > 0.0:
-            scored.append((s, i))
-    # Stable: score desc, then doc ordinal asc.
-    scored.sort(key=lambda x: (-x[0], x[1]))
-
-    out: List[Dict[str, Any]] = []
-    for rank, (s, i) in enumerate(scored[: max(0, int(topk))], start=1):
-        out.append(
-            {
-                "rank": rank,
-                "id": str(idx.doc_ids[i]),
-                "source": str(idx.doc_sources[i]),
-                "keyword_score": float(s),
-            }
-        )
-    return out
-
-
-def _rrf_fuse(
-    *,
-    dense: List[Dict[str, Any]],
-    keyword: List[Dict[str, Any]],
-    topk: int,
-    rrf_k: int = 60,
-) -> List[Dict[str, Any]]:
-    # Reciprocal Rank Fusion.
-    scores: Dict[str, float] = {}
-    dense_rank: Dict[str, int] = {}
-    keyword_rank: Dict[str, int] = {}
-
-    for it in dense:
-        cid = str(it.get("id") or "")
-        if not cid:
-            continue
-        r = int(it.get("rank") or 0) or (len(dense_rank) + 1)
-        dense_rank[cid] = r
-        scores[cid] = scores.get(cid, 0.0) + (1.0 / float(rrf_k + r))
-
-    for it in keyword:
-        cid = str(it.get("id") or "")
-        if not cid:
-            continue
-        r = int(it.get("rank") or 0) or (len(keyword_rank) + 1)
-        keyword_rank[cid] = r
-        scores[cid] = scores.get(cid, 0.0) + (1.0 / float(rrf_k + r))
-
-    # Materialize candidates.
-    dense_by_id = {str(it.get("id")): it for it in dense if it.get("id")}
-    keyword_by_id = {str(it.get("id")): it for it in keyword if it.get("id")}
-
-    fused: List[Dict[str, Any]] = []
-    for cid, sc in scores.items():
-        base: Dict[str, Any] = {"id": cid, "fusion_score": float(sc)}
-        if cid in dense_by_id:
-            base["distance"] = dense_by_id[cid].get("distance")
-            base["source"] = dense_by_id[cid].get("source")
-        if cid in keyword_by_id:
-            base["keyword_score"] = keyword_by_id[cid].get("keyword_score")
-            if not base.get("source"):
-                base["source"] = keyword_by_id[cid].get("source")
-        base["dense_rank"] = dense_rank.get(cid)
-        base["keyword_rank"] = keyword_rank.get(cid)
-        fused.append(base)
-
-    # Stable: fusion_score desc, then best rank asc, then id.
-    def _best_rank(x: Dict[str, Any]) -> int:
-        dr = x.get("dense_rank")
-        kr = x.get("keyword_rank")
-        ranks = [r for r in [dr, kr] if isinstance(r, int) and r > 0]
-        return min(ranks) if ranks else 10**9
-
-    fused.sort(key=lambda x: (-float(x.get("fusion_score") or 0.0), _best_rank(x), str(x.get("id") or "")))
-    out: List[Dict[str, Any]] = []
-    for r, it in enumerate(fused[: max(0, int(topk))], start=1):
-        it2 = dict(it)
-        it2["rank"] = r
-        out.append(it2)
-    return out
+def embed_queries(embedder: Any, backend: str, texts: List[str]) -> List[List[float]]:
+    """Encode a batch of queries in one model call (same vectors as embed_query, row by row)."""
+    if backend == "flagembedding":
+        mat = embedder.encode(list(texts))
+    elif backend == "sentence-transformers":
+        mat = embedder.encode(list(texts), normalize_embeddings=False)
+    else:
+        raise RuntimeError(f"Unknown backend: {backend}")
+    return [v.tolist() if hasattr(v, "tolist") else list(v) for v in mat]
 
 
 def main() -> int:
@@ -478,6 +199,23 @@ def main() -> int:
         help="fusion method for hybrid retrieval (currently: rrf)",
     )
     ap.add_argument("--rrf-k", type=int, default=60, help="RRF k parameter (rank bias)")
+    ap.add_argument(
+        "--query-batch",
+        type=int,
+        default=32,
+        help="queries per batched embed + collection.query call (1 = one query at a time)",
+    )
+    ap.add_argument(
+        "--keyword-index",
+        default="auto",
+        choices=["auto", "rebuild", "memory"],
+        help="BM25 index for hybrid: auto (reuse persisted index, rebuild if stale)|rebuild|memory (no persistence)",
+    )
+    ap.add_argument(
+        "--state-root",
+        default="data_processed/index_state",
+        help="index_state root (relative to root); the persisted keyword index lives next to index_state.json",
+    )
     ap.add_argument(
         "--skip-if-missing",
         action="store_true",
@@ -489,6 +227,15 @@ def main() -> int:
         default="source_uri|source|path|file",
         help="metadata field(s) for source path (use | to separate)",
     )
+    ap.add_argument(
+        "--query-embed-cache",
+        default="off",
+        help="persistent query-vector cache dir (relative to root, e.g. data_processed/query_embed_cache); "
+        "off = in-memory LRU only",
+    )
+    ap.add_argument(
+        "--query-embed-cache-size", type=int, default=1024, help="in-memory query-vector LRU entries (0 = disabled)"
+    )
     ap.add_argument("--embed-backend", default="auto", help="auto|flagembedding|sentence-transformers")
     ap.add_argument("--embed-model", default="BAAI/bge-m3", help="embed model name")
     ap.add_argument("--device", default="cpu", help="cpu|cuda")
@@ -575,6 +322,7 @@ def main() -> int:
     kw_index_info: Dict[str, Any] = {"enabled": False}
     bucket_metrics: Dict[str, Any] = {}
     query_error_cases = 0
+    query_cache: Optional[QueryEmbeddingCache] = None
 
     def _emit_item(raw: Dict[str, Any]) -> None:
         it = ensure_item_fields(raw, tool_default="run_eval_retrieval")
@@ -623,7 +371,9 @@ def main() -> int:
                     "keyword_pool_k": int(keyword_pool_k),
                     "fusion_method": str(args.fusion_method),
                     "rrf_k": int(args.rrf_k),
+                    "query_batch": int(args.query_batch),
                     "keyword_index": kw_index_info,
+                    "query_embed_cache": query_cache.stats() if query_cache is not None else {},
                 },
                 "run_meta": {
                     "tool": "run_eval_retrieval",
@@ -652,6 +402,8 @@ def main() -> int:
         if events_path is not None:
             report["data"]["events_path"] = str(events_path.resolve().as_posix())
 
+        if query_cache is not None:
+            query_cache.close()
         # Ensure progress line is cleaned before final stdout report.
         progress.close()
         if events_writer is not None:
@@ -767,6 +519,20 @@ def main() -> int:
             _emit_item(_termination_item(message=f"embedder init failed: {type(e).__name__}: {e}", exc=e))
             return _finalize_and_write()
 
+        # Query vectors go through an in-memory LRU + persistent store; hits skip the model.
+        qc = open_query_embedding_cache(
+            root,
+            str(args.query_embed_cache),
+            embed_model=str(args.embed_model),
+            normalize=backend == "flagembedding",
+            backend=backend,
+            max_entries=int(args.query_embed_cache_size),
+        )
+        query_cache = qc
+
+        def _embed_many(texts: List[str]) -> List[List[float]]:
+            return qc.encode_through(texts, lambda miss: embed_queries(embedder, backend, miss))
+
         try:
             client = chromadb.PersistentClient(path=str(db_path))
             col = client.get_collection(args.collection)
@@ -826,24 +592,27 @@ def main() -> int:
         dense_pool_k = int(args.dense_topk) if int(args.dense_topk) > 0 else int(args.k)
         keyword_pool_k = int(args.keyword_topk) if int(args.keyword_topk) > 0 else int(args.k)
 
-        # Build a lightweight keyword index (BM25-ish) over stored Chroma documents.
-        # NOTE: this requires the collection to store `documents`.
-        kw_idx: Optional[_KeywordIndex] = None
+        # Open the persisted BM25 index (or rebuild it from stored Chroma documents).
+        # NOTE: rebuilding requires the collection to store `documents`.
+        kw_idx: Optional[KeywordIndex] = None
         kw_index_info = {"enabled": False, "n_docs": 0, "avgdl": 0.0, "query_vocab": 0}
         if str(args.retrieval_mode) == "hybrid":
-            progress.update(stage="build_keyword_index")
+            progress.update(stage="open_keyword_index")
             query_vocab: set[str] = set()
             for _ln, cc in valid_cases:
-                qv = str(cc.get("query") or "").strip()
-                for t in _tokenize(qv):
-                    if t:
-                        query_vocab.add(t)
+                query_vocab.update(tokenize(str(cc.get("query") or "").strip()))
             kw_index_info["query_vocab"] = len(query_vocab)
 
-            doc_ids, doc_texts, doc_metas = _load_chroma_docs(col, include_documents=True)
-            kw_index_info["n_docs"] = len(doc_texts)
+            kw_idx, kw_open_info = open_keyword_index_for_collection(
+                mode=str(args.keyword_index),
+                col=col,
+                state_root=root / str(args.state_root),
+                collection=str(args.collection),
+                meta_field=str(args.meta_field),
+            )
+            kw_index_info.update(kw_open_info)
 
-            if not doc_texts:
+            if kw_idx is None:
                 # Hybrid requires documents. Treat this as a data contract issue.
                 msg = "hybrid retrieval requires Chroma documents (collection has no documents)"
                 _emit_item(
@@ -862,165 +631,154 @@ def main() -> int:
                 )
                 return _finalize_and_write()
 
-            kw_idx = _build_keyword_index(
-                doc_ids=doc_ids,
-                doc_texts=doc_texts,
-                doc_metas=doc_metas,
-                query_vocab=query_vocab,
-                meta_field=str(args.meta_field),
-            )
-            kw_index_info.update({"enabled": True, "avgdl": float(kw_idx.avgdl)})
-
-        for idx, (lineno, c) in enumerate(valid_cases, start=1):
-            progress.update(current=idx, stage="eval")
-
-            cid = str(c.get("id", "")).strip() or f"line_{lineno}"
-            q = str(c.get("query", "")).strip()
-            case_t0 = time.time()
-
-            bucket = normalize_bucket(c.get("bucket"), warnings, case_id=cid, line_hint=lineno)
-            pair_id = c.get("pair_id")
-            concept_id = c.get("concept_id")
-            must_include = c.get("must_include", []) or []
-            expected = c.get("expected_sources", []) or []
-            expected = [str(x) for x in expected]
-
-            if not q:
-                _emit_item(
-                    {
-                        "tool": "run_eval_retrieval",
-                        "title": cid,
-                        "status_label": "FAIL",
-                        "severity_level": 3,
-                        "message": "missing query",
-                        "loc": f"{_normalize_rel(args.cases)}:{lineno}:1",
-                        "duration_ms": int((time.time() - case_t0) * 1000),
-                        "detail": {"line": lineno, "case": dict(c)},
-                    }
-                )
-                continue
+            kw_index_info.update({"enabled": True, "n_docs": kw_idx.n_chunks, "avgdl": float(kw_idx.avgdl)})
+
+        retriever = HybridRetriever(
+            collection=col,
+            embed=lambda text: _embed_many([text])[0],
+            embed_many=_embed_many,
+            keyword_index=kw_idx,
+            mode=str(args.retrieval_mode),
+            dense_pool_k=int(dense_pool_k),
+            keyword_pool_k=int(keyword_pool_k),
+            rrf_k=int(args.rrf_k),
+            meta_field=str(args.meta_field),
+        )
+        query_batch = max(1, int(args.query_batch))
+        for b0 in range(0, len(valid_cases), query_batch):
+            chunk = valid_cases[b0 : b0 + query_batch]
+            chunk_qs = [q for q in (str(c.get("query", "")).strip() for _ln, c in chunk) if q]
+            progress.update(current=b0, stage="retrieve_batch")
+            batch_t0 = time.time()
+            batch: Optional[List[RetrievalResult]] = None
             try:
-                qvec = embed_query(embedder, backend, q)
-                query_embeddings: List[Sequence[float]] = [qvec]
-                res = col.query(
-                    query_embeddings=query_embeddings,
-                    n_results=int(dense_pool_k),
-                    include=["metadatas", "distances"],
-                )
-                ids = (res.get("ids") or [[]])[0]
-                metadatas = (res.get("metadatas") or [[]])[0]
-                distances = (res.get("distances") or [[]])[0]
-            except Exception as e:
-                query_error_cases += 1
+                batch = retriever.retrieve_many(chunk_qs, int(args.k), with_text=False)
+            except Exception:
+                # Fall back to per-query calls below so the failure is attributed to the case that caused it.
+                batch = None
+            batch_share_s = (time.time() - batch_t0) / len(chunk_qs) if (batch is not None and chunk_qs) else 0.0
+            batch_iter = iter(batch or [])
+
+            for idx, (lineno, c) in enumerate(chunk, start=b0 + 1):
+                progress.update(current=idx, stage="eval")
+
+                cid = str(c.get("id", "")).strip() or f"line_{lineno}"
+                q = str(c.get("query", "")).strip()
+                case_t0 = time.time() - batch_share_s
+
+                bucket = normalize_bucket(c.get("bucket"), warnings, case_id=cid, line_hint=lineno)
+                pair_id = c.get("pair_id")
+                concept_id = c.get("concept_id")
+                must_include = c.get("must_include", []) or []
+                expected = c.get("expected_sources", []) or []
+                expected = [str(x) for x in expected]
+
+                if not q:
+                    _emit_item(
+                        {
+                            "tool": "run_eval_retrieval",
+                            "title": cid,
+                            "status_label": "FAIL",
+                            "severity_level": 3,
+                            "message": "missing query",
+                            "loc": f"{_normalize_rel(args.cases)}:{lineno}:1",
+                            "duration_ms": 0,
+                            "detail": {"line": lineno, "case": dict(c)},
+                        }
+                    )
+                    continue
+                try:
+                    res = next(batch_iter) if batch is not None else retriever.retrieve(q, int(args.k), with_text=False)
+                except Exception as e:
+                    query_error_cases += 1
+                    _emit_item(
+                        {
+                            "tool": "run_eval_retrieval",
+                            "title": cid,
+                            "status_label": "ERROR",
+                            "severity_level": 4,
+                            "message": f"query failed: {type(e).__name__}: {e}",
+                            "loc": f"{_normalize_rel(args.cases)}:{lineno}:1",
+                            "duration_ms": int((time.time() - case_t0) * 1000),
+                            "detail": {"line": lineno, "case": dict(c), "traceback": traceback.format_exc()},
+                        }
+                    )
+                    continue
+
+                evaluated_cases += 1
+
+                dense_topk: List[Dict[str, Any]] = res.dense
+                keyword_topk: List[Dict[str, Any]] = res.keyword
+                topk_hits = res.fused
+
+                def _is_hit(got: List[Dict[str, Any]]) -> bool:
+                    # hit rule: any expected substring matches any got source
+                    for e in expected:
+                        for g in got:
+                            if e and g.get("source") and (e in str(g.get("source"))):
+                                return True
+                    # allow prefix match for expected dir like "docs/"
+                    for e in expected:
+                        if e.endswith("/"):
+                            for g in got:
+                                if str(g.get("source") or "").replace("\\", "/").startswith(e):
+                                    return True
+                    return False
+
+                hit_dense: Optional[bool] = _is_hit(dense_topk[: int(args.k)]) if expected else None
+                hit_val: Optional[bool] = _is_hit(topk_hits) if expected else None
+                if hit_dense is True:
+                    hit_cases_dense += 1
+                if hit_val is True:
+                    hit_cases += 1
+
+                one_case = {
+                    "id": cid,
+                    "bucket": bucket,
+                    "pair_id": pair_id,
+                    "concept_id": concept_id,
+                    "query": q,
+                    "expected_sources": expected,
+                    "must_include": must_include,
+                    "hit_at_k": hit_val,
+                    "topk": topk_hits,
+                    "debug": {
+                        "retrieval_mode": str(args.retrieval_mode),
+                        "dense_topk": dense_topk[: int(args.k)],
+                        "keyword_topk": keyword_topk[: int(args.k)],
+                        "fusion_topk": topk_hits if str(args.retrieval_mode) == "hybrid" else [],
+                        "expansion_trace": None,
+                        "fusion_method": str(args.fusion_method),
+                        "rrf_k": int(args.rrf_k),
+                        "hit_at_k_dense": hit_dense,
+                    },
+                }
+                per_case.append(one_case)
+
+                if hit_val is True:
+                    status_label = "PASS"
+                    severity_level = 0
+                elif hit_val is False:
+                    status_label = "FAIL"
+                    severity_level = 3
+                else:
+                    status_label = "INFO"
+                    severity_level = 1
+
                 _emit_item(
                     {
                         "tool": "run_eval_retrieval",
                         "title": cid,
-                        "status_label": "ERROR",
-                        "severity_level": 4,
-                        "message": f"query failed: {type(e).__name__}: {e}",
+                        "status_label": status_label,
+                        "severity_level": severity_level,
+                        "message": f"hit_at_k={hit_val} bucket={bucket} k={int(args.k)} mode={str(args.retrieval_mode)}",
                         "loc": f"{_normalize_rel(args.cases)}:{lineno}:1",
                         "duration_ms": int((time.time() - case_t0) * 1000),
-                        "detail": {"line": lineno, "case": dict(c), "traceback": traceback.format_exc()},
-                    }
-                )
-                continue
-
-            evaluated_cases += 1
-
-            dense_topk: List[Dict[str, Any]] = []
-            for i, m in enumerate(metadatas or []):
-                m = m or {}
-                src = extract_source(m, str(args.meta_field))
-                dense_topk.append(
-                    {
-                        "rank": i + 1,
-                        "id": str(ids[i]) if i < len(ids) else "",
-                        "source": str(src),
-                        "distance": distances[i] if i < len(distances) else None,
+                        "detail": one_case,
                     }
                 )
 
-            keyword_topk: List[Dict[str, Any]] = []
-            if str(args.retrieval_mode) == "hybrid" and kw_idx is not None:
-                keyword_topk = _keyword_search(idx=kw_idx, query=q, topk=int(keyword_pool_k))
-
-            if str(args.retrieval_mode) == "hybrid":
-                topk_hits = _rrf_fuse(
-                    dense=dense_topk,
-                    keyword=keyword_topk,
-                    topk=int(args.k),
-                    rrf_k=int(args.rrf_k),
-                )
-            else:
-                topk_hits = dense_topk[: int(args.k)]
-
-            def _is_hit(got: List[Dict[str, Any]]) -> bool:
-                # hit rule: any expected substring matches any got source
-                for e in expected:
-                    for g in got:
-                        if e and g.get("source") and (e in str(g.get("source"))):
-                            return True
-                # allow prefix match for expected dir like "docs/"
-                for e in expected:
-                    if e.endswith("/"):
-                        for g in got:
-                            if str(g.get("source") or "").replace("\\", "/").startswith(e):
-                                return True
-                return False
-
-            hit_dense: Optional[bool] = _is_hit(dense_topk[: int(args.k)]) if expected else None
-            hit_val: Optional[bool] = _is_hit(topk_hits) if expected else None
-            if hit_dense is True:
-                hit_cases_dense += 1
-            if hit_val is True:
-                hit_cases += 1
-
-            one_case = {
-                "id": cid,
-                "bucket": bucket,
-                "pair_id": pair_id,
-                "concept_id": concept_id,
-                "query": q,
-                "expected_sources": expected,
-                "must_include": must_include,
-                "hit_at_k": hit_val,
-                "topk": topk_hits,
-                "debug": {
-                    "retrieval_mode": str(args.retrieval_mode),
-                    "dense_topk": dense_topk[: int(args.k)],
-                    "keyword_topk": keyword_topk[: int(args.k)],
-                    "fusion_topk": topk_hits if str(args.retrieval_mode) == "hybrid" else [],
-                    "expansion_trace": None,
-                    "fusion_method": str(args.fusion_method),
-                    "rrf_k": int(args.rrf_k),
-                    "hit_at_k_dense": hit_dense,
-                },
-            }
-            per_case.append(one_case)
-
-            if hit_val is True:
-                status_label = "PASS"
-                severity_level = 0
-            elif hit_val is False:
-                status_label = "FAIL"
-                severity_level = 3
-            else:
-                status_label = "INFO"
-                severity_level = 1
-
-            _emit_item(
-                {
-                    "tool": "run_eval_retrieval",
-                    "title": cid,
-                    "status_label": status_label,
-                    "severity_level": severity_level,
-                    "message": f"hit_at_k={hit_val} bucket={bucket} k={int(args.k)} mode={str(args.retrieval_mode)}",
-                    "loc": f"{_normalize_rel(args.cases)}:{lineno}:1",
-                    "duration_ms": int((time.time() - case_t0) * 1000),
-                    "detail": one_case,
-                }
-            )
+        retriever.close()
 
         # Aggregate bucket metrics (evaluated cases only; query errors are excluded from denominators).
         b_total: Counter[str] = Counter()
@@ -14,21 +14,35 @@
   python -m mhy_ai_rag_data.tools.run_rag_eval_batch --queries tests/rag_queries_v1.json --k 5
   python -m mhy_ai_rag_data.tools.run_rag_eval_batch --queries tests/rag_queries_v1.json --k 5 --pipeline
   python -m mhy_ai_rag_data.tools.run_rag_eval_batch --queries tests/rag_queries_v1.json --k 5 --answer
+  python -m mhy_ai_rag_data.tools.run_rag_eval_batch --queries tests/rag_queries_v1.json --k 5 --answer --llm-cache read
+
+--llm-cache：read 回放已录制的同一请求回答（检索上下文不变时不再调用 LLM），write 强制重录。
+
+执行方式（--exec）：
+- in-process（默认）：本进程只加载一次检索器（embedding 模型 + Chroma + 关键词索引），全部 query 按 --query-batch
+  批量走 retriever_chroma.retrieve_many；--pipeline / --answer 直接调用 check_rag_pipeline.format_pipeline_check /
+  prompt_rag + llm_client_http.call_llm。stdout 文本与对应 CLI 输出一致，关键词启发式口径不变。
+- subprocess：每个 query 每个步骤起一个子进程（retriever_chroma.py / check_rag_pipeline.py / answer_cli.py），
+  隔离性最好但每次都要重新加载 torch / 模型 / Chroma；需在含这些根目录脚本的仓库根运行。
 """
 
 from __future__ import annotations
 
 
 import argparse
+import contextlib
 import json
 import os
 import subprocess
 import sys
 import time
+import traceback
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+from mhy_ai_rag_data.llm_cache import LLM_CACHE_MODES, LLMResponseCache, open_llm_cache
+from mhy_ai_rag_data.rag_config import LLM_CACHE_PATH
 from mhy_ai_rag_data.tools.report_bundle import default_md_path_for_json, write_report_bundle
 from mhy_ai_rag_data.tools.selftest_utils import add_selftest_args, maybe_run_selftest_from_args
 from mhy_ai_rag_data.tools.report_contract import compute_summary, ensure_item_fields, iso_now
@@ -100,6 +114,74 @@ def parse_retriever_output(out: str) -> Dict[str, Any]:
     return res
 
 
+def retrieve_in_process(queries: List[str], k: int, batch: int) -> List[Dict[str, Any]]:
+    """One step record per query ({returncode, seconds, stdout, sources}) from the shared in-process retriever.
+
+    Queries go through retrieve_many in chunks of `batch` (seconds is the chunk time split evenly); a failing chunk is
+    retried query by query so one bad query does not fail its neighbours.
+    """
+    from mhy_ai_rag_data.retriever_chroma import format_results, retrieve, retrieve_many
+
+    def _ok(q: str, dt: float, sources: List[Any]) -> Dict[str, Any]:
+        out = format_results(q, k, None, None, "in-process", sources)
+        return {"mode": "in-process", "returncode": 0, "seconds": dt, "stdout": out, "sources": sources}
+
+    steps: List[Dict[str, Any]] = []
+    n = max(1, int(batch))
+    for start in range(0, len(queries), n):
+        part = queries[start : start + n]
+        t0 = time.perf_counter()
+        try:
+            results = retrieve_many(part, k)
+            per = (time.perf_counter() - t0) / len(part)
+            steps.extend(_ok(q, per, sources) for q, sources in zip(part, results))
+            continue
+        except Exception:
+            pass
+        for q in part:
+            t1 = time.perf_counter()
+            try:
+                steps.append(_ok(q, time.perf_counter() - t1, retrieve(q, k)))
+            except Exception:
+                steps.append(
+                    {
+                        "mode": "in-process",
+                        "returncode": 1,
+                        "seconds": time.perf_counter() - t1,
+                        "stdout": traceback.format_exc(),
+                        "sources": [],
+                    }
+                )
+    return steps
+
+
+def pipeline_in_process(q: str, k: int, sources: List[Any]) -> Dict[str, Any]:
+    from mhy_ai_rag_data.check_rag_pipeline import format_pipeline_check
+
+    t0 = time.perf_counter()
+    try:
+        rc, out = 0, format_pipeline_check(q, k, sources)
+    except Exception:
+        rc, out = 1, traceback.format_exc()
+    return {"mode": "in-process", "returncode": rc, "seconds": time.perf_counter() - t0, "stdout": out}
+
+
+def answer_in_process(q: str, sources: List[Any], cache: Any) -> Dict[str, Any]:
+    """Same request as `answer_cli --q q` (default temperature 0.2), so --llm-cache entries are shared.
+
+    Unlike answer_cli (which prints the error and exits 0), an LLM error gives returncode=1 here.
+    """
+    from mhy_ai_rag_data.llm_client_http import LLMError, call_llm
+    from mhy_ai_rag_data.prompt_rag import build_messages
+
+    t0 = time.perf_counter()
+    try:
+        rc, out = 0, call_llm(build_messages(q, sources), temperature=0.2, cache=cache)
+    except LLMError as e:
+        rc, out = 1, f"[LLM ERROR] {e}"
+    return {"mode": "in-process", "returncode": rc, "seconds": time.perf_counter() - t0, "stdout": out}
+
+
 def keyword_score(text: str, keywords: List[str]) -> Dict[str, Any]:
     hit = 0
     misses = []
@@ -133,6 +215,26 @@ def main() -> int:
     ap.add_argument("--k", type=int, default=5)
     ap.add_argument("--pipeline", action="store_true")
     ap.add_argument("--answer", action="store_true")
+    ap.add_argument(
+        "--exec",
+        dest="exec_mode",
+        default="in-process",
+        choices=["in-process", "subprocess"],
+        help="in-process: load the retriever once and run every query through the library API; "
+        "subprocess: one child process per query and step (isolated, reloads models each time)",
+    )
+    ap.add_argument(
+        "--query-batch",
+        type=int,
+        default=32,
+        help="in-process: queries per batched retrieval call (one embed + one collection.query)",
+    )
+    ap.add_argument(
+        "--llm-cache",
+        default="off",
+        choices=list(LLM_CACHE_MODES),
+        help="with --answer: answer cache (off | read = replay + record misses | write = re-record)",
+    )
     ap.add_argument(
         "--out",
         default="",
@@ -236,6 +338,9 @@ def main() -> int:
                 "k": int(args.k),
                 "pipeline": bool(args.pipeline),
                 "answer": bool(args.answer),
+                "llm_cache": str(args.llm_cache),
+                "exec": str(args.exec_mode),
+                "query_batch": int(args.query_batch),
                 "elapsed_ms": int((time.time() - t0) * 1000),
             },
         }
@@ -256,6 +361,7 @@ def main() -> int:
         )
         return int(summary.overall_rc)
 
+    stack = contextlib.ExitStack()
     try:
         if not qpath.exists():
             _emit_item(_termination_item(f"queries not found: {qpath.as_posix()}"))
@@ -272,6 +378,19 @@ def main() -> int:
         progress.total = total if total > 0 else None
 
         cwd = root
+        in_process = args.exec_mode == "in-process"
+        retrieved: Iterator[Dict[str, Any]] = iter(())
+        llm_cache: Optional[LLMResponseCache] = None
+        if in_process:
+            # rag_config paths (chroma_db, index_state, caches) are relative to the project root, as for the CLIs.
+            stack.enter_context(contextlib.chdir(root))
+            progress.update(stage="retrieve")
+            queries = [str(x.get("query") or x.get("q")) for x in qitems if x.get("query") or x.get("q")]
+            retrieved = iter(retrieve_in_process(queries, int(args.k), int(args.query_batch)))
+            if args.answer:
+                llm_cache = open_llm_cache(root, args.llm_cache, LLM_CACHE_PATH)
+                if llm_cache is not None:
+                    stack.callback(llm_cache.close)
 
         for idx, it in enumerate(qitems, start=1):
             progress.update(current=idx, stage="batch")
@@ -295,22 +414,39 @@ def main() -> int:
             started = time.time()
             one: Dict[str, Any] = {"id": qid, "query": q, "expect_keywords": kws, "steps": {}}
 
-            cmd_r = [sys.executable, "retriever_chroma.py", "--q", str(q), "--k", str(args.k)]
-            rc, dt, out = run_capture(cmd_r, cwd)
-            one["steps"]["retriever"] = {"cmd": cmd_r, "returncode": rc, "seconds": dt, "stdout": out}
-            one["retrieval"] = parse_retriever_output(out)
+            if in_process:
+                step = next(retrieved)
+                sources = step.pop("sources")
+                rc, dt, out = int(step["returncode"]), float(step["seconds"]), str(step["stdout"])
+                one["steps"]["retriever"] = step
+                one["retrieval"] = {
+                    "retrieved": len(sources) if rc == 0 else None,
+                    "hits": [
+                        {"doc_id": str(s.doc_id), "source_uri": str(s.source_uri), "locator": str(s.locator)}
+                        for s in sources
+                    ],
+                }
+                if args.pipeline:
+                    one["steps"]["pipeline"] = pipeline_in_process(str(q), int(args.k), sources)
+                if args.answer:
+                    one["steps"]["answer"] = answer_in_process(str(q), sources, llm_cache)
+            else:
+                cmd_r = [sys.executable, "retriever_chroma.py", "--q", str(q), "--k", str(args.k)]
+                rc, dt, out = run_capture(cmd_r, cwd)
+                one["steps"]["retriever"] = {"cmd": cmd_r, "returncode": rc, "seconds": dt, "stdout": out}
+                one["retrieval"] = parse_retriever_output(out)
+
+                # optional steps
+                if args.pipeline:
+                    cmd_p = [sys.executable, "check_rag_pipeline.py", "--q", str(q), "--k", str(args.k)]
+                    rc2, dt2, out2 = run_capture(cmd_p, cwd)
+                    one["steps"]["pipeline"] = {"cmd": cmd_p, "returncode": rc2, "seconds": dt2, "stdout": out2}
+                if args.answer:
+                    cmd_a = [sys.executable, "answer_cli.py", "--q", str(q), "--llm-cache", str(args.llm_cache)]
+                    rc3, dt3, out3 = run_capture(cmd_a, cwd)
+                    one["steps"]["answer"] = {"cmd": cmd_a, "returncode": rc3, "seconds": dt3, "stdout": out3}
             one["heuristic"] = {"keywords_in_output": keyword_score(out, [str(x) for x in kws])}
 
-            # optional steps
-            if args.pipeline:
-                cmd_p = [sys.executable, "check_rag_pipeline.py", "--q", str(q), "--k", str(args.k)]
-                rc2, dt2, out2 = run_capture(cmd_p, cwd)
-                one["steps"]["pipeline"] = {"cmd": cmd_p, "returncode": rc2, "seconds": dt2, "stdout": out2}
-            if args.answer:
-                cmd_a = [sys.executable, "answer_cli.py", "--q", str(q)]
-                rc3, dt3, out3 = run_capture(cmd_a, cwd)
-                one["steps"]["answer"] = {"cmd": cmd_a, "returncode": rc3, "seconds": dt3, "stdout": out3}
-
             # status/severity decision: prioritize subprocess failures, then keyword heuristic
             status_label = "INFO"
             severity_level = 1
@@ -359,6 +495,8 @@ def main() -> int:
     except Exception as e:
         _emit_item(_termination_item(f"unhandled exception: {type(e).__name__}: {e}"))
         return _finalize_and_write()
+    finally:
+        stack.close()
 
 
 if __name__ == "__main__":
@@ -48,7 +48,8 @@ try:
 except Exception:  # noqa: BLE001
     _llm_http_client = importlib.import_module("llm_http_client")
 resolve_trust_env = _llm_http_client.resolve_trust_env
-get_session = _llm_http_client.get_session
+send_request = _llm_http_client.send_request
+last_request_timing = _llm_http_client.last_request_timing
 
 
 def _now_iso() -> str:
@@ -168,15 +169,16 @@ def probe_llm(
     details["enabled"] = True
     base = base_url.rstrip("/")
     trust_env = resolve_trust_env(base_url, trust_env_mode)
-    sess = get_session(trust_env=trust_env)
+    timeout = (connect_timeout, read_timeout)
 
     def url(p: str) -> str:
         return f"{base}{p}"
 
     ok = True
     try:
-        r = sess.get(url("/models"), timeout=(connect_timeout, read_timeout))
+        r = send_request("GET", url("/models"), trust_env=trust_env, timeout=timeout)
         details["get_models_status"] = r.status_code
+        details["get_models_http"] = last_request_timing()
         ok = ok and (200 <= r.status_code < 300)
         # keep response small
         try:
@@ -220,8 +222,9 @@ def probe_llm(
             "temperature": 0,
             "max_tokens": 8,
         }
-        r = sess.post(url("/chat/completions"), json=payload, timeout=(connect_timeout, read_timeout))
+        r = send_request("POST", url("/chat/completions"), trust_env=trust_env, timeout=timeout, json=payload)
         details["chat_status"] = r.status_code
+        details["chat_http"] = last_request_timing()
         ok = ok and (200 <= r.status_code < 300)
         # do not log full text; just presence of choices
         try:
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""mhy_ai_rag_data.units_reader
+
+text_units.jsonl 的轻量读取（标准库实现）：只解码需要的字段，按字节偏移回读整条 unit，
+以及 extract_units 写出的 sidecar 偏移索引（text_units.jsonl.idx）。
+
+用途
+- build_chroma_index_flagembedding 的增量判定只需要每条 unit 的 (source_uri, doc_id, content_sha256, ...)，
+  不需要 text；原先把整条 unit（含全文 text）挂在 cur_docs 里直到 delta 算完，峰值内存 ≈ 全语料文本。
+- 现在分两遍：第一遍 iter_unit_heads() 只扫出头部字段 + 该行的 (offset, length)；
+  第二遍由 UnitsFile.read() 按偏移只回读待处理的 unit。
+
+字段扫描（scan_fields）
+- 在行字节上逐个跳过顶层 key/value：字符串用 bytes.find 定位未转义的结束引号（不构造 str），嵌套对象/数组按括号配平跳过；
+  只有被请求的字段才 json.loads 其值片段。text 这类大字段因此既不解码也不复制。
+  扫描器每行有固定的 Python 开销（约 80µs），短行（< _SCAN_MIN_BYTES）直接整行 json.loads 更快；
+  转义引号很多的字符串逐个跳过也比 C 解码器慢，超过 _MAX_ESCAPED_QUOTES 即整行回退。
+  收益主要在内存：无论走哪条路，text 都不会留在 cur_docs 里；长文档行上扫描本身也快数倍。
+- 重复 key 以最后一次为准（与 json.loads 一致）；扫描器不认识的写法（非对象、语法异常等）回退到整行 json.loads，
+  结果与完整解析一致，错误行照常抛 ValueError。
+
+偏移索引（units_index_path）
+- JSONL：首行 header {"schema", "units_bytes", "units_mtime_ns", "count", "fields"}，
+  之后每条 unit 一行 [offset, length, doc_id, source_uri, source_type, content_sha256, updated_at]（与文件顺序一致）。
+- header 记录写索引时 units 文件的 size / mtime_ns；任一不符即视为过期（load_units_index 返回 None），
+  调用方回退到 iter_unit_heads 扫描，不会读到错位的偏移。
+- iter_unit_refs() 统一两条路径：索引新鲜则不读 units 文件，否则逐行扫描头部字段。
+
+随机读取（UnitsFile）
+- mmap 只读映射整份 JSONL，read(offset, length) 只切出并解析那一行；get(source_uri) 经索引直接定位。
+- units 文件应整体替换（extract_units 用 tmp + os.replace），不要原地改写正在被读取的文件。
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import re
+from pathlib import Path
+from typing import Any, Collection, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+# What delta detection / should_index_unit need from each unit (everything except the payload text).
+HEAD_FIELDS = frozenset({"doc_id", "source_uri", "source_type", "content_sha256", "updated_at"})
+
+UNITS_INDEX_SCHEMA = "units_index_v1"
+UNITS_INDEX_SUFFIX = ".idx"
+# Column order of index rows after (offset, length).
+INDEX_FIELDS = ("doc_id", "source_uri", "source_type", "content_sha256", "updated_at")
+
+# Below this line size the C json decoder beats the scanner's fixed per-line overhead.
+_SCAN_MIN_BYTES = 32 * 1024
+
+# Escaped quotes tolerated inside one string before the line falls back to json.loads.
+_MAX_ESCAPED_QUOTES = 64
+
+_WS = re.compile(rb"[ \t\r\n]*")
+_SCALAR = re.compile(rb"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null")
+_NESTED_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]', re.S)
+
+
+class _ScanError(Exception):
+    pass
+
+
+class UnitRef(NamedTuple):
+    offset: int
+    length: int
+    head: Dict[str, Any]
+
+
+def _ws(b: bytes, i: int) -> int:
+    m = _WS.match(b, i)
+    return m.end() if m else i
+
+
+def _string_end(b: bytes, i: int) -> int:
+    """Index just past the JSON string starting at b[i] == '"' (memchr for quotes; no decoding)."""
+    j = i + 1
+    for _ in range(_MAX_ESCAPED_QUOTES):
+        j = b.find(b'"', j)
+        if j < 0:
+            raise _ScanError("unterminated string")
+        k = j - 1
+        while b[k] == 0x5C:  # backslash
+            k -= 1
+        if (j - 1 - k) % 2 == 0:
+            return j + 1
+        j += 1
+    # Quote-heavy text: per-quote Python steps would cost more than the C json decoder.
+    raise _ScanError("too many escaped quotes")
+
+
+def _skip_nested(b: bytes, i: int) -> int:
+    depth = 0
+    for m in _NESTED_TOKEN.finditer(b, i):
+        tok = m.group()
+        if tok in (b"{", b"["):
+            depth += 1
+        elif tok in (b"}", b"]"):
+            depth -= 1
+            if depth == 0:
+                return m.end()
+    raise _ScanError("unbalanced value")
+
+
+def _scan(b: bytes, fields: Collection[str]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    i = _ws(b, 0)
+    if b[i : i + 1] != b"{":
+        raise _ScanError("not an object")
+    i = _ws(b, i + 1)
+    if b[i : i + 1] == b"}":
+        i += 1
+    else:
+        while True:
+            if b[i : i + 1] != b'"':
+                raise _ScanError("bad key")
+            key_end = _string_end(b, i)
+            raw_key = b[i:key_end]
+            key = json.loads(raw_key) if b"\\" in raw_key else raw_key[1:-1].decode("utf-8")
+            i = _ws(b, key_end)
+            if b[i : i + 1] != b":":
+                raise _ScanError("missing colon")
+            i = _ws(b, i + 1)
+            c = b[i : i + 1]
+            if c == b'"':
+                end = _string_end(b, i)
+            elif c in (b"{", b"["):
+                end = _skip_nested(b, i)
+            else:
+                vm = _SCALAR.match(b, i)
+                end = vm.end() if vm else -1
+            if end < 0:
+                raise _ScanError("bad value")
+            if key in fields:
+                out[key] = json.loads(b[i:end])
+            i = _ws(b, end)
+            c = b[i : i + 1]
+            i += 1
+            if c == b",":
+                i = _ws(b, i)
+                continue
+            if c == b"}":
+                break
+            raise _ScanError("missing comma")
+    if _ws(b, i) != len(b):
+        raise _ScanError("trailing data")
+    return out
+
+
+def scan_fields(line: bytes, fields: Collection[str] = HEAD_FIELDS) -> Dict[str, Any]:
+    """Top-level `fields` of one JSON object line, without decoding the other values."""
+    if len(line) >= _SCAN_MIN_BYTES:
+        try:
+            return _scan(line, fields)
+        except (_ScanError, ValueError):
+            pass
+    obj = json.loads(line)
+    if not isinstance(obj, dict):
+        raise ValueError(f"unit line is not a JSON object: {type(obj).__name__}")
+    return {k: v for k, v in obj.items() if k in fields}
+
+
+def iter_unit_heads(path: Path, fields: Collection[str] = HEAD_FIELDS) -> Iterator[UnitRef]:
+    """Yield (byte offset, byte length, head fields) for every non-blank line of a units JSONL."""
+    with path.open("rb") as f:
+        offset = 0
+        for raw in f:
+            n = len(raw)
+            if raw.strip():
+                yield UnitRef(offset, n, scan_fields(raw, fields))
+            offset += n
+
+
+def units_index_path(units_path: Path) -> Path:
+    return units_path.with_name(units_path.name + UNITS_INDEX_SUFFIX)
+
+
+def write_units_index(units_path: Path, refs: Iterable[UnitRef]) -> Path:
+    """Write the sidecar index for units_path (call after units_path is final); returns its path."""
+    rows = [
+        json.dumps([r.offset, r.length, *(str(r.head.get(k) or "") for k in INDEX_FIELDS)], ensure_ascii=False)
+        for r in refs
+    ]
+    st = units_path.stat()
+    header = {
+        "schema": UNITS_INDEX_SCHEMA,
+        "units_bytes": st.st_size,
+        "units_mtime_ns": st.st_mtime_ns,
+        "count": len(rows),
+        "fields": ["offset", "length", *INDEX_FIELDS],
+    }
+    out = units_index_path(units_path)
+    tmp = out.with_name(out.name + ".tmp")
+    with tmp.open("w", encoding="utf-8", newline="\n") as f:
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for row in rows:
+            f.write(row + "\n")
+    os.replace(tmp, out)
+    return out
+
+
+def load_units_index(units_path: Path) -> Optional[List[UnitRef]]:
+    """Refs from the sidecar index, or None when it is missing, unreadable or stale for units_path."""
+    idx = units_index_path(units_path)
+    try:
+        st = units_path.stat()
+        with idx.open("r", encoding="utf-8") as f:
+            header = json.loads(f.readline() or "null")
+            if not isinstance(header, dict) or header.get("schema") != UNITS_INDEX_SCHEMA:
+                return None
+            if header.get("units_bytes") != st.st_size or header.get("units_mtime_ns") != st.st_mtime_ns:
+                return None
+            refs: List[UnitRef] = []
+            for line in f:
+                row = json.loads(line)
+                refs.append(UnitRef(int(row[0]), int(row[1]), dict(zip(INDEX_FIELDS, row[2:]))))
+    except (OSError, ValueError, TypeError, IndexError):
+        return None
+    if len(refs) != header.get("count"):
+        return None
+    return refs
+
+
+def iter_unit_refs(units_path: Path) -> Iterator[UnitRef]:
+    """Head fields + byte range of every unit: from a fresh sidecar index, else by scanning units_path."""
+    refs = load_units_index(units_path)
+    if refs is not None:
+        yield from refs
+    else:
+        yield from iter_unit_heads(units_path)
+
+
+class UnitsFile:
+    """Random access to whole units over a read-only mmap; safe to share across threads."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._f = path.open("rb")
+        self._mm: Optional[mmap.mmap] = None
+        if os.fstat(self._f.fileno()).st_size > 0:  # an empty file cannot be mapped
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._by_uri: Optional[Dict[str, UnitRef]] = None
+
+    def read(self, offset: int, length: int) -> Dict[str, Any]:
+        offset = int(offset)
+        raw = self._mm[offset : offset + int(length)] if self._mm is not None else b""
+        obj = json.loads(raw)
+        if not isinstance(obj, dict):
+            raise ValueError(f"unit at offset {offset} is not a JSON object")
+        return obj
+
+    def refs(self) -> Dict[str, UnitRef]:
+        """source_uri -> UnitRef (last occurrence wins, like the builders); loaded on first use."""
+        if self._by_uri is None:
+            self._by_uri = {str(r.head.get("source_uri") or ""): r for r in iter_unit_refs(self.path)}
+        return self._by_uri
+
+    def get(self, source_uri: str) -> Optional[Dict[str, Any]]:
+        ref = self.refs().get(source_uri)
+        return self.read(ref.offset, ref.length) if ref is not None else None
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+        self._f.close()
+
+    def __enter__(self) -> "UnitsFile":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
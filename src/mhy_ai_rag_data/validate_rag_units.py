@@ -10,6 +10,8 @@ Checks:
   1) JSONL parseability + required fields + non-empty text
   2) Alignment: every inventory source_uri has a unit; each uri maps to a single doc_id
   3) Markdown refs sanity: md units contain asset_refs/doc_refs; targets exist on disk; locator quality
+  4) Offset index (text_units.jsonl.idx, written by extract_units): when fresh, every row must point at
+     the same (offset, length, source_uri, content_sha256) as the JSONL line; stale/missing is informational
 
 Usage:
   python validate_rag_units.py
@@ -34,6 +36,7 @@ from pathlib import Path
 from typing import Any, Dict, List, Tuple
 
 from mhy_ai_rag_data.tools.reporting import build_base, add_error, status_to_rc, write_report
+from mhy_ai_rag_data.units_reader import load_units_index, units_index_path
 
 
 REQ_FIELDS = {
@@ -71,6 +74,9 @@ class Stats:
     video_units: int = 0
     other_units: int = 0
 
+    units_index: str = "missing"
+    units_index_mismatch: int = 0
+
 
 def _load_inventory(inv_path: Path) -> List[Dict[str, str]]:
     rows: List[Dict[str, str]] = []
@@ -82,12 +88,16 @@ def _load_inventory(inv_path: Path) -> List[Dict[str, str]]:
 
 
 def _iter_units(units_path: Path) -> Any:
-    with units_path.open("r", encoding="utf-8") as f:
-        for i, line in enumerate(f, 1):
-            line = line.strip()
+    """Yield (line_no, byte offset, byte length, stripped line) for each non-blank line."""
+    with units_path.open("rb") as f:
+        offset = 0
+        for i, raw in enumerate(f, 1):
+            start = offset
+            offset += len(raw)
+            line = raw.decode("utf-8").strip()
             if not line:
                 continue
-            yield i, line
+            yield i, start, len(raw), line
 
 
 def _is_local_target(uri: str) -> bool:
@@ -118,16 +128,22 @@ def _collect(root: Path, inv_path: Path, units_path: Path, max_samples: int) ->
     unit_by_uri: Dict[str, List[Dict[str, Any]]] = {}
     docid_by_uri: Dict[str, set[str]] = {}
 
+    # (offset, length, source_uri, content_sha256) per non-blank line, compared against the offset index.
+    line_refs: List[Tuple[int, int, str, str]] = []
+
     # ---- 1) JSONL structural checks ----
-    for line_no, line in _iter_units(units_path):
+    for line_no, offset, length, line in _iter_units(units_path):
         st.total_units += 1
         try:
             obj = json.loads(line)
         except Exception as e:
             st.bad_json += 1
+            line_refs.append((offset, length, "", ""))
             if len(issues) < max_samples:
                 issues.append(f"[JSON_ERROR] line={line_no} err={e}")
             continue
+        head = obj if isinstance(obj, dict) else {}
+        line_refs.append((offset, length, str(head.get("source_uri") or ""), str(head.get("content_sha256") or "")))
 
         miss = REQ_FIELDS - set(obj.keys())
         if miss:
@@ -219,6 +235,25 @@ def _collect(root: Path, inv_path: Path, units_path: Path, max_samples: int) ->
     if multi_docid_uris and len(issues) < max_samples:
         issues.append(f"[MULTI_DOCID_FOR_URI] count={len(multi_docid_uris)} sample={multi_docid_uris[:5]}")
 
+    # ---- 4) Offset index ----
+    refs = load_units_index(units_path)
+    if refs is None:
+        st.units_index = "stale" if units_index_path(units_path).exists() else "missing"
+    else:
+        st.units_index = "fresh"
+        idx_refs = [
+            (r.offset, r.length, str(r.head.get("source_uri") or ""), str(r.head.get("content_sha256") or ""))
+            for r in refs
+        ]
+        bad = [i for i, (a, b) in enumerate(zip(idx_refs, line_refs)) if a != b]
+        st.units_index_mismatch = len(bad) + abs(len(idx_refs) - len(line_refs))
+        if st.units_index_mismatch and len(issues) < max_samples:
+            sample = [idx_refs[i][2] for i in bad[:5]]
+            issues.append(
+                f"[UNITS_INDEX_MISMATCH] count={st.units_index_mismatch} rows={len(idx_refs)} "
+                f"lines={len(line_refs)} sample={sample}"
+            )
+
     return st, fatal, issues
 
 
@@ -232,6 +267,7 @@ def _is_fail(st: Stats) -> bool:
         or st.md_missing_refs_fields > 0
         or st.md_broken_asset_targets > 0
         or st.md_broken_doc_targets > 0
+        or st.units_index_mismatch > 0
     )
 
 
@@ -275,6 +311,10 @@ def _print_summary(
     print("")
     print("4) By type")
     print(f"  image_units={st.image_units} video_units={st.video_units} other_units={st.other_units}")
+    print("")
+    print("5) Offset index")
+    print(f"  units_index={st.units_index} (fresh/stale/missing; stale or missing -> readers scan the JSONL)")
+    print(f"  units_index_mismatch={st.units_index_mismatch}")
 
     if issues:
         print("\n=== SAMPLE ISSUES (up to {}): ===".format(max_samples))
@@ -354,6 +394,10 @@ def main() -> None:
                 "video_units": st.video_units,
                 "other_units": st.other_units,
             },
+            "units_index": {
+                "state": st.units_index,
+                "mismatch": st.units_index_mismatch,
+            },
         }
         if fatal:
             report["status"] = "FAIL"
@@ -1,10 +1,23 @@
 from __future__ import annotations
 
 import json
+import sys
 from pathlib import Path
-from typing import Dict
+from types import SimpleNamespace
+from typing import Any, Dict, List
 
-from mhy_ai_rag_data.tools.build_chroma_index_flagembedding import read_wal
+import numpy as np
+import pytest
+
+from mhy_ai_rag_data.tools import build_chroma_index_flagembedding as builder
+from mhy_ai_rag_data.tools.build_chroma_index_flagembedding import (
+    WalWriter,
+    _is_ndarray_rejection,
+    _l2_normalize_rows,
+    read_wal,
+    rotate_wal,
+    wal_checkpoint_path,
+)
 
 
 def _write_event(path: Path, obj: Dict[str, object]) -> None:
@@ -118,3 +131,208 @@ def test_read_wal_tracks_batches_and_finish(tmp_path: Path) -> None:
     assert wal.upsert_rows_committed_total == 2
     assert "u2" in wal.done_docs
     assert wal.done_docs["u2"].doc_id == "d2"
+
+
+def _doc(i: int) -> Dict[str, object]:
+    return {"source_uri": f"u{i}", "doc_id": f"d{i}", "content_sha256": f"s{i}", "n_chunks": i, "updated_at": "t"}
+
+
+def test_checkpoint_tail_replay_matches_full_scan(tmp_path: Path) -> None:
+    stage_file = tmp_path / "index_state.stage.jsonl"
+    kw = dict(collection="c1", schema_hash="abc", db_path_posix="/db")
+    w = WalWriter(wal_path=stage_file, run_id="r1", fsync_mode="off", fsync_interval=1, checkpoint_every=5, **kw)
+    w.write_event("RUN_START")
+    for i in range(40):
+        w.write_event("DOC_BEGIN", {"source_uri": f"u{i}"})
+        w.write_event("DOC_COMMITTED", _doc(i))
+        if i % 10 == 9:
+            w.write_event("UPSERT_BATCH_COMMITTED", {"upsert_rows_committed_total": (i + 1) * 3})
+    w.close()
+    assert w.checkpoints_written >= 2
+
+    fast = read_wal(stage_file, **kw)
+    full = read_wal(stage_file, use_checkpoint=False, **kw)
+    assert fast is not None and full is not None
+    assert fast.checkpoint_offset > 0 and full.checkpoint_offset == -1
+    assert fast.bytes_replayed < full.bytes_replayed == stage_file.stat().st_size
+    assert (fast.done_docs, fast.committed_batches, fast.upsert_rows_committed_total, fast.last_event) == (
+        full.done_docs,
+        full.committed_batches,
+        full.upsert_rows_committed_total,
+        full.last_event,
+    )
+    assert len(fast.done_docs) == 40 and fast.committed_batches == 4 and fast.last_event == "UPSERT_BATCH_COMMITTED"
+
+    # A crash mid-line: the reader flags it; the resuming writer cuts it so its events stay readable.
+    with open(stage_file, "ab") as f:
+        f.write(b'{"event":"DOC_COMM')
+    assert read_wal(stage_file, **kw).truncated_tail_ignored  # type: ignore[union-attr]
+    w2 = WalWriter(wal_path=stage_file, run_id="r2", fsync_mode="off", fsync_interval=1, checkpoint_every=0, **kw)
+    w2.write_event("RUN_RESUME")
+    w2.write_event("DOC_DONE", _doc(1))
+    w2.close()
+    assert w2.torn_tail_bytes == len(b'{"event":"DOC_COMM')
+    resumed = read_wal(stage_file, **kw)
+    assert resumed is not None and resumed.run_id == "r2" and list(resumed.done_docs) == ["u1"]
+    assert not resumed.truncated_tail_ignored
+
+
+def test_rotate_wal_keeps_newest_rotations(tmp_path: Path) -> None:
+    stage_file = tmp_path / "index_state.stage.jsonl"
+    for ts in (100, 200, 300):
+        (tmp_path / f"index_state.stage.jsonl.prev-{ts}").write_text("", encoding="utf-8")
+    stage_file.write_text("", encoding="utf-8")
+    wal_checkpoint_path(stage_file).write_text("{}", encoding="utf-8")
+
+    rotated = rotate_wal(stage_file, keep=2)
+    assert not stage_file.exists() and not wal_checkpoint_path(stage_file).exists()
+    left = sorted(p.name for p in tmp_path.glob("index_state.stage.jsonl.prev-*"))
+    assert left == sorted([rotated.name, "index_state.stage.jsonl.prev-300"])
+
+
+def test_group_commit_batches_fsyncs_and_barrier_makes_events_readable(tmp_path: Path) -> None:
+    kw = dict(collection="c1", schema_hash="abc", db_path_posix="/db")
+    snaps = []
+    for group in (False, True):
+        stage_file = tmp_path / f"g{int(group)}" / "index_state.stage.jsonl"
+        w = WalWriter(
+            wal_path=stage_file,
+            run_id="r1",
+            fsync_mode="doc",
+            fsync_interval=1,
+            checkpoint_every=25,
+            group_commit=group,
+            flush_ms=20,
+            **kw,
+        )
+        w.write_event("RUN_START")
+        for i in range(100):
+            w.write_event("DOC_COMMITTED", _doc(i))
+            w.doc_boundary()
+        assert w.barrier()
+        mid = read_wal(stage_file, use_checkpoint=False, **kw)
+        assert mid is not None and len(mid.done_docs) == 100
+        w.write_event("RUN_FINISH", {"ok": True})
+        w.close()
+        stats = w.stats()
+        if group:
+            assert stats["groups_written"] < stats["events"] and stats["fsyncs"] < 100
+        else:
+            assert stats["fsyncs"] >= 100
+        snaps.append(read_wal(stage_file, **kw))
+
+    sync_snap, group_snap = snaps
+    assert sync_snap is not None and group_snap is not None
+    assert group_snap.checkpoint_offset > 0 and group_snap.finished_ok
+    assert (group_snap.done_docs, group_snap.last_event) == (sync_snap.done_docs, sync_snap.last_event)
+
+
+def test_l2_normalize_rows_keeps_zero_rows_and_rejects_bad_shapes() -> None:
+    mat = _l2_normalize_rows([np.array([3.0, 4.0]), np.array([0.0, 0.0]), [1.0, 0.0]])
+    assert mat.dtype == np.float32 and mat.flags["C_CONTIGUOUS"] and mat.shape == (3, 2)
+    np.testing.assert_allclose(mat, [[0.6, 0.8], [0.0, 0.0], [1.0, 0.0]], rtol=1e-6)
+    assert _l2_normalize_rows(np.zeros((0, 4))).shape == (0, 4)
+    with pytest.raises(ValueError):
+        _l2_normalize_rows([1.0, 2.0])
+
+
+def test_only_chroma_list_validation_errors_trigger_the_list_fallback() -> None:
+    assert _is_ndarray_rejection(ValueError("Expected embeddings to be a list, got [[0.1 0.2]]"))
+    assert _is_ndarray_rejection(ValueError("The truth value of an array with more than one element is ambiguous."))
+    assert not _is_ndarray_rejection(ValueError("Embedding dimension 3 does not match collection dimensionality 4"))
+    assert not _is_ndarray_rejection(TypeError("Expected metadata value to be a str, int, float or bool"))
+    assert not _is_ndarray_rejection(RuntimeError("to be a list"))
+
+
+class _FakeCollection:
+    """In-memory stand-in for a Chroma collection; rows outlive the client like a persistent db."""
+
+    def __init__(self) -> None:
+        self.rows: Dict[str, str] = {}
+        self.deleted: List[str] = []
+
+    def count(self) -> int:
+        return len(self.rows)
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: Any, embeddings: Any) -> None:
+        self.rows.update(zip(ids, documents))
+
+    def delete(self, ids: List[str]) -> None:
+        self.deleted.extend(ids)
+        for i in ids:
+            self.rows.pop(i, None)
+
+
+def _fake_build_deps(monkeypatch: pytest.MonkeyPatch) -> Dict[str, _FakeCollection]:
+    cols: Dict[str, _FakeCollection] = {}
+
+    class Client:
+        def __init__(self, path: str, settings: Any = None) -> None:
+            pass
+
+        def get_or_create_collection(self, name: str, metadata: Any = None) -> _FakeCollection:
+            return cols.setdefault(name, _FakeCollection())
+
+        def delete_collection(self, name: str) -> None:
+            cols.pop(name, None)
+
+    class Model:
+        def __init__(self, name: str, **kw: Any) -> None:
+            pass
+
+        def encode(self, texts: List[str], **kw: Any) -> Dict[str, Any]:
+            return {"dense_vecs": np.ones((len(texts), 4), dtype=np.float32)}
+
+    settings = SimpleNamespace(Settings=lambda **kw: None)
+    monkeypatch.setitem(sys.modules, "chromadb", SimpleNamespace(PersistentClient=Client, config=settings))
+    monkeypatch.setitem(sys.modules, "FlagEmbedding", SimpleNamespace(BGEM3FlagModel=Model))
+    return cols
+
+
+def _write_units(root: Path, texts: Dict[str, str]) -> None:
+    units = root / "data_processed" / "text_units.jsonl"
+    units.parent.mkdir(parents=True, exist_ok=True)
+    rows = []
+    for n, (uri, text) in enumerate(texts.items()):
+        digest = f"{len(text):064x}"
+        rows.append(
+            {"doc_id": f"doc-{n}", "source_uri": uri, "source_type": "md", "text": text, "content_sha256": digest}
+        )
+    units.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows), encoding="utf-8")
+
+
+def _build(root: Path, monkeypatch: pytest.MonkeyPatch) -> int:
+    argv = ["build", "--root", str(root), "--collection", "c", "--device", "cpu", "--progress", "false"]
+    argv += ["--sync-mode", "incremental", "--chunk-chars", "200", "--overlap-chars", "20", "--min-chunk-chars", "20"]
+    monkeypatch.setattr(sys, "argv", ["build_chroma_index_flagembedding", *argv])
+    return builder.main()
+
+
+def test_failed_wal_barrier_aborts_before_deleting_a_shrunk_docs_tail(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cols = _fake_build_deps(monkeypatch)
+    long_text = "".join(f"第{i}段：索引构建与增量同步的说明文字。\n\n" * 6 for i in range(12))
+    _write_units(tmp_path, {"data_raw/a.md": long_text, "data_raw/b.md": "短文档 " * 40})
+    assert _build(tmp_path, monkeypatch) == 0
+    before = dict(cols["c"].rows)
+    assert len(before) > 4
+
+    # a.md shrinks to one chunk, but its DOC_COMMITTED cannot be made durable: nothing may be deleted.
+    _write_units(tmp_path, {"data_raw/a.md": long_text[:150], "data_raw/b.md": "短文档 " * 40})
+    with monkeypatch.context() as m:
+        m.setattr(WalWriter, "barrier", lambda self, timeout=None: False)
+        assert _build(tmp_path, monkeypatch) == 2
+    assert cols["c"].deleted == [] and set(before) <= set(cols["c"].rows)
+    (stage_file,) = (tmp_path / "data_processed" / "index_state" / "c").glob("*/index_state.stage.jsonl")
+    events = [json.loads(s) for s in stage_file.read_text(encoding="utf-8").splitlines()]
+    assert events[-1]["event"] == "RUN_FINISH" and events[-1]["reason"] == "wal_write_failed"
+    assert events[-1]["source_uri"] == "data_raw/a.md"
+
+    # The next run resumes and converges: the stale tail is gone and the manifest matches the collection.
+    assert _build(tmp_path, monkeypatch) == 0
+    assert cols["c"].deleted
+    (state_file,) = stage_file.parent.glob("index_state.json")
+    last_build = json.loads(state_file.read_text(encoding="utf-8"))["last_build"]
+    assert last_build["resume_active"] and last_build["chunks_deleted_changed_tail"] > 0
+    assert last_build["expected_chunks"] == last_build["collection_count"] == cols["c"].count()
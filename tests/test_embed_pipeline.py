@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pytest
+
+from mhy_ai_rag_data.tools.embed_pipeline import (
+    JOB_EMBED,
+    JOB_EMPTY,
+    JOB_RESUME_SKIP,
+    StageError,
+    build_doc_pipeline,
+    iter_background,
+    summarize_embed_stats,
+)
+
+
+class _Done:
+    def __init__(self, doc_id: str, content_sha256: str) -> None:
+        self.doc_id = doc_id
+        self.content_sha256 = content_sha256
+
+
+def _build_chunks(unit: Dict[str, Any], conf: Any) -> Tuple[List[str], Dict[str, Any]]:
+    parts = [p for p in str(unit.get("text") or "").split("|") if p]
+    return parts, {"doc_id": unit["doc_id"]}
+
+
+def _cur_docs(n: int) -> Dict[str, Dict[str, Any]]:
+    out: Dict[str, Dict[str, Any]] = {}
+    for i in range(n):
+        uri = f"u{i:02d}"
+        text = "" if i % 5 == 0 else "|".join(f"{uri}-c{j}" for j in range(i % 4 + 1))
+        out[uri] = {"doc_id": f"d{i}", "content_sha256": f"s{i}", "unit": {"doc_id": f"d{i}", "text": text}}
+    return out
+
+
+def _encode(texts: List[str]) -> List[List[float]]:
+    return [[float(len(t)), float(sum(map(ord, t)) % 97)] for t in texts]
+
+
+@pytest.mark.parametrize("depth", [None, 1, 3])
+def test_pipeline_preserves_doc_order_and_vector_alignment(depth: Any) -> None:
+    cur = _cur_docs(23)
+    uris = sorted(cur)
+    jobs = list(
+        build_doc_pipeline(
+            uris,
+            cur_docs=cur,
+            resume_done={"u03": _Done("d3", "s3"), "u04": _Done("d4", "stale")},
+            build_chunks=_build_chunks,
+            conf=None,
+            encode=_encode,
+            embed_batch=2,
+            depth=depth,
+        )
+    )
+
+    assert [j.uri for j in jobs] == uris
+    kinds = {j.uri: j.kind for j in jobs}
+    assert kinds["u03"] == JOB_RESUME_SKIP
+    assert kinds["u04"] == JOB_EMBED
+    assert kinds["u05"] == JOB_EMPTY
+    for j in jobs:
+        if j.kind == JOB_EMBED:
+            assert [list(v) for v in j.dense] == _encode(j.chunk_texts)
+
+
+@pytest.mark.parametrize("depth", [None, 2])
+def test_pipeline_forwards_stage_error_with_source_uri(depth: Any) -> None:
+    cur = _cur_docs(12)
+
+    def _encode_fail(texts: List[str]) -> List[List[float]]:
+        if any(t.startswith("u07") for t in texts):
+            raise RuntimeError("boom")
+        return _encode(texts)
+
+    seen: List[str] = []
+    with pytest.raises(StageError) as ei:
+        for job in build_doc_pipeline(
+            sorted(cur),
+            cur_docs=cur,
+            resume_done={},
+            build_chunks=_build_chunks,
+            conf=None,
+            encode=_encode_fail,
+            embed_batch=4,
+            depth=depth,
+        ):
+            seen.append(job.uri)
+
+    uris = sorted(cur)
+    assert ei.value.reason == "embed_failed"
+    # Chunk counts fix the batches of 4: [u01 u01 u02 u02] [u02 u03 u03 u03] [u03 u04 u06 u06] [u06 u07 u07 u07].
+    # The failing batch is attributed to its first document; nothing from that batch is released.
+    assert ei.value.source_uri == "u06"
+    assert ei.value.source_uri not in seen
+    assert seen == uris[: len(seen)]
+
+
+def test_embed_batches_span_documents() -> None:
+    cur = _cur_docs(30)
+    sizes: List[int] = []
+
+    def _encode_rec(texts: List[str]) -> List[List[float]]:
+        sizes.append(len(texts))
+        return _encode(texts)
+
+    stats: Dict[str, float] = {}
+    jobs = list(
+        build_doc_pipeline(
+            sorted(cur),
+            cur_docs=cur,
+            resume_done={},
+            build_chunks=_build_chunks,
+            conf=None,
+            encode=_encode_rec,
+            embed_batch=8,
+            depth=None,
+            stats=stats,
+        )
+    )
+
+    n_chunks = sum(len(j.chunk_texts) for j in jobs)
+    assert sum(sizes) == n_chunks
+    assert all(n == 8 for n in sizes[:-1])
+    assert stats["encode_calls"] == len(sizes)
+    assert stats["encode_texts"] == n_chunks
+
+
+def test_length_bucketing_restores_order_and_reduces_padding() -> None:
+    cur: Dict[str, Dict[str, Any]] = {}
+    for i in range(12):
+        texts = ["x" * (40 if (i + j) % 2 else 4000) for j in range(3)]
+        texts = [f"{t}{i}-{j}" for j, t in enumerate(texts)]
+        cur[f"u{i:02d}"] = {
+            "doc_id": f"d{i}",
+            "content_sha256": f"s{i}",
+            "unit": {"doc_id": f"d{i}", "text": "|".join(texts)},
+        }
+
+    def _run(bucketing: bool) -> Tuple[List[Any], Dict[str, Any]]:
+        stats: Dict[str, float] = {}
+        jobs = list(
+            build_doc_pipeline(
+                sorted(cur),
+                cur_docs=cur,
+                resume_done={},
+                build_chunks=_build_chunks,
+                conf=None,
+                encode=_encode,
+                embed_batch=4,
+                depth=None,
+                stats=stats,
+                length_bucketing=bucketing,
+                bucket_window=3,
+            )
+        )
+        return jobs, summarize_embed_stats(stats)
+
+    plain_jobs, plain = _run(False)
+    bucket_jobs, bucketed = _run(True)
+
+    assert [j.uri for j in bucket_jobs] == [j.uri for j in plain_jobs]
+    for a, b in zip(plain_jobs, bucket_jobs):
+        assert [list(v) for v in b.dense] == [list(v) for v in a.dense] == _encode(a.chunk_texts)
+    assert plain["padding_ratio"] == plain["padding_ratio_doc_order"]
+    assert bucketed["padding_ratio_doc_order"] == plain["padding_ratio_doc_order"]
+    assert bucketed["padding_ratio"] < plain["padding_ratio"]
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_pool_submit_keeps_alignment_and_failure_attribution(fail: bool) -> None:
+    import random
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    cur = _cur_docs(25)
+
+    def _encode_slow(texts: List[str]) -> List[List[float]]:
+        time.sleep(random.random() * 0.01)
+        if fail and any(t.startswith("u13") for t in texts):
+            raise RuntimeError("worker died")
+        return _encode(texts)
+
+    stats: Dict[str, float] = {}
+    jobs: List[Any] = []
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        pipeline = build_doc_pipeline(
+            sorted(cur),
+            cur_docs=cur,
+            resume_done={},
+            build_chunks=_build_chunks,
+            conf=None,
+            encode=_encode,
+            embed_batch=2,
+            depth=2,
+            stats=stats,
+            submit=lambda texts: pool.submit(_encode_slow, texts),
+            max_inflight=6,
+        )
+        if fail:
+            with pytest.raises(StageError) as ei:
+                for job in pipeline:
+                    jobs.append(job)
+            assert ei.value.reason == "embed_failed"
+            assert ei.value.source_uri <= "u13"
+        else:
+            jobs = list(pipeline)
+
+    assert [j.uri for j in jobs] == sorted(cur)[: len(jobs)]
+    for j in jobs:
+        if j.kind == JOB_EMBED:
+            assert [list(v) for v in j.dense] == _encode(j.chunk_texts)
+    if not fail:
+        assert stats["encode_texts"] == sum(len(j.chunk_texts) for j in jobs)
+
+
+def test_closing_background_stage_waits_for_producer_exit() -> None:
+    exited: List[bool] = []
+
+    def _slow() -> Iterator[int]:
+        try:
+            for i in range(100):
+                time.sleep(0.02)
+                yield i
+        finally:
+            exited.append(True)
+
+    it = iter_background(_slow(), maxsize=1, name="t")
+    assert next(it) == 0
+    it.close()
+    # The consumer may now close what the producer was using (embed cache, units mmap).
+    assert exited == [True]
+
+
+def test_failing_cache_is_dropped_and_the_build_keeps_its_vectors() -> None:
+    class _BrokenCache:
+        def __init__(self) -> None:
+            self.gets = 0
+
+        def get_many(self, texts: List[str]) -> List[Any]:
+            self.gets += 1
+            return [None] * len(texts)
+
+        def put_many(self, texts: List[str], vectors: Any) -> None:
+            raise OSError(28, "No space left on device")
+
+    cur = _cur_docs(20)
+    cache = _BrokenCache()
+    errors: List[Exception] = []
+    stats: Dict[str, float] = {}
+    jobs = list(
+        build_doc_pipeline(
+            sorted(cur),
+            cur_docs=cur,
+            resume_done={},
+            build_chunks=_build_chunks,
+            conf=None,
+            encode=_encode,
+            embed_batch=4,
+            depth=None,
+            stats=stats,
+            cache=cache,
+            on_cache_error=errors.append,
+        )
+    )
+
+    embedded = [j for j in jobs if j.kind == JOB_EMBED]
+    assert [j.uri for j in jobs] == sorted(cur)
+    assert all(j.dense == _encode(j.chunk_texts) for j in embedded)
+    assert len(errors) == 1 and isinstance(errors[0], OSError)
+    assert summarize_embed_stats(stats)["cache_errors"] == 1
+    assert cache.gets < len(embedded)  # not consulted after the failure
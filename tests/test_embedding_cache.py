@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import errno
+import os
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+
+from mhy_ai_rag_data import embedding_cache
+from mhy_ai_rag_data.embedding_cache import (
+    CacheLockedError,
+    EmbeddingCache,
+    QueryEmbeddingCache,
+    open_embedding_cache,
+    open_query_embedding_cache,
+    text_key,
+)
+
+
+def _vec(text: str, dim: int = 8) -> np.ndarray:
+    rng = np.random.default_rng(sum(map(ord, text)))
+    return rng.standard_normal(dim).astype(np.float32)
+
+
+def _encode(texts: List[str]) -> np.ndarray:
+    return np.stack([_vec(t) for t in texts])
+
+
+def test_cache_roundtrip_across_reopen(tmp_path: Path) -> None:
+    texts = [f"chunk-{i}" for i in range(50)]
+    c1 = EmbeddingCache(tmp_path, embed_model="m", normalize=False, dtype="float32")
+    c1.put_many(texts, _encode(texts))
+    c1.close()
+
+    c2 = EmbeddingCache(tmp_path, embed_model="m", normalize=False, dtype="float32")
+    assert len(c2) == 50
+    got = c2.get_many(texts + ["unknown"])
+    assert got[-1] is None
+    for t, v in zip(texts, got[:-1]):
+        assert v is not None
+        np.testing.assert_array_equal(v, _vec(t))
+
+    # A different model (or normalize flag) lives in its own namespace.
+    other = EmbeddingCache(tmp_path, embed_model="m2", normalize=False, dtype="float32")
+    assert len(other) == 0
+
+
+def test_namespace_is_exclusive_and_hits_verify_the_row_key(tmp_path: Path) -> None:
+    texts = ["a", "b", "c"]
+    c1 = EmbeddingCache(tmp_path, embed_model="m", normalize=False, dtype="float32")
+    c1.put_many(texts, _encode(texts))
+    with pytest.raises(CacheLockedError):
+        EmbeddingCache(tmp_path, embed_model="m", normalize=False, dtype="float32")
+
+    # Another writer reused b's row for a different text: the stale in-memory mapping must not hit.
+    c1._index["key"][c1._rows[text_key("b")]] = np.frombuffer(text_key("other"), dtype=np.uint8)
+    got = c1.get_many(texts)
+    assert got[1] is None and got[0] is not None and got[2] is not None
+    c1.close()
+
+    c2 = EmbeddingCache(tmp_path, embed_model="m", normalize=False, dtype="float32")
+    assert c2.get_many(["a"])[0] is not None
+    c2.close()
+
+
+def test_encode_through_only_encodes_misses(tmp_path: Path) -> None:
+    calls: List[List[str]] = []
+
+    def _enc(texts: List[str]) -> np.ndarray:
+        calls.append(list(texts))
+        return _encode(texts)
+
+    cache = open_embedding_cache(tmp_path, "cache", embed_model="m", normalize=True, backend="t")
+    assert cache is not None
+    first = cache.encode_through(["a", "b"], _enc)
+    second = cache.encode_through(["b", "c", "a"], _enc)
+
+    assert calls == [["a", "b"], ["c"]]
+    np.testing.assert_allclose(second[0], first[1], rtol=1e-3, atol=1e-3)
+    np.testing.assert_allclose(second[2], first[0], rtol=1e-3, atol=1e-3)
+    assert cache.stats()["hits"] == 2
+    assert open_embedding_cache(tmp_path, "off", embed_model="m", normalize=True, backend="t") is None
+
+
+def test_cache_size_cap_evicts_least_recently_used(tmp_path: Path) -> None:
+    # 8 dims * 4 bytes + 40 bytes index row = 72 bytes/row -> cap at 100 rows.
+    cache = EmbeddingCache(tmp_path, embed_model="m", normalize=False, dtype="float32", max_bytes=72 * 100)
+    hot = [f"hot-{i}" for i in range(10)]
+    cache.put_many(hot, _encode(hot))
+    for i in range(30):
+        batch = [f"cold-{i}-{j}" for j in range(10)]
+        cache.put_many(batch, _encode(batch))
+        assert all(v is not None for v in cache.get_many(hot))
+
+    st = cache.stats()
+    assert st["capacity"] <= 100
+    assert st["rows"] <= 100
+    assert st["evictions"] > 0
+
+
+def test_query_cache_lru_then_store_across_reopen(tmp_path: Path) -> None:
+    calls: List[List[str]] = []
+
+    def _enc(texts: List[str]) -> np.ndarray:
+        calls.append(list(texts))
+        return _encode(texts)
+
+    def _open(size: int) -> QueryEmbeddingCache:
+        return open_query_embedding_cache(
+            tmp_path, "qcache", embed_model="m", normalize=True, backend="t", max_entries=size
+        )
+
+    q1 = _open(2)
+    first = q1.encode_through(["q1", "q2", "q1"], _enc)
+    again = q1.encode_through(["q2"], _enc)
+    assert calls == [["q1", "q2"]] and first[0] == first[2] and again[0] == first[1]
+    assert q1.stats()["memory_hits"] == 1 and q1.stats()["encoded"] == 2
+    q1.close()
+
+    # A new process: LRU is cold, the persistent store answers and vectors are bit-identical.
+    q2 = _open(2)
+    assert q2.encode_through(["q1", "q2"], _enc) == [first[0], first[1]]
+    assert len(calls) == 1 and q2.stats()["store_hits"] == 2
+    q2.close()
+
+
+def test_extend_file_allocates_blocks_and_keeps_old_size_on_enospc(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    p = tmp_path / "vectors.bin"
+    p.write_bytes(b"x" * 10)
+    embedding_cache._extend_file(p, 1 << 20)
+    assert p.stat().st_size == 1 << 20 and p.read_bytes()[:10] == b"x" * 10
+    if hasattr(os.stat_result, "st_blocks"):
+        assert p.stat().st_blocks * 512 >= 1 << 20  # not a sparse hole: memmap stores cannot SIGBUS
+
+    def _fallocate(fd: int, offset: int, length: int) -> None:
+        raise OSError(errno.EOPNOTSUPP, "not supported")
+
+    monkeypatch.setattr(os, "posix_fallocate", _fallocate, raising=False)
+    embedding_cache._extend_file(p, 3 << 20)  # zero-filled fallback
+    assert p.stat().st_size == 3 << 20
+
+    def _full(fd: int, offset: int, length: int) -> None:
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(os, "posix_fallocate", _full, raising=False)
+    with pytest.raises(OSError):
+        embedding_cache._extend_file(p, 8 << 20)
+    assert p.stat().st_size == 3 << 20
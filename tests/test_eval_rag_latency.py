@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import json
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import pytest
+
+from mhy_ai_rag_data.hybrid_retriever import RetrievedChunk
+from mhy_ai_rag_data.tools.run_eval_rag import latency_summary
+
+
+def test_latency_summary_percentiles_and_buckets() -> None:
+    s = latency_summary([100, 300, 300, 900, 4000, 400000] + [200] * 14)
+    assert s["count"] == 20 and s["max"] == 400000
+    assert s["p50"] == 200 and s["p90"] == 900 and s["p95"] == 4000 and s["p99"] == 400000
+    h = s["histogram_ms"]
+    assert h["<=250"] == 15 and h["<=500"] == 2 and h["<=1000"] == 1 and h["<=5000"] == 1 and h[">300000"] == 1
+    assert sum(h.values()) == 20
+    assert latency_summary([]) == {"count": 0}
+
+
+def test_concurrent_cases_are_reported_in_case_order(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from mhy_ai_rag_data.tools import run_eval_rag as m
+
+    # Line 3 is blank so line_no and case index disagree; q3 fails inside the LLM call.
+    lines = ['{"id": "c1", "query": "q1", "must_include": ["a1"]}', '{"id": "c2", "query": "q2"}', ""]
+    lines += [json.dumps({"id": f"c{n}", "query": f"q{n}", "must_include": [f"a{n}"]}) for n in range(3, 7)]
+    (tmp_path / "cases.jsonl").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    (tmp_path / "db").mkdir()
+    line_of = {"c1": 1, "c2": 2, "c3": 4, "c4": 5, "c5": 6, "c6": 7}
+
+    # The first four cases finish in reverse order: q<n> waits until q<n+1> has returned.
+    done = {n: threading.Event() for n in range(1, 8)}
+    finished: List[int] = []
+
+    def fake_call_chat(*args: Any) -> Dict[str, Any]:
+        n = int(args[5][-1]["content"].split("\n", 1)[0].removeprefix("问题：q"))
+        try:
+            if n < 4:
+                assert done[n + 1].wait(10)
+            if n == 3:
+                raise RuntimeError("boom")
+            return {"choices": [{"message": {"content": f"answer a{n}"}}]}
+        finally:
+            finished.append(n)
+            done[n].set()
+
+    class _Retriever:
+        keyword_index_info: Dict[str, Any] = {}
+
+        def retrieve_many(self, queries: List[str], k: int) -> List[Any]:
+            chunk = RetrievedChunk(id="x", rank=1, text="ctx", metadata={}, source="doc.md")
+            return [SimpleNamespace(hits=[chunk]) for _q in queries]
+
+        def close(self) -> None:
+            pass
+
+    client = SimpleNamespace(get_collection=lambda name: object())
+    monkeypatch.setitem(sys.modules, "chromadb", SimpleNamespace(PersistentClient=lambda path: client))
+    monkeypatch.setattr(m, "load_embedder", lambda *a: ("fake", object()))
+    monkeypatch.setattr(m, "resolve_model_id", lambda *a, **kw: ("fake-model", {}))
+    monkeypatch.setattr(m, "open_hybrid_retriever", lambda **kw: _Retriever())
+    monkeypatch.setattr(m, "call_chat", fake_call_chat)
+    # The written report is re-ordered by severity for reading; capture the report main() built.
+    reports: List[Dict[str, Any]] = []
+    write_bundle = m.write_report_bundle
+    monkeypatch.setattr(m, "write_report_bundle", lambda **kw: reports.append(kw["report"]) or write_bundle(**kw))
+    argv = ["run_eval_rag", "--root", str(tmp_path), "--db", "db", "--cases", "cases.jsonl", "--out", "r.json"]
+    argv += ["--concurrency", "4", "--query-batch", "2", "--stream", "off", "--progress", "off"]
+    monkeypatch.setattr(sys, "argv", argv)
+
+    m.main()
+
+    assert [n for n in finished if n <= 4] == [4, 3, 2, 1]
+    per_case = reports[0]["data"]["cases"]
+    assert [(c["id"], c["line_no"]) for c in per_case] == list(line_of.items())
+    assert [c["answer"] for c in per_case] == ["answer a1", "answer a2", "", "answer a4", "answer a5", "answer a6"]
+    events = [json.loads(s) for s in (tmp_path / "r.events.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [e["loc"] for e in events] == [f"cases.jsonl:{ln}:1" for ln in line_of.values()]
+    failed = [e for e in events if e["status_label"] == "ERROR"]
+    assert len(failed) == 1 and failed[0]["title"] == "c3" and failed[0]["loc"] == "cases.jsonl:4:1"
+    assert failed[0]["detail"]["error"] == "RuntimeError: boom"
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from mhy_ai_rag_data import extract_units, make_inventory
+from mhy_ai_rag_data.units_reader import iter_unit_heads, load_units_index, units_index_path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _run(monkeypatch: pytest.MonkeyPatch, module: object, root: Path, *extra: str) -> None:
+    monkeypatch.setattr(sys, "argv", ["prog", "--root", str(root), *extra])
+    module.main()  # type: ignore[attr-defined]
+
+
+def test_incremental_and_parallel_units_match_full_serial_run(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    raw = tmp_path / "data_raw"
+    (raw / "img").mkdir(parents=True)
+    for i in range(8):
+        (raw / f"doc{i}.md").write_text(f"# d{i}\n\n![p](img/p{i % 3}.png) [next](doc{i + 1}.md)\n", encoding="utf-8")
+    for i in range(3):
+        (raw / "img" / f"p{i}.png").write_bytes(bytes([i]) * 10)
+    (raw / "img" / "p1.txt").write_text("caption", encoding="utf-8")
+    (raw / "notes.txt").write_text("plain", encoding="utf-8")
+
+    units = tmp_path / "data_processed" / "text_units.jsonl"
+    _run(monkeypatch, make_inventory, tmp_path)
+    _run(monkeypatch, extract_units, tmp_path)
+
+    (raw / "doc2.md").write_text("# changed\n\n[x](doc5.md)\n", encoding="utf-8")
+    (raw / "img" / "p1.txt").write_text("new caption", encoding="utf-8")
+    (raw / "doc6.md").unlink()
+    (raw / "added.md").write_text("# added\n", encoding="utf-8")
+    _run(monkeypatch, make_inventory, tmp_path, "--incremental", "false")
+
+    _run(monkeypatch, extract_units, tmp_path)
+    incremental = units.read_bytes()
+    assert load_units_index(units) == list(iter_unit_heads(units))
+    _run(monkeypatch, extract_units, tmp_path, "--incremental", "false")
+    assert incremental == units.read_bytes()
+    _run(monkeypatch, extract_units, tmp_path, "--incremental", "false", "--jobs", "2")
+    assert incremental == units.read_bytes()
+    assert "new caption" in incremental.decode("utf-8")
+
+
+def test_root_entrypoint_runs_the_package_module(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # run_build_profile / smoke_test_pipeline / OPERATION_GUIDE call `python extract_units.py` at the repo root.
+    raw = tmp_path / "data_raw"
+    raw.mkdir()
+    for i in range(3):
+        (raw / f"doc{i}.md").write_text(f"# d{i}\n\n[next](doc{i + 1}.md)\n", encoding="utf-8")
+    _run(monkeypatch, make_inventory, tmp_path)
+
+    p = subprocess.run(
+        [sys.executable, str(REPO_ROOT / "extract_units.py"), "--root", str(tmp_path)],
+        cwd=str(tmp_path),
+        text=True,
+        capture_output=True,
+    )
+    assert p.returncode == 0, f"stdout:\n{p.stdout}\nstderr:\n{p.stderr}"
+    units = tmp_path / "data_processed" / "text_units.jsonl"
+    assert units_index_path(units).exists()
+    assert load_units_index(units) == list(iter_unit_heads(units))
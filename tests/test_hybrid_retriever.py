@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from mhy_ai_rag_data.hybrid_retriever import HybridRetriever, open_hybrid_retriever, rrf_fuse
+from mhy_ai_rag_data.keyword_index import KeywordIndex, build_keyword_index, keyword_index_path
+from mhy_ai_rag_data.tools.index_state import state_dir_for, write_latest_pointer
+
+CHUNKS = {
+    "a:0": ("索引构建 build index", [1.0, 0.0]),
+    "a:1": ("检索评估 retrieval eval", [0.9, 0.1]),
+    "b:0": ("hybrid RRF 融合 keyword", [0.0, 1.0]),
+    "b:1": ("WAL resume state", [0.2, 0.8]),
+}
+
+
+class _Collection:
+    """Dense leg stand-in: ranks by dot product and records get() calls."""
+
+    def __init__(self) -> None:
+        self.get_calls: List[List[str]] = []
+        self.query_calls = 0
+        self.count_calls = 0
+
+    def query(self, query_embeddings: List[List[float]], n_results: int, include: Any, where: Any = None) -> Any:
+        self.query_calls += 1
+        out: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in query_embeddings:
+            ranked = sorted(CHUNKS, key=lambda cid: -sum(a * b for a, b in zip(q, CHUNKS[cid][1])))[:n_results]
+            out["ids"].append(ranked)
+            out["documents"].append([CHUNKS[c][0] for c in ranked])
+            out["metadatas"].append([{"source_uri": f"data_raw/{c[0]}.md"} for c in ranked])
+            out["distances"].append([1.0 - sum(a * b for a, b in zip(q, CHUNKS[c][1])) for c in ranked])
+        return out
+
+    def count(self) -> int:
+        self.count_calls += 1
+        return len(CHUNKS)
+
+    def get(self, ids: List[str], include: Any) -> Dict[str, Any]:
+        self.get_calls.append(list(ids))
+        return {
+            "ids": list(ids),
+            "documents": [CHUNKS[c][0] for c in ids],
+            "metadatas": [{"source_uri": f"data_raw/{c[0]}.md"} for c in ids],
+        }
+
+
+def _retriever(col: _Collection, **kw: Any) -> HybridRetriever:
+    idx = KeywordIndex(":memory:")
+    idx.add(list(CHUNKS), [t for t, _ in CHUNKS.values()], [f"data_raw/{c[0]}.md" for c in CHUNKS])
+    return HybridRetriever(collection=col, embed=_embed, keyword_index=idx, **kw)
+
+
+def _embed(q: str) -> List[float]:
+    return [0.0, 1.0] if "WAL" in q else [1.0, 0.0]
+
+
+def test_hybrid_matches_rrf_of_both_legs_and_fetches_keyword_only_text() -> None:
+    col = _Collection()
+    r = _retriever(col, keyword_pool_k=2)
+    res = r.retrieve("RRF 融合", 2)
+
+    assert res.mode == "hybrid"
+    expected = rrf_fuse(dense=res.dense, keyword=res.keyword, topk=2, rrf_k=60)
+    assert [h.id for h in res.hits] == [it["id"] for it in expected]
+    # b:0 is only reachable through the keyword leg; its text comes from one collection.get.
+    by_id = {h.id: h for h in res.hits}
+    assert by_id["b:0"].text == CHUNKS["b:0"][0] and by_id["b:0"].dense_rank is None
+    assert col.get_calls == [["b:0"]]
+    assert {"embed_ms", "dense_ms", "keyword_ms", "total_ms"} <= set(res.timings_ms)
+    r.close()
+
+
+def test_where_or_dense_mode_skips_keyword_leg() -> None:
+    col = _Collection()
+    r = _retriever(col)
+    where: Optional[Dict[str, str]] = {"source_type": "md"}
+    for res in (r.retrieve("RRF", 2, where=where), r.retrieve("RRF", 2, mode="dense")):
+        assert res.mode == "dense" and res.keyword == []
+        assert [h.id for h in res.hits] == ["a:0", "a:1"]
+        assert res.hits[0].text == CHUNKS["a:0"][0] and res.hits[0].source == "data_raw/a.md"
+    assert col.get_calls == []
+    r.close()
+
+
+def test_retrieve_many_batches_embed_and_query_and_matches_single_calls() -> None:
+    col = _Collection()
+    batches: List[List[str]] = []
+
+    def _embed_many(qs: List[str]) -> List[List[float]]:
+        batches.append(list(qs))
+        return [_embed(q) for q in qs]
+
+    r = _retriever(col, embed_many=_embed_many, keyword_pool_k=2)
+    queries = ["RRF 融合", "WAL resume", "build index"]
+    many = r.retrieve_many(queries, 2)
+    assert batches == [queries] and col.query_calls == 1
+    assert len(col.get_calls) <= 1
+
+    singles = [r.retrieve(q, 2) for q in queries]
+    assert [[(h.id, h.text, h.fusion_score) for h in m.hits] for m in many] == [
+        [(h.id, h.text, h.fusion_score) for h in s.hits] for s in singles
+    ]
+    assert many[0].timings_ms["batch_size"] == 3
+    r.close()
+
+
+def test_persisted_keyword_index_is_only_opened_never_built(tmp_path: Path) -> None:
+    col = _Collection()
+    opts: Dict[str, Any] = {"collection": col, "collection_name": "c", "embed": _embed, "state_root": tmp_path}
+    with pytest.raises(ValueError, match="persisted keyword index"):
+        open_hybrid_retriever(mode="hybrid", keyword_index="persisted", **opts)
+    r = open_hybrid_retriever(mode="dense", keyword_index="persisted", **opts)
+    assert r.keyword_index is None and r.retrieve("RRF 融合", 2, mode="hybrid").mode == "dense"
+    assert col.get_calls == []  # no Chroma dump on the query path
+    r.close()
+
+    write_latest_pointer(tmp_path, "c", "h")
+    path = keyword_index_path(state_dir_for(tmp_path, "c", "h"))
+    path.parent.mkdir(parents=True)
+    ids = list(CHUNKS)
+    build_keyword_index(
+        path, ids=ids, texts=[CHUNKS[c][0] for c in ids], metas=[{"source_uri": f"data_raw/{c[0]}.md"} for c in ids]
+    ).close()
+    # Dense-default: the index is only opened by the first hybrid call, not by open_hybrid_retriever.
+    col.count_calls = 0
+    r = open_hybrid_retriever(mode="dense", keyword_index="persisted", **opts)
+    assert r.retrieve("RRF 融合", 2).mode == "dense"
+    assert r.keyword_index is None and r.keyword_index_info == {} and col.count_calls == 0
+    assert r.retrieve("RRF 融合", 2, mode="hybrid").mode == "hybrid"
+    assert r.keyword_index_info["source"] == "persisted" and col.count_calls == 1
+    assert r.retrieve("WAL", 2, mode="hybrid").mode == "hybrid" and col.count_calls == 1
+    r.close()
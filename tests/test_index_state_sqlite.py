@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict
+
+from mhy_ai_rag_data.tools import index_state as ist
+
+
+def _doc(uri: str, sha: str, n: int) -> Dict[str, Any]:
+    return {
+        "doc_id": "d-" + uri,
+        "source_uri": uri,
+        "source_type": "md",
+        "content_sha256": sha,
+        "n_chunks": n,
+        "updated_at": "t",
+    }
+
+
+def _common(tmp_path: Path) -> Dict[str, Any]:
+    return dict(
+        root=tmp_path,
+        state_root=tmp_path / "state",
+        collection="c",
+        schema_hash="h",
+        db=tmp_path / "db",
+        embed_model="m",
+        chunk_conf={"chunk_chars": 10},
+        include_media_stub=False,
+        last_build={"sync_mode": "incremental"},
+    )
+
+
+def test_sqlite_backend_applies_delta_and_matches_json_export(tmp_path: Path) -> None:
+    kw = _common(tmp_path)
+    db_path = ist.state_db_for(kw["state_root"], "c", "h")
+    json_path = ist.state_file_for(kw["state_root"], "c", "h")
+
+    first = {u: _doc(u, "s1", 1) for u in ("a", "b", "c")}
+    ist.write_index_state_sqlite(upserts=first, deletes=[], replace=True, export_json=False, **kw)
+    assert db_path.exists() and not json_path.exists()
+    assert ist.read_latest_pointer(kw["state_root"], "c") == "h"
+
+    state = ist.load_index_state_sqlite(db_path, root=tmp_path)
+    assert state is not None and state["collection"] == "c" and state["schema_version"] == 2
+    docs = state["docs"]
+    assert isinstance(docs, ist.SqliteDocStore)
+    assert len(docs) == 3 and "b" in docs and "z" not in docs and docs.get("z") is None
+    assert docs["b"] == first["b"]
+    assert ist.doc_digests(docs) == ist.doc_digests(first) == {u: ("s1", 1) for u in first}
+    docs.close()
+
+    # b changed, c deleted, a untouched: only the delta is written.
+    ist.write_index_state_sqlite(upserts={"b": _doc("b", "s2", 4)}, deletes=["c"], replace=False, **kw)
+    exported = ist.load_index_state(json_path)
+    assert exported is not None
+    assert exported["docs"] == {"a": first["a"], "b": _doc("b", "s2", 4)}
+
+    # Switching back to json makes the sqlite manifest stale: it is removed.
+    ist.write_index_state_report(docs=exported["docs"], **kw)
+    assert not db_path.exists()
+
+
+def test_sqlite_backend_imports_existing_json_once(tmp_path: Path) -> None:
+    kw = _common(tmp_path)
+    docs = {u: _doc(u, "s", 2) for u in ("x", "y")}
+    json_path = ist.write_index_state_report(docs=docs, **kw)
+    db_path = ist.state_db_for(kw["state_root"], "c", "h")
+
+    assert ist.load_index_state_sqlite(db_path, root=tmp_path) is None  # no fallback given
+    state = ist.load_index_state_sqlite(db_path, root=tmp_path, json_fallback=json_path)
+    assert state is not None and dict(state["docs"]) == docs
+    assert state["last_build"] == {"sync_mode": "incremental"}
+    state["docs"].close()
+    json_path.unlink()
+    again = ist.load_index_state_sqlite(db_path, root=tmp_path, json_fallback=json_path)
+    assert again is not None and len(again["docs"]) == 2
+    again["docs"].close()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import math
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from mhy_ai_rag_data.keyword_index import (
+    KeywordIndex,
+    build_keyword_index,
+    open_keyword_index_for_sync,
+    tokenize,
+)
+
+DOCS = {
+    "a:0": "Chroma 索引构建 build index with BM25",
+    "a:1": "检索评估 retrieval eval 报告",
+    "b:0": "hybrid 检索 = dense + keyword，RRF 融合",
+    "b:1": "索引 索引 索引 state WAL resume",
+    "c:0": "nothing relevant here",
+}
+
+
+def _linear_bm25(docs: Dict[str, str], query: str, k1: float = 1.5, b: float = 0.75) -> List[Tuple[str, float]]:
+    """Reference: score every document (the pre-index run_eval_retrieval behaviour)."""
+    tfs = {cid: Counter(tokenize(t)) for cid, t in docs.items()}
+    n = len(docs)
+    avgdl = sum(sum(tf.values()) for tf in tfs.values()) / n
+    q = set(tokenize(query))
+    out = []
+    for cid, tf in tfs.items():
+        dl = sum(tf.values())
+        s = 0.0
+        for t in q:
+            if tf.get(t):
+                df = sum(1 for x in tfs.values() if t in x)
+                idf = math.log((n - df + 0.5) / (df + 0.5) + 1.0)
+                s += idf * (tf[t] * (k1 + 1.0)) / (tf[t] + k1 * (1.0 - b + b * dl / avgdl))
+        if s > 0:
+            out.append((cid, s))
+    out.sort(key=lambda x: (-x[1], list(docs).index(x[0])))
+    return out
+
+
+def _scores(idx: KeywordIndex, query: str) -> List[Tuple[str, float]]:
+    return [(r["id"], r["keyword_score"]) for r in idx.search(query, 10)]
+
+
+def _assert_same(got: List[Tuple[str, float]], want: List[Tuple[str, float]]) -> None:
+    assert [c for c, _ in got] == [c for c, _ in want]
+    for (_, g), (_, w) in zip(got, want):
+        assert math.isclose(g, w, rel_tol=1e-12)
+
+
+def test_postings_search_matches_linear_bm25(tmp_path: Path) -> None:
+    ids = list(DOCS)
+    idx = build_keyword_index(
+        tmp_path / "kw.sqlite",
+        ids=ids,
+        texts=[DOCS[i] for i in ids],
+        metas=[{"source_uri": f"data_raw/{i.split(':')[0]}.md"} for i in ids],
+    )
+    for q in ["索引 build", "检索", "BM25 RRF", "WAL", "absent"]:
+        _assert_same(_scores(idx, q), _linear_bm25(DOCS, q))
+    assert idx.search("RRF", 1)[0]["source"] == "data_raw/b.md"
+    idx.close()
+
+    reopened = KeywordIndex(tmp_path / "kw.sqlite")
+    assert reopened.n_chunks == len(DOCS)
+    _assert_same(_scores(reopened, "索引 检索"), _linear_bm25(DOCS, "索引 检索"))
+
+
+def test_incremental_add_remove_equals_fresh_build(tmp_path: Path) -> None:
+    idx = KeywordIndex(tmp_path / "kw.sqlite")
+    idx.add(list(DOCS), list(DOCS.values()), [""] * len(DOCS))
+    idx.commit()
+    # Re-adding is an upsert; removal drops postings and df.
+    idx.add(["b:1"], ["索引 changed text"], [""])
+    idx.remove(["c:0", "unknown"])
+    idx.commit()
+
+    docs = dict(DOCS)
+    docs["b:1"] = "索引 changed text"
+    del docs["c:0"]
+    assert idx.n_chunks == len(docs)
+    for q in ["索引", "changed 检索", "nothing"]:
+        got = sorted(_scores(idx, q))
+        want = sorted(_linear_bm25(docs, q))
+        assert [c for c, _ in got] == [c for c, _ in want]
+        assert all(math.isclose(g, w, rel_tol=1e-12) for (_, g), (_, w) in zip(got, want))
+
+
+def test_readding_a_tokenless_chunk_is_an_upsert() -> None:
+    # Chunks without a single token leave the terms table empty; re-adding one must still replace it.
+    idx = KeywordIndex(":memory:")
+    idx.add(["x"], ["!!!"], [""])
+    idx.add(["x"], ["!!!"], [""])
+    assert idx.n_chunks == 1
+    assert idx.remove(["x"]) == 1 and idx.n_chunks == 0
+    idx.close()
+
+
+def test_sync_open_drops_stale_or_dirty_index(tmp_path: Path) -> None:
+    path = tmp_path / "kw.sqlite"
+    idx, status = open_keyword_index_for_sync(path, collection_count=0)
+    assert status == "created" and idx is not None and idx.dirty
+    idx.add(["a:0"], [DOCS["a:0"]], [""])
+    idx.set_dirty(False)
+    idx.close()
+
+    idx, status = open_keyword_index_for_sync(path, collection_count=1)
+    assert status == "opened" and idx is not None
+    idx.close()  # left dirty, as after an interrupted build
+
+    idx, status = open_keyword_index_for_sync(path, collection_count=1)
+    assert (idx, status) == (None, "dropped")
+    assert not path.exists()
+
+
+def test_sync_open_resumes_dirty_index_up_to_last_commit(tmp_path: Path) -> None:
+    path = tmp_path / "kw.sqlite"
+    idx, _ = open_keyword_index_for_sync(path, collection_count=0)
+    assert idx is not None
+    # Per-document commits must not pay a rollback-journal fsync each.
+    assert idx._db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    idx.add(["a:0", "a:1"], [DOCS["a:0"], DOCS["a:1"]], ["a", "a"])
+    idx.commit()  # DOC_COMMITTED for "a"
+    idx.add(["b:0"], [DOCS["b:0"]], ["b"])
+    idx._db.close()  # crash: the uncommitted "b" rows roll back
+
+    idx, status = open_keyword_index_for_sync(path, collection_count=2, resume=True)
+    assert status == "resumed" and idx is not None and idx.dirty
+    assert idx.n_chunks == 2 and [h["id"] for h in idx.search("hybrid", 5)] == []
+    idx.add(["b:0"], [DOCS["b:0"]], ["b"])
+    assert [h["id"] for h in idx.search("hybrid", 5)] == ["b:0"]
+    idx.close()
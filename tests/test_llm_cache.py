@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import socket
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+from mhy_ai_rag_data.llm_cache import LLMResponseCache, open_llm_cache, payload_key
+from mhy_ai_rag_data.llm_client_http import LLMError, call_llm, stream_llm
+
+MESSAGES = [{"role": "system", "content": "只依据资料回答"}, {"role": "user", "content": "存档如何导出？"}]
+
+
+def _dead_url() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}/v1"
+
+
+def test_payload_key_ignores_transport_fields_only() -> None:
+    base: Dict[str, Any] = {"model": "m", "messages": MESSAGES, "temperature": 0.0, "max_tokens": 64}
+    assert payload_key(base) == payload_key({**base, "stream": True}) == payload_key(dict(reversed(base.items())))
+    assert payload_key(base) != payload_key({**base, "temperature": 0.2})
+    assert payload_key(base) != payload_key({**base, "messages": MESSAGES[1:]})
+
+
+def test_read_replays_and_write_rerecords(tmp_path: Path) -> None:
+    assert open_llm_cache(tmp_path, "off", "c.sqlite") is None
+    with pytest.raises(ValueError):
+        open_llm_cache(tmp_path, "replay", "c.sqlite")
+
+    payload: Dict[str, Any] = {"model": "m", "messages": MESSAGES, "temperature": 0.0, "max_tokens": 64}
+    writer = open_llm_cache(tmp_path, "write", "c.sqlite")
+    assert writer is not None
+    writer.put(payload, "v1")
+    assert writer.get(payload) is None  # write mode never serves
+    writer.put(payload, "v2")
+    writer.close()
+
+    reader = LLMResponseCache(tmp_path / "c.sqlite", mode="read")
+    assert reader.get(payload) == "v2"
+    assert reader.get({**payload, "max_tokens": 65}) is None
+    assert reader.stats()["entries"] == 1 and reader.stats()["hits"] == 1 and reader.stats()["misses"] == 1
+    reader.close()
+
+
+def test_client_hit_sends_no_request(tmp_path: Path) -> None:
+    cache = LLMResponseCache(tmp_path / "c.sqlite", mode="read")
+    dead = _dead_url()
+    with pytest.raises(LLMError):
+        call_llm(MESSAGES, base_url=dead, model="m", temperature=0.0, max_tokens=64, cache=cache)
+
+    payload: Dict[str, Any] = {"model": "m", "messages": MESSAGES, "temperature": 0.0, "max_tokens": 64}
+    cache.put(payload, "导出在设置页")
+    assert call_llm(MESSAGES, base_url=dead, model="m", temperature=0.0, max_tokens=64, cache=cache) == "导出在设置页"
+    seen: List[str] = []
+    res = stream_llm(
+        MESSAGES, on_delta=seen.append, base_url=dead, model="m", temperature=0.0, max_tokens=64, cache=cache
+    )
+    assert res.cached and res.content == "导出在设置页" and seen == ["导出在设置页"] and res.ttft_ms is None
+    cache.close()
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator
+
+import pytest
+
+from mhy_ai_rag_data.tools import llm_http_client as client
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    busy: Dict[str, int] = {}
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _send(self, code: int, obj: Dict[str, Any], extra: Dict[str, str]) -> None:
+        b = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        for k, v in {"Content-Type": "application/json", "Content-Length": str(len(b)), **extra}.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(b)
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        left = self.busy.get(self.path, 0)
+        if left > 0:
+            self.busy[self.path] = left - 1
+            self._send(429 if left % 2 else 503, {"error": "busy"}, {"Retry-After": "0"})
+            return
+        self._send(200, {"choices": [{"message": {"content": "ok"}}]}, {})
+
+
+@pytest.fixture()
+def base_url() -> Iterator[str]:
+    client.configure_http(max_retries=2, backoff_base_s=0.0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        defaults = client.HTTPConfig()
+        client.configure_http(max_retries=defaults.max_retries, backoff_base_s=defaults.backoff_base_s)
+
+
+def test_retries_429_503_then_reuses_keep_alive_connection(base_url: str) -> None:
+    _Handler.busy["/v1/chat/completions"] = 2
+    client.http_stats(reset=True)
+    payload: Dict[str, Any] = {"model": "m", "messages": []}
+
+    assert client.extract_chat_content(client.chat_completions(base_url + "/v1", payload)) == "ok"
+    t = client.last_request_timing()
+    assert t is not None and t["attempts"] == 3 and t["status_code"] == 200
+    assert t["new_connections"] == 1 and t["connect_ms"] > 0
+
+    client.chat_completions(base_url + "/v1", payload)
+    t = client.last_request_timing()
+    assert t is not None and t["attempts"] == 1 and t["new_connections"] == 0 and t["connect_ms"] == 0
+
+    stats = client.http_stats()
+    assert stats["requests"] == 2 and stats["retries"] == 2 and stats["new_connections"] == 1
+
+    _Handler.busy["/v1/chat/completions"] = 3
+    with pytest.raises(client.LLMHTTPError) as ei:
+        client.chat_completions(base_url + "/v1", payload)
+    assert ei.value.status_code == 429
+
+
+def test_retry_delay_is_bounded_and_honours_retry_after() -> None:
+    for attempt in range(1, 8):
+        assert 0.0 <= client._retry_delay(attempt, None) <= client.HTTPConfig().backoff_max_s
+    assert client._retry_delay(1, "1.5") == 1.5
+    assert client._retry_delay(1, "3600") == client.HTTPConfig().backoff_max_s
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, List
+
+import pytest
+
+from mhy_ai_rag_data.tools.llm_http_client import LLMHTTPError, iter_sse_data, stream_chat_completions
+
+PIECES = ["存档", "可以", "导出", "。"]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _chunk(self, data: str) -> None:
+        b = data.encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(b), b))
+        self.wfile.flush()
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        if self.path.endswith("/bad/chat/completions"):
+            self.send_response(400)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+            return
+        assert body["stream"] is True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._chunk(": keep-alive\n\n")
+        time.sleep(0.05)
+        for p in PIECES:
+            self._chunk("data: " + json.dumps({"choices": [{"delta": {"content": p}}]}) + "\n\n")
+            time.sleep(0.02)
+        self._chunk("data: " + json.dumps({"choices": [{"delta": {}, "finish_reason": "stop"}]}) + "\n\n")
+        self._chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+@pytest.fixture()
+def base_url() -> Iterator[str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_iter_sse_data_joins_multiline_events_and_skips_comments() -> None:
+    lines = [b": ping", b"data: a", b"data:b", b"", b"event: x", b"data: c", b""]
+    assert list(iter_sse_data(lines)) == ["a\nb", "c"]
+
+
+def test_stream_yields_deltas_in_order_with_ttft(base_url: str) -> None:
+    seen: List[str] = []
+    res = stream_chat_completions(base_url + "/v1", {"model": "m", "messages": []}, on_delta=seen.append)
+    assert seen == PIECES and res.content == "".join(PIECES)
+    assert res.streamed and res.finish_reason == "stop"
+    assert res.completion_tokens == len(PIECES) and res.tokens_source == "chunks"
+    assert res.ttft_ms is not None and 40 <= res.ttft_ms < res.total_ms
+    assert res.tokens_per_s is not None and res.tokens_per_s > 0
+
+    with pytest.raises(LLMHTTPError) as ei:
+        stream_chat_completions(base_url + "/bad", {"model": "m", "messages": []})
+    assert ei.value.status_code == 400
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import csv
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from mhy_ai_rag_data import make_inventory
+
+
+def _run(monkeypatch: pytest.MonkeyPatch, root: Path, *extra: str) -> Dict[str, Dict[str, str]]:
+    monkeypatch.setattr(sys, "argv", ["prog", "--root", str(root), *extra])
+    make_inventory.main()
+    with (root / "inventory.csv").open(encoding="utf-8", newline="") as f:
+        return {r["source_uri"]: r for r in csv.DictReader(f)}
+
+
+def _set_mtime(p: Path, sec: int, frac_ns: int) -> None:
+    ns = sec * 10**9 + frac_ns
+    os.utime(p, ns=(ns, ns))
+
+
+def test_stat_fast_path_reuses_hash_and_parallel_hashing_matches_serial(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    raw = tmp_path / "data_raw"
+    raw.mkdir()
+    base_sec = 1_700_000_000
+    for i in range(12):
+        p = raw / f"doc{i}.md"
+        p.write_text(f"# doc {i}\n" * (i + 1), encoding="utf-8")
+        _set_mtime(p, base_sec + i, 100_000_000)
+    same = raw / "doc3.md"
+    grown = raw / "doc5.md"
+    racy = raw / "doc7.md"
+    now_ns = time.time_ns()
+    os.utime(racy, ns=(now_ns, now_ns))  # mtime within the racy window of the first scan
+
+    first = _run(monkeypatch, tmp_path, "--hash-workers", "1")
+    old_sha = first["data_raw/doc3.md"]["content_sha256"]
+    assert old_sha == hashlib.sha256(same.read_bytes()).hexdigest()
+    capsys.readouterr()
+
+    # Same size and same second (updated_at has second resolution), but a different mtime_ns: rehashed.
+    same.write_bytes(same.read_bytes().replace(b"doc 3", b"DOC 3"))
+    _set_mtime(same, base_sec + 3, 900_000_000)
+    grown.write_text(grown.read_text(encoding="utf-8") + "more\n", encoding="utf-8")
+
+    second = _run(monkeypatch, tmp_path, "--hash-workers", "1")
+    assert "(hashed=3, reused=9)" in capsys.readouterr().out  # doc3, doc5 and the racily-clean doc7
+    assert second["data_raw/doc3.md"]["updated_at"] == first["data_raw/doc3.md"]["updated_at"]
+    assert second["data_raw/doc3.md"]["content_sha256"] == hashlib.sha256(same.read_bytes()).hexdigest() != old_sha
+    assert second["data_raw/doc5.md"]["content_sha256"] == hashlib.sha256(grown.read_bytes()).hexdigest()
+    assert second["data_raw/doc5.md"]["doc_id"] == first["data_raw/doc5.md"]["doc_id"]
+
+    serial = _run(monkeypatch, tmp_path, "--incremental", "false", "--hash-workers", "1")
+    serial_bytes = (tmp_path / "inventory.csv").read_bytes()
+    assert serial == second
+    _run(monkeypatch, tmp_path, "--incremental", "false", "--hash-workers", "4")
+    assert (tmp_path / "inventory.csv").read_bytes() == serial_bytes
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from markdown_it import MarkdownIt
+
+from mhy_ai_rag_data import md_refs
+from mhy_ai_rag_data.md_refs import extract_refs_from_md, get_md_parser, may_contain_refs
+
+
+def test_parser_is_shared_per_preset() -> None:
+    assert get_md_parser("commonmark") is get_md_parser("commonmark")
+    assert get_md_parser("zero") is not get_md_parser("commonmark")
+
+
+def test_fast_path_keeps_reference_style_links(tmp_path: Path) -> None:
+    md_path = tmp_path / "data_raw" / "a.md"
+    text = "see [guide][g] and ![shot][s]\n\n[g]: guide.md\n[s]: img/shot.png\n"
+    assert may_contain_refs(text)
+    asset_refs, doc_refs = extract_refs_from_md(md_path=md_path, md_text=text, project_root=tmp_path)
+    assert [r["target_uri"] for r in doc_refs] == ["data_raw/guide.md"]
+    assert [r["target_uri"] for r in asset_refs] == ["data_raw/img/shot.png"]
+
+    plain = "# title\n\nno links, only <b>html</b> and [brackets] here\n"
+    assert not may_contain_refs(plain)
+    assert extract_refs_from_md(md_path=md_path, md_text=plain, project_root=tmp_path) == ([], [])
+
+
+def test_link_free_text_skips_the_parser(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    md_path = tmp_path / "data_raw" / "doc.md"
+    plain = "# doc\n\n" + "body line without links, [brackets] and <img> tags\n" * 20
+    assert not may_contain_refs(plain)
+    expected = extract_refs_from_md(md_path=md_path, md_text=plain, project_root=tmp_path)
+
+    def _no_parse(preset: str = "commonmark") -> MarkdownIt:
+        raise AssertionError("link-free markdown must not be parsed")
+
+    monkeypatch.setattr(md_refs, "get_md_parser", _no_parse)
+    assert extract_refs_from_md(md_path=md_path, md_text=plain, project_root=tmp_path) == expected == ([], [])
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import os
+import socket
+import threading
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+from mhy_ai_rag_data.hybrid_retriever import HybridRetriever
+from mhy_ai_rag_data.keyword_index import KeywordIndex
+from mhy_ai_rag_data.rag_daemon import (
+    DaemonError,
+    RagDaemonServer,
+    answer_remote,
+    daemon_for,
+    index_identity,
+    retrieve_remote,
+    to_source_chunks,
+)
+from mhy_ai_rag_data.retriever_chroma import SourceChunk
+from mhy_ai_rag_data.tools.index_state import state_file_for, write_latest_pointer
+
+DOCS = {"a:0": ("存档 导入 导出", [1.0, 0.0]), "b:0": ("资产 自定义", [0.0, 1.0])}
+
+
+class _Collection:
+    def query(self, query_embeddings: List[List[float]], n_results: int, include: Any, where: Any = None) -> Any:
+        out: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in query_embeddings:
+            ranked = sorted(DOCS, key=lambda c: -sum(a * b for a, b in zip(q, DOCS[c][1])))[:n_results]
+            out["ids"].append(ranked)
+            out["documents"].append([DOCS[c][0] for c in ranked])
+            out["metadatas"].append([{"doc_id": c[0], "source_uri": f"data_raw/{c[0]}.md"} for c in ranked])
+            out["distances"].append([0.1 * (i + 1) for i in range(len(ranked))])
+        return out
+
+    def get(self, ids: List[str], include: Any) -> Dict[str, Any]:
+        return {
+            "ids": ids,
+            "documents": [DOCS[c][0] for c in ids],
+            "metadatas": [{"doc_id": c[0], "source_uri": f"data_raw/{c[0]}.md"} for c in ids],
+        }
+
+
+def _answer(question: str, sources: List[SourceChunk], temperature: float) -> Dict[str, Any]:
+    return {"answer": f"{question}|{','.join(s.sid for s in sources)}|{temperature}", "error": None}
+
+
+def test_daemon_serves_same_hits_as_in_process(tmp_path: Path) -> None:
+    idx = KeywordIndex(":memory:")
+    idx.add(list(DOCS), [t for t, _ in DOCS.values()], [f"data_raw/{c[0]}.md" for c in DOCS])
+    retriever = HybridRetriever(
+        collection=_Collection(), embed=lambda q: [0.0, 1.0] if "资产" in q else [1.0, 0.0], keyword_index=idx
+    )
+    state_root = tmp_path / "index_state"
+    write_latest_pointer(state_root, "c", "h1")
+    state = state_file_for(state_root, "c", "h1")
+    state.parent.mkdir(parents=True)
+    state.write_text("{}", encoding="utf-8")
+    info = {
+        "db": (tmp_path / "chroma_db").resolve().as_posix(),
+        "collection": "c",
+        "embed_model": "m",
+        "index": index_identity(state_root, "c"),
+    }
+    server = RagDaemonServer(("127.0.0.1", 0), retriever=retriever, info=info, answer=_answer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    same = {"db": str(tmp_path / "chroma_db"), "embed_model": "m", "state_root": str(state_root)}
+    try:
+        assert daemon_for(url, collection="c", **same) == url
+        assert daemon_for(url, collection="other", **same) == ""
+
+        remote = to_source_chunks(retrieve_remote(url, "资产 自定义", 2)["hits"])
+        local = retriever.retrieve("资产 自定义", 2).hits
+        assert [(s.doc_id, s.text) for s in remote] == [(h.metadata["doc_id"], h.text) for h in local]
+        assert remote[0].sid == "S1"
+
+        out = answer_remote(url, "资产", 1, temperature=0.5)
+        assert out["answer"] == "资产|S1|0.5" and len(out["hits"]) == 1
+
+        with pytest.raises(DaemonError, match="400"):
+            retrieve_remote(url, "q", 2, mode="sparse")
+
+        # A later build rewrites index_state (or moves LATEST): the running daemon no longer matches.
+        mtime_ns = state.stat().st_mtime_ns + 10**9
+        os.utime(state, ns=(mtime_ns, mtime_ns))
+        assert daemon_for(url, collection="c", **same) == ""
+        os.utime(state, ns=(mtime_ns - 10**9, mtime_ns - 10**9))
+        write_latest_pointer(state_root, "c", "h2")
+        assert daemon_for(url, collection="c", **same) == ""
+    finally:
+        server.shutdown()
+        server.server_close()
+        retriever.close()
+
+
+def test_daemon_for_falls_back_when_nothing_listens() -> None:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    assert daemon_for(f"http://127.0.0.1:{port}") == ""
+    assert daemon_for("off") == ""
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from typing import Any, List
+
+import pytest
+
+from mhy_ai_rag_data import retriever_chroma
+from mhy_ai_rag_data.retriever_chroma import SourceChunk
+from mhy_ai_rag_data.tools.run_rag_eval_batch import parse_retriever_output, retrieve_in_process
+
+
+def _chunks(q: str) -> List[SourceChunk]:
+    return [SourceChunk(sid="S1", doc_id="a", source_uri=f"data_raw/{q}.md", locator=None, text=f"{q} 正文")]
+
+
+def test_batched_retrieval_matches_cli_output_and_isolates_failures(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: List[List[str]] = []
+
+    def retrieve_many(questions: List[str], k: Any = None, **kw: Any) -> List[List[SourceChunk]]:
+        calls.append(list(questions))
+        if "bad" in questions:
+            raise RuntimeError("batch failed")
+        return [_chunks(q) for q in questions]
+
+    def retrieve(question: str, k: Any = None, **kw: Any) -> List[SourceChunk]:
+        if question == "bad":
+            raise RuntimeError("boom")
+        return _chunks(question)
+
+    monkeypatch.setattr(retriever_chroma, "retrieve_many", retrieve_many)
+    monkeypatch.setattr(retriever_chroma, "retrieve", retrieve)
+
+    steps = retrieve_in_process(["q1", "q2", "bad", "q4"], 3, 2)
+    assert calls == [["q1", "q2"], ["bad", "q4"]]
+    assert [s["returncode"] for s in steps] == [0, 0, 1, 0]
+    assert "boom" in steps[2]["stdout"] and steps[2]["sources"] == []
+
+    parsed = parse_retriever_output(steps[3]["stdout"])
+    assert parsed["retrieved"] == 1
+    assert parsed["hits"] == [{"doc_id": "a", "source_uri": "data_raw/q4.md", "locator": "None"}]
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+from mhy_ai_rag_data.build_chroma_index import iter_units
+from mhy_ai_rag_data.units_reader import (
+    HEAD_FIELDS,
+    UnitsFile,
+    _scan,
+    iter_unit_heads,
+    iter_unit_refs,
+    load_units_index,
+    scan_fields,
+    units_index_path,
+    write_units_index,
+)
+
+
+def _unit(i: int, text: str, **extra: Any) -> Dict[str, Any]:
+    return {
+        "doc_id": f"d{i}",
+        "source_uri": f"data_raw/文档{i}.md",
+        "source_type": "md",
+        "text": text,
+        "asset_refs": [{"ref": "a]b}", "n": [1, {"x": '"['}]}],
+        "content_sha256": f"{i:064x}",
+        "updated_at": "2026-01-01T00:00:00Z",
+        **extra,
+    }
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        json.dumps(_unit(1, "中文正文\n" * 5000), ensure_ascii=False),
+        json.dumps(_unit(2, 'say \\"hi\\" ' * 4000)),
+        json.dumps(_unit(3, "x" * 40000, score=-1.5e3, ok=True, note=None)),
+        '{"do\\u0063_id": "escaped-key", "text": "' + "y" * 40000 + '", "doc_id": "last-wins"}',
+        '  { "source_uri" : "a.md" , "text" : "' + "z" * 40000 + '" }  \n',
+        '{"doc_id": "short", "source_type": "txt"}',
+    ],
+)
+def test_scan_fields_matches_json_loads(line: str) -> None:
+    full = json.loads(line)
+    assert scan_fields(line.encode("utf-8")) == {k: v for k, v in full.items() if k in HEAD_FIELDS}
+
+
+def test_scanner_skips_text_and_rejects_malformed_lines() -> None:
+    line = json.dumps(_unit(1, "正文" * 20000), ensure_ascii=False).encode("utf-8")
+    assert "text" not in _scan(line, HEAD_FIELDS)
+    with pytest.raises(ValueError):
+        scan_fields(b'{"doc_id": "a", "text": "' + b"x" * 40000 + b'"')
+    with pytest.raises(ValueError):
+        scan_fields(b"[1, 2]")
+
+
+def test_iter_unit_heads_offsets_round_trip(tmp_path: Path) -> None:
+    units: List[Dict[str, Any]] = [_unit(i, "段落\n" * (i * 9000)) for i in range(4)]
+    p = tmp_path / "text_units.jsonl"
+    p.write_text("\n".join(json.dumps(u, ensure_ascii=False) for u in units) + "\n\n", encoding="utf-8")
+
+    refs = list(iter_unit_heads(p))
+    assert [r.head["source_uri"] for r in refs] == [u["source_uri"] for u in units]
+    with UnitsFile(p) as uf:
+        for ref, unit in zip(reversed(refs), reversed(units)):
+            assert uf.read(ref.offset, ref.length) == unit
+
+
+def test_sidecar_index_serves_lookups_until_units_file_changes(tmp_path: Path) -> None:
+    units = [_unit(i, f"正文{i}") for i in range(5)]
+    p = tmp_path / "text_units.jsonl"
+    p.write_text("".join(json.dumps(u, ensure_ascii=False) + "\n" for u in units), encoding="utf-8")
+    assert load_units_index(p) is None
+
+    write_units_index(p, iter_unit_heads(p))
+    assert load_units_index(p) == list(iter_unit_heads(p))
+    uris = [units[3]["source_uri"], "data_raw/missing.md", units[1]["source_uri"]]
+    assert list(iter_units(p, source_uris=uris)) == [units[3], units[1]]
+
+    mtime_ns = p.stat().st_mtime_ns
+    p.write_text("".join(json.dumps(u, ensure_ascii=False) + "\n" for u in units[::-1]), encoding="utf-8")
+    os.utime(p, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+    assert load_units_index(p) is None  # same size, new mtime: stale
+    assert units_index_path(p).exists()
+    assert [r.head["source_uri"] for r in iter_unit_refs(p)] == [u["source_uri"] for u in units[::-1]]
+    with UnitsFile(p) as uf:
+        assert uf.get(units[0]["source_uri"]) == units[0]